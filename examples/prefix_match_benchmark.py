@@ -0,0 +1,79 @@
+"""Microbenchmark of prompt cache prefix matching.
+
+Compares the former element by element matching over Python lists with the
+vectorized matching over ``array('i')`` token storage, for a follow-up request
+extending a cached conversation by 100 tokens. Runs without a model:
+
+    python examples/prefix_match_benchmark.py
+"""
+
+import random
+import timeit
+from array import array
+
+from mlx_omni_server.chat.mlx.prompt_cache import common_prefix_len
+from mlx_omni_server.chat.mlx.radix_cache import RadixPrefixCache
+
+SIZES = [10_000, 100_000, 1_000_000]
+BLOCK_SIZE = 64
+
+
+def loop_prefix_len(list1, list2):
+    """Former ``common_prefix_len``."""
+    min_len = min(len(list1), len(list2))
+    for i in range(min_len):
+        if list1[i] != list2[i]:
+            return i
+    return min_len
+
+
+def tuple_blocks(tokens):
+    """Former radix tree block keys."""
+    for start in range(0, len(tokens) - BLOCK_SIZE + 1, BLOCK_SIZE):
+        yield tuple(tokens[start : start + BLOCK_SIZE])
+
+
+def best_ms(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1000
+
+
+def main():
+    radix = RadixPrefixCache(block_size=BLOCK_SIZE)
+    print(
+        f"{'tokens':>10} | {'match list':>10} {'match array':>11} {'speedup':>8} | "
+        f"{'blocks tuple':>12} {'blocks bytes':>12} {'speedup':>8} | "
+        f"{'list->array':>11}"
+    )
+    for size in SIZES:
+        cached = [random.randrange(150_000) for _ in range(size)]
+        prompt = cached + [random.randrange(150_000) for _ in range(100)]
+        cached_array = array("i", cached)
+        prompt_array = array("i", prompt)
+        assert loop_prefix_len(cached, prompt) == size
+        assert common_prefix_len(cached_array, prompt_array) == size
+        number = max(1, 1_000_000 // size)
+
+        match_old = best_ms(lambda: loop_prefix_len(cached, prompt), number)
+        match_new = best_ms(
+            lambda: common_prefix_len(cached_array, prompt_array), number
+        )
+        blocks_old = best_ms(lambda: sum(1 for _ in tuple_blocks(prompt)), number)
+        blocks_new = best_ms(
+            lambda: sum(1 for _ in radix._blocks(prompt_array)), number
+        )
+        convert = best_ms(lambda: array("i", prompt), number)
+        print(
+            f"{size:>10} | {match_old:>8.2f}ms {match_new:>9.3f}ms "
+            f"{match_old / match_new:>7.0f}x | {blocks_old:>10.2f}ms "
+            f"{blocks_new:>10.2f}ms {blocks_old / blocks_new:>7.1f}x | "
+            f"{convert:>9.2f}ms"
+        )
+    print(
+        "The prompt is converted to an array once per request (list->array), "
+        "every match against slots, the radix tree and the disk cache then "
+        "works on the array."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Administration API of the server."""
@@ -0,0 +1,223 @@
+import asyncio
+import time
+from typing import Optional, Tuple
+
+import mlx.core as mx
+from fastapi import APIRouter, HTTPException
+
+from ..chat.mlx.cache_budget import shared_prompt_cache_budget
+from ..chat.mlx.model_registry import shared_model_registry
+from ..chat.mlx.preload import load_and_warm_up
+from ..chat.mlx.wrapper_cache import ModelBusyError, WrapperCacheKey, wrapper_cache
+from .schema import (
+    CacheUsage,
+    ModelCacheUsage,
+    ModelEvictRequest,
+    ModelKey,
+    ModelLoadRequest,
+    ModelReloadRequest,
+    ModelResidency,
+    ModelState,
+    ResidencySettings,
+    ResidentModel,
+)
+
+router = APIRouter(tags=["admin"])
+
+
+@router.get("/admin/cache", response_model=CacheUsage)
+async def get_cache_usage() -> CacheUsage:
+    """Show the memory held by the prompt caches of every loaded model."""
+    return await asyncio.to_thread(_cache_usage)
+
+
+def _cache_usage() -> CacheUsage:
+    models = []
+    for key, generator in wrapper_cache.get_wrappers():
+        stats = generator.get_prompt_cache_stats()
+        if stats is None:
+            # No request has used the model yet, it holds no prompt cache
+            continue
+        prefix_cache = stats["prefix_cache"]
+        models.append(
+            ModelCacheUsage(
+                model=key.model_id,
+                adapter_path=key.adapter_path,
+                draft_model=key.draft_model_id,
+                bytes=stats["bytes"],
+                slot_bytes=sum(stats["bytes_per_slot"]),
+                prefix_cache_bytes=prefix_cache["bytes"],
+                used_slots=stats["used_slots"],
+                leased_slots=stats["leased_slots"],
+                slot_tokens=sum(stats["cached_tokens_per_slot"]),
+                prefix_cache_tokens=prefix_cache["cached_tokens"],
+                evictions=stats["evictions"] + prefix_cache["evicted_blocks"],
+            )
+        )
+
+    budget = shared_prompt_cache_budget().get_stats()
+    return CacheUsage(
+        max_bytes=budget["max_bytes"],
+        used_bytes=budget["used_bytes"],
+        evictions=budget["evictions"],
+        evicted_bytes=budget["evicted_bytes"],
+        active_memory=mx.get_active_memory(),
+        cache_memory=mx.get_cache_memory(),
+        data=models,
+    )
+
+
+@router.get("/admin/models", response_model=ModelResidency)
+async def list_resident_models() -> ModelResidency:
+    """List the loaded and loading models with their memory, last use and load."""
+    return await asyncio.to_thread(_model_residency)
+
+
+@router.post("/admin/models/load", response_model=ModelState)
+async def load_model(request: ModelLoadRequest) -> ModelState:
+    """Load a model ahead of traffic and keep it through idle periods."""
+    key = _model_key(request)
+    load_seconds, warm_up_seconds = await asyncio.to_thread(
+        _load_model, key, request.warm_up
+    )
+    return _model_state(key, load_seconds, warm_up_seconds)
+
+
+@router.post("/admin/models/reload", response_model=ModelState)
+async def reload_model(request: ModelReloadRequest) -> ModelState:
+    """Unload a model and load it again, e.g. after its weights or adapter changed."""
+    key = _model_key(request)
+    await asyncio.to_thread(_evict_model, key, request.force, False)
+    load_seconds, warm_up_seconds = await asyncio.to_thread(
+        _load_model, key, request.warm_up
+    )
+    return _model_state(key, load_seconds, warm_up_seconds)
+
+
+@router.post("/admin/models/evict", response_model=ModelState)
+async def evict_model(request: ModelEvictRequest) -> ModelState:
+    """Unload a model now, pinned or not. Its pin is kept for when it is reloaded."""
+    key = _model_key(request)
+    await asyncio.to_thread(_evict_model, key, request.force, True)
+    return _model_state(key)
+
+
+@router.post("/admin/models/pin", response_model=ModelState)
+async def pin_model(request: ModelKey) -> ModelState:
+    """Never evict a model, neither when idle nor to make room for others.
+
+    Models that are not loaded yet are kept once they are.
+    """
+    key = _model_key(request)
+    wrapper_cache.pin(key)
+    return _model_state(key)
+
+
+@router.post("/admin/models/unpin", response_model=ModelState)
+async def unpin_model(request: ModelKey) -> ModelState:
+    """Make a pinned or preloaded model evictable again."""
+    key = _model_key(request)
+    if not wrapper_cache.unpin(key):
+        raise HTTPException(status_code=404, detail=f"Model is not pinned: {key}")
+    return _model_state(key)
+
+
+@router.patch("/admin/models/settings", response_model=ModelResidency)
+async def update_residency_settings(settings: ResidencySettings) -> ModelResidency:
+    """Change the maximum number of models, their memory budget and TTL."""
+
+    def update() -> ModelResidency:
+        if settings.max_models is not None:
+            wrapper_cache.set_max_size(settings.max_models)
+        if settings.max_bytes is not None:
+            wrapper_cache.set_max_bytes(settings.max_bytes)
+        if settings.ttl_seconds is not None:
+            wrapper_cache.set_ttl_seconds(settings.ttl_seconds)
+        return _model_residency()
+
+    return await asyncio.to_thread(update)
+
+
+def _model_key(request: ModelKey) -> WrapperCacheKey:
+    """Resolve the requested model through the model registry."""
+    return WrapperCacheKey(
+        *shared_model_registry().resolve(
+            request.model, request.adapter_path, request.draft_model
+        )
+    )
+
+
+def _model_residency() -> ModelResidency:
+    models = []
+    for entry in wrapper_cache.get_entries():
+        key, generator = entry["key"], entry["wrapper"]
+        admission = generator.admission.get_stats() if generator else {}
+        pool = (generator.get_prompt_cache_stats() if generator else None) or {}
+        models.append(
+            ResidentModel(
+                model=key.model_id,
+                adapter_path=key.adapter_path,
+                draft_model=key.draft_model_id,
+                status="loaded" if generator else "loading",
+                weight_bytes=entry["weight_bytes"],
+                prompt_cache_bytes=pool.get("bytes", 0),
+                last_used=_unix_time(entry["last_used"]),
+                expires_at=_unix_time(entry["expires_at"]),
+                pinned=entry["pinned"],
+                resident=entry["resident"],
+                inflight_sequences=admission.get("inflight_sequences", 0),
+                queued_requests=admission.get("queued_requests", 0),
+                loads=entry["load_stats"].get("loads", 0),
+                last_load_seconds=entry["load_stats"].get("last_load_seconds"),
+            )
+        )
+
+    info = wrapper_cache.get_cache_info()
+    return ModelResidency(
+        max_models=info["max_size"],
+        max_bytes=info["max_bytes"],
+        used_bytes=info["used_bytes"],
+        ttl_seconds=info["ttl_seconds"],
+        data=models,
+    )
+
+
+def _load_model(key: WrapperCacheKey, warm_up: bool) -> Tuple[float, Optional[float]]:
+    try:
+        if warm_up:
+            return load_and_warm_up(wrapper_cache, key)
+        start_time = time.perf_counter()
+        wrapper_cache.get_wrapper(key.model_id, key.adapter_path, key.draft_model_id)
+        wrapper_cache.keep_resident(key)
+        return time.perf_counter() - start_time, None
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load {key}: {e}")
+
+
+def _evict_model(key: WrapperCacheKey, force: bool, must_exist: bool) -> None:
+    # The cache checks for requests under its lock, so none can slip in
+    try:
+        evicted = wrapper_cache.evict(key, force=force)
+    except ModelBusyError as e:
+        raise HTTPException(status_code=409, detail=f"{e}, set force to evict anyway")
+    if not evicted and must_exist:
+        raise HTTPException(status_code=404, detail=f"Model is not loaded: {key}")
+
+
+def _model_state(
+    key: WrapperCacheKey,
+    load_seconds: Optional[float] = None,
+    warm_up_seconds: Optional[float] = None,
+) -> ModelState:
+    return ModelState(
+        model=key.model_id,
+        adapter_path=key.adapter_path,
+        draft_model=key.draft_model_id,
+        load_seconds=load_seconds,
+        warm_up_seconds=warm_up_seconds,
+        **wrapper_cache.get_residency(key),
+    )
+
+
+def _unix_time(timestamp: Optional[float]) -> Optional[int]:
+    return None if timestamp is None else int(timestamp)
@@ -0,0 +1,121 @@
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class ModelCacheUsage(BaseModel):
+    """Memory held by the prompt caches of one loaded model."""
+
+    model: str
+    adapter_path: Optional[str] = None
+    draft_model: Optional[str] = None
+    bytes: int = Field(..., description="Bytes held by the slots and the radix tree")
+    slot_bytes: int
+    prefix_cache_bytes: int
+    used_slots: int
+    leased_slots: int
+    slot_tokens: int = Field(..., description="Tokens held by the cache slots")
+    prefix_cache_tokens: int = Field(..., description="Tokens held by the radix tree")
+    evictions: int
+
+
+class CacheUsage(BaseModel):
+    """Memory held by the prompt caches of all loaded models."""
+
+    object: str = "cache.usage"
+    max_bytes: int = Field(..., description="Prompt cache budget, 0 if unlimited")
+    used_bytes: int
+    evictions: int = Field(..., description="Entries evicted to fit the budget")
+    evicted_bytes: int
+    active_memory: int = Field(..., description="Bytes of MLX arrays in use")
+    cache_memory: int = Field(..., description="Bytes of MLX's buffer cache")
+    data: List[ModelCacheUsage]
+
+
+class ModelKey(BaseModel):
+    """A model, by registry alias or model ID, with its adapter and draft model."""
+
+    model: str
+    adapter_path: Optional[str] = None
+    draft_model: Optional[str] = None
+
+
+class ModelLoadRequest(ModelKey):
+    """Load a model and keep it through idle periods."""
+
+    warm_up: bool = Field(True, description="Run a short dummy prefill and decode")
+
+
+class ModelEvictRequest(ModelKey):
+    """Unload a model."""
+
+    force: bool = Field(
+        False, description="Evict even if requests are in flight, they finish first"
+    )
+
+
+class ModelReloadRequest(ModelLoadRequest):
+    """Unload a model and load it again, e.g. after its files changed."""
+
+    force: bool = Field(
+        False,
+        description="Reload even if requests are in flight, they finish on the old model",
+    )
+
+
+class ResidentModel(BaseModel):
+    """Residency of one loaded or loading model."""
+
+    model: str
+    adapter_path: Optional[str] = None
+    draft_model: Optional[str] = None
+    status: Literal["loading", "loaded"]
+    weight_bytes: int
+    prompt_cache_bytes: int
+    last_used: Optional[int] = Field(None, description="Unix time of the last use")
+    expires_at: Optional[int] = Field(
+        None, description="Unix time of its TTL eviction, None if exempt"
+    )
+    pinned: bool = Field(..., description="Never evicted")
+    resident: bool = Field(..., description="Preloaded, exempt from the TTL")
+    inflight_sequences: int
+    queued_requests: int
+    loads: int
+    last_load_seconds: Optional[float] = None
+
+
+class ModelResidency(BaseModel):
+    """Loaded models and the residency limits of the server."""
+
+    object: str = "models.residency"
+    max_models: int
+    max_bytes: int = Field(
+        ..., description="Memory budget of the weights, 0 if unlimited"
+    )
+    used_bytes: int
+    ttl_seconds: int = Field(
+        ..., description="Idle time before eviction, 0 if disabled"
+    )
+    data: List[ResidentModel]
+
+
+class ResidencySettings(BaseModel):
+    """Residency limits to change, unset ones are kept."""
+
+    max_models: Optional[int] = Field(None, ge=0)
+    max_bytes: Optional[int] = Field(None, ge=0)
+    ttl_seconds: Optional[int] = Field(None, ge=0)
+
+
+class ModelState(BaseModel):
+    """Residency state of a model after an admin action."""
+
+    object: str = "model.residency"
+    model: str
+    adapter_path: Optional[str] = None
+    draft_model: Optional[str] = None
+    loaded: bool
+    pinned: bool
+    resident: bool
+    load_seconds: Optional[float] = None
+    warm_up_seconds: Optional[float] = None
@@ -9,6 +9,7 @@ from typing import Any, Dict, Generator, List, Optional
 
 from mlx_omni_server.chat.anthropic.anthropic_schema import (
     AnthropicTool,
+    CacheControl,
     ContentBlock,
     InputMessage,
     MessagesRequest,
@@ -27,9 +28,18 @@ from mlx_omni_server.chat.anthropic.anthropic_schema import (
     ToolUseBlock,
     Usage,
 )
-from mlx_omni_server.chat.mlx.chat_generator import ChatGenerator
+from mlx_omni_server.chat.mlx.cancellation import CancellationToken
+from mlx_omni_server.chat.mlx.chat_generator import (
+    KV_QUANTIZATION_PARAMS,
+    KV_WINDOW_PARAMS,
+    ChatGenerator,
+)
+from mlx_omni_server.chat.mlx.core_types import CacheBreakpoint, GenerationStats
 from mlx_omni_server.utils.logger import logger
 
+# Seconds a cache_control breakpoint keeps its prefix cached, by ttl
+CACHE_CONTROL_TTLS = {"5m": 300.0, "1h": 3600.0}
+
 
 class AnthropicMessagesAdapter:
     """Anthropic Messages API adapter with internal parameter management."""
@@ -155,11 +165,14 @@ class AnthropicMessagesAdapter:
 
         return mlx_tools
 
-    def _prepare_generation_params(self, request: MessagesRequest) -> Dict[str, Any]:
+    def _prepare_generation_params(
+        self, request: MessagesRequest, session_id: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Prepare parameters for MLX generation.
 
         Args:
             request: Anthropic Messages API request
+            session_id: Client session, defaults to ``metadata.user_id``
 
         Returns:
             Parameters for ChatGenerator
@@ -197,13 +210,106 @@ class AnthropicMessagesAdapter:
             "enable_prompt_cache": True,
         }
 
-        # Note: ChatGenerator doesn't currently support stop_sequences
-        # This is a known limitation that will be addressed in the future
-        # if request.stop_sequences:
-        #     params["stop_sequences"] = request.stop_sequences
+        if session_id is None and request.metadata is not None:
+            session_id = request.metadata.user_id
+        if session_id:
+            params["session_id"] = session_id
+
+        breakpoints = self._cache_breakpoints(request)
+        if breakpoints:
+            params["cache_breakpoints"] = breakpoints
 
+        if request.stop_sequences:
+            params["stop_sequences"] = request.stop_sequences
+
+        params.update(self._kv_params(request))
         return params
 
+    def _kv_params(self, request: MessagesRequest) -> Dict[str, Any]:
+        """KV cache quantization and window overrides of the model's defaults.
+
+        They are sent as extra fields (extra_body in the Anthropic SDK).
+        """
+        extra_fields = request.model_extra or {}
+        return {
+            key: extra_fields[key]
+            for key in KV_QUANTIZATION_PARAMS + KV_WINDOW_PARAMS
+            if extra_fields.get(key) is not None
+        }
+
+    def validate(self, request: MessagesRequest) -> None:
+        """Reject a request that would fail generating, before it is admitted.
+
+        Raises:
+            ValueError: If the KV cache parameters don't suit the model
+        """
+        self._generate_wrapper.validate_kv_params(self._kv_params(request))
+
+    def _cache_breakpoints(self, request: MessagesRequest) -> List[CacheBreakpoint]:
+        """Turn the request's ``cache_control`` markers into cache breakpoints.
+
+        A breakpoint covers the prompt up to the end of the marked block, in
+        the order tools, system, messages. Chat templates render the tools
+        into the system turn, so a marked tool covers the prompt up to the
+        system prompt's text.
+
+        Args:
+            request: Anthropic Messages API request
+
+        Returns:
+            Breakpoints with the messages up to each marker
+        """
+
+        def make_breakpoint(
+            messages: List[Dict[str, Any]], cache_control: CacheControl
+        ) -> CacheBreakpoint:
+            ttl = CACHE_CONTROL_TTLS[cache_control.ttl or "5m"]
+            return CacheBreakpoint(messages=messages, ttl=ttl)
+
+        breakpoints = []
+        tool_markers = [t.cache_control for t in request.tools or [] if t.cache_control]
+        if tool_markers:
+            messages = [{"role": "system", "content": ""}]
+            breakpoints.append(make_breakpoint(messages, tool_markers[-1]))
+
+        if isinstance(request.system, list):
+            for i, block in enumerate(request.system):
+                if block.cache_control is not None:
+                    messages = self._convert_system_to_messages(
+                        request.system[: i + 1], []
+                    )
+                    breakpoints.append(make_breakpoint(messages, block.cache_control))
+
+        for i, message in enumerate(request.messages):
+            if isinstance(message.content, str):
+                continue
+            for j, block in enumerate(message.content):
+                if block.cache_control is not None:
+                    marked = message.model_copy(
+                        update={"content": message.content[: j + 1]}
+                    )
+                    messages = self._convert_system_to_messages(
+                        request.system, request.messages[:i] + [marked]
+                    )
+                    breakpoints.append(make_breakpoint(messages, block.cache_control))
+
+        return breakpoints
+
+    def _create_usage(self, stats: GenerationStats) -> Usage:
+        """Split the prompt tokens into cache reads, cache writes and the rest.
+
+        Like the Anthropic API, ``input_tokens`` counts neither the tokens read
+        from the cache nor those cached for the request's breakpoints.
+        """
+        cached_tokens = stats.cache_hit_tokens
+        written_tokens = stats.cache_write_tokens
+        return Usage(
+            input_tokens=stats.prompt_tokens - written_tokens,
+            output_tokens=stats.completion_tokens,
+            cache_creation_input_tokens=written_tokens if written_tokens > 0 else None,
+            cache_read_input_tokens=cached_tokens if cached_tokens > 0 else None,
+        )
+
     def _create_content_blocks(
         self,
         text_content: Optional[str],
@@ -271,18 +377,27 @@ class AnthropicMessagesAdapter:
         else:
             return StopReason.END_TURN
 
-    def generate(self, request: MessagesRequest) -> MessagesResponse:
+    def generate(
+        self,
+        request: MessagesRequest,
+        cancellation_token: Optional[CancellationToken] = None,
+        session_id: Optional[str] = None,
+    ) -> MessagesResponse:
         """Generate complete response using the wrapper.
 
         Args:
             request: Anthropic Messages API request
+            cancellation_token: Token to stop generation early (e.g. on disconnect)
+            session_id: Client session keeping a prompt cache slot, defaults to
+                        the request's ``metadata.user_id``
 
         Returns:
             Anthropic Messages API response
         """
         try:
             # Prepare parameters
-            params = self._prepare_generation_params(request)
+            params = self._prepare_generation_params(request, session_id)
+            params["cancellation_token"] = cancellation_token
 
             # Generate using wrapper
             result = self._generate_wrapper.generate(**params)
@@ -300,18 +415,14 @@ class AnthropicMessagesAdapter:
             )
 
             # Create usage statistics
-            cached_tokens = result.stats.cache_hit_tokens
-            usage = Usage(
-                input_tokens=result.stats.prompt_tokens + cached_tokens,
-                output_tokens=result.stats.completion_tokens,
-                cache_read_input_tokens=cached_tokens if cached_tokens > 0 else None,
-            )
+            usage = self._create_usage(result.stats)
 
             return MessagesResponse(
                 id=f"msg_{uuid.uuid4().hex[:24]}",
                 content=content_blocks,
                 model=request.model,
                 stop_reason=stop_reason,
+                stop_sequence=result.stop_sequence,
                 usage=usage,
             )
 
@@ -322,12 +433,18 @@ class AnthropicMessagesAdapter:
             raise RuntimeError(f"Failed to generate completion: {str(e)}")
 
     def generate_stream(
-        self, request: MessagesRequest
+        self,
+        request: MessagesRequest,
+        cancellation_token: Optional[CancellationToken] = None,
+        session_id: Optional[str] = None,
     ) -> Generator[MessageStreamEvent, None, None]:
         """Generate streaming response.
 
         Args:
             request: Anthropic Messages API request
+            cancellation_token: Token to stop generation early (e.g. on disconnect)
+            session_id: Client session keeping a prompt cache slot, defaults to
+                        the request's ``metadata.user_id``
 
         Yields:
             Anthropic streaming events
@@ -336,7 +453,8 @@ class AnthropicMessagesAdapter:
             message_id = f"msg_{uuid.uuid4().hex[:24]}"
 
             # Prepare parameters
-            params = self._prepare_generation_params(request)
+            params = self._prepare_generation_params(request, session_id)
+            params["cancellation_token"] = cancellation_token
 
             # Start message event
             yield MessageStreamEvent(
@@ -436,14 +554,7 @@ class AnthropicMessagesAdapter:
 
             # Map stop reason and usage
             if final_result:
-                cached_tokens = final_result.stats.cache_hit_tokens
-                usage = Usage(
-                    input_tokens=final_result.stats.prompt_tokens + cached_tokens,
-                    output_tokens=final_result.stats.completion_tokens,
-                    cache_read_input_tokens=(
-                        cached_tokens if cached_tokens > 0 else None
-                    ),
-                )
+                usage = self._create_usage(final_result.stats)
 
                 stop_reason = self._map_finish_reason(
                     final_result.finish_reason,
@@ -456,7 +567,10 @@ class AnthropicMessagesAdapter:
             # Message delta event with stop reason and usage
             yield MessageStreamEvent(
                 type=StreamEventType.MESSAGE_DELTA,
-                delta=StreamDelta(stop_reason=stop_reason),
+                delta=StreamDelta(
+                    stop_reason=stop_reason,
+                    stop_sequence=final_result.stop_sequence if final_result else None,
+                ),
                 usage=usage,
             )
 
@@ -37,6 +37,13 @@ class ToolChoiceType(str, Enum):
     TOOL = "tool"
 
 
+class CacheControl(BaseModel):
+    """Prompt caching breakpoint, the prefix up to the marked block is cached."""
+
+    type: Literal["ephemeral"] = "ephemeral"
+    ttl: Optional[Literal["5m", "1h"]] = None
+
+
 # Content Blocks
 class TextBlock(BaseModel):
     """Text content block."""
@@ -98,6 +105,7 @@ class AnthropicTool(BaseModel):
     name: str = Field(..., max_length=200, pattern=r"^[a-zA-Z0-9_-]+$")
     description: Optional[str] = None
     input_schema: ToolInputSchema
+    cache_control: Optional[CacheControl] = None
 
 
 class ToolChoiceAuto(BaseModel):
@@ -154,6 +162,7 @@ class RequestTextBlock(BaseModel):
 
     type: Literal["text"] = "text"
     text: str
+    cache_control: Optional[CacheControl] = None
 
 
 class RequestImageBlock(BaseModel):
@@ -161,6 +170,7 @@ class RequestImageBlock(BaseModel):
 
     type: Literal["image"] = "image"
     source: Dict[str, Any]  # Simplified for now
+    cache_control: Optional[CacheControl] = None
 
 
 class RequestToolUseBlock(BaseModel):
@@ -170,6 +180,7 @@ class RequestToolUseBlock(BaseModel):
     id: str
     name: str
     input: Dict[str, Any]
+    cache_control: Optional[CacheControl] = None
 
 
 class RequestToolResultBlock(BaseModel):
@@ -179,6 +190,7 @@ class RequestToolResultBlock(BaseModel):
     tool_use_id: str
     content: Union[str, List[Union[RequestTextBlock, RequestImageBlock]]]
     is_error: Optional[bool] = False
+    cache_control: Optional[CacheControl] = None
 
 
 RequestContentBlock = Union[
@@ -199,6 +211,7 @@ class SystemTextBlock(BaseModel):
 
     type: Literal["text"] = "text"
     text: str
+    cache_control: Optional[CacheControl] = None
 
 
 SystemPrompt = Union[str, List[SystemTextBlock]]
@@ -1,15 +1,30 @@
+import asyncio
 import json
-from typing import Generator, Optional
+from typing import AsyncGenerator, Optional
 
-from fastapi import APIRouter, Query
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 from mlx_omni_server.chat.anthropic.anthropic_messages_adapter import (
     AnthropicMessagesAdapter,
 )
 
+from ..mlx.admission import (
+    PRIORITY_HEADER,
+    OverloadedError,
+    Priority,
+    estimate_tokens,
+)
+from ..mlx.cancellation import CancellationToken, cancel_on_disconnect
 from ..mlx.chat_generator import ChatGenerator
-from .anthropic_schema import MessagesRequest, MessagesResponse
+from ..mlx.model_registry import shared_model_registry
+from ..mlx.prompt_cache import SESSION_HEADER
+from .anthropic_schema import (
+    AnthropicError,
+    ErrorResponse,
+    MessagesRequest,
+    MessagesResponse,
+)
 from .models_service import AnthropicModelsService
 from .schema import AnthropicModelList
 
@@ -49,24 +64,88 @@ async def list_anthropic_models(
 
 @router.post("/messages", response_model=MessagesResponse)
 @router.post("/v1/messages", response_model=MessagesResponse)
-async def create_message(request: MessagesRequest):
+async def create_message(request: MessagesRequest, raw_request: Request):
     """Create an Anthropic Messages API completion"""
 
-    anthropic_model = _create_anthropic_model(
+    # Model loading can take a long time, keep it off the event loop
+    generator = await asyncio.to_thread(
+        _get_generator,
         request.model,
         # Extract extra params if needed - for now use defaults
         None,  # adapter_path
         None,  # draft_model
+        reserve=True,
     )
+    anthropic_model = AnthropicMessagesAdapter(wrapper=generator)
+    try:
+        anthropic_model.validate(request)
+    except ValueError as e:
+        generator.admission.cancel_reservation()
+        error = ErrorResponse(
+            error=AnthropicError(type="invalid_request_error", message=str(e))
+        )
+        return JSONResponse(status_code=400, content=error.model_dump())
+
+    # Stop generating (or waiting for admission) as soon as the client goes away
+    cancellation_token = CancellationToken()
+    watcher = asyncio.create_task(cancel_on_disconnect(raw_request, cancellation_token))
+
+    try:
+        ticket = await generator.admission.acquire(
+            tokens=estimate_tokens(
+                len(request.model_dump_json(include={"messages", "system", "tools"})),
+                request.max_tokens,
+            ),
+            priority=Priority.from_header(raw_request.headers.get(PRIORITY_HEADER)),
+            cancellation_token=cancellation_token,
+            reserved=True,
+        )
+    except OverloadedError as e:
+        watcher.cancel()
+        error = ErrorResponse(
+            error=AnthropicError(type="overloaded_error", message=str(e))
+        )
+        return JSONResponse(
+            status_code=529,
+            content=error.model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    if ticket is None:
+        # Client closed the connection while queued
+        watcher.cancel()
+        return Response(status_code=499)
 
     if not request.stream:
-        completion = anthropic_model.generate(request)
+        try:
+            completion = await generator.executor.run(
+                anthropic_model.generate,
+                request,
+                cancellation_token,
+                raw_request.headers.get(SESSION_HEADER),
+            )
+        finally:
+            watcher.cancel()
+            ticket.release()
         return JSONResponse(content=completion.model_dump(exclude_none=True))
 
-    async def anthropic_event_generator() -> Generator[str, None, None]:
-        for event in anthropic_model.generate_stream(request):
-            yield f"event: {event.type.value}\n"
-            yield f"data: {json.dumps(event.model_dump(exclude_none=True))}\n\n"
+    # Also frees the slot if the response body is never iterated
+    cancellation_token.add_callback(ticket.release)
+
+    async def anthropic_event_generator() -> AsyncGenerator[str, None]:
+        try:
+            async for event in generator.executor.stream(
+                anthropic_model.generate_stream,
+                request,
+                cancellation_token,
+                raw_request.headers.get(SESSION_HEADER),
+            ):
+                yield f"event: {event.type.value}\n"
+                yield f"data: {json.dumps(event.model_dump(exclude_none=True))}\n\n"
+        finally:
+            watcher.cancel()
+            ticket.release()
+            # No-op if generation completed, otherwise the client disconnected
+            cancellation_token.cancel()
 
     return StreamingResponse(
         anthropic_event_generator(),
@@ -78,23 +157,26 @@ async def create_message(request: MessagesRequest):
     )
 
 
-def _create_anthropic_model(
+def _get_generator(
     model_id: str,
     adapter_path: Optional[str] = None,
     draft_model: Optional[str] = None,
-) -> AnthropicMessagesAdapter:
-    """Create an Anthropic Messages adapter based on the model parameters.
+    reserve: bool = False,
+) -> ChatGenerator:
+    """Get the ChatGenerator for the model parameters.
 
     Uses the shared wrapper cache to get or create ChatGenerator instance.
     This avoids expensive model reloading when the same model configuration
-    is used across different requests or API endpoints.
+    is used across different requests or API endpoints. Model aliases are
+    resolved through the server's model registry. With ``reserve`` the model
+    stays loaded until the request acquires its admission.
     """
-    # Get cached or create new ChatGenerator
-    wrapper = ChatGenerator.get_or_create(
+    model_id, adapter_path, draft_model = shared_model_registry().resolve(
+        model_id, adapter_path, draft_model
+    )
+    return ChatGenerator.get_or_create(
         model_id=model_id,
         adapter_path=adapter_path,
         draft_model_id=draft_model,
+        reserve=reserve,
     )
-
-    # Create AnthropicMessagesAdapter with the cached wrapper directly
-    return AnthropicMessagesAdapter(wrapper=wrapper)
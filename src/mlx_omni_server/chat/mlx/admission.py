@@ -0,0 +1,429 @@
+"""Admission Control - bound the work in flight per model.
+
+Without a bound, a burst of requests all start generating at once: every one of
+them holds a worker thread and a KV cache, and the server runs into memory
+pressure instead of pushing back. ``AdmissionController`` sits in front of a
+model's ``ChatGenerator``:
+
+- At most ``max_inflight_sequences`` sequences (and optionally
+  ``max_inflight_tokens`` prompt + completion tokens) run at a time.
+- Further requests wait in a priority queue (high, normal, low; FIFO within a
+  class) of at most ``max_queue_depth`` requests.
+- When the queue is full, the request is rejected right away with
+  ``OverloadedError`` carrying a ``Retry-After`` estimate. A higher priority
+  request instead takes the place of the newest lowest-priority waiter.
+"""
+
+import asyncio
+import bisect
+import itertools
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional
+
+from ...utils.logger import logger
+from .cancellation import CancellationToken
+
+# Request header selecting the priority class
+PRIORITY_HEADER = "X-Priority"
+
+# Default number of sequences generated concurrently per model
+DEFAULT_MAX_INFLIGHT_SEQUENCES = 16
+
+# Default number of requests waiting for admission per model
+DEFAULT_MAX_QUEUE_DEPTH = 64
+
+# Default budget of prompt + completion tokens in flight (0 = unlimited)
+DEFAULT_MAX_INFLIGHT_TOKENS = 0
+
+# Characters per token when estimating prompt size before tokenization
+_CHARS_PER_TOKEN = 4
+
+# Weight of the latest request in the moving average of request durations
+_DURATION_SMOOTHING = 0.2
+
+
+class Priority(IntEnum):
+    """Priority classes, lower values are admitted first."""
+
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> "Priority":
+        """Parse a priority header value, defaulting to NORMAL."""
+        if not value:
+            return cls.NORMAL
+        try:
+            return cls[value.strip().upper()]
+        except KeyError:
+            logger.debug(f"Unknown priority '{value}', using normal")
+            return cls.NORMAL
+
+
+def estimate_tokens(prompt_chars: int, max_tokens: int, n: int = 1) -> int:
+    """Estimate the prompt + completion tokens of a request for the token budget.
+
+    Args:
+        prompt_chars: Length of the serialized prompt (messages, system, tools)
+        max_tokens: Completion token limit per sequence
+        n: Number of sequences
+    """
+    return prompt_chars // _CHARS_PER_TOKEN + max_tokens * n
+
+
+class OverloadedError(Exception):
+    """Raised when a request cannot be queued for admission."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """Admission of one request; release it when the request is done."""
+
+    def __init__(
+        self,
+        controller: "AdmissionController",
+        sequences: int,
+        tokens: int,
+        priority: Priority,
+        queue_wait: float,
+    ):
+        self.sequences = sequences
+        self.tokens = tokens
+        self.priority = priority
+        self.queue_wait = queue_wait  # Seconds spent waiting for admission
+        self._controller = controller
+        self._admit_time = time.perf_counter()
+        self._released = False
+
+    def release(self) -> None:
+        """Return the admitted capacity. Safe to call more than once."""
+        self._controller._release(self)
+
+
+@dataclass(order=True)
+class _Waiter:
+    """A queued request, ordered by priority class and arrival."""
+
+    priority: int
+    order: int
+    sequences: int = field(compare=False)
+    tokens: int = field(compare=False)
+    loop: Any = field(compare=False)
+    future: Any = field(compare=False)
+    enqueue_time: float = field(compare=False, default_factory=time.perf_counter)
+
+
+class AdmissionController:
+    """Per-model admission queue with concurrency and token limits.
+
+    ``acquire`` is awaited on the event loop; ``release`` may be called from any
+    thread.
+
+    Examples:
+        controller = AdmissionController("mlx-community/Qwen3-0.6B-4bit")
+        ticket = await controller.acquire(sequences=1, tokens=1024)
+        try:
+            ...  # generate
+        finally:
+            ticket.release()
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_inflight_sequences: int = DEFAULT_MAX_INFLIGHT_SEQUENCES,
+        max_queue_depth: int = DEFAULT_MAX_QUEUE_DEPTH,
+        max_inflight_tokens: int = DEFAULT_MAX_INFLIGHT_TOKENS,
+    ):
+        """Initialize controller.
+
+        Args:
+            name: Name used in log messages (typically the model id)
+            max_inflight_sequences: Maximum sequences generating concurrently
+            max_queue_depth: Maximum requests waiting; further requests are rejected
+            max_inflight_tokens: Maximum prompt + completion tokens in flight,
+                                 0 for no token budget
+        """
+        self.name = name
+        self.max_inflight_sequences = max_inflight_sequences
+        self.max_queue_depth = max_queue_depth
+        self.max_inflight_tokens = max_inflight_tokens
+
+        self._lock = threading.Lock()
+        self._queue: List[_Waiter] = []
+        self._order = itertools.count()
+        self._inflight_sequences = 0
+        self._inflight_tokens = 0
+        # Requests that got the model and are about to call acquire
+        self._reserved = 0
+        self._avg_duration = 1.0
+        self._idle_callbacks: List[Callable[[], None]] = []
+        self._release_callbacks: List[Callable[[], None]] = []
+
+        # Statistics
+        self._admitted_requests = 0
+        self._rejected_requests = 0
+        self._total_queue_wait = 0.0
+        self._max_queue_wait = 0.0
+
+    async def acquire(
+        self,
+        sequences: int = 1,
+        tokens: int = 0,
+        priority: Priority = Priority.NORMAL,
+        cancellation_token: Optional[CancellationToken] = None,
+        reserved: bool = False,
+    ) -> Optional[AdmissionTicket]:
+        """Wait until the request may start generating.
+
+        A request larger than the limits is admitted once nothing else is in
+        flight, so it is never starved.
+
+        Args:
+            sequences: Number of sequences the request generates (``n``)
+            tokens: Estimated prompt + completion tokens of the request
+            priority: Priority class of the request
+            cancellation_token: Stops waiting when the client goes away
+            reserved: Whether the request holds a reservation from ``reserve``,
+                      which it gives up
+
+        Returns:
+            Ticket to release when the request is done, or None if the request
+            was cancelled while queued
+
+        Raises:
+            OverloadedError: If the queue is full
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            with self._lock:
+                if reserved:
+                    self._reserved -= 1
+                if not self._queue and self._fits(sequences, tokens):
+                    return self._admit(sequences, tokens, priority, 0.0)
+
+                waiter = _Waiter(
+                    priority=priority,
+                    order=next(self._order),
+                    sequences=sequences,
+                    tokens=tokens,
+                    loop=loop,
+                    future=loop.create_future(),
+                )
+                if len(self._queue) >= self.max_queue_depth:
+                    shed = self._queue[-1] if self._queue else None
+                    if shed is None or shed.priority <= priority:
+                        self._rejected_requests += 1
+                        raise OverloadedError(
+                            f"Model {self.name} is overloaded", self._retry_after()
+                        )
+                    # Make room by rejecting the newest lowest-priority waiter
+                    self._queue.pop()
+                    self._rejected_requests += 1
+                    self._wake(
+                        shed,
+                        OverloadedError(
+                            f"Model {self.name} is overloaded", self._retry_after()
+                        ),
+                    )
+                bisect.insort(self._queue, waiter)
+        except OverloadedError:
+            # A rejected reservation may have been the last thing keeping
+            # the controller busy
+            self._notify_idle()
+            raise
+
+        def stop_waiting() -> None:
+            loop.call_soon_threadsafe(_cancel_future, waiter.future)
+
+        if cancellation_token is not None:
+            cancellation_token.add_callback(stop_waiting)
+
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._queue:
+                    self._queue.remove(waiter)
+                    self._admit_waiting()
+            self._notify_idle()
+            # Admitted just before the cancellation arrived
+            future = waiter.future
+            if future.done() and not future.cancelled() and not future.exception():
+                future.result().release()
+            if cancellation_token is not None and cancellation_token.cancelled:
+                logger.debug(f"Request for {self.name} cancelled while queued")
+                return None
+            raise
+        finally:
+            if cancellation_token is not None:
+                cancellation_token.remove_callback(stop_waiting)
+
+    def add_idle_callback(self, callback: Callable[[], None]) -> None:
+        """Call ``callback`` once no request is in flight, queued or reserved.
+
+        It is called right away if the controller is idle, otherwise on a
+        separate thread after the last request is released, since requests are
+        released on the event loop.
+        """
+        with self._lock:
+            if self._is_busy():
+                self._idle_callbacks.append(callback)
+                return
+        callback()
+
+    def reserve(self) -> None:
+        """Count a request as busy before it calls ``acquire``.
+
+        The wrapper cache reserves for requests it hands a model to, so the
+        model is not evicted before they are admitted. The request passes
+        ``reserved=True`` to ``acquire`` or calls ``cancel_reservation``.
+        """
+        with self._lock:
+            self._reserved += 1
+
+    def cancel_reservation(self) -> None:
+        """Give up a reservation without acquiring."""
+        with self._lock:
+            self._reserved = max(self._reserved - 1, 0)
+        self._notify_idle()
+
+    def add_release_callback(self, callback: Callable[[], None]) -> None:
+        """Call ``callback`` after every released request, e.g. to track use."""
+        with self._lock:
+            self._release_callbacks.append(callback)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get admission statistics.
+
+        Returns:
+            Dictionary with current load, limits and queue wait times in seconds
+        """
+        with self._lock:
+            return {
+                "max_inflight_sequences": self.max_inflight_sequences,
+                "max_inflight_tokens": self.max_inflight_tokens,
+                "max_queue_depth": self.max_queue_depth,
+                "inflight_sequences": self._inflight_sequences,
+                "inflight_tokens": self._inflight_tokens,
+                "queued_requests": len(self._queue),
+                "reserved_requests": self._reserved,
+                "admitted_requests": self._admitted_requests,
+                "rejected_requests": self._rejected_requests,
+                "avg_queue_wait": (
+                    self._total_queue_wait / self._admitted_requests
+                    if self._admitted_requests
+                    else 0.0
+                ),
+                "max_queue_wait": self._max_queue_wait,
+            }
+
+    def _is_busy(self) -> bool:
+        """Whether requests are in flight, queued or reserved (lock held)."""
+        return bool(self._inflight_sequences or self._queue or self._reserved)
+
+    def _fits(self, sequences: int, tokens: int) -> bool:
+        """Whether a request fits next to the work already in flight."""
+        if self._inflight_sequences == 0:
+            return True
+        if self._inflight_sequences + sequences > self.max_inflight_sequences:
+            return False
+        return (
+            not self.max_inflight_tokens
+            or self._inflight_tokens + tokens <= self.max_inflight_tokens
+        )
+
+    def _admit(
+        self, sequences: int, tokens: int, priority: Priority, queue_wait: float
+    ) -> AdmissionTicket:
+        """Account for an admitted request (lock held)."""
+        self._inflight_sequences += sequences
+        self._inflight_tokens += tokens
+        self._admitted_requests += 1
+        self._total_queue_wait += queue_wait
+        self._max_queue_wait = max(self._max_queue_wait, queue_wait)
+        return AdmissionTicket(self, sequences, tokens, priority, queue_wait)
+
+    def _admit_waiting(self) -> None:
+        """Admit queued requests in priority order while they fit (lock held)."""
+        while self._queue and self._fits(
+            self._queue[0].sequences, self._queue[0].tokens
+        ):
+            waiter = self._queue.pop(0)
+            queue_wait = time.perf_counter() - waiter.enqueue_time
+            ticket = self._admit(
+                waiter.sequences, waiter.tokens, Priority(waiter.priority), queue_wait
+            )
+            self._wake(waiter, ticket)
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        with self._lock:
+            if ticket._released:
+                return
+            ticket._released = True
+            self._inflight_sequences -= ticket.sequences
+            self._inflight_tokens -= ticket.tokens
+
+            duration = (time.perf_counter() - ticket._admit_time) / ticket.sequences
+            self._avg_duration += _DURATION_SMOOTHING * (duration - self._avg_duration)
+            self._admit_waiting()
+            callbacks = list(self._release_callbacks)
+        for callback in callbacks:
+            callback()
+        self._notify_idle()
+
+    def _notify_idle(self) -> None:
+        """Run the idle callbacks once nothing is in flight, queued or reserved."""
+        with self._lock:
+            if self._is_busy() or not self._idle_callbacks:
+                return
+            callbacks, self._idle_callbacks = self._idle_callbacks, []
+
+        def run() -> None:
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Idle callback of {self.name} failed: {e}")
+
+        threading.Thread(
+            target=run, name=f"admission-idle-{self.name}", daemon=True
+        ).start()
+
+    def _retry_after(self) -> int:
+        """Estimate in seconds until a queue slot frees up (lock held)."""
+        backlog = sum(w.sequences for w in self._queue) + self._inflight_sequences
+        return max(
+            1,
+            math.ceil(self._avg_duration * backlog / self.max_inflight_sequences),
+        )
+
+    @staticmethod
+    def _wake(waiter: _Waiter, result: Any) -> None:
+        """Resolve a waiter's future on its event loop."""
+        waiter.loop.call_soon_threadsafe(_resolve_future, waiter, result)
+
+
+def _resolve_future(waiter: _Waiter, result: Any) -> None:
+    if waiter.future.done():
+        # The waiter gave up in the meantime, hand back an admission
+        if isinstance(result, AdmissionTicket):
+            result.release()
+        return
+    if isinstance(result, BaseException):
+        waiter.future.set_exception(result)
+    else:
+        waiter.future.set_result(result)
+
+
+def _cancel_future(future: asyncio.Future) -> None:
+    if not future.done():
+        future.cancel()
@@ -0,0 +1,184 @@
+"""Prompt Cache Budget - bounds the memory held by prompt caches of all models.
+
+Prompt cache slots and radix trees are sized in tokens per model, so a few
+long sessions on large models can grow the KV state beyond the memory of the
+machine. Every cached KV state reports its size in bytes, and a global budget
+evicts the least valuable entries of all models until the caches fit again.
+
+An entry's value is its prefix length times its recency: long prefixes used a
+moment ago are kept, short or long forgotten ones go first. Leased slots and
+referenced or pinned radix tree blocks are never evicted. After evicting,
+``mx.clear_cache()`` returns the freed buffers to the system.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import mlx.core as mx
+from mlx.utils import tree_flatten
+
+from ...utils.logger import logger
+
+
+def nbytes(tree: Any) -> int:
+    """Bytes of the arrays in a nested structure of lists, tuples and dicts."""
+    return sum(a.nbytes for _, a in tree_flatten(tree) if isinstance(a, mx.array))
+
+
+def cache_nbytes(cache: List[Any]) -> int:
+    """Bytes allocated by the layers of a prompt cache, including headroom."""
+    total = 0
+    for layer_cache in cache:
+        total += nbytes(
+            [
+                getattr(layer_cache, "keys", None),
+                getattr(layer_cache, "values", None),
+                getattr(layer_cache, "cache", None),  # State space layers
+            ]
+        )
+    return total
+
+
+@dataclass
+class EvictionCandidate:
+    """A cached KV state the budget may evict.
+
+    Attributes:
+        tokens: Length of the prefix the entry serves
+        last_used: ``time.monotonic()`` of its last use
+        evict: Drops the entry, returns the bytes freed (0 if it is in use again)
+    """
+
+    tokens: int
+    last_used: float
+    evict: Callable[[], int]
+
+    def value(self, now: float) -> float:
+        """Prefix length times recency, the least valuable entry goes first."""
+        return self.tokens / (1.0 + max(now - self.last_used, 0.0))
+
+
+class PromptCacheBudget:
+    """Memory budget shared by the prompt cache pools of all models.
+
+    Pools register themselves and call ``enforce`` whenever their caches grew.
+
+    Examples:
+        budget = PromptCacheBudget(max_bytes=32 * 1024**3)
+        pool = PromptCachePool(budget=budget)
+        ...
+        budget.get_stats()["used_bytes"]
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        """Initialize budget.
+
+        Args:
+            max_bytes: Maximum bytes held by all prompt caches (0 = unlimited)
+        """
+        self.max_bytes = max(max_bytes, 0)
+        self._lock = threading.Lock()
+        self._enforce_lock = threading.Lock()
+        self._pools: List[Any] = []
+
+        # Statistics
+        self._evictions = 0
+        self._evicted_bytes = 0
+
+    def register(self, pool: Any) -> None:
+        """Account for a pool, which provides ``nbytes`` and ``eviction_candidates``."""
+        with self._lock:
+            if not any(p is pool for p in self._pools):
+                self._pools.append(pool)
+
+    def unregister(self, pool: Any) -> None:
+        with self._lock:
+            self._pools = [p for p in self._pools if p is not pool]
+
+    @property
+    def used_bytes(self) -> int:
+        """Bytes currently held by the registered pools."""
+        with self._lock:
+            pools = list(self._pools)
+        return sum(pool.nbytes for pool in pools)
+
+    def enforce(self) -> int:
+        """Evict the least valuable entries until the caches fit the budget.
+
+        Returns:
+            Number of bytes freed
+        """
+        if self.max_bytes <= 0:
+            return 0
+
+        freed = 0
+        with self._enforce_lock:
+            excess = self.used_bytes - self.max_bytes
+            while excess > 0:
+                # Evicting leaves exposes their parents, so collect in rounds
+                with self._lock:
+                    pools = list(self._pools)
+                now = time.monotonic()
+                candidates = [c for pool in pools for c in pool.eviction_candidates()]
+                candidates.sort(key=lambda c: c.value(now))
+
+                round_freed = 0
+                for candidate in candidates:
+                    if excess <= 0:
+                        break
+                    size = candidate.evict()
+                    if size > 0:
+                        round_freed += size
+                        excess -= size
+                        with self._lock:
+                            self._evictions += 1
+                            self._evicted_bytes += size
+                freed += round_freed
+                if round_freed == 0:
+                    break  # Everything left is in use
+
+        if freed > 0:
+            mx.clear_cache()
+            logger.debug(f"Evicted {freed} bytes of prompt caches to fit the budget")
+        return freed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get budget statistics.
+
+        Returns:
+            Dictionary with the budget, the bytes held by all prompt caches and
+            the evictions made to fit the budget
+        """
+        used_bytes = self.used_bytes
+        with self._lock:
+            return {
+                "max_bytes": self.max_bytes,
+                "used_bytes": used_bytes,
+                "models": len(self._pools),
+                "evictions": self._evictions,
+                "evicted_bytes": self._evicted_bytes,
+            }
+
+
+_shared_budget: Optional[PromptCacheBudget] = None
+_shared_lock = threading.Lock()
+
+
+def shared_prompt_cache_budget() -> PromptCacheBudget:
+    """Get the budget of all prompt cache pools.
+
+    ``MLX_OMNI_PROMPT_CACHE_GB`` sets its size, 0 or unset leaves the caches
+    unbounded but still accounted.
+    """
+    global _shared_budget
+    with _shared_lock:
+        if _shared_budget is None:
+            try:
+                max_gb = float(os.environ.get("MLX_OMNI_PROMPT_CACHE_GB", 0))
+            except ValueError:
+                max_gb = 0.0
+            _shared_budget = PromptCacheBudget(int(max_gb * 1024**3))
+        return _shared_budget
@@ -0,0 +1,89 @@
+"""Cancellation - stop generation for requests nobody is waiting for anymore.
+
+A ``CancellationToken`` is created per request by the API layer and passed down to
+``ChatGenerator``. When the client disconnects, the token is cancelled and the
+scheduler stops decoding the request's sequence at its next step.
+"""
+
+import asyncio
+import threading
+from typing import Any, Callable, List
+
+from ...utils.logger import logger
+
+# How often the client connection is checked while a request is running (seconds)
+DEFAULT_DISCONNECT_POLL_INTERVAL = 0.1
+
+
+class CancellationToken:
+    """Thread-safe, one-shot cancellation flag with callbacks.
+
+    Examples:
+        token = CancellationToken()
+        token.add_callback(handle.cancel)
+        ...
+        token.cancel()  # Runs handle.cancel() once
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks: List[Callable[[], Any]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """Cancel the token and run all registered callbacks (once)."""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+
+    def add_callback(self, callback: Callable[[], Any]) -> None:
+        """Register a callback to run on cancellation.
+
+        The callback runs immediately if the token is already cancelled.
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], Any]) -> None:
+        """Unregister a callback that is no longer needed."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+async def cancel_on_disconnect(
+    request: Any,
+    token: CancellationToken,
+    poll_interval: float = DEFAULT_DISCONNECT_POLL_INTERVAL,
+) -> None:
+    """Cancel ``token`` once the client of ``request`` has disconnected.
+
+    Meant to run as a background task next to the request's generation and to
+    be cancelled when the response is done.
+
+    Args:
+        request: Starlette/FastAPI request providing ``is_disconnected()``
+        token: Token to cancel on disconnect
+        poll_interval: Seconds between connection checks
+    """
+    while not token.cancelled:
+        if await request.is_disconnected():
+            logger.info("Client disconnected, cancelling generation")
+            token.cancel()
+            return
+        await asyncio.sleep(poll_interval)
@@ -1,13 +1,34 @@
 """Chat Generator - Core abstraction layer over mlx-lm for chat completions."""
 
+import os
 import time
-from typing import Any, Callable, Dict, Generator, List, Optional, Union
+from array import array
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from mlx_lm.generate import stream_generate
+from mlx_lm.models.cache import make_prompt_cache
 from mlx_lm.sample_utils import make_sampler
 
 from ...utils.logger import logger
+from .admission import (
+    DEFAULT_MAX_INFLIGHT_SEQUENCES,
+    DEFAULT_MAX_INFLIGHT_TOKENS,
+    DEFAULT_MAX_QUEUE_DEPTH,
+    AdmissionController,
+)
+from .cancellation import CancellationToken
 from .core_types import (
+    CacheBreakpoint,
     CompletionContent,
     CompletionResult,
     GenerationResult,
@@ -15,12 +36,45 @@ from .core_types import (
     StreamContent,
     StreamResult,
 )
+from .generation_context import GenerationContext
+from .generation_executor import GenerationExecutor
 from .logprobs_processor import LogprobsProcessor
+from .model_registry import ModelProfile, shared_model_registry
 from .model_types import MLXModel
+from .prompt_lookup import DEFAULT_NUM_DRAFT_TOKENS
+from .radix_cache import KVFormat
+from .rotating_cache import (
+    DEFAULT_KV_SINK_TOKENS,
+    KVWindow,
+    make_window_cache,
+    supports_window,
+)
+from .scheduler import (
+    DEFAULT_PREFILL_CHUNK_SIZE,
+    GenerationScheduler,
+    SequenceHandle,
+    TokenResponse,
+)
+from .stop_matcher import StopSequenceMatcher
+
+if TYPE_CHECKING:
+    from .prompt_cache import PinnedPrefix
 
 # Default generation parameters
 DEFAULT_MAX_TOKENS = 4096
 
+# KV cache quantization parameters, set per model or per request
+KV_QUANTIZATION_PARAMS = ("kv_bits", "kv_group_size", "quantized_kv_start")
+DEFAULT_KV_BITS = 8
+DEFAULT_KV_GROUP_SIZE = 64
+DEFAULT_QUANTIZED_KV_START = 5000
+_SUPPORTED_KV_BITS = (2, 3, 4, 5, 6, 8)
+_SUPPORTED_KV_GROUP_SIZES = (32, 64, 128)
+
+# Rotating KV cache parameters, set per model or per request
+KV_WINDOW_PARAMS = ("max_kv_size", "kv_sink_tokens")
+DEFAULT_MAX_KV_SIZE = 4096
+
 
 class ChatGenerator:
     """Core chat generator with unified interface for MLX-based text generation.
@@ -39,8 +93,64 @@ class ChatGenerator:
         self.model = model
         self.tokenizer = model.tokenizer
         self.chat_template = model.chat_template
-        self._prompt_cache = None
+        self._prompt_cache_pool = None
+        self._supports_kv_quantization: Optional[bool] = None
+        self._supports_kv_window: Optional[bool] = None
         self._logprobs_processor = None
+        # Defaults of the model in the server's model registry, if any
+        self.profile = shared_model_registry().profile_for(
+            model.model_id, model.adapter_path, model.draft_model_id
+        )
+        self.scheduler = GenerationScheduler(
+            model,
+            prefill_chunk_size=_env_int(
+                "MLX_OMNI_PREFILL_CHUNK_SIZE", DEFAULT_PREFILL_CHUNK_SIZE
+            ),
+        )
+        # Bounds the requests in flight, API routers acquire before generating
+        self.admission = AdmissionController(
+            name=model.model_id,
+            max_inflight_sequences=_model_int(
+                self.profile,
+                "max_inflight_sequences",
+                "MLX_OMNI_MAX_INFLIGHT_SEQUENCES",
+                DEFAULT_MAX_INFLIGHT_SEQUENCES,
+            ),
+            max_queue_depth=_model_int(
+                self.profile,
+                "max_queue_depth",
+                "MLX_OMNI_MAX_QUEUE_DEPTH",
+                DEFAULT_MAX_QUEUE_DEPTH,
+            ),
+            max_inflight_tokens=_model_int(
+                self.profile,
+                "max_inflight_tokens",
+                "MLX_OMNI_MAX_INFLIGHT_TOKENS",
+                DEFAULT_MAX_INFLIGHT_TOKENS,
+            ),
+        )
+        # One worker per admitted sequence, so admitted requests reach the scheduler
+        self.executor = GenerationExecutor(
+            name=model.model_id,
+            max_workers=max(
+                self.scheduler.max_batch_size,
+                self.admission.max_inflight_sequences,
+            ),
+        )
+        # Draft tokens per step of prompt lookup decoding, unless a request
+        # overrides it (0 = disabled)
+        self.prompt_lookup_num_tokens = _default_prompt_lookup_num_tokens(
+            model.model_id, self.profile
+        )
+        # Maximum draft tokens per step of the draft model, None for the
+        # scheduler's default
+        self.num_draft_tokens = getattr(self.profile, "num_draft_tokens", None)
+        # KV cache quantization of requests that don't set it, empty for
+        # full precision
+        self.kv_quantization = _default_kv_quantization(model.model_id, self.profile)
+        # Rotating KV window of requests that don't set it, empty for an
+        # unbounded KV cache
+        self.kv_window = _default_kv_window(model.model_id, self.profile)
 
     @classmethod
     def create(
@@ -92,6 +202,7 @@ class ChatGenerator:
         model_id: str,
         adapter_path: Optional[str] = None,
         draft_model_id: Optional[str] = None,
+        reserve: bool = False,
     ) -> "ChatGenerator":
         """Get or create cached ChatGenerator instance.
 
@@ -103,6 +214,7 @@ class ChatGenerator:
             model_id: Model name/path (HuggingFace model ID or local path)
             adapter_path: Optional path to LoRA adapter
             draft_model_id: Optional draft model name/path for speculative decoding
+            reserve: Reserve an admission, see ``MLXWrapperCache.get_wrapper``
 
         Returns:
             Cached or newly created ChatGenerator instance
@@ -134,16 +246,37 @@ class ChatGenerator:
             model_id=model_id,
             adapter_path=adapter_path,
             draft_model_id=draft_model_id,
+            reserve=reserve,
         )
 
     @property
-    def prompt_cache(self):
-        """Lazy initialization of prompt cache."""
-        if self._prompt_cache is None:
-            from .prompt_cache import PromptCache
-
-            self._prompt_cache = PromptCache()
-        return self._prompt_cache
+    def prompt_cache_pool(self):
+        """Lazy initialization of prompt cache pool."""
+        if self._prompt_cache_pool is None:
+            from .cache_budget import shared_prompt_cache_budget
+            from .disk_cache import shared_disk_prompt_cache
+            from .prompt_cache import (
+                DEFAULT_PROMPT_CACHE_SLOTS,
+                DEFAULT_SESSION_TTL,
+                PromptCachePool,
+            )
+            from .radix_cache import DEFAULT_PREFIX_CACHE_TOKENS
+
+            self._prompt_cache_pool = PromptCachePool(
+                num_slots=_model_int(
+                    self.profile,
+                    "prompt_cache_slots",
+                    "MLX_OMNI_PROMPT_CACHE_SLOTS",
+                    DEFAULT_PROMPT_CACHE_SLOTS,
+                ),
+                prefix_cache_tokens=_env_int(
+                    "MLX_OMNI_PREFIX_CACHE_TOKENS", DEFAULT_PREFIX_CACHE_TOKENS
+                ),
+                disk_cache=shared_disk_prompt_cache(),
+                budget=shared_prompt_cache_budget(),
+                session_ttl=_env_int("MLX_OMNI_SESSION_TTL", DEFAULT_SESSION_TTL),
+            )
+        return self._prompt_cache_pool
 
     @property
     def logprobs_processor(self):
@@ -152,16 +285,196 @@ class ChatGenerator:
             self._logprobs_processor = LogprobsProcessor(self.tokenizer)
         return self._logprobs_processor
 
+    def close(self) -> None:
+        """Release background resources held by this generator.
+
+        Requests in flight or queued finish first, the resources are released
+        once the last one is done. The prompt cache slots are persisted if a
+        disk cache is configured.
+        """
+        self.admission.add_idle_callback(self._release_resources)
+
+    def _release_resources(self) -> None:
+        self.scheduler.shutdown(drain=True)
+        self.executor.shutdown(wait=False)
+        if self._prompt_cache_pool is not None:
+            self._prompt_cache_pool.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get generation statistics of this generator.
+
+        Returns:
+            Dictionary with scheduler statistics (active, completed and aborted
+            sequences, tokens saved by aborting), admission statistics
+            (in-flight and queued requests, queue wait times) and prompt cache
+            statistics (slots, hit rates) once the prompt cache is created
+        """
+        stats = self.scheduler.get_stats()
+        stats["admission"] = self.admission.get_stats()
+        prompt_cache = self.get_prompt_cache_stats()
+        if prompt_cache is not None:
+            stats["prompt_cache"] = prompt_cache
+        return stats
+
+    def get_prompt_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Get prompt cache statistics without creating the prompt cache.
+
+        Returns:
+            Statistics of the prompt cache pool, or None if no request has
+            used it yet
+        """
+        if self._prompt_cache_pool is None:
+            return None
+        return self._prompt_cache_pool.get_stats()
+
+    @property
+    def supports_kv_quantization(self) -> bool:
+        """Whether every KV cache layer of the model can be quantized.
+
+        Sliding window layers (``RotatingKVCache``) cannot.
+        """
+        if self._supports_kv_quantization is None:
+            models = [self.model.model, self.model.draft_model]
+            try:
+                for model in [m for m in models if m is not None]:
+                    for layer_cache in make_prompt_cache(model):
+                        if hasattr(layer_cache, "to_quantized"):
+                            layer_cache.to_quantized()
+                self._supports_kv_quantization = True
+            except NotImplementedError:
+                self._supports_kv_quantization = False
+        return self._supports_kv_quantization
+
+    @property
+    def supports_kv_window(self) -> bool:
+        """Whether the model's KV cache can be a rotating window.
+
+        Models with sliding window or state space layers and speculative
+        decoding with a draft model keep their own cache.
+        """
+        if self._supports_kv_window is None:
+            self._supports_kv_window = (
+                supports_window(self.model.model) and not self.has_draft_model()
+            )
+        return self._supports_kv_window
+
+    @property
+    def weight_bytes(self) -> int:
+        """Bytes of the model weights held by this generator, draft model included."""
+        return self.model.nbytes
+
     def has_draft_model(self) -> bool:
         """Check if this wrapper has a draft model for speculative decoding."""
         return self.model.has_draft_model()
 
+    def has_pinned_prefixes(self) -> bool:
+        """Check if this wrapper holds pinned prompt prefixes."""
+        return (
+            self._prompt_cache_pool is not None
+            and len(self._prompt_cache_pool.list_pins()) > 0
+        )
+
+    def warm_prompt_cache(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        template_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> Tuple["PinnedPrefix", int]:
+        """Prefill the KV cache for a prompt and pin it.
+
+        The prompt is rendered like a chat request, so later requests sharing
+        its system prompt and tools reuse the pinned blocks.
+
+        Args:
+            messages: Chat messages in standard format (dictionaries)
+            tools: Optional tools for function calling
+            template_kwargs: Template parameters for chat tokenizer
+
+        Returns:
+            Tuple of (pinned prefix, number of tokens that were already cached)
+
+        Raises:
+            RuntimeError: If every prompt cache slot is in use
+            ValueError: If the prompt cannot be pinned
+        """
+        context = GenerationContext()
+        prompt = self._prepare_prompt(messages, tools, template_kwargs, None, context)
+        tokenized_prompt = self.tokenizer.encode(prompt)
+        kv_kwargs: Dict[str, Any] = {}
+        # Rotating windows are not shared, their requests seed from full
+        # precision blocks
+        window = self._resolve_kv_window(kv_kwargs)
+        kv_format = self._resolve_kv_quantization(kv_kwargs, window is None)
+
+        processed_prompt = self._lease_prompt_cache(
+            context, tokenized_prompt, kv_format
+        )
+        if context.prompt_cache is None:
+            raise RuntimeError("All prompt cache slots are in use")
+        cached_tokens = context.cached_tokens
+
+        handle = None
+        sampled_tokens = []
+        failed = False
+        try:
+            # Generating a single token runs the prefill through the scheduler
+            handle = self.scheduler.submit(
+                processed_prompt,
+                prompt_cache=context.prompt_cache.cache,
+                max_tokens=1,
+                **kv_kwargs,
+            )
+            sampled_tokens = [r.token for r in handle if r.token >= 0]
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._release_prompt_cache(
+                context,
+                sampled_tokens,
+                handle.cache_length if handle is not None else None,
+                failed,
+            )
+
+        pinned = self.prompt_cache_pool.pin(tokenized_prompt, kv_format)
+        return pinned, cached_tokens
+
+    def warm_up(self, max_tokens: int = 2) -> CompletionResult:
+        """Run a short dummy chat request through the generation path.
+
+        Renders the chat template, prefills and decodes a few tokens, so the
+        first real request does not pay template and kernel compilation.
+        Nothing is kept in the prompt caches.
+        """
+        return self.generate(
+            [{"role": "user", "content": "Hello"}],
+            max_tokens=max_tokens,
+            enable_prompt_cache=False,
+        )
+
+    def list_pinned_prefixes(self) -> List["PinnedPrefix"]:
+        """Get the pinned prompt prefixes of this wrapper."""
+        if self._prompt_cache_pool is None:
+            return []
+        return self._prompt_cache_pool.list_pins()
+
+    def unpin_prefix(self, pin_id: str) -> bool:
+        """Make a pinned prompt prefix evictable again.
+
+        Returns:
+            Whether the pin existed
+        """
+        if self._prompt_cache_pool is None:
+            return False
+        return self._prompt_cache_pool.unpin(pin_id)
+
     def _prepare_prompt(
         self,
         messages: List[Dict[str, Any]],
         tools: Optional[List[Dict[str, Any]]] = None,
         template_kwargs: Optional[Dict[str, Any]] = None,
         json_schema: Optional[Any] = None,
+        context: Optional[GenerationContext] = None,
     ) -> str:
         """Prepare prompt using chat tokenizer.
 
@@ -170,13 +483,13 @@ class ChatGenerator:
             tools: Optional tools for function calling
             template_kwargs: Template parameters for chat tokenizer
             json_schema: JSON schema for structured output (used to detect thinking+schema combination)
+            context: Request context receiving the template's thinking and tools flags
 
         Returns:
             Encoded prompt string
         """
-        # Use template_kwargs directly, default to empty dict
-        if template_kwargs is None:
-            template_kwargs = {}
+        # Copy template_kwargs, the caller's dict is left untouched
+        template_kwargs = dict(template_kwargs or {})
 
         # Check if we have thinking + json_schema combination
         # If so, let OutlinesLogitsProcessor handle the <think> tags completely
@@ -193,6 +506,7 @@ class ChatGenerator:
         prompt = self.chat_template.apply_chat_template(
             messages=messages,
             tools=tools,
+            context=context,
             **template_kwargs,
         )
 
@@ -203,6 +517,7 @@ class ChatGenerator:
         self,
         sampler: Union[Dict[str, Any], Callable, None] = None,
         max_tokens: int = DEFAULT_MAX_TOKENS,
+        context: Optional[GenerationContext] = None,
         **kwargs,
     ) -> Dict[str, Any]:
         """Convert parameters to mlx-lm compatible kwargs.
@@ -213,6 +528,7 @@ class ChatGenerator:
                 - Callable: Pre-built sampler function
                 - None: Let mlx-lm use its default sampler
             max_tokens: Maximum tokens to generate
+            context: Request context with the chat template flags
             **kwargs: Additional MLX generation parameters
 
         Returns:
@@ -255,7 +571,7 @@ class ChatGenerator:
             from .outlines_logits_processor import OutlinesLogitsProcessor
 
             # Check if we need thinking support
-            enable_thinking = self.chat_template.enable_thinking_parse
+            enable_thinking = context.enable_thinking_parse if context else None
             logits_processors.append(
                 OutlinesLogitsProcessor(
                     self.tokenizer, json_schema, enable_thinking=enable_thinking
@@ -291,6 +607,8 @@ class ChatGenerator:
         template_kwargs: Optional[Dict[str, Any]] = None,
         # Control parameters
         enable_prompt_cache: bool = False,
+        cancellation_token: Optional[CancellationToken] = None,
+        stop_sequences: Optional[List[str]] = None,
         # Additional MLX generation parameters via **kwargs
         **kwargs,
     ) -> CompletionResult:
@@ -307,22 +625,74 @@ class ChatGenerator:
             top_logprobs: Number of top logprobs to include (None to disable)
             template_kwargs: Template parameters for chat tokenizer (enable_thinking, thinking_budget, etc.)
             enable_prompt_cache: Enable prompt caching
-            **kwargs: Additional MLX generation parameters (max_kv_size, kv_bits, repetition_penalty, etc.)
+            cancellation_token: Token to stop generation early (e.g. on client disconnect)
+            stop_sequences: Strings that end generation when they appear in the output.
+                            They are not included in the returned text.
+            **kwargs: Additional MLX generation parameters (max_kv_size, kv_bits, repetition_penalty, etc.).
+                      ``prompt_lookup_num_tokens`` selects prompt lookup decoding
+                      (0 disables it), overriding the model's default.
+                      ``session_id`` keeps a prompt cache slot for the client
+                      session across its requests. ``cache_breakpoints`` is a
+                      list of ``CacheBreakpoint`` prefixes kept cached for
+                      their time to live.
 
         Returns:
             Complete generation result
         """
+        return self.generate_choices(
+            messages,
+            tools,
+            max_tokens,
+            sampler,
+            top_logprobs,
+            template_kwargs,
+            enable_prompt_cache,
+            cancellation_token,
+            n=1,
+            stop_sequences=stop_sequences,
+            **kwargs,
+        )[0]
+
+    def generate_choices(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        # Core generation parameters
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        sampler: Union[Dict[str, Any], Callable, None] = None,
+        top_logprobs: Optional[int] = None,
+        # Template parameters
+        template_kwargs: Optional[Dict[str, Any]] = None,
+        # Control parameters
+        enable_prompt_cache: bool = False,
+        cancellation_token: Optional[CancellationToken] = None,
+        n: int = 1,
+        stop_sequences: Optional[List[str]] = None,
+        # Additional MLX generation parameters via **kwargs
+        **kwargs,
+    ) -> List[CompletionResult]:
+        """Generate ``n`` complete responses for the same prompt.
+
+        The prompt is processed once and the continuations are decoded together.
+        Arguments are the same as for ``generate``.
+
+        Args:
+            n: Number of responses to generate
+
+        Returns:
+            Complete generation results, ordered by choice index
+        """
         try:
-            # Generate complete response by collecting stream.
-            # stream_generate handles the preparation of configurations.
-            complete_raw_text = ""
-            complete_thinking = ""
-            complete_content = ""
-            final_stream_result = None
-            all_text_tokens = []
-            all_reasoning_tokens = []
-
-            for stream_result in self.generate_stream(
+            # Generate complete responses by collecting the stream per choice
+            complete_raw_text = [""] * n
+            complete_thinking = [""] * n
+            complete_content = [""] * n
+            final_stream_results = [None] * n
+            all_text_tokens = [[] for _ in range(n)]
+            all_reasoning_tokens = [[] for _ in range(n)]
+            contexts = [None] * n
+
+            for stream_result, context in self._generate_stream(
                 messages,
                 tools,
                 max_tokens,
@@ -330,48 +700,66 @@ class ChatGenerator:
                 top_logprobs,
                 template_kwargs,
                 enable_prompt_cache,
+                cancellation_token,
+                n,
+                stop_sequences,
                 **kwargs,
             ):
+                i = stream_result.index
+                contexts[i] = context
+
                 # Collect deltas to reconstruct complete content
                 if stream_result.content.reasoning_delta:
-                    complete_thinking += stream_result.content.reasoning_delta
-                    complete_raw_text += stream_result.content.reasoning_delta
-                    all_reasoning_tokens.append(stream_result.content.token)
+                    complete_thinking[i] += stream_result.content.reasoning_delta
+                    complete_raw_text[i] += stream_result.content.reasoning_delta
+                    all_reasoning_tokens[i].append(stream_result.content.token)
                 if stream_result.content.text_delta:
-                    complete_content += stream_result.content.text_delta
-                    complete_raw_text += stream_result.content.text_delta
-                    all_text_tokens.append(stream_result.content.token)
-
-                final_stream_result = stream_result
-
-            if final_stream_result is None:
-                raise RuntimeError("No tokens generated")
-
-            logger.info(f"Model Response:\nThinking: {complete_thinking}\nContent: {complete_content}")
-            chat_result = self.chat_template.parse_chat_response(complete_raw_text)
-
-            # Determine appropriate finish_reason
-            finish_reason = final_stream_result.finish_reason
-            if chat_result.tool_calls:
-                finish_reason = "tools"
-
-            # Create CompletionContent with complete data
-            content = CompletionContent(
-                text=complete_content,
-                reasoning=complete_thinking,
-                tool_calls=chat_result.tool_calls,
-                text_tokens=all_text_tokens,
-                reasoning_tokens=all_reasoning_tokens if all_reasoning_tokens else None,
-            )
+                    complete_content[i] += stream_result.content.text_delta
+                    complete_raw_text[i] += stream_result.content.text_delta
+                    all_text_tokens[i].append(stream_result.content.token)
 
-            # Return final result with all processing applied
-            return GenerationResult(
-                content=content,
-                finish_reason=finish_reason,
-                stats=final_stream_result.stats,
-                logprobs=final_stream_result.logprobs,
-                from_draft=final_stream_result.from_draft,
-            )
+                final_stream_results[i] = stream_result
+
+            results = []
+            for i, final_stream_result in enumerate(final_stream_results):
+                if final_stream_result is None:
+                    raise RuntimeError("No tokens generated")
+
+                logger.info(
+                    f"Model Response:\nThinking: {complete_thinking[i]}\nContent: {complete_content[i]}"
+                )
+                chat_result = self.chat_template.parse_chat_response(
+                    complete_raw_text[i], contexts[i]
+                )
+
+                # Determine appropriate finish_reason
+                finish_reason = final_stream_result.finish_reason
+                if chat_result.tool_calls:
+                    finish_reason = "tools"
+
+                # Create CompletionContent with complete data
+                content = CompletionContent(
+                    text=complete_content[i],
+                    reasoning=complete_thinking[i],
+                    tool_calls=chat_result.tool_calls,
+                    text_tokens=all_text_tokens[i],
+                    reasoning_tokens=all_reasoning_tokens[i] or None,
+                )
+
+                # Final result with all processing applied
+                results.append(
+                    GenerationResult(
+                        content=content,
+                        finish_reason=finish_reason,
+                        stats=final_stream_result.stats,
+                        logprobs=final_stream_result.logprobs,
+                        from_draft=final_stream_result.from_draft,
+                        index=i,
+                        stop_sequence=final_stream_result.stop_sequence,
+                    )
+                )
+
+            return results
 
         except Exception as e:
             logger.error(f"Error during generation: {e}")
@@ -389,6 +777,9 @@ class ChatGenerator:
         template_kwargs: Optional[Dict[str, Any]] = None,
         # Control parameters
         enable_prompt_cache: bool = False,
+        cancellation_token: Optional[CancellationToken] = None,
+        n: int = 1,
+        stop_sequences: Optional[List[str]] = None,
         # Additional MLX generation parameters via **kwargs
         **kwargs,
     ) -> Generator[StreamResult, None, None]:
@@ -405,116 +796,614 @@ class ChatGenerator:
             top_logprobs: Number of top logprobs to include (None to disable)
             template_kwargs: Template parameters for chat tokenizer (enable_thinking, thinking_budget, etc.)
             enable_prompt_cache: Enable prompt caching
+            cancellation_token: Token to stop generation early (e.g. on client disconnect)
+            stop_sequences: Strings that end generation when they appear in the output.
+                            They are not included in the returned text.
+            n: Number of responses to generate from one prompt prefill. Results of
+               different choices are interleaved and tagged with their index.
             **kwargs: Additional MLX generation parameters (max_kv_size, kv_bits, repetition_penalty, etc.)
 
         Yields:
-            Streaming generation results
+            Streaming generation results. The last result of each choice carries
+            the finish_reason.
+        """
+        for result, _ in self._generate_stream(
+            messages,
+            tools,
+            max_tokens,
+            sampler,
+            top_logprobs,
+            template_kwargs,
+            enable_prompt_cache,
+            cancellation_token,
+            n,
+            stop_sequences,
+            **kwargs,
+        ):
+            yield result
+
+    def _generate_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        sampler: Union[Dict[str, Any], Callable, None] = None,
+        top_logprobs: Optional[int] = None,
+        template_kwargs: Optional[Dict[str, Any]] = None,
+        enable_prompt_cache: bool = False,
+        cancellation_token: Optional[CancellationToken] = None,
+        n: int = 1,
+        stop_sequences: Optional[List[str]] = None,
+        **kwargs,
+    ) -> Generator[Tuple[StreamResult, Any], None, None]:
+        """Generate streaming response through the batching scheduler.
+
+        Yields:
+            Tuples of (streaming result, generation context of its choice)
         """
         # Record start time for first token latency measurement
         request_start_time = time.perf_counter()
-        first_token_time = None
+        context = GenerationContext()
+        choices: List[_ChoiceState] = []
+        checkpoints: List[Tuple[int, float]] = []
+        generation_failed = False
 
         try:
-
             # Extract json_schema from kwargs for coordination with chat_template
             json_schema = kwargs.get("json_schema")
 
-            # Prepare prompt
-            prompt = self._prepare_prompt(messages, tools, template_kwargs, json_schema)
-
-            # Tokenize prompt
+            # Prepare and tokenize prompt
+            prompt = self._prepare_prompt(
+                messages, tools, template_kwargs, json_schema, context
+            )
             tokenized_prompt = self.tokenizer.encode(prompt)
+            window = self._resolve_kv_window(kwargs)
+            kv_format = self._resolve_kv_quantization(kwargs, window is None)
+            session_id = kwargs.pop("session_id", None)
+            breakpoints = kwargs.pop("cache_breakpoints", None)
 
             # Process cache if enabled
             processed_prompt = tokenized_prompt
-            cached_tokens = 0
-
             if enable_prompt_cache:
-                processed_prompt, cached_tokens = self.prompt_cache.get_prompt_cache(
-                    self.model, tokenized_prompt
+                processed_prompt = self._lease_prompt_cache(
+                    context, tokenized_prompt, kv_format, window, session_id
                 )
+                # Rotating windows are not shared, their prefixes cannot be kept
+                if breakpoints and window is None:
+                    checkpoints = self._breakpoint_offsets(
+                        breakpoints, tokenized_prompt, tools, template_kwargs
+                    )
+                    context.cache_write_tokens = max(
+                        max((offset for offset, _ in checkpoints), default=0)
+                        - context.cached_tokens,
+                        0,
+                    )
+            prompt_cache = context.prompt_cache.cache if context.prompt_cache else None
+            if prompt_cache is None and window is not None:
+                prompt_cache = make_window_cache(self.model.model, window)
+
+            # Prompt lookup decoding verifies drafts position by position, which
+            # stateful JSON schema processors cannot follow
+            num_lookup_tokens = kwargs.pop("prompt_lookup_num_tokens", None)
+            if num_lookup_tokens is None:
+                num_lookup_tokens = self.prompt_lookup_num_tokens
+            if (
+                num_lookup_tokens > 0
+                and json_schema is None
+                and not self.has_draft_model()
+            ):
+                kwargs["prompt_lookup_num_tokens"] = num_lookup_tokens
+            if self.num_draft_tokens is not None and self.has_draft_model():
+                kwargs.setdefault("num_draft_tokens", self.num_draft_tokens)
+
+            # Create MLX kwargs. Logits processors can be stateful (e.g. JSON
+            # schema), so every choice gets its own.
+            choice_kwargs = [
+                self._create_mlx_kwargs(
+                    sampler=sampler,
+                    max_tokens=max_tokens,
+                    context=context,
+                    **kwargs,
+                )
+                for _ in range(n)
+            ]
+            logits_processors = [k.pop("logits_processors", []) for k in choice_kwargs]
+
+            handles = self.scheduler.submit_parallel(
+                processed_prompt,
+                n,
+                prompt_cache=prompt_cache,
+                logits_processors=logits_processors,
+                context_tokens=tokenized_prompt[
+                    : len(tokenized_prompt) - len(processed_prompt)
+                ],
+                on_prefilled=(
+                    context.prompt_cache.checkpoint_window
+                    if context.prompt_cache and window is not None
+                    else None
+                ),
+                **choice_kwargs[0],
+            )
+            choices = [
+                _ChoiceState(
+                    index=i,
+                    handle=handle,
+                    context=context.fork(),
+                    detokenizer=self.tokenizer.detokenizer,
+                    stop_matcher=(
+                        StopSequenceMatcher(stop_sequences) if stop_sequences else None
+                    ),
+                )
+                for i, handle in enumerate(handles)
+            ]
+            if cancellation_token is not None:
+                for choice in choices:
+                    cancellation_token.add_callback(choice.handle.cancel)
+
+            # Stream generation, one token per unfinished choice in turn
+            active = list(choices)
+            while active:
+                for choice in list(active):
+                    result = self._make_stream_result(
+                        choice,
+                        next(choice.responses),
+                        top_logprobs,
+                        context.cached_tokens,
+                        context.cache_write_tokens,
+                        request_start_time,
+                    )
+                    if result.finish_reason is not None:
+                        active.remove(choice)
+                    yield result, choice.context
 
-            # Create MLX kwargs
-            mlx_kwargs = self._create_mlx_kwargs(
-                sampler=sampler,
-                max_tokens=max_tokens,
-                **kwargs,
+        except Exception as e:
+            generation_failed = True
+            logger.error(f"Error during stream generation: {e}")
+            raise RuntimeError(f"Stream generation failed: {e}")
+
+        finally:
+            if cancellation_token is not None:
+                for choice in choices:
+                    cancellation_token.remove_callback(choice.handle.cancel)
+
+            # Sequences can still be running if a stop sequence ended them or the
+            # consumer went away: stop decoding, and wait until the scheduler is
+            # done with the KV cache before releasing it
+            unfinished = [c for c in choices if not c.handle.finished]
+            for choice in unfinished:
+                choice.handle.cancel()
+            try:
+                for choice in unfinished:
+                    for response in choice.responses:
+                        if response.token >= 0:
+                            choice.sampled_tokens.append(response.token)
+            except Exception:
+                generation_failed = True
+
+            self._release_prompt_cache(
+                context,
+                choices[0].sampled_tokens if choices else [],
+                choices[0].handle.cache_length if choices else None,
+                generation_failed,
             )
+            if not generation_failed:
+                self._pin_checkpoints(checkpoints, tokenized_prompt, kv_format)
 
-            # Add cache to kwargs if available
-            if enable_prompt_cache and self.prompt_cache.cache:
-                mlx_kwargs["prompt_cache"] = self.prompt_cache.cache
+    def _make_stream_result(
+        self,
+        choice: "_ChoiceState",
+        response: TokenResponse,
+        top_logprobs: Optional[int],
+        cached_tokens: int,
+        cache_write_tokens: int,
+        request_start_time: float,
+    ) -> StreamResult:
+        """Turn a scheduler token response into a streaming result for a choice."""
+        if response.token >= 0:
+            choice.sampled_tokens.append(response.token)
+
+        # Record first token time if this is the first token
+        if choice.first_token_time is None:
+            choice.first_token_time = time.perf_counter() - request_start_time
+
+        # EOS is not part of the text
+        detokenizer = choice.detokenizer
+        if response.finish_reason != "stop" and response.token >= 0:
+            detokenizer.add_token(response.token)
+        if response.finish_reason is not None:
+            detokenizer.finalize()
+
+        # Match stop sequences on the raw text, holding back partial matches
+        text = detokenizer.last_segment
+        finish_reason = response.finish_reason
+        stop_sequence = None
+        if choice.stop_matcher:
+            text, stop_sequence = choice.stop_matcher.feed(text)
+            if stop_sequence is not None:
+                finish_reason = "stop_sequence"
+                # Not an abort: the sequence ended normally
+                choice.handle.cancel(reason="stop")
+            elif finish_reason is not None:
+                text += choice.stop_matcher.flush()
+
+        # Process logprobs if requested
+        logprobs = None
+        if top_logprobs is not None and response.logprobs is not None:
+            logprobs = self.logprobs_processor.get_logprobs(response, top_logprobs)
+
+        parse_result = self.chat_template.stream_parse_chat_result(text, choice.context)
+
+        # Create StreamContent based on parse result
+        chunk_index = len(choice.sampled_tokens)
+
+        # Determine which delta field to populate
+        if parse_result.thinking:
+            content = StreamContent(
+                reasoning_delta=parse_result.thinking,
+                token=response.token,
+                chunk_index=chunk_index,
+            )
+        else:
+            content = StreamContent(
+                text_delta=parse_result.content,
+                token=response.token,
+                chunk_index=chunk_index,
+            )
 
-            # Stream generation
-            generated_tokens = []
+        stats = GenerationStats(
+            prompt_tokens=response.prompt_tokens,
+            completion_tokens=response.generation_tokens,
+            prompt_tps=response.prompt_tps,
+            generation_tps=response.generation_tps,
+            peak_memory=response.peak_memory,
+            cache_hit_tokens=cached_tokens,
+            cache_write_tokens=cache_write_tokens,
+            time_to_first_token=choice.first_token_time or 0.0,
+            prefill_chunks=response.prefill_chunks,
+            draft_tokens=response.draft_tokens,
+            accepted_draft_tokens=response.accepted_draft_tokens,
+        )
 
-            for response in stream_generate(
-                model=self.model.model,
-                tokenizer=self.tokenizer,
-                prompt=processed_prompt,
-                draft_model=self.model.draft_model,
-                **mlx_kwargs,
-            ):
-                if response.finish_reason is not None:
-                    break
+        return GenerationResult(
+            content=content,
+            finish_reason=finish_reason,
+            stats=stats,
+            logprobs=logprobs,
+            from_draft=response.from_draft,
+            index=choice.index,
+            stop_sequence=stop_sequence,
+        )
 
-                generated_tokens.append(response.token)
+    def validate_kv_params(self, params: Dict[str, Any]) -> None:
+        """Check the KV cache parameters of a request before it is admitted.
 
-                # Record first token time if this is the first token
-                if first_token_time is None:
-                    first_token_time = time.perf_counter() - request_start_time
+        Args:
+            params: KV cache quantization and window parameters of the
+                    request, None for unset
 
-                # Process logprobs if requested
-                logprobs = None
-                if top_logprobs is not None:
-                    logprobs = self.logprobs_processor.get_logprobs(
-                        response, top_logprobs
-                    )
+        Raises:
+            ValueError: If generating with the parameters would fail
+        """
+        kwargs = dict(params)
+        window = self._resolve_kv_window(kwargs)
+        self._resolve_kv_quantization(kwargs, window is None)
+
+    def _resolve_kv_quantization(
+        self, kwargs: Dict[str, Any], enabled: bool = True
+    ) -> KVFormat:
+        """Fill in the model's KV cache quantization for a request.
+
+        Parameters the request leaves unset (None) take the model's defaults,
+        ``kv_bits`` of 0 disables quantization for the request. Defaults are
+        ignored for models whose KV cache cannot be quantized.
+
+        Args:
+            kwargs: Generation kwargs of the request, updated in place
+            enabled: Whether the request's KV cache can be quantized, rotating
+                     windows cannot
+
+        Returns:
+            KV cache quantization as (bits, group size), None for full precision
 
-                parse_result = self.chat_template.stream_parse_chat_result(
-                    response.text
+        Raises:
+            ValueError: If the bits or group size are not supported, or the
+                        request quantizes a model that doesn't support it
+        """
+        requested = kwargs.get("kv_bits")
+        for key in KV_QUANTIZATION_PARAMS:
+            if kwargs.get(key) is None:
+                kwargs.pop(key, None)
+                if key in self.kv_quantization:
+                    kwargs[key] = self.kv_quantization[key]
+
+        kv_bits = kwargs.get("kv_bits")
+        if kv_bits and not (enabled and self.supports_kv_quantization):
+            if requested:
+                raise ValueError(
+                    f"The KV cache of {self.model.model_id} cannot be quantized"
                 )
+            kv_bits = None
+        if not kv_bits:
+            for key in KV_QUANTIZATION_PARAMS:
+                kwargs.pop(key, None)
+            return None
+
+        group_size = kwargs.setdefault("kv_group_size", DEFAULT_KV_GROUP_SIZE)
+        kwargs.setdefault("quantized_kv_start", DEFAULT_QUANTIZED_KV_START)
+        if kv_bits not in _SUPPORTED_KV_BITS:
+            raise ValueError(
+                f"kv_bits must be one of {_SUPPORTED_KV_BITS}, got {kv_bits}"
+            )
+        if group_size not in _SUPPORTED_KV_GROUP_SIZES:
+            raise ValueError(
+                f"kv_group_size must be one of {_SUPPORTED_KV_GROUP_SIZES}, "
+                f"got {group_size}"
+            )
+        return kv_bits, group_size
 
-                # Create StreamContent based on parse result
-                chunk_index = len(generated_tokens)
+    def _resolve_kv_window(self, kwargs: Dict[str, Any]) -> KVWindow:
+        """Take the rotating KV window of a request out of its kwargs.
 
-                # Determine which delta field to populate
-                if parse_result.thinking:
-                    content = StreamContent(
-                        reasoning_delta=parse_result.thinking,
-                        token=response.token,
-                        chunk_index=chunk_index,
-                    )
-                else:
-                    content = StreamContent(
-                        text_delta=parse_result.content,
-                        token=response.token,
-                        chunk_index=chunk_index,
-                    )
-                # For debugging: print(parse_result.content.upper() + parse_result.thinking.lower(), end="", flush=True)
-
-                stats = GenerationStats(
-                    prompt_tokens=response.prompt_tokens,
-                    completion_tokens=response.generation_tokens,
-                    prompt_tps=response.prompt_tps,
-                    generation_tps=response.generation_tps,
-                    peak_memory=response.peak_memory,
-                    cache_hit_tokens=cached_tokens,
-                    time_to_first_token=first_token_time or 0.0,
+        Parameters the request leaves unset (None) take the model's defaults,
+        ``max_kv_size`` of 0 disables the window for the request. Defaults are
+        ignored for models whose KV cache cannot be a rotating window.
+
+        Args:
+            kwargs: Generation kwargs of the request, updated in place
+
+        Returns:
+            Rotating KV cache as (max_size, sink tokens), None for an unbounded
+            cache
+
+        Raises:
+            ValueError: If the sizes are invalid, or the request sets a window
+                        for a model that doesn't support it
+        """
+        requested = kwargs.get("max_kv_size")
+        params = {key: kwargs.pop(key, None) for key in KV_WINDOW_PARAMS}
+        for key, value in self.kv_window.items():
+            if params[key] is None:
+                params[key] = value
+        for key, value in params.items():
+            if value is not None and (
+                not isinstance(value, int) or isinstance(value, bool)
+            ):
+                raise ValueError(f"{key} must be an integer, got {value!r}")
+
+        max_size = params["max_kv_size"]
+        if max_size and not self.supports_kv_window:
+            if requested:
+                raise ValueError(
+                    f"The KV cache of {self.model.model_id} cannot be a rotating "
+                    "window"
                 )
+            max_size = None
+        if not max_size:
+            return None
+
+        keep = params["kv_sink_tokens"]
+        if keep is None:
+            keep = DEFAULT_KV_SINK_TOKENS
+        if keep < 0:
+            raise ValueError(f"kv_sink_tokens must not be negative, got {keep}")
+        if max_size <= keep:
+            raise ValueError(
+                f"max_kv_size must be larger than kv_sink_tokens ({keep}), "
+                f"got {max_size}"
+            )
+        return max_size, keep
+
+    def _lease_prompt_cache(
+        self,
+        context: GenerationContext,
+        tokenized_prompt: List[int],
+        kv_format: KVFormat = None,
+        window: KVWindow = None,
+        session_id: Optional[str] = None,
+    ) -> List[int]:
+        """Lease the best matching prompt cache slot and reuse its common prefix.
+
+        A request that finds every slot in use by other requests runs uncached.
+        A request with a session id leases its session's slot.
+
+        Returns:
+            Prompt tokens that still need processing
+        """
+        lease = self.prompt_cache_pool.acquire(
+            self.model, tokenized_prompt, kv_format, window, session_id
+        )
+        if lease is None:
+            logger.debug("All prompt cache slots are in use, processing full prompt")
+            return tokenized_prompt
+
+        context.prompt_cache, processed_prompt, context.cached_tokens = lease
+        return processed_prompt
+
+    def _breakpoint_offsets(
+        self,
+        breakpoints: List[CacheBreakpoint],
+        tokenized_prompt: List[int],
+        tools: Optional[List[Dict[str, Any]]],
+        template_kwargs: Optional[Dict[str, Any]],
+    ) -> List[Tuple[int, float]]:
+        """Find the prompt token offsets of the client's cache breakpoints.
+
+        The messages up to a breakpoint are rendered like the full prompt, the
+        tokens they share with it end at the breakpoint.
 
-                yield GenerationResult(
-                    content=content,
-                    finish_reason=response.finish_reason,
-                    stats=stats,
-                    logprobs=logprobs,
-                    from_draft=response.from_draft,
+        Returns:
+            List of (token offset, time to live in seconds)
+        """
+        from .prompt_cache import common_prefix_len
+
+        checkpoints = []
+        for cache_breakpoint in breakpoints:
+            try:
+                prefix = self.tokenizer.encode(
+                    self._prepare_prompt(
+                        cache_breakpoint.messages, tools, template_kwargs
+                    )
                 )
+            except Exception as e:
+                # Some chat templates reject e.g. a conversation without a user turn
+                logger.debug(f"Cache breakpoint not rendered: {e}")
+                continue
+            offset = min(
+                common_prefix_len(prefix, tokenized_prompt), len(tokenized_prompt) - 1
+            )
+            if offset > 0:
+                checkpoints.append((offset, cache_breakpoint.ttl))
+        return checkpoints
+
+    def _pin_checkpoints(
+        self,
+        checkpoints: List[Tuple[int, float]],
+        tokenized_prompt: List[int],
+        kv_format: KVFormat,
+    ) -> None:
+        """Keep the prompt prefixes of cache breakpoints for their time to live.
+
+        They are retained rather than pinned, so they still give way when the
+        prefix cache or the memory budget is full.
+        """
+        for offset, ttl in checkpoints:
+            try:
+                self.prompt_cache_pool.retain(tokenized_prompt[:offset], kv_format, ttl)
+            except ValueError as e:
+                logger.debug(f"Cache breakpoint at {offset} tokens not kept: {e}")
 
-            # Extend cache with generated tokens if caching is enabled
-            if enable_prompt_cache and generated_tokens:
-                self.prompt_cache.extend_completion_cache(generated_tokens)
+    def _release_prompt_cache(
+        self,
+        context: GenerationContext,
+        sampled_tokens: List[int],
+        cache_length: Optional[int],
+        failed: bool,
+    ) -> None:
+        """Return a request's prompt cache lease, if it holds one.
 
-        except Exception as e:
-            logger.error(f"Error during stream generation: {e}")
-            raise RuntimeError(f"Stream generation failed: {e}")
+        Args:
+            context: Request context holding the lease
+            sampled_tokens: All tokens sampled for the request, including EOS
+            cache_length: Number of tokens held by the KV cache, if known
+            failed: Whether generation failed and left the KV cache unusable
+        """
+        prompt_cache = context.prompt_cache
+        if prompt_cache is None:
+            return
+        context.prompt_cache = None
+
+        try:
+            if failed:
+                # The KV cache may be partially updated, start over next time
+                prompt_cache.tokens = array("i")
+            elif cache_length is None:
+                prompt_cache.extend_completion_cache(sampled_tokens)
+            else:
+                # Keep the cached tokens in line with what the KV cache holds
+                num_generated = cache_length - len(prompt_cache.tokens)
+                prompt_cache.extend_completion_cache(sampled_tokens[:num_generated])
+        finally:
+            self.prompt_cache_pool.release(prompt_cache)
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting passed down from the server command line."""
+    return int(os.environ.get(name, default))
+
+
+def _model_int(
+    profile: Optional[ModelProfile], name: str, env_name: str, default: int
+) -> int:
+    """Read a setting of the model's registry profile, else the server's one."""
+    value = getattr(profile, name, None)
+    return _env_int(env_name, default) if value is None else value
+
+
+def _default_prompt_lookup_num_tokens(
+    model_id: str, profile: Optional[ModelProfile] = None
+) -> int:
+    """Draft tokens per step if the registry or server enables prompt lookup."""
+    if profile is not None and profile.prompt_lookup_num_tokens is not None:
+        return profile.prompt_lookup_num_tokens
+    models = os.environ.get("MLX_OMNI_PROMPT_LOOKUP_MODELS", "")
+    models = {m.strip() for m in models.split(",") if m.strip()}
+    if "*" not in models and model_id not in models:
+        return 0
+    return _env_int("MLX_OMNI_PROMPT_LOOKUP_NUM_TOKENS", DEFAULT_NUM_DRAFT_TOKENS)
+
+
+def _default_kv_quantization(
+    model_id: str, profile: Optional[ModelProfile] = None
+) -> Dict[str, int]:
+    """KV cache quantization if the registry or server enables it for a model."""
+    if profile is not None and profile.kv_bits is not None:
+        if profile.kv_bits == 0:
+            return {}
+        return {
+            "kv_bits": profile.kv_bits,
+            "kv_group_size": _model_int(
+                profile,
+                "kv_group_size",
+                "MLX_OMNI_KV_GROUP_SIZE",
+                DEFAULT_KV_GROUP_SIZE,
+            ),
+            "quantized_kv_start": _model_int(
+                profile,
+                "quantized_kv_start",
+                "MLX_OMNI_QUANTIZED_KV_START",
+                DEFAULT_QUANTIZED_KV_START,
+            ),
+        }
+    models = os.environ.get("MLX_OMNI_KV_QUANTIZED_MODELS", "")
+    models = {m.strip() for m in models.split(",") if m.strip()}
+    if "*" not in models and model_id not in models:
+        return {}
+    return {
+        "kv_bits": _env_int("MLX_OMNI_KV_BITS", DEFAULT_KV_BITS),
+        "kv_group_size": _env_int("MLX_OMNI_KV_GROUP_SIZE", DEFAULT_KV_GROUP_SIZE),
+        "quantized_kv_start": _env_int(
+            "MLX_OMNI_QUANTIZED_KV_START", DEFAULT_QUANTIZED_KV_START
+        ),
+    }
+
+
+def _default_kv_window(
+    model_id: str, profile: Optional[ModelProfile] = None
+) -> Dict[str, int]:
+    """Rotating KV window if the registry or server enables it for a model."""
+    if profile is not None and profile.max_kv_size is not None:
+        if profile.max_kv_size == 0:
+            return {}
+        return {
+            "max_kv_size": profile.max_kv_size,
+            "kv_sink_tokens": _model_int(
+                profile,
+                "kv_sink_tokens",
+                "MLX_OMNI_KV_SINK_TOKENS",
+                DEFAULT_KV_SINK_TOKENS,
+            ),
+        }
+    models = os.environ.get("MLX_OMNI_ROTATING_KV_MODELS", "")
+    models = {m.strip() for m in models.split(",") if m.strip()}
+    if "*" not in models and model_id not in models:
+        return {}
+    return {
+        "max_kv_size": _env_int("MLX_OMNI_MAX_KV_SIZE", DEFAULT_MAX_KV_SIZE),
+        "kv_sink_tokens": _env_int("MLX_OMNI_KV_SINK_TOKENS", DEFAULT_KV_SINK_TOKENS),
+    }
+
+
+@dataclass
+class _ChoiceState:
+    """Per-choice decoding state of a request."""
+
+    index: int
+    handle: SequenceHandle
+    context: GenerationContext
+    detokenizer: Any
+    stop_matcher: Optional[StopSequenceMatcher] = None
+    sampled_tokens: List[int] = field(default_factory=list)
+    first_token_time: Optional[float] = None
+
+    def __post_init__(self):
+        self.responses = iter(self.handle)
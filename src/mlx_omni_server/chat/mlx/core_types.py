@@ -13,6 +13,29 @@ class ToolCall:
     arguments: Dict[str, Any]
 
 
+@dataclass
+class CacheBreakpoint:
+    """A prompt prefix the client asked to keep cached (Anthropic ``cache_control``).
+
+    Attributes:
+        messages: Chat messages up to the marked content, the last one ending
+                  with it
+        ttl: Seconds the prefix is evicted last, extended whenever it is
+             marked again
+    """
+
+    messages: List[Dict[str, Any]]
+    ttl: float
+
+
+@dataclass
+class PrefillChunkTiming:
+    """Timing of one prompt prefill forward pass."""
+
+    tokens: int  # Prompt tokens processed in this chunk
+    seconds: float  # Wall time of the forward pass
+
+
 @dataclass
 class GenerationStats:
     """Statistics for generation performance and token usage."""
@@ -22,12 +45,25 @@ class GenerationStats:
     completion_tokens: int = 0
     # Caching statistics
     cache_hit_tokens: int = 0  # Number of tokens served from cache
+    cache_write_tokens: int = 0  # Prompt tokens cached for the client's breakpoints
 
     # Performance metrics
     prompt_tps: float = 0.0  # Tokens per second for prompt processing
     generation_tps: float = 0.0  # Tokens per second for generation
     peak_memory: float = 0.0  # Peak memory usage in MB
     time_to_first_token: float = 0.0  # Time from request start to first token (seconds)
+    # Prefill chunks, interleaved with other sequences' decode steps
+    prefill_chunks: List[PrefillChunkTiming] = field(default_factory=list)
+    # Speculative decoding: draft tokens proposed and accepted (from_draft)
+    draft_tokens: int = 0
+    accepted_draft_tokens: int = 0
+
+    @property
+    def draft_acceptance_rate(self) -> float:
+        """Share of proposed draft tokens that were accepted."""
+        if not self.draft_tokens:
+            return 0.0
+        return self.accepted_draft_tokens / self.draft_tokens
 
 
 @dataclass
@@ -62,6 +98,8 @@ class GenerationResult(Generic[ContentT]):
     stats: GenerationStats = field(default_factory=GenerationStats)
     logprobs: Optional[Dict[str, Any]] = None
     from_draft: bool = False
+    index: int = 0  # Choice index when several responses are generated per request
+    stop_sequence: Optional[str] = None  # Stop sequence that ended generation, if any
 
 
 @dataclass
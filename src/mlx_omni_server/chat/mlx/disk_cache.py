@@ -0,0 +1,378 @@
+"""Disk Prompt Cache - prompt caches that survive restarts and model evictions.
+
+Prompt cache slots and the radix tree live in memory, so after a restart or a
+``MLXWrapperCache`` eviction every long system prompt and agent transcript is
+prefilled again from scratch. The disk cache saves the KV state of evicted
+slots as safetensors files in a local directory, keyed by model and a hash of
+the token prefix.
+
+Prefixes are identified by chained block hashes: hash ``i`` covers the first
+``i + 1`` blocks of ``block_size`` tokens and is seeded with the model namespace.
+A request matches the longest persisted block prefix of its prompt. Files are
+loaded with ``mx.load``, which reads the arrays lazily when they are first
+evaluated. The directory has a size budget, least recently used files are
+deleted first.
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from mlx_lm.models.cache import (
+    can_trim_prompt_cache,
+    load_prompt_cache,
+    save_prompt_cache,
+    trim_prompt_cache,
+)
+
+from ...utils.logger import logger
+from .model_types import MLXModel
+from .radix_cache import DEFAULT_BLOCK_SIZE, as_token_array
+
+# Default disk budget in GB
+DEFAULT_DISK_CACHE_GB = 10.0
+
+# Shorter sequences are cheap to prefill and not worth a file
+DEFAULT_MIN_PERSIST_TOKENS = 256
+
+_FILE_SUFFIX = ".safetensors"
+
+
+def disk_cache_namespace(model: MLXModel) -> str:
+    """Identify the model configuration a persisted KV cache belongs to."""
+    return "|".join(
+        [model.model_id, model.adapter_path or "", model.draft_model_id or ""]
+    )
+
+
+def block_hashes(namespace: str, tokens: Sequence[int], block_size: int) -> List[str]:
+    """Chained hashes of the full token blocks, hash ``i`` covering blocks 0..i."""
+    digest = hashlib.sha256(namespace.encode()).digest()
+    data = as_token_array(tokens).tobytes()
+    size = block_size * array("i").itemsize
+    hashes = []
+    for start in range(0, len(data) - size + 1, size):
+        digest = hashlib.sha256(digest + data[start : start + size]).digest()
+        hashes.append(digest.hex())
+    return hashes
+
+
+@dataclass
+class DiskCacheEntry:
+    """A persisted prompt cache file."""
+
+    path: str
+    namespace: str
+    hashes: List[str] = field(default_factory=list)
+    size: int = 0
+    last_access: float = 0.0
+
+    @property
+    def num_blocks(self) -> int:
+        return len(self.hashes)
+
+
+class DiskPromptCache:
+    """Directory of persisted prompt caches shared by all models.
+
+    Files are written by a background thread, so evicting a slot never waits
+    for the disk.
+
+    Examples:
+        disk_cache = DiskPromptCache("~/.cache/mlx-omni-server/prompt-cache")
+        disk_cache.save(namespace, tokens, cache)
+        match = disk_cache.match(namespace, prompt_tokens)
+        if match is not None:
+            cache = disk_cache.load(*match)
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = int(DEFAULT_DISK_CACHE_GB * 1024**3),
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        min_tokens: int = DEFAULT_MIN_PERSIST_TOKENS,
+    ):
+        """Initialize disk cache.
+
+        Args:
+            directory: Directory holding the cache files
+            max_bytes: Maximum total size of the cache files
+            block_size: Number of tokens per hashed block
+            min_tokens: Minimum sequence length worth persisting
+        """
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.min_tokens = max(min_tokens, block_size)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, DiskCacheEntry] = {}
+        # Block hash -> entries containing the prefix it covers
+        self._index: Dict[str, List[DiskCacheEntry]] = {}
+        self._scanned = False
+        self._pending: "queue.Queue[Optional[Tuple[str, array, List[Any]]]]" = (
+            queue.Queue()
+        )
+        self._writer: Optional[threading.Thread] = None
+
+        # Statistics
+        self._lookups = 0
+        self._hits = 0
+        self._loaded_tokens = 0
+        self._load_time = 0.0
+        self._saves = 0
+        self._evictions = 0
+
+    def match(
+        self, namespace: str, tokens: Sequence[int]
+    ) -> Optional[Tuple[DiskCacheEntry, int]]:
+        """Find the longest persisted block prefix of ``tokens``.
+
+        Returns:
+            Tuple of (file entry, number of matched tokens), or None
+        """
+        self._scan()
+        with self._lock:
+            self._lookups += 1
+            best = None
+            for i, block_hash in enumerate(
+                block_hashes(namespace, tokens, self.block_size)
+            ):
+                entries = self._index.get(block_hash)
+                if not entries:
+                    break
+                best = (entries[-1], (i + 1) * self.block_size)
+            return best
+
+    def load(self, entry: DiskCacheEntry, num_tokens: int) -> Optional[List[Any]]:
+        """Load the first ``num_tokens`` tokens of a persisted prompt cache.
+
+        Returns:
+            The prompt cache, or None if the file could not be read
+        """
+        start = time.perf_counter()
+        try:
+            cache = load_prompt_cache(entry.path)
+        except Exception as e:
+            logger.warning(f"Failed to load prompt cache {entry.path}: {e}")
+            with self._lock:
+                self._remove(entry)
+            return None
+
+        excess = entry.num_blocks * self.block_size - num_tokens
+        if excess > 0:
+            trim_prompt_cache(cache, excess)
+
+        with self._lock:
+            entry.last_access = time.time()
+            self._hits += 1
+            self._loaded_tokens += num_tokens
+            self._load_time += time.perf_counter() - start
+        try:
+            os.utime(entry.path)
+        except OSError:
+            pass
+        return cache
+
+    def save(self, namespace: str, tokens: Sequence[int], cache: List[Any]) -> bool:
+        """Queue a prompt cache for writing.
+
+        Only full blocks are persisted. The cache must not be used afterwards,
+        it is trimmed to the persisted length by the writer.
+
+        Args:
+            namespace: Model configuration of the cache
+            tokens: Tokens whose keys and values the cache holds
+            cache: Prompt cache to persist
+
+        Returns:
+            Whether the cache was queued
+        """
+        if not cache or len(tokens) < self.min_tokens:
+            return False
+        if not can_trim_prompt_cache(cache):
+            return False
+
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="prompt-cache-writer", daemon=True
+                )
+                self._writer.start()
+        self._pending.put((namespace, array("i", tokens), cache))
+        return True
+
+    def flush(self) -> None:
+        """Wait until all queued caches are written."""
+        self._pending.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get disk cache statistics.
+
+        Returns:
+            Dictionary with the number and size of cache files, the share of
+            lookups served from disk and the average load time
+        """
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "files": len(self._entries),
+                "bytes": sum(e.size for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": self._hits / self._lookups if self._lookups else 0.0,
+                "loaded_tokens": self._loaded_tokens,
+                "avg_load_time": self._load_time / self._hits if self._hits else 0.0,
+                "saves": self._saves,
+                "evictions": self._evictions,
+            }
+
+    def _scan(self) -> None:
+        """Index the files left by earlier runs, reading only their metadata."""
+        with self._lock:
+            if self._scanned:
+                return
+            self._scanned = True
+            if not os.path.isdir(self.directory):
+                return
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(_FILE_SUFFIX):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        _, metadata = load_prompt_cache(path, return_metadata=True)
+                        stat = os.stat(path)
+                    except Exception as e:
+                        logger.warning(f"Ignoring unreadable prompt cache {path}: {e}")
+                        continue
+                    self._add(
+                        DiskCacheEntry(
+                            path=path,
+                            namespace=metadata.get("namespace", ""),
+                            hashes=metadata.get("block_hashes", "").split(),
+                            size=stat.st_size,
+                            last_access=stat.st_mtime,
+                        )
+                    )
+            logger.info(f"Indexed {len(self._entries)} persisted prompt caches")
+
+    def _write_loop(self) -> None:
+        while True:
+            namespace, tokens, cache = self._pending.get()
+            try:
+                self._write(namespace, tokens, cache)
+            except Exception as e:
+                logger.warning(f"Failed to persist prompt cache: {e}")
+            finally:
+                self._pending.task_done()
+
+    def _write(self, namespace: str, tokens: array, cache: List[Any]) -> None:
+        self._scan()
+        num_tokens = min(len(tokens), cache[0].offset)
+        hashes = block_hashes(namespace, tokens[:num_tokens], self.block_size)
+        if not hashes or len(hashes) * self.block_size < self.min_tokens:
+            return
+
+        with self._lock:
+            if self._index.get(hashes[-1]):
+                return  # Already persisted
+            # Files holding a prefix of this sequence become redundant
+            redundant = [
+                entry
+                for block_hash in hashes
+                for entry in self._index.get(block_hash, [])
+                if entry.hashes[-1] == block_hash
+            ]
+
+        trim_prompt_cache(cache, cache[0].offset - len(hashes) * self.block_size)
+        directory = os.path.join(
+            self.directory, hashlib.sha256(namespace.encode()).hexdigest()[:16]
+        )
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, hashes[-1][:32] + _FILE_SUFFIX)
+        save_prompt_cache(
+            path,
+            cache,
+            metadata={"namespace": namespace, "block_hashes": " ".join(hashes)},
+        )
+
+        with self._lock:
+            self._add(
+                DiskCacheEntry(
+                    path=path,
+                    namespace=namespace,
+                    hashes=hashes,
+                    size=os.path.getsize(path),
+                    last_access=time.time(),
+                )
+            )
+            self._saves += 1
+            for entry in redundant:
+                self._remove(entry)
+            self._evict()
+        logger.debug(f"Persisted prompt cache of {len(hashes)} blocks to {path}")
+
+    def _add(self, entry: DiskCacheEntry) -> None:
+        self._entries[entry.path] = entry
+        for block_hash in entry.hashes:
+            self._index.setdefault(block_hash, []).append(entry)
+
+    def _remove(self, entry: DiskCacheEntry) -> None:
+        if self._entries.pop(entry.path, None) is None:
+            return
+        for block_hash in entry.hashes:
+            entries = [e for e in self._index.get(block_hash, []) if e is not entry]
+            if entries:
+                self._index[block_hash] = entries
+            else:
+                self._index.pop(block_hash, None)
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        """Delete least recently used files down to the size budget."""
+        total = sum(e.size for e in self._entries.values())
+        for entry in sorted(self._entries.values(), key=lambda e: e.last_access):
+            if total <= self.max_bytes:
+                break
+            total -= entry.size
+            self._remove(entry)
+            self._evictions += 1
+            logger.debug(f"Evicted persisted prompt cache {entry.path}")
+
+
+_shared_cache: Optional[DiskPromptCache] = None
+_shared_lock = threading.Lock()
+
+
+def shared_disk_prompt_cache() -> Optional[DiskPromptCache]:
+    """Get the disk cache configured by environment, None if disabled.
+
+    ``MLX_OMNI_PROMPT_CACHE_DIR`` enables it, ``MLX_OMNI_PROMPT_CACHE_DISK_GB``
+    sets the size budget.
+    """
+    global _shared_cache
+    directory = os.environ.get("MLX_OMNI_PROMPT_CACHE_DIR", "")
+    if not directory:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            try:
+                max_gb = float(
+                    os.environ.get(
+                        "MLX_OMNI_PROMPT_CACHE_DISK_GB", DEFAULT_DISK_CACHE_GB
+                    )
+                )
+            except ValueError:
+                max_gb = DEFAULT_DISK_CACHE_GB
+            _shared_cache = DiskPromptCache(directory, int(max_gb * 1024**3))
+        return _shared_cache
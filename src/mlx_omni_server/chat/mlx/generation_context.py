@@ -0,0 +1,58 @@
+"""Generation Context - per-request state of a chat generation.
+
+A model's ``ChatGenerator``, ``ChatTemplate``, tokenizer and scheduler are shared
+by every request for that model. Everything a request changes while it runs
+lives in its own ``GenerationContext`` instead:
+
+- Template flags recorded while applying the chat template (thinking parse,
+  tools).
+- The thinking decoder, which keeps parse state across streamed chunks.
+- The lease on the prompt cache, if the request got one.
+
+Concurrent requests therefore never see each other's parse state or KV cache.
+"""
+
+import copy
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from .tools.thinking_decoder import ThinkingDecoder
+
+if TYPE_CHECKING:
+    from .prompt_cache import PromptCache
+
+
+@dataclass
+class GenerationContext:
+    """Mutable state of one generation request.
+
+    Examples:
+        context = GenerationContext()
+        prompt = chat_template.apply_chat_template(messages, context=context)
+        ...
+        result = chat_template.stream_parse_chat_result(text, context)
+    """
+
+    # Chat template flags, recorded by ChatTemplate.apply_chat_template
+    enable_thinking_parse: Optional[bool] = None
+    has_tools: bool = False
+
+    # Output parse state
+    reason_decoder: Optional[ThinkingDecoder] = None
+
+    # Prompt cache leased by this request (None if it runs uncached)
+    prompt_cache: Optional["PromptCache"] = None
+    cached_tokens: int = 0
+    # Prompt tokens up to the client's last cache breakpoint that were not cached
+    cache_write_tokens: int = 0
+
+    def fork(self) -> "GenerationContext":
+        """Copy the context for one of several choices of the same request.
+
+        The copy has its own thinking decoder state, so each choice's stream is
+        parsed independently. The prompt cache lease stays with the request.
+        """
+        forked = copy.copy(self)
+        forked.reason_decoder = copy.deepcopy(self.reason_decoder)
+        forked.prompt_cache = None
+        return forked
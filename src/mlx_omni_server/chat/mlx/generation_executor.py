@@ -0,0 +1,167 @@
+"""Generation Executor - runs blocking MLX generation off the asyncio event loop.
+
+mlx-lm generation is synchronous and can run for many seconds. Calling it from an
+``async def`` route handler freezes the whole event loop, stalling health checks,
+model listings and every other stream. ``GenerationExecutor`` owns dedicated worker
+thread(s) per model and bridges results back to the event loop, so route handlers
+only ever *await* generation.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, AsyncGenerator, Callable, Iterator, TypeVar
+
+from ...utils.logger import logger
+
+T = TypeVar("T")
+
+# Maximum number of items buffered between the worker thread and the event loop.
+# When the consumer is slower than generation, the worker blocks (backpressure).
+DEFAULT_QUEUE_SIZE = 32
+
+# How often a blocked producer re-checks whether the consumer went away (seconds)
+_PUT_POLL_INTERVAL = 0.1
+
+_END_OF_STREAM = object()
+
+
+class _StreamFailure:
+    """Wraps an exception raised by the producer so it can cross the queue."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class GenerationExecutor:
+    """Dedicated worker thread(s) for running generation of a single model.
+
+    Each model gets its own executor, so a long generation on one model never
+    blocks the event loop, and requests for different models never queue behind
+    each other.
+
+    Examples:
+        executor = GenerationExecutor("mlx-community/Qwen3-0.6B-4bit")
+
+        # Non-streaming: await the blocking call
+        result = await executor.run(adapter.generate, request)
+
+        # Streaming: iterate a blocking generator asynchronously
+        async for chunk in executor.stream(adapter.generate_stream, request):
+            ...
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int = 1,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        """Initialize executor.
+
+        Args:
+            name: Name used for worker threads (typically the model id)
+            max_workers: Number of worker threads for this model (default: 1)
+            queue_size: Maximum number of buffered stream items before the
+                        worker thread blocks (default: 32)
+        """
+        self._name = name
+        self._queue_size = queue_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"mlx-generation-{name}"
+        )
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a blocking function in the worker thread and await its result.
+
+        Args:
+            fn: Blocking callable, e.g. ``OpenAIAdapter.generate``
+            *args: Positional arguments for ``fn``
+            **kwargs: Keyword arguments for ``fn``
+
+        Returns:
+            The return value of ``fn``
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    async def stream(
+        self, fn: Callable[..., Iterator[T]], *args: Any, **kwargs: Any
+    ) -> AsyncGenerator[T, None]:
+        """Iterate a blocking generator in the worker thread.
+
+        Items are forwarded through a bounded ``asyncio.Queue``. If the consumer
+        falls behind, the worker blocks until there is room again. If the consumer
+        stops iterating (e.g. the client disconnected), the worker stops pulling
+        from the generator and closes it.
+
+        Args:
+            fn: Callable returning a blocking iterator, e.g. ``OpenAIAdapter.generate_stream``
+            *args: Positional arguments for ``fn``
+            **kwargs: Keyword arguments for ``fn``
+
+        Yields:
+            Items produced by the blocking iterator, in order
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        stopped = threading.Event()
+
+        def put(item: Any) -> bool:
+            """Put an item from the worker thread, honouring backpressure.
+
+            Returns:
+                False if the consumer went away and producing should stop
+            """
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=_PUT_POLL_INTERVAL)
+                    return True
+                except FutureTimeoutError:
+                    if stopped.is_set() or loop.is_closed():
+                        future.cancel()
+                        return False
+
+        def produce() -> None:
+            iterator = None
+            try:
+                iterator = iter(fn(*args, **kwargs))
+                for item in iterator:
+                    if stopped.is_set() or not put(item):
+                        logger.debug(f"Stream consumer for {self._name} went away")
+                        return
+                put(_END_OF_STREAM)
+            except BaseException as e:
+                if not stopped.is_set():
+                    put(_StreamFailure(e))
+            finally:
+                # Make sure generator cleanup (finally blocks) runs in this thread
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+
+        loop.run_in_executor(self._executor, produce)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, _StreamFailure):
+                    raise item.error
+                yield item
+        finally:
+            stopped.set()
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting new work and release the worker thread(s).
+
+        Args:
+            wait: Whether to block until running work has finished
+        """
+        self._executor.shutdown(wait=wait)
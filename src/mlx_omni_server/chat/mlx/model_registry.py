@@ -0,0 +1,216 @@
+"""Model Registry - server-side model aliases and per-model defaults.
+
+A YAML or TOML file given with ``--model-registry`` (``MLX_OMNI_MODEL_REGISTRY``)
+names the models the server offers. Every entry maps its name and aliases to a
+model, adapter and draft model, and sets the defaults of the model's requests
+and its residency, so clients neither carry alias tables nor send performance
+parameters with every request:
+
+    models:
+      qwen3-8b:
+        model: mlx-community/Qwen3-8B-4bit
+        draft_model: mlx-community/Qwen3-0.6B-4bit
+        aliases: [gpt-4o, claude-sonnet-4]
+        kv_bits: 8
+        prompt_cache_slots: 8
+        num_draft_tokens: 4
+        max_inflight_sequences: 8
+        pinned: true
+        preload: true
+
+Settings left out take the server-wide defaults of the command line, and
+request parameters still override the model's defaults. Requests naming a
+model directly instead of an alias get its defaults as well.
+"""
+
+import os
+import threading
+import tomllib
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from ...utils.logger import logger
+
+# Model, adapter path and draft model of a registry entry
+ModelKey = Tuple[str, Optional[str], Optional[str]]
+
+
+class ModelProfile(BaseModel):
+    """A registered model, its aliases and the defaults of its requests."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    name: str
+    model: str = Field(..., description="HuggingFace model ID or local path")
+    adapter_path: Optional[str] = None
+    draft_model: Optional[str] = None
+    aliases: List[str] = Field(default_factory=list)
+
+    # KV cache, kv_bits or max_kv_size of 0 disable a server-wide default
+    kv_bits: Optional[Literal[0, 2, 3, 4, 5, 6, 8]] = None
+    kv_group_size: Optional[Literal[32, 64, 128]] = None
+    quantized_kv_start: Optional[int] = Field(None, ge=0)
+    max_kv_size: Optional[int] = Field(None, ge=0)
+    kv_sink_tokens: Optional[int] = Field(None, ge=0)
+    prompt_cache_slots: Optional[int] = Field(None, ge=1)
+
+    # Speculative decoding
+    num_draft_tokens: Optional[int] = Field(
+        None, ge=1, description="Maximum draft tokens per step of the draft model"
+    )
+    prompt_lookup_num_tokens: Optional[int] = Field(
+        None, ge=0, description="Prompt lookup decoding draft tokens, 0 disables it"
+    )
+
+    # Admission
+    max_inflight_sequences: Optional[int] = Field(None, ge=1)
+    max_queue_depth: Optional[int] = Field(None, ge=0)
+    max_inflight_tokens: Optional[int] = Field(None, ge=0)
+
+    # Residency
+    pinned: bool = Field(False, description="Never evict the model once loaded")
+    preload: bool = Field(False, description="Load and warm up at startup")
+
+    @property
+    def key(self) -> ModelKey:
+        return self.model, self.adapter_path, self.draft_model
+
+
+class ModelRegistry:
+    """Resolves model aliases and looks up the profiles of loaded models.
+
+    Examples:
+        registry = ModelRegistry.load("models.yaml")
+        model_id, adapter_path, draft_model = registry.resolve("gpt-4o")
+        profile = registry.profile_for(model_id, adapter_path, draft_model)
+    """
+
+    def __init__(self, profiles: Optional[List[ModelProfile]] = None):
+        """Initialize registry.
+
+        Raises:
+            ValueError: If two profiles share a name or alias
+        """
+        self._profiles = list(profiles or [])
+        self._aliases: Dict[str, ModelProfile] = {}
+        for profile in self._profiles:
+            for alias in [profile.name, *profile.aliases]:
+                if alias in self._aliases:
+                    raise ValueError(f"Duplicate model alias in registry: {alias!r}")
+                self._aliases[alias] = profile
+
+    @classmethod
+    def load(cls, path: str) -> "ModelRegistry":
+        """Load a registry from a ``.yaml``, ``.yml`` or ``.toml`` file.
+
+        Raises:
+            OSError: If the file cannot be read
+            ValueError: If the file is no valid registry
+        """
+        data = _read_registry_file(path) or {}
+        if not isinstance(data, dict) or set(data) - {"models"}:
+            raise ValueError(f"Model registry {path} must only have a 'models' table")
+        models = data.get("models") or {}
+        if not isinstance(models, dict):
+            raise ValueError(f"'models' of model registry {path} must be a table")
+
+        profiles = []
+        for name, entry in models.items():
+            if not isinstance(entry, dict):
+                raise ValueError(f"Model {name!r} of registry {path} must be a table")
+            try:
+                profiles.append(ModelProfile.model_validate({**entry, "name": name}))
+            except ValidationError as e:
+                raise ValueError(f"Invalid model {name!r} in registry {path}: {e}")
+        return cls(profiles)
+
+    @property
+    def profiles(self) -> List[ModelProfile]:
+        return list(self._profiles)
+
+    def resolve(
+        self,
+        model: str,
+        adapter_path: Optional[str] = None,
+        draft_model: Optional[str] = None,
+    ) -> ModelKey:
+        """Resolve a requested model, an alias or a model ID.
+
+        An alias gives its model, adapter and draft model, adapter and draft
+        model set by the request take precedence. Other names are returned
+        unchanged.
+        """
+        profile = self._aliases.get(model)
+        if profile is None:
+            return model, adapter_path, draft_model
+        return (
+            profile.model,
+            adapter_path or profile.adapter_path,
+            draft_model or profile.draft_model,
+        )
+
+    def profile_for(
+        self,
+        model_id: str,
+        adapter_path: Optional[str] = None,
+        draft_model: Optional[str] = None,
+    ) -> Optional[ModelProfile]:
+        """Get the profile of a model, None if it is not registered.
+
+        The profile registering the same model, adapter and draft model wins,
+        otherwise the first one registering the model.
+        """
+        key = (model_id, adapter_path, draft_model)
+        for profile in self._profiles:
+            if profile.key == key:
+                return profile
+        for profile in self._profiles:
+            if profile.model == model_id:
+                return profile
+        return None
+
+
+def _read_registry_file(path: str) -> Any:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        with open(path, "rb") as f:
+            try:
+                return tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(f"Invalid TOML in model registry {path}: {e}")
+    if extension in (".yaml", ".yml"):
+        import yaml
+
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                return yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"Invalid YAML in model registry {path}: {e}")
+    raise ValueError(f"Model registry must be a .yaml, .yml or .toml file: {path}")
+
+
+_shared_registry: Optional[ModelRegistry] = None
+_shared_lock = threading.Lock()
+
+
+def shared_model_registry() -> ModelRegistry:
+    """Get the registry of the server.
+
+    ``MLX_OMNI_MODEL_REGISTRY`` is the path of its file, unset for an empty
+    registry. A file that fails to load is logged and leaves it empty.
+    """
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is None:
+            path = os.environ.get("MLX_OMNI_MODEL_REGISTRY", "")
+            _shared_registry = ModelRegistry()
+            if path:
+                try:
+                    _shared_registry = ModelRegistry.load(path)
+                    logger.info(
+                        f"Loaded {len(_shared_registry.profiles)} models from registry {path}"
+                    )
+                except (OSError, ValueError) as e:
+                    logger.error(f"Failed to load model registry: {e}")
+        return _shared_registry
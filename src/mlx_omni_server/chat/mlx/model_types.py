@@ -1,12 +1,16 @@
 """MLX Model types and management."""
 
+import glob
+import os
 from typing import Optional
 
 import mlx.nn as nn
+from huggingface_hub import snapshot_download
 from mlx_lm.tokenizer_utils import TokenizerWrapper
 from mlx_lm.utils import get_model_path, load, load_config
 
 from ...utils.logger import logger
+from .cache_budget import nbytes
 from .tools.chat_template import ChatTemplate
 
 
@@ -87,6 +91,30 @@ def load_mlx_model(
         raise RuntimeError(f"Model loading failed for {model_id}: {e}") from e
 
 
+def weight_file_bytes(model_id: Optional[str]) -> int:
+    """Size of a model's weight files, if the model is available locally.
+
+    Estimates the memory a model takes before it is loaded, without
+    downloading it.
+
+    Returns:
+        Bytes of the safetensors files, 0 if the model is not found locally
+    """
+    if not model_id:
+        return 0
+    path = model_id
+    if not os.path.isdir(path):
+        try:
+            path = snapshot_download(
+                model_id, local_files_only=True, allow_patterns=["*.safetensors"]
+            )
+        except Exception:
+            return 0
+    return sum(
+        os.path.getsize(f) for f in glob.glob(os.path.join(path, "*.safetensors"))
+    )
+
+
 class MLXModel:
     """Simplified MLX model container.
 
@@ -163,6 +191,14 @@ class MLXModel:
         """Hash based on model configuration for use as dict keys."""
         return hash((self.model_id, self.adapter_path, self.draft_model_id))
 
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the weights of the model and its draft model."""
+        total = nbytes(self.model.parameters())
+        if self.draft_model is not None:
+            total += nbytes(self.draft_model.parameters())
+        return total
+
     def has_adapter(self) -> bool:
         """Check if this model has an adapter configured."""
         return self.adapter_path is not None
@@ -0,0 +1,225 @@
+"""Model Preload - loads and warms up models when the server starts.
+
+The first request to a model pays for loading its weights and tokenizer and
+for compiling its chat template and first kernels. Models given with
+``--preload model[,adapter][,draft]`` (``MLX_OMNI_PRELOAD``, specs separated by
+``;``) or marked ``preload`` in the model registry are loaded into the wrapper
+cache at startup, each runs a short dummy prefill and decode, and they are
+kept resident through idle periods.
+
+The server is ready once every preloaded model is warm, so load balancers
+only route to warm replicas.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ...utils.logger import logger
+from .model_registry import ModelRegistry, shared_model_registry
+from .wrapper_cache import MLXWrapperCache, WrapperCacheKey, wrapper_cache
+
+# Separates model specs in MLX_OMNI_PRELOAD
+PRELOAD_SEPARATOR = ";"
+
+# Tokens decoded by the dummy request of the warm-up
+WARM_UP_TOKENS = 2
+
+
+def parse_preload_spec(spec: str) -> WrapperCacheKey:
+    """Parse a ``model[,adapter][,draft]`` spec, empty fields are left unset.
+
+    Raises:
+        ValueError: If the spec has no model or more than three fields
+    """
+    fields = [field.strip() for field in spec.split(",")]
+    if len(fields) > 3 or not fields[0]:
+        raise ValueError(
+            f"Invalid preload spec, expected model[,adapter][,draft]: {spec!r}"
+        )
+    fields += [""] * (3 - len(fields))
+    return WrapperCacheKey(
+        model_id=fields[0],
+        adapter_path=fields[1] or None,
+        draft_model_id=fields[2] or None,
+    )
+
+
+def configured_preload_keys(
+    registry: Optional[ModelRegistry] = None,
+) -> List[WrapperCacheKey]:
+    """Get the models to preload from ``MLX_OMNI_PRELOAD`` and the registry.
+
+    Specs may name registry aliases, invalid specs are skipped.
+    """
+    if registry is None:
+        registry = shared_model_registry()
+
+    keys = []
+    for spec in os.environ.get("MLX_OMNI_PRELOAD", "").split(PRELOAD_SEPARATOR):
+        if not spec.strip():
+            continue
+        try:
+            key = parse_preload_spec(spec)
+        except ValueError as e:
+            logger.error(str(e))
+            continue
+        key = WrapperCacheKey(
+            *registry.resolve(key.model_id, key.adapter_path, key.draft_model_id)
+        )
+        if key not in keys:
+            keys.append(key)
+    for profile in registry.profiles:
+        key = WrapperCacheKey(*profile.key)
+        if profile.preload and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def load_and_warm_up(
+    cache: MLXWrapperCache,
+    key: WrapperCacheKey,
+    warm_up_tokens: int = WARM_UP_TOKENS,
+    on_loaded: Optional[Callable[[float], None]] = None,
+) -> Tuple[float, float]:
+    """Load a model into the cache, keep it resident and warm it up.
+
+    Args:
+        cache: Wrapper cache the model is loaded into
+        key: Model to load
+        warm_up_tokens: Tokens decoded by the dummy request
+        on_loaded: Called with the load seconds before the warm-up starts
+
+    Returns:
+        Tuple of (load seconds, warm-up seconds)
+    """
+    start_time = time.perf_counter()
+    wrapper = cache.get_wrapper(
+        model_id=key.model_id,
+        adapter_path=key.adapter_path,
+        draft_model_id=key.draft_model_id,
+    )
+    cache.keep_resident(key)
+    load_seconds = time.perf_counter() - start_time
+    if on_loaded is not None:
+        on_loaded(load_seconds)
+
+    start_time = time.perf_counter()
+    wrapper.warm_up(warm_up_tokens)
+    return load_seconds, time.perf_counter() - start_time
+
+
+class ModelPreloader:
+    """Loads and warms up models in the background and tracks readiness.
+
+    Examples:
+        preloader = ModelPreloader(wrapper_cache)
+        preloader.start([WrapperCacheKey("mlx-community/Qwen3-0.6B-4bit")])
+        ...
+        preloader.is_ready()
+    """
+
+    def __init__(self, cache: MLXWrapperCache, warm_up_tokens: int = WARM_UP_TOKENS):
+        """Initialize preloader.
+
+        Args:
+            cache: Wrapper cache the models are loaded into
+            warm_up_tokens: Tokens decoded by the dummy request of the warm-up
+        """
+        self._cache = cache
+        self._warm_up_tokens = warm_up_tokens
+        self._lock = threading.Lock()
+        self._states: Dict[WrapperCacheKey, Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, keys: List[WrapperCacheKey]) -> None:
+        """Preload models in a background thread, the server keeps serving meanwhile."""
+        if not keys:
+            return
+        self._register(keys)
+        self._thread = threading.Thread(
+            target=self._preload, args=(keys,), name="model-preload", daemon=True
+        )
+        self._thread.start()
+
+    def run(self, keys: List[WrapperCacheKey]) -> None:
+        """Preload models in the calling thread."""
+        self._register(keys)
+        self._preload(keys)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for a background preload to finish."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_ready(self) -> bool:
+        """Whether every model to preload is loaded and warm."""
+        with self._lock:
+            return all(state["status"] == "ready" for state in self._states.values())
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get the readiness of the server and of every model to preload.
+
+        Returns:
+            Dictionary with the overall status (ready, warming_up or failed)
+            and the status, load and warm-up durations and error per model
+        """
+        with self._lock:
+            models = [
+                {
+                    "model": key.model_id,
+                    "adapter_path": key.adapter_path,
+                    "draft_model": key.draft_model_id,
+                    **state,
+                }
+                for key, state in self._states.items()
+            ]
+        statuses = {model["status"] for model in models}
+        if statuses <= {"ready"}:
+            status = "ready"
+        elif statuses <= {"ready", "failed"}:
+            status = "failed"
+        else:
+            status = "warming_up"
+        return {"status": status, "models": models}
+
+    def _register(self, keys: List[WrapperCacheKey]) -> None:
+        with self._lock:
+            for key in keys:
+                self._states[key] = {
+                    "status": "pending",
+                    "load_seconds": None,
+                    "warm_up_seconds": None,
+                    "error": None,
+                }
+
+    def _update(self, key: WrapperCacheKey, **state: Any) -> None:
+        with self._lock:
+            self._states[key].update(state)
+
+    def _preload(self, keys: List[WrapperCacheKey]) -> None:
+        # One model after the other, loading them concurrently would only
+        # compete for memory bandwidth
+        for key in keys:
+            try:
+                self._update(key, status="loading")
+                load_seconds, warm_up_seconds = load_and_warm_up(
+                    self._cache,
+                    key,
+                    self._warm_up_tokens,
+                    on_loaded=lambda seconds, key=key: self._update(
+                        key, status="warming_up", load_seconds=seconds
+                    ),
+                )
+                self._update(key, status="ready", warm_up_seconds=warm_up_seconds)
+                logger.info(
+                    f"Preloaded {key} (load {load_seconds:.1f}s, warm-up {warm_up_seconds:.1f}s)"
+                )
+            except Exception as e:
+                self._update(key, status="failed", error=str(e))
+                logger.error(f"Failed to preload {key}: {e}")
+
+
+# Global preloader of the server's wrapper cache
+model_preloader = ModelPreloader(wrapper_cache)
@@ -3,11 +3,26 @@ Prompt Cache Management Module
 
 This module provides functionality for managing and optimizing model prompt caching,
 to improve performance in multi-turn conversations.
+
+Each model has a ``PromptCachePool`` of KV cache slots, so several conversations
+keep their state at the same time. A request leases the slot continuing its
+conversation, or a new slot starting from the longest prefix in the model's
+radix tree of KV blocks, and the least recently used slot is evicted when a new
+conversation needs room. With a ``DiskPromptCache`` evicted slots are persisted
+and restored after restarts. Slots of requests with a KV window hold rotating
+caches of constant size. Requests with a session id keep a dedicated slot for
+their session until it expires. A ``PromptCacheBudget`` bounds the bytes held
+by the slots and radix trees of all models.
 """
 
+import threading
+import time
+import uuid
+from array import array
 from dataclasses import dataclass, field
-from typing import Any, List
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
 from mlx_lm.models.cache import (
     can_trim_prompt_cache,
     make_prompt_cache,
@@ -17,31 +32,64 @@ from mlx_lm.models.cache import (
 from mlx_omni_server.chat.mlx.model_types import MLXModel
 
 from ...utils.logger import logger
+from .cache_budget import EvictionCandidate, PromptCacheBudget, cache_nbytes
+from .disk_cache import DiskPromptCache, disk_cache_namespace
+from .radix_cache import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_PREFIX_CACHE_TOKENS,
+    KVFormat,
+    RadixNode,
+    RadixPrefixCache,
+    as_token_array,
+    cache_kv_format,
+)
+from .rotating_cache import (
+    KVWindow,
+    make_window_cache,
+    snapshot_window_cache,
+    trim_window_cache,
+    window_cache_from,
+)
+
+# Tokens compared per vectorized step, so an early mismatch stops early
+_PREFIX_CHUNK = 1 << 14
+
+
+def _as_numpy(tokens: Sequence[int]) -> np.ndarray:
+    """View an ``array('i')`` as a NumPy array, convert other sequences."""
+    if isinstance(tokens, array) and tokens.typecode == "i":
+        return np.frombuffer(tokens, dtype=np.intc)
+    return np.asarray(tokens, dtype=np.intc)
 
 
 def common_prefix_len(list1, list2):
     """
-    Calculates the length of the common prefix of two lists.
+    Calculates the length of the common prefix of two token sequences.
+
+    The sequences are compared with NumPy in chunks. ``array('i')`` token
+    buffers are compared in place, other sequences are converted first.
 
     Args:
-        list1: The first list of strings.
-        list2: The second list of strings.
+        list1: The first token sequence.
+        list2: The second token sequence.
 
     Returns:
-        The length of the common prefix. Returns 0 if lists are empty
+        The length of the common prefix. Returns 0 if sequences are empty
         or do not match at the first element.
     """
-    # Determine the maximum possible length of the common prefix
     min_len = min(len(list1), len(list2))
+    if min_len == 0:
+        return 0
 
-    # Iterate up to the length of the shorter list
-    for i in range(min_len):
-        if list1[i] != list2[i]:
-            # Mismatch found, the common prefix length is the current index
-            return i
+    tokens1, tokens2 = _as_numpy(list1), _as_numpy(list2)
+    for start in range(0, min_len, _PREFIX_CHUNK):
+        end = min(start + _PREFIX_CHUNK, min_len)
+        mismatches = np.flatnonzero(tokens1[start:end] != tokens2[start:end])
+        if mismatches.size:
+            # Mismatch found, the common prefix length is its index
+            return start + int(mismatches[0])
 
-    # No mismatch found within the bounds of the shorter list,
-    # so the common prefix length is the length of the shorter list.
+    # No mismatch found within the bounds of the shorter sequence
     return min_len
 
 
@@ -51,27 +99,53 @@ class PromptCache:
     Prompt cache class for storing and managing model prompt caches
 
     Attributes:
-        tokens: Cached token sequence
+        tokens: Cached token sequence, a compact ``array('i')``
         cache: Model's KV cache state, a list matching the number of model layers
         model_key: Model identifier to ensure cache matches the model
+        prompt_length: Number of prompt tokens of the last request, the
+                       remaining tokens were generated
+        window: Rotating KV cache as (max_size, sink tokens), None for an
+                unbounded cache
+        checkpoint: Copy of the rotating KV cache as the last prompt was
+                    prefilled, it can be trimmed further than the decoded one
+        last_used: ``time.monotonic()`` of the last release
+        session_id: Client session the slot is dedicated to, None if shared
     """
 
-    tokens: List[int] = field(default_factory=list)
+    tokens: array = field(default_factory=lambda: array("i"))
     cache: List[Any] = field(default_factory=list)
     model_key: str = ""
+    prompt_length: int = 0
+    window: KVWindow = None
+    checkpoint: List[Any] = field(default_factory=list)
+    last_used: float = 0.0
+    session_id: Optional[str] = None
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes allocated by the KV cache and its checkpoint."""
+        return cache_nbytes(self.cache) + cache_nbytes(self.checkpoint)
 
     def extend_completion_cache(self, completion_tokens):
         self.tokens.extend(completion_tokens)
 
+    def checkpoint_window(self, cache: List[Any]) -> None:
+        """Keep a copy of the prefilled rotating KV cache for the next turn."""
+        self.checkpoint = snapshot_window_cache(cache)
+
     def reset_prompt_cache(self, model: MLXModel, prompt):
         logger.debug("*** Resetting cache. ***")
         self.model_key = model.model_id
-        self.cache = make_prompt_cache(model.model)
+        self.checkpoint = []
+        if self.window is not None:
+            self.cache = make_window_cache(model.model, self.window)
+        else:
+            self.cache = make_prompt_cache(model.model)
 
         if model.draft_model is not None:
             self.cache += make_prompt_cache(model.draft_model)
 
-        self.tokens = list(prompt)  # Cache the new prompt fully
+        self.tokens = array("i", prompt)  # Cache the new prompt fully
 
     def get_prompt_cache(self, model, prompt):
         """
@@ -84,13 +158,14 @@ class PromptCache:
         recomputation.
 
         Args:
-            prompt (List[int]): The tokenized new prompt.
+            prompt (Sequence[int]): The tokenized new prompt.
 
         Returns:
             List[int]: The suffix of the prompt that actually needs to be processed
                        by the model. This will be the full prompt if the cache is
                        reset or cannot be effectively used.
         """
+        prompt = as_token_array(prompt)
         cache_len = len(self.tokens)
         prompt_len = len(prompt)
         com_prefix_len = common_prefix_len(self.tokens, prompt)
@@ -118,10 +193,26 @@ class PromptCache:
                 f"*** Common prefix ({com_prefix_len}) shorter than cache ({cache_len}). Attempting trim. ***"
             )
 
+            num_to_trim = cache_len - com_prefix_len
             if can_trim_prompt_cache(self.cache):
-                num_to_trim = cache_len - com_prefix_len
                 logger.debug(f"    Trimming {num_to_trim} tokens from cache.")
                 trim_prompt_cache(self.cache, num_to_trim)
+                trimmed = True
+            else:
+                # Rotated windows may still hold what the shorter sequence
+                # needs, the prefilled checkpoint holds more than the decoded one
+                trimmed = trim_window_cache(self.cache, num_to_trim)
+                if not trimmed and self.checkpoint:
+                    com_prefix_len = min(com_prefix_len, self.checkpoint[0].offset)
+                    num_to_trim = self.checkpoint[0].offset - com_prefix_len
+                    trimmed = trim_window_cache(self.checkpoint, num_to_trim)
+                    if trimmed:
+                        self.cache = self.checkpoint
+                if trimmed:
+                    logger.debug(f"    Trimming {num_to_trim} tokens from window.")
+            self.checkpoint = []
+
+            if trimmed:
                 self.tokens = self.tokens[:com_prefix_len]
                 prompt = prompt[com_prefix_len:]
                 self.tokens.extend(prompt)
@@ -138,4 +229,538 @@ class PromptCache:
             self.reset_prompt_cache(model, prompt)
 
         logger.debug(f"Returning {len(prompt)} tokens for processing.")
-        return prompt, prompt_cached_tokens
+        return prompt.tolist(), prompt_cached_tokens
+
+
+# Default number of prompt cache slots per model
+DEFAULT_PROMPT_CACHE_SLOTS = 4
+
+# Default seconds a session keeps its slot after its last request
+DEFAULT_SESSION_TTL = 600.0
+
+# Request header naming the client session, for a dedicated prompt cache slot
+SESSION_HEADER = "X-Session-Id"
+
+
+@dataclass
+class PinnedPrefix:
+    """A prompt prefix whose radix tree blocks are never evicted.
+
+    Attributes:
+        id: Pin identifier
+        prompt_tokens: Number of tokens of the pinned prompt
+        pinned_tokens: Number of tokens held by the pinned blocks
+        created: Unix time the prefix was pinned
+        expires_at: Unix time the pin is dropped, None to keep it until unpinned
+        path: Referenced radix tree nodes
+    """
+
+    id: str
+    prompt_tokens: int
+    pinned_tokens: int
+    created: int = field(default_factory=lambda: int(time.time()))
+    expires_at: Optional[float] = None
+    path: List[RadixNode] = field(default_factory=list, repr=False)
+
+
+class PromptCachePool:
+    """Prompt cache slots of one model, each leased to one request at a time.
+
+    A request continues the free slot holding the longest earlier prompt of its
+    conversation, i.e. a prompt that is a prefix of the new one, and the slot's
+    generated tokens are trimmed where they diverge. Any other request gets a
+    fresh slot (or the least recently used free slot) assembled from the
+    longest prefix found in the pool's ``RadixPrefixCache``, which holds the KV
+    blocks of every sequence run on the model, or in the ``DiskPromptCache``
+    if that holds a longer one. Evicted slots are persisted to the disk cache.
+    With a ``PromptCacheBudget`` free slots and tree blocks are also evicted
+    when the caches of all models outgrow it.
+
+    Slots, blocks and files holding a quantized KV cache are only reused by
+    requests asking for the same quantization. Full precision ones are reused
+    by every request, generation quantizes them if requested. Slots with a
+    rotating KV window are only reused by requests asking for the same window,
+    they are seeded from radix tree prefixes fitting into the window and are
+    neither indexed in the tree nor persisted.
+
+    A request with a session id continues the slot of its session even if its
+    prompt diverges from the cached one, e.g. after the client edited earlier
+    turns. Session slots are not continued by other requests and are evicted
+    after the slots of no or expired sessions, least recently used first. A
+    session expires ``session_ttl`` seconds after its last request.
+
+    Examples:
+        pool = PromptCachePool(num_slots=4)
+        lease = pool.acquire(model, prompt_tokens)
+        if lease is not None:
+            slot, remaining_tokens, cached_tokens = lease
+            ...  # generate with slot.cache
+            pool.release(slot)
+    """
+
+    def __init__(
+        self,
+        num_slots: int = DEFAULT_PROMPT_CACHE_SLOTS,
+        prefix_cache_tokens: int = DEFAULT_PREFIX_CACHE_TOKENS,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        disk_cache: Optional[DiskPromptCache] = None,
+        budget: Optional[PromptCacheBudget] = None,
+        session_ttl: float = DEFAULT_SESSION_TTL,
+    ):
+        """Initialize pool.
+
+        Args:
+            num_slots: Maximum number of KV cache slots kept for the model
+            prefix_cache_tokens: Maximum number of tokens kept in the radix
+                                 tree shared by all requests (0 disables it)
+            block_size: Number of tokens per radix tree KV block
+            disk_cache: Persists evicted slots and restores their prefixes
+            budget: Memory budget shared with the pools of other models
+            session_ttl: Seconds a session keeps its slot after its last
+                         request (0 keeps it until evicted as least recently
+                         used)
+        """
+        self.num_slots = num_slots
+        self.prefix_cache = RadixPrefixCache(prefix_cache_tokens, block_size)
+        self.disk_cache = disk_cache
+        self.budget = budget
+        self.session_ttl = session_ttl
+        self._namespace = ""
+        self._lock = threading.Lock()
+        self._slots: List[PromptCache] = []  # Least recently used first
+        self._leased: List[PromptCache] = []
+        # Radix tree blocks referenced by leased slots, by slot identity
+        self._paths: Dict[int, List[RadixNode]] = {}
+        self._pins: Dict[str, PinnedPrefix] = {}
+
+        if budget is not None:
+            budget.register(self)
+
+        # Statistics
+        self._requests = 0
+        self._hits = 0
+        self._uncached = 0
+        self._evictions = 0
+        self._session_requests = 0
+        self._session_hits = 0
+        self._prompt_tokens = 0
+        self._cached_tokens = 0
+
+    def acquire(
+        self,
+        model: MLXModel,
+        prompt: Sequence[int],
+        kv_format: KVFormat = None,
+        window: KVWindow = None,
+        session_id: Optional[str] = None,
+    ) -> Optional[Tuple["PromptCache", List[int], int]]:
+        """Lease the best matching slot for a prompt.
+
+        Args:
+            model: Model the KV cache belongs to
+            prompt: Tokenized prompt
+            kv_format: KV cache quantization as (bits, group size) the request
+                       generates with, None for full precision
+            window: Rotating KV cache as (max_size, sink tokens) the request
+                    generates with, None for an unbounded cache
+            session_id: Client session the request belongs to, its slot is
+                        kept for the session's next requests
+
+        Returns:
+            Tuple of (leased slot, prompt tokens that still need processing,
+            number of cached tokens), or None if every slot is leased
+        """
+        prompt = as_token_array(prompt)
+        evicted = None
+        self._expire_pins()
+        with self._lock:
+            self._namespace = disk_cache_namespace(model)
+            self._requests += 1
+            self._prompt_tokens += len(prompt)
+            self._session_requests += session_id is not None
+            free = [s for s in self._slots if not self._is_leased(s)]
+            if not free and len(self._slots) >= self.num_slots:
+                self._uncached += 1
+                return None
+
+            now = time.monotonic()
+            for s in free:
+                if s.session_id is not None and not self._is_live(s, now):
+                    s.session_id = None  # Expired, shared again
+
+            # The session's own slot, wherever its prompt diverges
+            slot = None
+            if session_id is not None:
+                best = 0
+                for candidate in free:
+                    if (
+                        candidate.session_id == session_id
+                        and candidate.model_key == model.model_id
+                        and cache_kv_format(candidate.cache) in (None, kv_format)
+                        and candidate.window == window
+                    ):
+                        length = common_prefix_len(candidate.tokens, prompt)
+                        if length > best:
+                            slot, best = candidate, length
+                self._session_hits += slot is not None
+
+            # Longest earlier prompt of the same conversation
+            for candidate in free if slot is None else []:
+                length = candidate.prompt_length
+                if (
+                    candidate.model_key == model.model_id
+                    and candidate.session_id in (None, session_id)
+                    and length <= len(prompt)
+                    and (slot is None or length > slot.prompt_length)
+                    and cache_kv_format(candidate.cache) in (None, kv_format)
+                    and candidate.window == window
+                    and common_prefix_len(candidate.tokens, prompt) >= length
+                ):
+                    slot = candidate
+            continues = slot is not None
+
+            if not continues:
+                if len(self._slots) < self.num_slots:
+                    slot = PromptCache()
+                    self._slots.append(slot)
+                else:
+                    # Least recently used, slots of live sessions last
+                    slot = min(free, key=lambda s: s.session_id is not None)
+                    self._evictions += 1
+                    logger.debug(
+                        f"Evicting prompt cache slot of {len(slot.tokens)} tokens"
+                    )
+                    if (
+                        self.disk_cache is not None
+                        and slot.tokens
+                        and slot.window is None
+                    ):
+                        # Hand the KV state over to the disk cache writer
+                        evicted = (
+                            self._disk_namespace(cache_kv_format(slot.cache)),
+                            slot.tokens,
+                            slot.cache,
+                        )
+                        slot.tokens, slot.cache, slot.model_key = array("i"), [], ""
+                compatible = cache_kv_format(slot.cache) in (None, kv_format)
+                if not compatible or slot.window != window:
+                    slot.tokens = array("i")  # Start over with the request's cache
+                slot.window = window
+            slot.session_id = session_id
+
+            # Slots compare by value, track them by identity
+            self._slots = [s for s in self._slots if s is not slot] + [slot]
+            self._leased.append(slot)
+
+        if evicted is not None:
+            self.disk_cache.save(*evicted)
+
+        try:
+            if not continues:
+                self._restore_prefix(slot, model, prompt, kv_format, window)
+            remaining, cached_tokens = slot.get_prompt_cache(model, prompt)
+        except Exception:
+            self.release(slot)
+            raise
+
+        with self._lock:
+            slot.prompt_length = len(prompt)
+            self._hits += cached_tokens > 0
+            self._cached_tokens += cached_tokens
+        return slot, remaining, cached_tokens
+
+    def _restore_prefix(
+        self,
+        slot: "PromptCache",
+        model: MLXModel,
+        prompt: array,
+        kv_format: KVFormat,
+        window: KVWindow = None,
+    ) -> None:
+        """Start a slot from the longest prefix in the radix tree or on disk."""
+        # Leave at least one token in the prompt
+        path = self.prefix_cache.match(prompt[:-1], kv_format)
+        num_tokens = len(path) * self.prefix_cache.block_size
+        cache = None
+
+        if window is not None:
+            # Only full precision prefixes fitting into the window seed it
+            fitting = (window[0] - 1) // self.prefix_cache.block_size
+            self.prefix_cache.release(path[fitting:])
+            path = path[:fitting]
+            num_tokens = len(path) * self.prefix_cache.block_size
+            if path and path[-1].kv_format is None:
+                cache = window_cache_from(self.prefix_cache.make_cache(path), window)
+            self.prefix_cache.release(path)
+            if cache is not None:
+                slot.model_key = model.model_id
+                slot.cache, slot.checkpoint = cache, []
+                slot.tokens = prompt[:num_tokens]
+            return
+
+        if self.disk_cache is not None:
+            found = None
+            for namespace in dict.fromkeys(
+                [self._disk_namespace(kv_format), self._namespace]
+            ):
+                match = self.disk_cache.match(namespace, prompt[:-1])
+                if match is not None and (found is None or match[1] > found[1]):
+                    found = match
+            if found is not None and found[1] > num_tokens:
+                cache = self.disk_cache.load(*found)
+                if cache is not None:
+                    self.prefix_cache.release(path)
+                    path, num_tokens = [], found[1]
+
+        if path:
+            with self._lock:
+                self._paths[id(slot)] = path
+            cache = self.prefix_cache.make_cache(path)
+        if cache is not None:
+            slot.model_key = model.model_id
+            slot.cache = cache
+            slot.tokens = prompt[:num_tokens]
+
+    def release(self, slot: "PromptCache") -> None:
+        """Return a leased slot to the pool and index its KV blocks."""
+        with self._lock:
+            path = self._paths.pop(id(slot), [])
+        self._expire_pins()
+        try:
+            self.prefix_cache.insert(slot.tokens, slot.cache)
+        finally:
+            self.prefix_cache.release(path)
+            with self._lock:
+                slot.last_used = time.monotonic()
+                if self._is_leased(slot):
+                    self._leased = [s for s in self._leased if s is not slot]
+        if self.budget is not None:
+            self.budget.enforce()
+
+    def pin(
+        self,
+        tokens: List[int],
+        kv_format: KVFormat = None,
+        ttl: Optional[float] = None,
+    ) -> PinnedPrefix:
+        """Keep the radix tree blocks of a cached prompt from being evicted.
+
+        Pinning the same prefix again returns the existing pin, a pin with a
+        time to live is extended.
+
+        Args:
+            tokens: Prompt tokens, usually just run through the pool
+            kv_format: KV cache quantization the prompt was run with
+            ttl: Seconds until the pin is dropped, None to keep it until unpinned
+
+        Returns:
+            The pinned prefix
+
+        Raises:
+            ValueError: If no block of the prompt is in the radix tree
+        """
+        if not self.prefix_cache.enabled:
+            raise ValueError("The prefix cache is disabled")
+        path = self.prefix_cache.match(tokens, kv_format)
+        if not path:
+            raise ValueError(
+                "No KV blocks cached for the prompt, it is shorter than a block "
+                "or the model's KV cache cannot be shared"
+            )
+
+        expires_at = None if ttl is None else time.time() + ttl
+        with self._lock:
+            for pinned in self._pins.values():
+                if pinned.path[-1] is path[-1]:
+                    if pinned.expires_at is not None:
+                        pinned.expires_at = (
+                            None
+                            if expires_at is None
+                            else max(pinned.expires_at, expires_at)
+                        )
+                    break
+            else:
+                pinned = PinnedPrefix(
+                    id=f"pin-{uuid.uuid4().hex[:12]}",
+                    prompt_tokens=len(tokens),
+                    pinned_tokens=len(path) * self.prefix_cache.block_size,
+                    expires_at=expires_at,
+                    path=path,
+                )
+                self._pins[pinned.id] = pinned
+                return pinned
+        self.prefix_cache.release(path)
+        return pinned
+
+    def retain(
+        self, tokens: List[int], kv_format: KVFormat = None, ttl: float = 0.0
+    ) -> int:
+        """Evict the radix tree blocks of a cached prompt last for a while.
+
+        Unlike pinned blocks, retained blocks are still evicted when the tree
+        or the memory budget needs room, so clients cannot grow the cache
+        beyond its limits.
+
+        Args:
+            tokens: Prompt tokens, usually just run through the pool
+            kv_format: KV cache quantization the prompt was run with
+            ttl: Seconds the blocks are ranked as used
+
+        Returns:
+            Number of tokens retained
+
+        Raises:
+            ValueError: If no block of the prompt is in the radix tree
+        """
+        if not self.prefix_cache.enabled:
+            raise ValueError("The prefix cache is disabled")
+        retained_tokens = self.prefix_cache.retain(tokens, kv_format, ttl)
+        if not retained_tokens:
+            raise ValueError(
+                "No KV blocks cached for the prompt, it is shorter than a block "
+                "or the model's KV cache cannot be shared"
+            )
+        return retained_tokens
+
+    def unpin(self, pin_id: str) -> bool:
+        """Make a pinned prefix evictable again.
+
+        Returns:
+            Whether the pin existed
+        """
+        with self._lock:
+            pinned = self._pins.pop(pin_id, None)
+        if pinned is None:
+            return False
+        self.prefix_cache.release(pinned.path)
+        return True
+
+    def list_pins(self) -> List[PinnedPrefix]:
+        """Get the pinned prefixes, oldest first."""
+        self._expire_pins()
+        with self._lock:
+            return list(self._pins.values())
+
+    def _expire_pins(self) -> None:
+        """Drop the pins whose time to live has passed."""
+        now = time.time()
+        with self._lock:
+            expired = [
+                pinned
+                for pinned in self._pins.values()
+                if pinned.expires_at is not None and pinned.expires_at <= now
+            ]
+            for pinned in expired:
+                del self._pins[pinned.id]
+        for pinned in expired:
+            self.prefix_cache.release(pinned.path)
+
+    def _disk_namespace(self, kv_format: KVFormat) -> str:
+        """Disk cache namespace of the model's caches with a quantization."""
+        if kv_format is None:
+            return self._namespace
+        bits, group_size = kv_format
+        return f"{self._namespace}|kv{bits}g{group_size}"
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the slots, leased ones included, and the radix tree."""
+        with self._lock:
+            slots = list(self._slots)
+        return sum(s.nbytes for s in slots) + self.prefix_cache.nbytes
+
+    def eviction_candidates(self) -> List[EvictionCandidate]:
+        """Free slots and unreferenced radix tree leaves the budget may evict."""
+        with self._lock:
+            free = [s for s in self._slots if s.cache and not self._is_leased(s)]
+        candidates = [
+            EvictionCandidate(
+                tokens=len(slot.tokens),
+                last_used=slot.last_used,
+                evict=lambda slot=slot: self._evict_slot(slot),
+            )
+            for slot in free
+        ]
+        return candidates + self.prefix_cache.eviction_candidates()
+
+    def _evict_slot(self, slot: "PromptCache") -> int:
+        """Drop a slot if it is still free, persisting it to the disk cache."""
+        with self._lock:
+            if self._is_leased(slot) or not any(s is slot for s in self._slots):
+                return 0
+            self._slots = [s for s in self._slots if s is not slot]
+            self._evictions += 1
+        size = slot.nbytes
+        logger.debug(f"Evicting prompt cache slot of {size} bytes to fit the budget")
+        self._persist(slot)
+        return size
+
+    def _persist(self, slot: "PromptCache") -> None:
+        """Hand a dropped slot's KV state over to the disk cache writer."""
+        if self.disk_cache is not None and slot.tokens and slot.window is None:
+            namespace = self._disk_namespace(cache_kv_format(slot.cache))
+            self.disk_cache.save(namespace, slot.tokens, slot.cache)
+
+    def close(self) -> None:
+        """Drop the free slots, persisting them to the disk cache."""
+        with self._lock:
+            closed = [s for s in self._slots if not self._is_leased(s)]
+            self._slots = [s for s in self._slots if self._is_leased(s)]
+
+        for slot in closed:
+            self._persist(slot)
+        if self.budget is not None:
+            self.budget.unregister(self)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get prompt cache statistics.
+
+        Returns:
+            Dictionary with slot usage, the share of requests that reused cached
+            tokens (``hit_rate``), the share of prompt tokens served from the
+            cache (``token_hit_rate``), the bytes held by the slots and the
+            radix tree, radix tree and disk cache statistics
+        """
+        self._expire_pins()
+        now = time.monotonic()
+        with self._lock:
+            stats = {
+                "slots": self.num_slots,
+                "used_slots": len(self._slots),
+                "leased_slots": len(self._leased),
+                "cached_tokens_per_slot": [len(s.tokens) for s in self._slots],
+                "bytes_per_slot": [s.nbytes for s in self._slots],
+                "requests": self._requests,
+                "hits": self._hits,
+                "hit_rate": self._hits / self._requests if self._requests else 0.0,
+                "uncached_requests": self._uncached,
+                "evictions": self._evictions,
+                "sessions": len(
+                    {s.session_id for s in self._slots if self._is_live(s, now)}
+                ),
+                "session_requests": self._session_requests,
+                "session_hits": self._session_hits,
+                "prompt_tokens": self._prompt_tokens,
+                "cached_tokens": self._cached_tokens,
+                "token_hit_rate": (
+                    self._cached_tokens / self._prompt_tokens
+                    if self._prompt_tokens
+                    else 0.0
+                ),
+                "prefix_cache": self.prefix_cache.get_stats(),
+                "pinned_prefixes": len(self._pins),
+                "pinned_tokens": sum(p.pinned_tokens for p in self._pins.values()),
+            }
+        stats["bytes"] = sum(stats["bytes_per_slot"]) + stats["prefix_cache"]["bytes"]
+        if self.disk_cache is not None:
+            stats["disk_cache"] = self.disk_cache.get_stats()
+        return stats
+
+    def _is_live(self, slot: "PromptCache", now: float) -> bool:
+        """Whether a slot is dedicated to a session that has not expired."""
+        if slot.session_id is None:
+            return False
+        return self.session_ttl <= 0 or now - slot.last_used <= self.session_ttl
+
+    def _is_leased(self, slot: "PromptCache") -> bool:
+        return any(s is slot for s in self._leased)
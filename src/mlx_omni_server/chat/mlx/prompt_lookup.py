@@ -0,0 +1,152 @@
+"""Prompt Lookup Decoding - speculative decoding without a draft model.
+
+Speculative decoding with a draft model costs a second model in memory. For
+code editing and RAG the output often copies long spans of the prompt, so the
+continuation can be guessed much more cheaply: find the latest earlier
+occurrence of the last few tokens in the prompt and generated history, and
+propose the tokens that followed it. The model verifies all proposed tokens in
+one forward pass, exactly like draft tokens, so the output is the same as
+without lookup and every accepted token saves a decode step.
+"""
+
+from typing import Dict, Generator, List, Optional, Tuple
+
+import mlx.core as mx
+import mlx.nn as nn
+
+from .speculative import AdaptiveDraftLength, DraftStats, speculative_generate_step
+
+# Default maximum number of tokens proposed per verification step
+DEFAULT_NUM_DRAFT_TOKENS = 10
+
+# Longest and shortest n-gram looked up in the history
+DEFAULT_MAX_NGRAM_SIZE = 3
+DEFAULT_MIN_NGRAM_SIZE = 2
+
+
+class NgramIndex:
+    """Token history indexed by n-grams for constant time draft lookup.
+
+    Every n-gram is mapped to the position following its latest occurrence that
+    already has a continuation, so the trailing n-gram never matches itself.
+
+    Examples:
+        index = NgramIndex([1, 2, 3, 4, 1, 2])
+        index.draft(2)  # [3, 4]
+    """
+
+    def __init__(
+        self,
+        tokens: List[int],
+        max_ngram_size: int = DEFAULT_MAX_NGRAM_SIZE,
+        min_ngram_size: int = DEFAULT_MIN_NGRAM_SIZE,
+    ):
+        """Index the initial history.
+
+        Args:
+            tokens: Token history, typically the full prompt
+            max_ngram_size: Longest trailing n-gram to look up
+            min_ngram_size: Shortest trailing n-gram to look up
+        """
+        if not 1 <= min_ngram_size <= max_ngram_size:
+            raise ValueError("Invalid n-gram sizes")
+        self.max_ngram_size = max_ngram_size
+        self.min_ngram_size = min_ngram_size
+        self.tokens: List[int] = []
+        self._positions: Dict[Tuple[int, ...], int] = {}
+        self.extend(tokens)
+
+    def append(self, token: int) -> None:
+        """Add a token to the history."""
+        end = len(self.tokens)
+        for size in range(self.min_ngram_size, min(self.max_ngram_size, end) + 1):
+            self._positions[tuple(self.tokens[end - size : end])] = end
+        self.tokens.append(token)
+
+    def extend(self, tokens: List[int]) -> None:
+        for token in tokens:
+            self.append(token)
+
+    def draft(self, num_tokens: int) -> List[int]:
+        """Propose up to ``num_tokens`` tokens continuing the history.
+
+        The longest trailing n-gram that occurred before wins. If its
+        continuation reaches the end of the history, the history is periodic
+        and the draft continues the period.
+
+        Returns:
+            Proposed tokens, empty if no trailing n-gram occurred before
+        """
+        if num_tokens <= 0:
+            return []
+        for size in range(self.max_ngram_size, self.min_ngram_size - 1, -1):
+            if size > len(self.tokens):
+                continue
+            start = self._positions.get(tuple(self.tokens[-size:]))
+            if start is not None:
+                period = len(self.tokens) - start
+                return [self.tokens[start + i % period] for i in range(num_tokens)]
+        return []
+
+
+class NgramDrafter:
+    """Drafts tokens by n-gram lookup for ``speculative_generate_step``."""
+
+    def __init__(self, index: NgramIndex):
+        self.index = index
+        self._last_draft: List[int] = []
+
+    def draft(self, num_tokens: int) -> List[int]:
+        self._last_draft = self.index.draft(num_tokens)
+        return self._last_draft
+
+    def update(self, num_accepted: int, token: int) -> None:
+        """Add the accepted draft tokens and the verified token to the history."""
+        self.index.extend(self._last_draft[:num_accepted])
+        self.index.append(token)
+
+
+def prompt_lookup_generate_step(
+    prompt: mx.array,
+    model: nn.Module,
+    *,
+    context_tokens: Optional[List[int]] = None,
+    num_draft_tokens: int = DEFAULT_NUM_DRAFT_TOKENS,
+    max_ngram_size: int = DEFAULT_MAX_NGRAM_SIZE,
+    min_ngram_size: int = DEFAULT_MIN_NGRAM_SIZE,
+    draft_length: Optional[AdaptiveDraftLength] = None,
+    draft_stats: Optional[DraftStats] = None,
+    **kwargs,
+) -> Generator[Tuple[int, mx.array, bool], None, None]:
+    """Generate tokens, drafting continuations by n-gram lookup.
+
+    Steps without a match are plain decode steps.
+
+    Args:
+        prompt: Prompt tokens still to be processed
+        model: The model to generate with
+        context_tokens: Tokens already held by the prompt cache (cached prefix),
+                        searched for drafts together with the prompt
+        num_draft_tokens: Maximum tokens proposed per step
+        max_ngram_size: Longest trailing n-gram to look up
+        min_ngram_size: Shortest trailing n-gram to look up
+        draft_length: Chooses the number of draft tokens per step (default:
+                      adaptive up to ``num_draft_tokens``)
+        draft_stats: Receives the number of proposed and accepted draft tokens
+        **kwargs: Further ``speculative_generate_step`` parameters (max_tokens,
+                  sampler, logits_processors, prompt_cache, etc.)
+
+    Yields:
+        Tuples of (token, log probabilities, whether the token was drafted)
+    """
+    index = NgramIndex(
+        list(context_tokens or []) + prompt.tolist(), max_ngram_size, min_ngram_size
+    )
+    yield from speculative_generate_step(
+        prompt,
+        model,
+        NgramDrafter(index),
+        draft_length=draft_length or AdaptiveDraftLength(num_draft_tokens),
+        draft_stats=draft_stats,
+        **kwargs,
+    )
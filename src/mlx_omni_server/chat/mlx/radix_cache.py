@@ -0,0 +1,423 @@
+"""Radix Prefix Cache - KV blocks shared by all requests of a model.
+
+Prompt cache slots only continue the conversation they hold, so hundreds of
+sessions sharing the same system prompt and tool definitions would each prefill
+it again. The radix tree stores the KV state of every cached sequence in blocks
+of ``block_size`` tokens. Each node holds one block and is keyed by its tokens,
+so a path from the root spells a token prefix and common prefixes are stored
+once. A request copies the blocks of its longest matching path into a fresh KV
+cache and only prefills the rest.
+
+Blocks on the path of a running request are referenced and never evicted.
+Unreferenced leaves are evicted least recently used first when the tree grows
+beyond its token budget. Retained blocks count as used until their retention
+ends, so they are evicted last but still make room under pressure.
+
+Quantized KV caches are stored as quantized blocks under a separate root per
+quantization, so they keep their smaller footprint in the tree. The tree
+accounts the bytes of its blocks and offers its unreferenced leaves to the
+``PromptCacheBudget``.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import mlx.core as mx
+from mlx_lm.models.cache import KVCache, QuantizedKVCache
+
+from .cache_budget import EvictionCandidate, nbytes
+
+# Default number of tokens per KV block
+DEFAULT_BLOCK_SIZE = 64
+
+# Default number of tokens kept in the tree
+DEFAULT_PREFIX_CACHE_TOKENS = 16384
+
+# KV cache quantization as (bits, group size), None for full precision
+KVFormat = Optional[Tuple[int, int]]
+
+
+def as_token_array(tokens: Sequence[int]) -> array:
+    """Get tokens as a compact ``array('i')``, without copying one."""
+    if isinstance(tokens, array) and tokens.typecode == "i":
+        return tokens
+    return array("i", tokens)
+
+
+def cache_kv_format(cache: List[Any]) -> KVFormat:
+    """Quantization of a prompt cache, None if it is not quantized."""
+    for layer_cache in cache:
+        if isinstance(layer_cache, QuantizedKVCache):
+            return layer_cache.bits, layer_cache.group_size
+    return None
+
+
+def supports_blocks(cache: List[Any]) -> bool:
+    """Whether a prompt cache can be split into and assembled from KV blocks."""
+    if not cache:
+        return False
+    kv_format = cache_kv_format(cache)
+    if kv_format is None:
+        return all(type(layer_cache) is KVCache for layer_cache in cache)
+    return all(
+        type(layer_cache) is QuantizedKVCache
+        and (layer_cache.bits, layer_cache.group_size) == kv_format
+        for layer_cache in cache
+    )
+
+
+def _slice_block(x: Any, start: int, end: int) -> Any:
+    """Copy tokens ``start:end`` of keys or values, quantized ones are lists."""
+    if isinstance(x, (list, tuple)):
+        return [mx.contiguous(a[..., start:end, :]) for a in x]
+    return mx.contiguous(x[..., start:end, :])
+
+
+def _concat_blocks(blocks: List[Any]) -> Any:
+    if isinstance(blocks[0], list):
+        return [
+            mx.concatenate([b[i] for b in blocks], axis=2)
+            for i in range(len(blocks[0]))
+        ]
+    return mx.concatenate(blocks, axis=2)
+
+
+class RadixNode:
+    """One block of tokens and its keys and values in every cache layer.
+
+    Blocks are keyed by the raw bytes of their ``int32`` tokens, which hash and
+    compare much faster than tuples of ints. Quantized keys and values are
+    lists of [data, scales, biases].
+    """
+
+    def __init__(
+        self,
+        tokens: bytes,
+        parent: Optional["RadixNode"],
+        keys: Optional[List[Any]] = None,
+        values: Optional[List[Any]] = None,
+        kv_format: KVFormat = None,
+    ):
+        self.tokens = tokens
+        self.parent = parent
+        self.kv_format = kv_format
+        self.children: Dict[bytes, "RadixNode"] = {}
+        self.keys = keys or []
+        self.values = values or []
+        self.nbytes = nbytes([self.keys, self.values])
+        self.ref_count = 0
+        self.last_access = 0.0  # time.monotonic()
+        self.retained_until = 0.0  # time.monotonic()
+
+    @property
+    def priority(self) -> float:
+        """Time of last use for eviction, retention counts as use."""
+        return max(self.last_access, self.retained_until)
+
+
+class RadixPrefixCache:
+    """Radix tree of ref-counted KV blocks for one model.
+
+    Examples:
+        prefix_cache = RadixPrefixCache(max_tokens=16384)
+        path = prefix_cache.match(prompt_tokens)
+        cache = prefix_cache.make_cache(path) if path else make_prompt_cache(model)
+        ...  # process prompt_tokens[len(path) * prefix_cache.block_size:]
+        prefix_cache.insert(prompt_tokens, cache)
+        prefix_cache.release(path)
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = DEFAULT_PREFIX_CACHE_TOKENS,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+    ):
+        """Initialize tree.
+
+        Args:
+            max_tokens: Maximum number of tokens kept in the tree (0 disables it)
+            block_size: Number of tokens per KV block
+        """
+        if block_size <= 0:
+            raise ValueError("Block size must be positive")
+        self.block_size = block_size
+        self.max_blocks = max(max_tokens, 0) // block_size
+        self._roots: Dict[KVFormat, RadixNode] = {}
+        self._num_blocks = 0
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+        # Statistics
+        self._lookups = 0
+        self._hits = 0
+        self._reused_tokens = 0
+        self._inserted_blocks = 0
+        self._evicted_blocks = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_blocks > 0
+
+    def match(
+        self, tokens: Sequence[int], kv_format: KVFormat = None
+    ) -> List[RadixNode]:
+        """Find and reference the longest cached block prefix of ``tokens``.
+
+        Args:
+            tokens: Prompt tokens
+            kv_format: Quantization the request uses. Quantized requests also
+                       match full precision blocks, which they quantize later.
+
+        Returns:
+            Referenced nodes from the root, to be passed to ``release`` once
+            the request is done with them
+        """
+        path: List[RadixNode] = []
+        if not self.enabled:
+            return path
+
+        with self._lock:
+            self._lookups += 1
+            now = time.monotonic()
+            path = self._longest_path(tokens, kv_format)
+            for node in path:
+                node.ref_count += 1
+                node.last_access = now
+
+            if path:
+                self._hits += 1
+                self._reused_tokens += len(path) * self.block_size
+        return path
+
+    def retain(
+        self, tokens: Sequence[int], kv_format: KVFormat = None, ttl: float = 0.0
+    ) -> int:
+        """Evict the cached block prefix of ``tokens`` last for ``ttl`` seconds.
+
+        Unlike references, retention does not keep blocks beyond the token
+        budget or the memory budget, it only ranks them as used until then.
+
+        Returns:
+            Number of tokens retained
+        """
+        if not self.enabled:
+            return 0
+
+        with self._lock:
+            path = self._longest_path(tokens, kv_format)
+            retained_until = time.monotonic() + ttl
+            for node in path:
+                node.retained_until = max(node.retained_until, retained_until)
+        return len(path) * self.block_size
+
+    def release(self, path: List[RadixNode]) -> None:
+        """Drop the references taken by ``match``."""
+        with self._lock:
+            for node in path:
+                node.ref_count -= 1
+
+    def make_cache(self, path: List[RadixNode]) -> List[KVCache]:
+        """Assemble a prompt cache holding the blocks of a matched path.
+
+        The blocks are copied, so the cache can be extended and trimmed without
+        affecting the tree.
+        """
+        kv_format = path[0].kv_format
+        cache = []
+        for layer in range(len(path[0].keys)):
+            keys = _concat_blocks([node.keys[layer] for node in path])
+            values = _concat_blocks([node.values[layer] for node in path])
+            if kv_format is None:
+                layer_cache = KVCache()
+                layer_cache.state = (keys, values)
+            else:
+                bits, group_size = kv_format
+                layer_cache = QuantizedKVCache(group_size=group_size, bits=bits)
+                layer_cache.state = (keys, values)
+                layer_cache.offset = len(path) * self.block_size
+            cache.append(layer_cache)
+        return cache
+
+    def insert(self, tokens: Sequence[int], cache: List[Any]) -> int:
+        """Add the full blocks of a sequence held by a prompt cache.
+
+        Blocks already in the tree are shared, only new ones are copied.
+        Quantized caches are added to the tree of their quantization.
+
+        Args:
+            tokens: Tokens whose keys and values the cache holds
+            cache: Prompt cache of the sequence
+
+        Returns:
+            Number of blocks added
+        """
+        if not self.enabled or not supports_blocks(cache):
+            return 0
+
+        kv_format = cache_kv_format(cache)
+        num_tokens = min(len(tokens), cache[0].offset)
+        new_nodes = []
+        with self._lock:
+            now = time.monotonic()
+            node = self._roots.get(kv_format)
+            if node is None:
+                node = RadixNode(b"", None, kv_format=kv_format)
+                self._roots[kv_format] = node
+            for i, block in enumerate(self._blocks(tokens[:num_tokens])):
+                child = node.children.get(block)
+                if child is None:
+                    start, end = i * self.block_size, (i + 1) * self.block_size
+                    child = RadixNode(
+                        block,
+                        node,
+                        keys=[_slice_block(c.keys, start, end) for c in cache],
+                        values=[_slice_block(c.values, start, end) for c in cache],
+                        kv_format=kv_format,
+                    )
+                    node.children[block] = child
+                    new_nodes.append(child)
+                child.last_access = now
+                node = child
+
+            self._num_blocks += len(new_nodes)
+            self._nbytes += sum(n.nbytes for n in new_nodes)
+            self._inserted_blocks += len(new_nodes)
+            self._evict()
+
+        # Materialize the copies so they don't keep the whole cache buffer alive
+        mx.eval([node.keys + node.values for node in new_nodes])
+        return len(new_nodes)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the blocks of the tree."""
+        return self._nbytes
+
+    def eviction_candidates(self) -> List[EvictionCandidate]:
+        """Unreferenced leaves, valued by the length of the prefix they end."""
+        candidates = []
+        with self._lock:
+            stack = [
+                (n, 1) for root in self._roots.values() for n in root.children.values()
+            ]
+            while stack:
+                node, depth = stack.pop()
+                if node.children:
+                    stack.extend((c, depth + 1) for c in node.children.values())
+                elif node.ref_count == 0:
+                    candidates.append(
+                        EvictionCandidate(
+                            tokens=depth * self.block_size,
+                            last_used=node.priority,
+                            evict=lambda node=node: self._evict_leaf(node),
+                        )
+                    )
+        return candidates
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get prefix cache statistics.
+
+        Returns:
+            Dictionary with the tree size and the share of lookups that reused
+            cached blocks
+        """
+        with self._lock:
+            return {
+                "block_size": self.block_size,
+                "max_tokens": self.max_blocks * self.block_size,
+                "blocks": self._num_blocks,
+                "cached_tokens": self._num_blocks * self.block_size,
+                "bytes": self._nbytes,
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": self._hits / self._lookups if self._lookups else 0.0,
+                "reused_tokens": self._reused_tokens,
+                "inserted_blocks": self._inserted_blocks,
+                "evicted_blocks": self._evicted_blocks,
+            }
+
+    def _longest_path(
+        self, tokens: Sequence[int], kv_format: KVFormat
+    ) -> List[RadixNode]:
+        """Nodes of the longest block prefix of ``tokens``, called with the lock held.
+
+        Quantized requests also match full precision blocks.
+        """
+        path: List[RadixNode] = []
+        for root_format in dict.fromkeys([kv_format, None]):
+            root = self._roots.get(root_format)
+            if root is not None:
+                candidate = self._walk(root, tokens)
+                if len(candidate) > len(path):
+                    path = candidate
+        return path
+
+    def _walk(self, root: RadixNode, tokens: Sequence[int]) -> List[RadixNode]:
+        """Nodes of the longest block prefix of ``tokens`` below ``root``."""
+        path = []
+        node = root
+        for block in self._blocks(tokens):
+            node = node.children.get(block)
+            if node is None:
+                break
+            path.append(node)
+        return path
+
+    def _blocks(self, tokens: Sequence[int]) -> Iterator[bytes]:
+        """Iterate over the full blocks of ``tokens``."""
+        data = as_token_array(tokens).tobytes()
+        size = self.block_size * array("i").itemsize
+        for start in range(0, len(data) - size + 1, size):
+            yield data[start : start + size]
+
+    def _evict(self) -> None:
+        """Evict unreferenced leaves, least recently used first, down to budget."""
+        excess = self._num_blocks - self.max_blocks
+        if excess <= 0:
+            return
+
+        order = itertools.count()
+        leaves = []
+        stack = [n for root in self._roots.values() for n in root.children.values()]
+        while stack:
+            node = stack.pop()
+            if node.children:
+                stack.extend(node.children.values())
+            elif node.ref_count == 0:
+                leaves.append((node.priority, next(order), node))
+        heapq.heapify(leaves)
+
+        while excess > 0 and leaves:
+            _, _, node = heapq.heappop(leaves)
+            parent = node.parent
+            self._remove(node)
+            excess -= 1
+            # The parent becomes a leaf once its last child is gone
+            if parent.parent is not None and not parent.children:
+                if parent.ref_count == 0:
+                    heapq.heappush(leaves, (parent.priority, next(order), parent))
+
+    def _evict_leaf(self, node: RadixNode) -> int:
+        """Evict a leaf if it is still unreferenced, returns the bytes freed."""
+        with self._lock:
+            parent = node.parent
+            if (
+                node.children
+                or node.ref_count > 0
+                or parent is None
+                or parent.children.get(node.tokens) is not node
+            ):
+                return 0
+            self._remove(node)
+        return node.nbytes
+
+    def _remove(self, node: RadixNode) -> None:
+        """Detach a leaf from the tree, called with the lock held."""
+        del node.parent.children[node.tokens]
+        self._num_blocks -= 1
+        self._nbytes -= node.nbytes
+        self._evicted_blocks += 1
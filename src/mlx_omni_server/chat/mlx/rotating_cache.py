@@ -0,0 +1,128 @@
+"""Rotating KV Cache - bounded memory for long-running chat sessions.
+
+A ``RotatingKVCache`` of ``max_size`` tokens keeps the first ``keep`` tokens
+(attention sinks) and the most recent ones, so the memory of a session stays
+constant however long the conversation grows.
+
+mlx-lm cannot trim a rotating cache once tokens have rotated out of it, so a
+follow-up prompt diverging from the cached tokens would start over. The window
+can still be trimmed where the cache holds tokens beyond the ``max_size - 1``
+tokens the next forward pass attends to: dropping them leaves the same window
+a fresh prefill of the shorter sequence would have. A window prefilled in
+chunks holds up to a chunk of such tokens, a decoded one holds a single token,
+so a copy of the window is kept as prefilled for the next turn to trim.
+"""
+
+from typing import Any, List, Optional, Tuple
+
+import mlx.core as mx
+import mlx.nn as nn
+from mlx_lm.models.cache import KVCache, RotatingKVCache, make_prompt_cache
+
+# Default number of attention sink tokens kept at the start of the window
+DEFAULT_KV_SINK_TOKENS = 4
+
+# Rotating KV cache as (max_size, sink tokens), None for an unbounded cache
+KVWindow = Optional[Tuple[int, int]]
+
+
+def supports_window(model: nn.Module) -> bool:
+    """Whether the model's KV cache can be made a rotating window.
+
+    Models whose cache has other layers than ``KVCache`` (e.g. sliding window
+    or state space layers) keep it.
+    """
+    return all(type(c) is KVCache for c in make_prompt_cache(model))
+
+
+def make_window_cache(model: nn.Module, window: Tuple[int, int]) -> List[Any]:
+    """Create a rotating KV cache for every layer of the model."""
+    max_size, keep = window
+    return [RotatingKVCache(max_size=max_size, keep=keep) for _ in model.layers]
+
+
+def window_cache_from(cache: List[Any], window: Tuple[int, int]) -> Optional[List[Any]]:
+    """Turn a full KV cache into a rotating one, if it fits into the window.
+
+    Returns:
+        The rotating cache, or None if the cache holds ``max_size`` tokens or
+        more, or has layers that are no plain ``KVCache``
+    """
+    max_size, keep = window
+    if not cache or any(type(c) is not KVCache for c in cache):
+        return None
+    if cache[0].offset >= max_size:
+        return None
+
+    window_cache = []
+    for layer_cache in cache:
+        keys, values = layer_cache.state
+        rotating = RotatingKVCache(max_size=max_size, keep=keep)
+        rotating.state = (keys, values)
+        rotating.offset = rotating._idx = layer_cache.offset
+        window_cache.append(rotating)
+    return window_cache
+
+
+def snapshot_window_cache(cache: List[Any]) -> List[Any]:
+    """Copy a rotating KV cache, e.g. before decoding rotates its prefill out.
+
+    Returns:
+        The copy, or an empty list if the cache is empty or not rotating
+    """
+    if not cache or any(
+        not isinstance(c, RotatingKVCache) or c.keys is None for c in cache
+    ):
+        return []
+
+    snapshot = []
+    for layer_cache in cache:
+        keys = layer_cache._temporal_order(layer_cache.keys)
+        values = layer_cache._temporal_order(layer_cache.values)
+        copy = RotatingKVCache(max_size=layer_cache.max_size, keep=layer_cache.keep)
+        copy.keys = mx.contiguous(keys)
+        copy.values = mx.contiguous(values)
+        copy.offset = layer_cache.offset
+        copy._idx = keys.shape[2]
+        snapshot.append(copy)
+    mx.eval([c.state for c in snapshot])
+    return snapshot
+
+
+def trim_window_cache(cache: List[Any], num_tokens: int) -> bool:
+    """Drop the last ``num_tokens`` tokens of a cache with rotated windows.
+
+    Trimmable layers are trimmed as usual. A rotated window is trimmed if it
+    keeps the tokens its next forward pass attends to, otherwise nothing
+    changes.
+
+    Returns:
+        Whether the cache was trimmed
+    """
+    if num_tokens <= 0:
+        return True
+
+    rotated = set()
+    for i, layer_cache in enumerate(cache):
+        if layer_cache.is_trimmable():
+            continue
+        if not isinstance(layer_cache, RotatingKVCache):
+            return False
+        held = layer_cache._temporal_order(layer_cache.keys).shape[2] - num_tokens
+        offset = layer_cache.offset - num_tokens
+        if held < min(offset, layer_cache.max_size - 1):
+            return False  # Tokens the window needs have rotated out
+        rotated.add(i)
+
+    for i, layer_cache in enumerate(cache):
+        if i not in rotated:
+            layer_cache.trim(num_tokens)
+            continue
+        keys = layer_cache._temporal_order(layer_cache.keys)
+        values = layer_cache._temporal_order(layer_cache.values)
+        held = keys.shape[2] - num_tokens
+        layer_cache.keys = mx.contiguous(keys[..., :held, :])
+        layer_cache.values = mx.contiguous(values[..., :held, :])
+        layer_cache.offset -= num_tokens
+        layer_cache._idx = held
+    return True
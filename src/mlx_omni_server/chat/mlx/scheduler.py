@@ -0,0 +1,923 @@
+"""Generation Scheduler - continuous batching for a single MLX model.
+
+Running one ``stream_generate`` call per request gives N concurrent users 1/N of
+the throughput each, because every decode step is a separate, memory-bound
+forward pass. ``GenerationScheduler`` instead keeps all in-flight sequences of a
+model in one running batch:
+
+- New sequences are prefilled and admitted into the batch at token boundaries.
+- Each decode step runs a single batched forward pass for all batched sequences.
+- Finished sequences retire without stalling the others, and their KV cache is
+  written back so prompt caching keeps working.
+
+Every sequence keeps its own sampler, logits processors and KV cache. Sequences
+that cannot share a batched forward pass (speculative decoding, quantized or
+rotating KV caches, models with non-standard caches) are stepped individually
+in the same scheduler loop, so they still interleave with the batch token by
+token. Sequences with ``prompt_lookup_num_tokens`` use draft-free speculative
+decoding (see ``prompt_lookup``) and are stepped individually as well. The
+draft length of speculative sequences adapts to their acceptance rate (see
+``speculative``).
+
+Long prompts are prefilled in chunks: while other sequences are decoding, each
+scheduler step processes at most ``prefill_chunk_size`` prompt tokens before the
+next decode step, so a large prompt delays running streams by one chunk instead
+of its whole prefill. With nothing else to decode, the prompt is processed in
+``prefill_step_size`` pieces as in ``generate_step``.
+"""
+
+import copy
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import mlx.core as mx
+from mlx_lm.generate import (
+    generate_step,
+    generation_stream,
+    maybe_quantize_kv_cache,
+    wired_limit,
+)
+from mlx_lm.models.cache import (
+    BatchKVCache,
+    KVCache,
+    can_trim_prompt_cache,
+    make_prompt_cache,
+)
+
+from ...utils.logger import logger
+from .core_types import PrefillChunkTiming
+from .model_types import MLXModel
+from .prompt_lookup import prompt_lookup_generate_step
+from .speculative import (
+    DEFAULT_MAX_DRAFT_TOKENS,
+    AcceptanceTracker,
+    AdaptiveDraftLength,
+    DraftStats,
+    draft_model_generate_step,
+)
+
+# Default number of sequences decoded together
+DEFAULT_MAX_BATCH_SIZE = 8
+
+# Default number of prompt tokens processed per forward pass during prefill
+DEFAULT_PREFILL_STEP_SIZE = 2048
+
+# Default number of prompt tokens prefilled per scheduler step while other
+# sequences are decoding (0 disables chunking)
+DEFAULT_PREFILL_CHUNK_SIZE = 512
+
+# Generation kwargs that do not prevent a sequence from joining the batch
+_BATCHABLE_KWARGS = {"max_kv_size", "prefill_step_size"}
+
+# Release cached MLX buffers every N batched decode steps (mirrors generate_step)
+_CLEAR_CACHE_INTERVAL = 256
+
+
+@dataclass
+class TokenResponse:
+    """A single generated token for one sequence.
+
+    Mirrors the fields of mlx-lm's ``GenerationResponse`` except ``text``:
+    detokenization is done by the consumer, per sequence.
+    """
+
+    token: int
+    logprobs: Any
+    from_draft: bool
+    prompt_tokens: int
+    prompt_tps: float
+    generation_tokens: int
+    generation_tps: float
+    peak_memory: float
+    finish_reason: Optional[str] = None
+    prefill_chunks: List[PrefillChunkTiming] = field(default_factory=list)
+    draft_tokens: int = 0  # Draft tokens proposed so far
+    accepted_draft_tokens: int = 0  # Draft tokens accepted so far (from_draft)
+
+
+class SequenceHandle:
+    """Consumer side of a scheduled sequence.
+
+    Iterating the handle blocks until the next token is available and stops
+    after the response carrying a ``finish_reason``.
+    """
+
+    def __init__(self):
+        self._responses: queue.Queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self._cancel_reason = "cancelled"
+        self._finished = False
+        self._final_response: Optional[TokenResponse] = None
+        # Number of tokens held in the sequence's KV cache once it retired
+        self.cache_length: Optional[int] = None
+
+    def __iter__(self) -> Iterator[TokenResponse]:
+        while not self._finished:
+            item = self._responses.get()
+            if isinstance(item, BaseException):
+                self._finished = True
+                raise item
+            if item.finish_reason is not None:
+                self._finished = True
+            yield item
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def cancel_reason(self) -> str:
+        """Finish reason of the sequence once it is cancelled."""
+        return self._cancel_reason
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Ask the scheduler to stop decoding this sequence at the next step.
+
+        Args:
+            reason: Finish reason of the sequence. Only ``"cancelled"`` counts
+                    as an abort; a consumer that is done with the sequence,
+                    e.g. on a stop sequence, passes ``"stop"``. The first
+                    reason wins.
+        """
+        if not self._cancelled.is_set():
+            self._cancel_reason = reason
+        self._cancelled.set()
+
+    def _put(self, item) -> None:
+        self._responses.put(item)
+
+
+@dataclass
+class _Sequence:
+    """Scheduler-side state of one sequence."""
+
+    handle: SequenceHandle
+    prompt: List[int]
+    cache: List[Any]
+    max_tokens: int
+    sampler: Callable
+    logits_processors: List[Callable]
+    kwargs: Dict[str, Any]
+    batchable: bool = False
+    context_tokens: List[int] = field(default_factory=list)  # Cached prefix
+    on_prefilled: Optional[Callable[[List[Any]], None]] = None
+
+    # Decoding state
+    y: Optional[int] = None  # Last sampled token, not yet fed to the model
+    history: Optional[mx.array] = None  # Token history for logits processors
+    iterator: Optional[Iterator] = (
+        None  # Token iterator for individually stepped sequences
+    )
+    num_generated: int = 0
+    prefilled: int = 0  # Prompt tokens already in the cache when decoding starts
+    draft_stats: DraftStats = field(default_factory=DraftStats)
+    draft_length: Optional[AdaptiveDraftLength] = None  # Speculative sequences
+
+    # Timing
+    submit_time: float = field(default_factory=time.perf_counter)
+    prompt_tps: float = 0.0
+    prefill_time: float = 0.0  # Seconds spent in prefill forward passes
+    prefill_chunks: List[PrefillChunkTiming] = field(default_factory=list)
+    decode_start: float = 0.0
+
+    @property
+    def prefill_remaining(self) -> int:
+        """Prompt tokens to prefill before the first token can be sampled."""
+        return len(self.prompt) - 1 - self.prefilled
+
+
+@dataclass
+class _Batch:
+    """Sequences decoded together, sharing one batched KV cache per layer."""
+
+    sequences: List[_Sequence]
+    cache: List[BatchKVCache]
+
+
+def _to_batch_cache(cache: KVCache) -> BatchKVCache:
+    """Wrap a single-sequence KV cache as a batch of one."""
+    batch_cache = BatchKVCache([0])
+    batch_cache.keys, batch_cache.values = cache.state
+    batch_cache.offset = mx.array([cache.offset])
+    batch_cache._idx = cache.offset
+    return batch_cache
+
+
+def _extract_cache(batch_cache: BatchKVCache, index: int) -> KVCache:
+    """Copy one sequence out of a batched KV cache."""
+    padding = batch_cache.left_padding[index].item()
+    cache = KVCache()
+    cache.keys = mx.contiguous(
+        batch_cache.keys[index : index + 1, :, padding : batch_cache._idx, :]
+    )
+    cache.values = mx.contiguous(
+        batch_cache.values[index : index + 1, :, padding : batch_cache._idx, :]
+    )
+    cache.offset = batch_cache._idx - padding
+    return cache
+
+
+def _all_cancelled(group: List[_Sequence]) -> bool:
+    return all(sequence.handle.cancelled for sequence in group)
+
+
+def _cache_length(cache: List[Any]) -> Optional[int]:
+    """Number of tokens held by a prompt cache, if the cache type tracks it."""
+    if not cache:
+        return None
+    offset = getattr(cache[0], "offset", None)
+    return offset if isinstance(offset, int) else None
+
+
+class GenerationScheduler:
+    """Continuous batching scheduler for one model.
+
+    All model computation for the model happens on the scheduler thread;
+    ``submit`` can be called from any thread.
+
+    Examples:
+        scheduler = GenerationScheduler(model)
+        handle = scheduler.submit(prompt_tokens, max_tokens=128)
+        for response in handle:
+            print(response.token, response.finish_reason)
+    """
+
+    def __init__(
+        self,
+        model: MLXModel,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        prefill_step_size: int = DEFAULT_PREFILL_STEP_SIZE,
+        prefill_chunk_size: int = DEFAULT_PREFILL_CHUNK_SIZE,
+    ):
+        """Initialize scheduler.
+
+        Args:
+            model: MLX model instance containing models and tokenizers
+            max_batch_size: Maximum number of sequences decoded concurrently;
+                            further sequences wait until a slot frees up
+            prefill_step_size: Prompt tokens processed per forward pass
+            prefill_chunk_size: Prompt tokens prefilled between two decode steps
+                                of other sequences; 0 prefills prompts in one go
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.prefill_step_size = prefill_step_size
+        self.prefill_chunk_size = prefill_chunk_size
+
+        self._condition = threading.Condition()
+        self._pending: List[List[_Sequence]] = []
+        self._prefilling: List[List[_Sequence]] = []
+        self._solo: List[_Sequence] = []
+        self._batch: Optional[_Batch] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._draining = False
+        self._steps = 0
+
+        # Statistics
+        self._completed_sequences = 0
+        self._generated_tokens = 0
+        self._aborted_sequences = 0
+        self._aborted_tokens_saved = 0
+        self._draft_tokens = 0
+        self._accepted_draft_tokens = 0
+        self._acceptance = AcceptanceTracker()
+
+    @property
+    def num_active(self) -> int:
+        """Number of sequences currently being prefilled or decoded."""
+        batched = len(self._batch.sequences) if self._batch else 0
+        prefilling = sum(len(group) for group in self._prefilling)
+        return batched + len(self._solo) + prefilling
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scheduler statistics.
+
+        Returns:
+            Dictionary with current load and lifetime counters. ``aborted_tokens_saved``
+            counts tokens that cancelled sequences were still allowed to generate,
+            ``draft_acceptance_rate`` is the share of draft tokens that were
+            accepted, ``speculative`` holds the acceptance histograms.
+        """
+        with self._condition:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "active_sequences": self.num_active,
+                "pending_sequences": sum(len(g) for g in self._pending),
+                "prefilling_sequences": sum(len(g) for g in self._prefilling),
+                "prefill_chunk_size": self.prefill_chunk_size,
+                "completed_sequences": self._completed_sequences,
+                "generated_tokens": self._generated_tokens,
+                "aborted_sequences": self._aborted_sequences,
+                "aborted_tokens_saved": self._aborted_tokens_saved,
+                "draft_tokens": self._draft_tokens,
+                "accepted_draft_tokens": self._accepted_draft_tokens,
+                "draft_acceptance_rate": (
+                    self._accepted_draft_tokens / self._draft_tokens
+                    if self._draft_tokens
+                    else 0.0
+                ),
+                "speculative": self._acceptance.get_stats(),
+            }
+
+    def submit(
+        self,
+        prompt: List[int],
+        prompt_cache: Optional[List[Any]] = None,
+        max_tokens: int = 256,
+        sampler: Optional[Callable] = None,
+        logits_processors: Optional[List[Callable]] = None,
+        context_tokens: Optional[List[int]] = None,
+        on_prefilled: Optional[Callable[[List[Any]], None]] = None,
+        **kwargs,
+    ) -> SequenceHandle:
+        """Schedule a sequence for generation.
+
+        Args:
+            prompt: Prompt tokens still to be processed (at least one)
+            prompt_cache: KV cache already holding any cached prompt prefix. It is
+                          updated in place and must not be used by the caller
+                          until the sequence has finished.
+            max_tokens: Maximum tokens to generate
+            sampler: Sampler function (default: greedy)
+            logits_processors: Logits processors applied before sampling
+            context_tokens: Tokens already held by ``prompt_cache``, searched for
+                            draft tokens together with the prompt
+            on_prefilled: Called with the KV cache once all prompt tokens but
+                          the last are prefilled
+            **kwargs: Additional mlx-lm generation parameters (max_kv_size,
+                      kv_bits, num_draft_tokens, etc.) or
+                      ``prompt_lookup_num_tokens`` for prompt lookup decoding
+
+        Returns:
+            Handle to iterate the generated tokens
+        """
+        return self.submit_parallel(
+            prompt,
+            n=1,
+            prompt_cache=prompt_cache,
+            max_tokens=max_tokens,
+            sampler=sampler,
+            logits_processors=[logits_processors or []],
+            context_tokens=context_tokens,
+            on_prefilled=on_prefilled,
+            **kwargs,
+        )[0]
+
+    def submit_parallel(
+        self,
+        prompt: List[int],
+        n: int,
+        prompt_cache: Optional[List[Any]] = None,
+        max_tokens: int = 256,
+        sampler: Optional[Callable] = None,
+        logits_processors: Optional[List[List[Callable]]] = None,
+        context_tokens: Optional[List[int]] = None,
+        on_prefilled: Optional[Callable[[List[Any]], None]] = None,
+        **kwargs,
+    ) -> List[SequenceHandle]:
+        """Schedule ``n`` sequences that continue the same prompt.
+
+        The prompt is prefilled once and the KV cache is forked for each
+        continuation, so the sequences only differ in what they sample.
+
+        Args:
+            prompt: Prompt tokens still to be processed (at least one)
+            n: Number of continuations to generate
+            prompt_cache: KV cache already holding any cached prompt prefix. It is
+                          used and updated by the first sequence, the others
+                          decode on copies.
+            max_tokens: Maximum tokens to generate per sequence
+            sampler: Sampler function shared by all sequences (default: greedy)
+            logits_processors: One list of logits processors per sequence. Stateful
+                               processors must not be shared between sequences.
+            context_tokens: Tokens already held by ``prompt_cache``, searched for
+                            draft tokens together with the prompt
+            on_prefilled: Called with the shared KV cache once all prompt tokens
+                          but the last are prefilled
+            **kwargs: Additional mlx-lm generation parameters
+
+        Returns:
+            One handle per sequence, in order
+        """
+        if len(prompt) == 0:
+            raise ValueError("Prompt must contain at least one token")
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        if logits_processors is not None and len(logits_processors) != n:
+            raise ValueError("logits_processors must contain one list per sequence")
+
+        if prompt_cache is None:
+            prompt_cache = make_prompt_cache(
+                self.model.model, max_kv_size=kwargs.get("max_kv_size")
+            )
+            if self.model.draft_model is not None:
+                prompt_cache += make_prompt_cache(self.model.draft_model)
+
+        batchable = (
+            self.model.draft_model is None
+            and set(kwargs) <= _BATCHABLE_KWARGS
+            and all(type(c) is KVCache for c in prompt_cache)
+        )
+        group = [
+            _Sequence(
+                handle=SequenceHandle(),
+                prompt=list(prompt),
+                cache=prompt_cache if i == 0 else list(prompt_cache),
+                max_tokens=max_tokens,
+                sampler=sampler or (lambda x: mx.argmax(x, axis=-1)),
+                logits_processors=logits_processors[i] if logits_processors else [],
+                kwargs=kwargs,
+                batchable=batchable,
+                context_tokens=list(context_tokens or []),
+                on_prefilled=on_prefilled if i == 0 else None,
+            )
+            for i in range(n)
+        ]
+
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Generation scheduler has been shut down")
+            self._pending.append(group)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"mlx-scheduler-{self.model.model_id}",
+                    daemon=True,
+                )
+                self._thread.start()
+            self._condition.notify()
+
+        return [sequence.handle for sequence in group]
+
+    def shutdown(self, drain: bool = False) -> None:
+        """Stop the scheduler thread.
+
+        Args:
+            drain: Let pending and active sequences finish and stop the thread
+                   once it is idle, without waiting for it. Otherwise wait for
+                   the thread and fail all unfinished sequences.
+        """
+        with self._condition:
+            if drain:
+                self._draining = True
+                if self._thread is None:
+                    self._stopping = True
+                self._condition.notify()
+                return
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5.0)
+
+    # ------------------------------------------------------------------
+    # Scheduler loop
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._stopping and not self._pending and not self.num_active:
+                    if self._draining:
+                        self._stopping = True
+                        break
+                    self._condition.wait()
+                if self._stopping:
+                    break
+
+            with wired_limit(self.model.model, [generation_stream]):
+                while self._tick():
+                    pass
+
+        self._fail_all(RuntimeError("Generation scheduler has been shut down"))
+
+    def _tick(self) -> bool:
+        """Run one scheduling step.
+
+        Returns:
+            True while there is more work to do
+        """
+        with self._condition:
+            if self._stopping:
+                return False
+            cancelled = [g for g in self._pending if _all_cancelled(g)]
+            self._pending = [g for g in self._pending if not _all_cancelled(g)]
+
+            # Admit whole groups in order while they fit. A group larger than
+            # the batch size is admitted alone.
+            free_slots = self.max_batch_size - self.num_active
+            admitted = []
+            while self._pending and (
+                len(self._pending[0]) <= free_slots
+                or (not admitted and self.num_active == 0)
+            ):
+                group = self._pending.pop(0)
+                admitted.append(group)
+                free_slots -= len(group)
+
+        for group in cancelled:
+            for sequence in group:
+                self._finish(sequence, sequence.handle.cancel_reason)
+
+        with mx.stream(generation_stream):
+            self._prefilling.extend(admitted)
+            self._step_prefill()
+            self._step_batch()
+            for sequence in list(self._solo):
+                self._step_solo(sequence)
+
+        with self._condition:
+            return bool(self._pending or self.num_active)
+
+    def _step_prefill(self) -> None:
+        """Prefill the oldest admitted group by one chunk and start it when done."""
+        for group in [g for g in self._prefilling if _all_cancelled(g)]:
+            self._prefilling.remove(group)
+            for sequence in group:
+                self._finish(sequence, sequence.handle.cancel_reason)
+
+        # Speculative decoding prefills inside speculative_generate_step
+        while self._prefilling and (
+            self.model.draft_model is not None
+            or self._prefilling[0][0].prefill_remaining == 0
+        ):
+            self._start(self._prefilling.pop(0))
+        if not self._prefilling:
+            return
+
+        group = self._prefilling[0]
+        lead = group[0]
+        interleave = self.prefill_chunk_size > 0
+        if interleave and (self._batch is not None or self._solo):
+            chunk_size = self.prefill_chunk_size
+        else:
+            chunk_size = lead.kwargs.get("prefill_step_size", self.prefill_step_size)
+
+        try:
+            while lead.prefill_remaining > 0:
+                self._prefill_chunk(lead, min(chunk_size, lead.prefill_remaining))
+                if interleave:
+                    break
+        except Exception as e:
+            logger.error(f"Failed to start sequence: {e}")
+            self._prefilling.pop(0)
+            for sequence in group:
+                sequence.handle._put(RuntimeError(f"Prefill failed: {e}"))
+            return
+
+        if lead.prefill_remaining == 0:
+            self._start(self._prefilling.pop(0))
+
+    def _prefill_chunk(self, sequence: _Sequence, num_tokens: int) -> None:
+        """Process the next prompt tokens into the cache without sampling."""
+        tokens = mx.array(
+            sequence.prompt[sequence.prefilled : sequence.prefilled + num_tokens]
+        )
+        tic = time.perf_counter()
+        self.model.model(tokens[None], cache=sequence.cache)
+        # Quantize as generate_step would, so long prompts never hold the
+        # full precision cache
+        maybe_quantize_kv_cache(
+            sequence.cache,
+            quantized_kv_start=sequence.kwargs.get("quantized_kv_start", 0),
+            kv_group_size=sequence.kwargs.get("kv_group_size", 64),
+            kv_bits=sequence.kwargs.get("kv_bits"),
+        )
+        mx.eval([c.state for c in sequence.cache])
+        elapsed = time.perf_counter() - tic
+        mx.clear_cache()
+
+        sequence.prefilled += num_tokens
+        sequence.prefill_time += elapsed
+        sequence.prefill_chunks.append(
+            PrefillChunkTiming(tokens=num_tokens, seconds=elapsed)
+        )
+
+    def _start(self, group: List[_Sequence]) -> None:
+        """Produce the first tokens of a prefilled group of sequences."""
+        lead = group[0]
+        prompt = mx.array(lead.prompt)
+        for sequence in group[1:]:
+            sequence.prefilled = lead.prefilled
+            sequence.prefill_time = lead.prefill_time
+            sequence.prefill_chunks = lead.prefill_chunks
+
+        try:
+            tic = time.perf_counter()
+            if lead.on_prefilled is not None:
+                lead.on_prefilled(lead.cache)
+            if lead.batchable:
+                # One forward pass for the last prompt token, every sequence
+                # samples from the same logits
+                logits = self.model.model(prompt[-1:][None], cache=lead.cache)
+                logits = logits[:, -1, :]
+            elif len(group) > 1:
+                # Fork the KV cache for the individually stepped sequences
+                for sequence in group[1:]:
+                    sequence.cache = copy.deepcopy(lead.cache)
+        except Exception as e:
+            logger.error(f"Failed to start sequence: {e}")
+            for sequence in group:
+                sequence.handle._put(RuntimeError(f"Prefill failed: {e}"))
+            return
+
+        for sequence in group:
+            if sequence.handle.cancelled:
+                self._finish(sequence, sequence.handle.cancel_reason)
+                continue
+
+            if not sequence.batchable:
+                sequence.iterator = self._solo_iterator(sequence)
+                self._solo.append(sequence)
+                continue
+
+            try:
+                token, logprobs = self._sample(sequence, logits, prompt[-1:])
+                mx.eval(token, logprobs)
+            except Exception as e:
+                logger.error(f"Failed to start sequence: {e}")
+                sequence.handle._put(RuntimeError(f"Sampling failed: {e}"))
+                continue
+
+            elapsed = sequence.prefill_time + time.perf_counter() - tic
+            sequence.prompt_tps = prompt.size / elapsed
+            sequence.decode_start = time.perf_counter()
+            sequence.y = token.item()
+            if self._emit(sequence, sequence.y, logprobs, False) is None:
+                self._join_batch(sequence)
+            else:
+                self._complete(sequence)
+
+    def _sample(
+        self, sequence: _Sequence, logits: mx.array, input_tokens: mx.array
+    ) -> tuple:
+        """Apply the sequence's logits processors and sampler to one row of logits."""
+        if sequence.logits_processors:
+            sequence.history = (
+                mx.concat([sequence.history, input_tokens])
+                if sequence.history is not None
+                else input_tokens
+            )
+            for processor in sequence.logits_processors:
+                logits = processor(sequence.history, logits)
+
+        logprobs = logits - mx.logsumexp(logits, keepdims=True)
+        return sequence.sampler(logprobs), logprobs.squeeze(0)
+
+    def _join_batch(self, sequence: _Sequence) -> None:
+        """Merge a prefilled sequence into the running batch."""
+        cache = [_to_batch_cache(c) for c in sequence.cache]
+        if self._batch is None:
+            self._batch = _Batch(sequences=[sequence], cache=cache)
+        else:
+            for batch_cache, new_cache in zip(self._batch.cache, cache):
+                batch_cache.extend(new_cache)
+            self._batch.sequences.append(sequence)
+
+    def _step_batch(self) -> None:
+        """Run one batched decode step for all batched sequences."""
+        batch = self._batch
+        if batch is None:
+            return
+
+        sequences = batch.sequences
+        try:
+            inputs = mx.array([[s.y] for s in sequences])
+            logits = self.model.model(inputs, cache=batch.cache)[:, -1, :]
+
+            tokens, logprobs = [], []
+            for i, sequence in enumerate(sequences):
+                token, row_logprobs = self._sample(
+                    sequence, logits[i : i + 1], inputs[i]
+                )
+                tokens.append(token)
+                logprobs.append(row_logprobs)
+            tokens = mx.concatenate(tokens)
+            mx.eval(tokens, logprobs)
+        except Exception as e:
+            logger.error(f"Batched decode step failed: {e}")
+            self._batch = None
+            for sequence in sequences:
+                sequence.handle._put(RuntimeError(f"Decode step failed: {e}"))
+            return
+
+        finished = []
+        for i, (sequence, token) in enumerate(zip(sequences, tokens.tolist())):
+            sequence.y = token
+            if self._emit(sequence, token, logprobs[i], False) is not None:
+                finished.append(i)
+        self._retire_from_batch(finished)
+
+        self._steps += 1
+        if self._steps % _CLEAR_CACHE_INTERVAL == 0:
+            mx.clear_cache()
+
+    def _retire_from_batch(self, indices: List[int]) -> None:
+        """Write back the KV caches of finished sequences and shrink the batch."""
+        if not indices:
+            return
+
+        batch = self._batch
+        retired = [batch.sequences[i] for i in indices]
+        for i, sequence in zip(indices, retired):
+            for layer, batch_cache in enumerate(batch.cache):
+                sequence.cache[layer] = _extract_cache(batch_cache, i)
+
+        keep = [i for i in range(len(batch.sequences)) if i not in indices]
+        if keep:
+            keep_idx = mx.array(keep, mx.int32)
+            for batch_cache in batch.cache:
+                batch_cache.filter(keep_idx)
+            batch.sequences = [batch.sequences[i] for i in keep]
+        else:
+            self._batch = None
+
+        for sequence in retired:
+            self._complete(sequence)
+
+    def _solo_iterator(self, sequence: _Sequence) -> Iterator:
+        """Token iterator for a sequence that is stepped outside the batch."""
+        kwargs = dict(sequence.kwargs)
+        kwargs.update(
+            max_tokens=sequence.max_tokens,
+            sampler=sequence.sampler,
+            logits_processors=sequence.logits_processors,
+            prompt_cache=sequence.cache,
+        )
+        prompt = mx.array(sequence.prompt[sequence.prefilled :])
+        num_lookup_tokens = kwargs.pop("prompt_lookup_num_tokens", 0)
+        num_draft_tokens = kwargs.pop("num_draft_tokens", DEFAULT_MAX_DRAFT_TOKENS)
+
+        if self.model.draft_model is None and not (
+            num_lookup_tokens > 0 and can_trim_prompt_cache(sequence.cache)
+        ):
+            for token, logprobs in generate_step(prompt, self.model.model, **kwargs):
+                yield token, logprobs, False
+            return
+
+        kwargs.pop("max_kv_size", None)
+        kwargs.pop("prompt_progress_callback", None)
+        with self._condition:
+            acceptance = self._acceptance.initial_acceptance()
+        if self.model.draft_model is None:
+            sequence.draft_length = AdaptiveDraftLength(num_lookup_tokens, acceptance)
+            yield from prompt_lookup_generate_step(
+                prompt,
+                self.model.model,
+                context_tokens=(
+                    sequence.context_tokens + sequence.prompt[: sequence.prefilled]
+                ),
+                draft_length=sequence.draft_length,
+                draft_stats=sequence.draft_stats,
+                **kwargs,
+            )
+        else:
+            sequence.draft_length = AdaptiveDraftLength(num_draft_tokens, acceptance)
+            yield from draft_model_generate_step(
+                prompt,
+                self.model.model,
+                self.model.draft_model,
+                draft_length=sequence.draft_length,
+                draft_stats=sequence.draft_stats,
+                **kwargs,
+            )
+
+    def _step_solo(self, sequence: _Sequence) -> None:
+        """Advance an individually stepped sequence by one token."""
+        try:
+            tic = time.perf_counter()
+            token, logprobs, from_draft = next(sequence.iterator)
+            if sequence.num_generated == 0:
+                # The first step includes the rest of the prefill
+                elapsed = sequence.prefill_time + time.perf_counter() - tic
+                sequence.prompt_tps = len(sequence.prompt) / elapsed
+                sequence.decode_start = time.perf_counter()
+        except StopIteration:
+            self._finish(sequence, "length")
+            return
+        except Exception as e:
+            logger.error(f"Decode step failed: {e}")
+            self._solo.remove(sequence)
+            sequence.handle._put(RuntimeError(f"Decode step failed: {e}"))
+            return
+
+        if self._emit(sequence, token, logprobs, from_draft) is not None:
+            self._solo.remove(sequence)
+            sequence.iterator.close()
+            self._complete(sequence)
+
+    def _emit(
+        self,
+        sequence: _Sequence,
+        token: int,
+        logprobs: mx.array,
+        from_draft: bool,
+    ) -> Optional[str]:
+        """Deliver a token to the consumer.
+
+        Returns:
+            The finish reason if the sequence is done, otherwise None
+        """
+        sequence.num_generated += 1
+
+        if token in self.model.tokenizer.eos_token_ids:
+            finish_reason = "stop"
+        elif sequence.num_generated >= sequence.max_tokens:
+            finish_reason = "length"
+        elif sequence.handle.cancelled:
+            finish_reason = sequence.handle.cancel_reason
+        else:
+            finish_reason = None
+
+        elapsed = time.perf_counter() - sequence.decode_start
+        response = TokenResponse(
+            token=token,
+            logprobs=logprobs,
+            from_draft=from_draft,
+            prompt_tokens=len(sequence.prompt),
+            prompt_tps=sequence.prompt_tps,
+            generation_tokens=sequence.num_generated,
+            generation_tps=sequence.num_generated / elapsed if elapsed > 0 else 0.0,
+            peak_memory=mx.get_peak_memory() / 1e9,
+            finish_reason=finish_reason,
+            prefill_chunks=sequence.prefill_chunks,
+            draft_tokens=sequence.draft_stats.proposed,
+            accepted_draft_tokens=sequence.draft_stats.accepted,
+        )
+
+        if finish_reason is None:
+            sequence.handle._put(response)
+        else:
+            # Delivered by _complete once the KV cache has been written back
+            sequence.handle._final_response = response
+        return finish_reason
+
+    def _complete(self, sequence: _Sequence) -> None:
+        """Publish the final token once the sequence's cache is consistent."""
+        self._record_finish(sequence, sequence.handle._final_response.finish_reason)
+        sequence.handle.cache_length = _cache_length(sequence.cache)
+        sequence.handle._put(sequence.handle._final_response)
+
+    def _finish(self, sequence: _Sequence, finish_reason: str) -> None:
+        """Finish a sequence without a new token (cancelled or exhausted)."""
+        if sequence in self._solo:
+            self._solo.remove(sequence)
+            sequence.iterator.close()
+        self._record_finish(sequence, finish_reason)
+        sequence.handle.cache_length = _cache_length(sequence.cache)
+        sequence.handle._put(
+            TokenResponse(
+                token=-1,
+                logprobs=None,
+                from_draft=False,
+                prompt_tokens=len(sequence.prompt),
+                prompt_tps=sequence.prompt_tps,
+                generation_tokens=sequence.num_generated,
+                generation_tps=0.0,
+                peak_memory=mx.get_peak_memory() / 1e9,
+                finish_reason=finish_reason,
+                prefill_chunks=sequence.prefill_chunks,
+                draft_tokens=sequence.draft_stats.proposed,
+                accepted_draft_tokens=sequence.draft_stats.accepted,
+            )
+        )
+
+    def _record_finish(self, sequence: _Sequence, finish_reason: str) -> None:
+        """Update statistics for a finished sequence."""
+        with self._condition:
+            self._completed_sequences += 1
+            self._generated_tokens += sequence.num_generated
+            self._draft_tokens += sequence.draft_stats.proposed
+            self._accepted_draft_tokens += sequence.draft_stats.accepted
+            if sequence.draft_length is not None:
+                self._acceptance.record(
+                    sequence.draft_stats, sequence.draft_length.enabled
+                )
+            if finish_reason == "cancelled":
+                saved = max(0, sequence.max_tokens - sequence.num_generated)
+                self._aborted_sequences += 1
+                self._aborted_tokens_saved += saved
+                logger.info(
+                    f"Aborted sequence after {sequence.num_generated} tokens, "
+                    f"saved up to {saved} tokens"
+                )
+
+    def _fail_all(self, error: Exception) -> None:
+        """Fail every unfinished sequence (used on shutdown)."""
+        with self._condition:
+            groups = self._pending + self._prefilling
+            sequences = [s for group in groups for s in group]
+            sequences += self._solo
+            if self._batch is not None:
+                sequences += self._batch.sequences
+            self._pending, self._prefilling = [], []
+            self._solo, self._batch = [], None
+        for sequence in sequences:
+            sequence.handle._put(error)
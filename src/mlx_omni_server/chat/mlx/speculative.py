@@ -0,0 +1,517 @@
+"""Speculative Decoding - draft tokens verified in one forward pass, adaptively.
+
+Speculative decoding proposes draft tokens, from a small draft model or by
+prompt lookup, and verifies them with the model in a single forward pass. How
+many draft tokens pay off depends on how often they are accepted, and that
+varies from prompt to prompt: with a fixed draft length, low acceptance wastes
+draft work and high acceptance leaves speedup unused.
+
+``speculative_generate_step`` therefore picks the draft length of every step
+with ``AdaptiveDraftLength``, from a moving acceptance rate and the measured
+cost of drafting. While speculation would be slower than plain decoding it
+stops drafting, and probes now and then whether that changed.
+``AcceptanceTracker`` keeps the acceptance histograms of a model and seeds new
+sequences with the model's acceptance rate.
+"""
+
+import functools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+
+import mlx.core as mx
+import mlx.nn as nn
+from mlx_lm.generate import generation_stream, maybe_quantize_kv_cache
+from mlx_lm.models import cache
+
+# Default maximum draft tokens per step with a draft model
+DEFAULT_MAX_DRAFT_TOKENS = 6
+
+# Acceptance rate assumed for a model without verification steps yet
+DEFAULT_ACCEPTANCE = 0.5
+
+# Weight of the latest verification step in the moving averages
+_SMOOTHING = 0.1
+
+# Minimum expected speedup over plain decoding for drafting to be worth it
+_MIN_SPEEDUP = 1.05
+
+# Plain decode steps between probing steps while speculation is switched off
+_PROBE_INTERVAL = 16
+
+# Number of buckets of the per-sequence acceptance rate histogram
+_RATE_BUCKETS = 10
+
+
+@dataclass
+class DraftStats:
+    """Counters of proposed and accepted draft tokens of one sequence."""
+
+    proposed: int = 0
+    accepted: int = 0
+    steps: int = 0  # Verification steps with at least one draft token
+    rejections: int = 0  # Steps that ended with a rejected draft token
+    # Number of steps by the number of accepted draft tokens
+    accepted_histogram: List[int] = field(default_factory=list)
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.proposed if self.proposed else 0.0
+
+    def record(self, proposed: int, accepted: int) -> None:
+        """Record one verification step."""
+        if not proposed:
+            return
+        self.proposed += proposed
+        self.accepted += accepted
+        self.steps += 1
+        self.rejections += accepted < proposed
+        if len(self.accepted_histogram) <= accepted:
+            self.accepted_histogram.extend(
+                [0] * (accepted + 1 - len(self.accepted_histogram))
+            )
+        self.accepted_histogram[accepted] += 1
+
+
+class AdaptiveDraftLength:
+    """Chooses the draft length of each step from a moving acceptance rate.
+
+    Draft tokens are modelled as accepted one after another with probability
+    ``alpha`` each, so a step with ``k`` draft tokens yields
+    ``(1 - alpha ** (k + 1)) / (1 - alpha)`` tokens on average, for one
+    verification pass plus ``k`` draft steps. The length with the best expected
+    speedup is used, or none if no length beats plain decoding.
+
+    Examples:
+        draft_length = AdaptiveDraftLength(max_draft_tokens=8)
+        num_draft = draft_length.next()
+        ...  # draft and verify
+        draft_length.update(num_draft, accepted, draft_time, verify_time)
+    """
+
+    def __init__(self, max_draft_tokens: int, acceptance: float = DEFAULT_ACCEPTANCE):
+        """Initialize controller.
+
+        Args:
+            max_draft_tokens: Upper bound of the draft length
+            acceptance: Initial per-token acceptance probability
+        """
+        self.max_draft_tokens = max_draft_tokens
+        # Moving averages of accepted tokens and rejections per step. Their
+        # ratio estimates the acceptance probability, also when a step accepts
+        # all of its draft tokens.
+        self._accepted = acceptance
+        self._rejected = 1.0 - acceptance
+        self._draft_time = 0.0  # Seconds per draft token
+        self._verify_time = 0.0  # Seconds per verification pass
+        self._plain_steps = 0
+        self.num_draft_tokens = self._choose()
+
+    @property
+    def acceptance(self) -> float:
+        """Estimated probability that a draft token is accepted."""
+        total = self._accepted + self._rejected
+        return self._accepted / total if total > 0 else 0.0
+
+    @property
+    def enabled(self) -> bool:
+        """Whether speculation currently pays off."""
+        return self.num_draft_tokens > 0
+
+    def next(self) -> int:
+        """Draft length of the next step."""
+        if self.num_draft_tokens == 0:
+            self._plain_steps += 1
+            if self._plain_steps % _PROBE_INTERVAL == 0:
+                return 1
+        return self.num_draft_tokens
+
+    def update(
+        self, proposed: int, accepted: int, draft_time: float, verify_time: float
+    ) -> None:
+        """Record a step and choose the next draft length.
+
+        Args:
+            proposed: Draft tokens verified in the step
+            accepted: Draft tokens accepted
+            draft_time: Seconds spent drafting
+            verify_time: Seconds spent in the verification pass
+        """
+        self._verify_time = _smooth(self._verify_time, verify_time)
+        if proposed:
+            self._accepted += _SMOOTHING * (accepted - self._accepted)
+            self._rejected += _SMOOTHING * ((accepted < proposed) - self._rejected)
+            self._draft_time = _smooth(self._draft_time, draft_time / proposed)
+        self.num_draft_tokens = self._choose()
+
+    def _choose(self) -> int:
+        alpha = self.acceptance
+        cost = self._draft_time / self._verify_time if self._verify_time else 0.0
+        best_length, best_speedup = 0, _MIN_SPEEDUP
+        for length in range(1, self.max_draft_tokens + 1):
+            if alpha < 1.0:
+                expected = (1.0 - alpha ** (length + 1)) / (1.0 - alpha)
+            else:
+                expected = length + 1.0
+            speedup = expected / (1.0 + cost * length)
+            if speedup >= best_speedup:
+                best_length, best_speedup = length, speedup
+        return best_length
+
+
+class AcceptanceTracker:
+    """Acceptance statistics of one model, across its speculative sequences."""
+
+    def __init__(self):
+        self._sequences = 0
+        self._disabled_sequences = 0
+        self._proposed = 0
+        self._accepted = 0
+        self._accepted_histogram: List[int] = []
+        self._rate_histogram = [0] * _RATE_BUCKETS
+        # Moving average of the acceptance probability of recent sequences
+        self._acceptance = DEFAULT_ACCEPTANCE
+
+    def initial_acceptance(self) -> float:
+        """Acceptance probability to start new sequences with."""
+        return self._acceptance
+
+    def record(self, stats: DraftStats, enabled: bool) -> None:
+        """Add the statistics of a finished sequence.
+
+        Args:
+            stats: Draft counters of the sequence
+            enabled: Whether speculation was still on when the sequence finished
+        """
+        self._sequences += 1
+        self._disabled_sequences += not enabled
+        self._proposed += stats.proposed
+        self._accepted += stats.accepted
+        for accepted, steps in enumerate(stats.accepted_histogram):
+            if len(self._accepted_histogram) <= accepted:
+                self._accepted_histogram.append(0)
+            self._accepted_histogram[accepted] += steps
+        if stats.proposed:
+            bucket = min(int(stats.acceptance_rate * _RATE_BUCKETS), _RATE_BUCKETS - 1)
+            self._rate_histogram[bucket] += 1
+            acceptance = stats.accepted / (stats.accepted + stats.rejections)
+            self._acceptance += _SMOOTHING * (acceptance - self._acceptance)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get acceptance statistics.
+
+        Returns:
+            Dictionary with the number of speculative sequences (and of those
+            that ended with speculation switched off), the acceptance rate
+            of all draft tokens, the acceptance probability new sequences
+            start with,
+            ``accepted_per_step`` (verification steps by accepted draft tokens)
+            and ``sequence_acceptance`` (sequences by acceptance rate, in
+            buckets of 10%)
+        """
+        return {
+            "sequences": self._sequences,
+            "disabled_sequences": self._disabled_sequences,
+            "acceptance_rate": (
+                self._accepted / self._proposed if self._proposed else 0.0
+            ),
+            "estimated_acceptance": self._acceptance,
+            "accepted_per_step": list(self._accepted_histogram),
+            "sequence_acceptance": list(self._rate_histogram),
+        }
+
+
+class DraftModelDrafter:
+    """Drafts tokens with a smaller draft model sharing the tokenizer."""
+
+    def __init__(
+        self,
+        model: nn.Module,
+        prompt_cache: List[Any],
+        sampler: Callable[[mx.array], mx.array],
+        quantize_cache_fn: Callable[[List[Any]], None],
+    ):
+        self.model = model
+        self.cache = prompt_cache
+        self.sampler = sampler
+        self.quantize_cache_fn = quantize_cache_fn
+        self._pending: List[int] = []  # Tokens not yet fed to the draft model
+        self._start = prompt_cache[0].offset
+        self._last_draft: List[int] = []
+
+    def prefill(self, prompt: List[int], prefill_step_size: int) -> None:
+        """Process the prompt but its last tokens."""
+        while len(prompt) > prefill_step_size:
+            self.model(mx.array(prompt[:prefill_step_size])[None], cache=self.cache)
+            self.quantize_cache_fn(self.cache)
+            mx.eval([c.state for c in self.cache])
+            prompt = prompt[prefill_step_size:]
+            mx.clear_cache()
+        self._pending = list(prompt)
+
+    def draft(self, num_tokens: int) -> List[int]:
+        if num_tokens == 0:
+            return []
+        y = mx.array(self._pending, mx.uint32)
+        tokens = []
+        for _ in range(num_tokens):
+            logits = self.model(y[None], cache=self.cache)[:, -1, :]
+            self.quantize_cache_fn(self.cache)
+            logprobs = logits - mx.logsumexp(logits, axis=-1, keepdims=True)
+            y = self.sampler(logprobs)
+            mx.async_eval(y)
+            tokens.append(y)
+        # The last draft token has not been fed to the draft model
+        self._last_draft = mx.concatenate(tokens).tolist()
+        return self._last_draft
+
+    def update(self, num_accepted: int, token: int) -> None:
+        """Drop rejected draft tokens and queue the verified token."""
+        num_draft = len(self._last_draft)
+        if num_draft == 0:
+            # Nothing was drafted, the draft model catches up on the next draft
+            self._pending.append(token)
+            return
+        cache.trim_prompt_cache(self.cache, max(num_draft - num_accepted - 1, 0))
+        self._pending = [token]
+        if num_accepted == num_draft:
+            self._pending.insert(0, self._last_draft[-1])
+        self._last_draft = []
+
+    def finish(self, tokens: List[int], num_cached: int) -> None:
+        """Align the draft cache with the model's cache for prompt caching.
+
+        Args:
+            tokens: Prompt and generated tokens of this generation
+            num_cached: How many of them the model's cache holds
+        """
+        num_fed = self.cache[0].offset - self._start
+        if num_fed > num_cached:
+            cache.trim_prompt_cache(self.cache, num_fed - num_cached)
+        elif num_fed < num_cached:
+            self.model(mx.array(tokens[num_fed:num_cached])[None], cache=self.cache)
+            mx.eval([c.state for c in self.cache])
+
+
+def speculative_generate_step(
+    prompt: mx.array,
+    model: nn.Module,
+    drafter: Any,
+    *,
+    draft_length: AdaptiveDraftLength,
+    max_tokens: int = 256,
+    sampler: Optional[Callable[[mx.array], mx.array]] = None,
+    logits_processors: Optional[List[Callable[[mx.array, mx.array], mx.array]]] = None,
+    prompt_cache: Optional[Any] = None,
+    prefill_step_size: int = 512,
+    kv_bits: Optional[int] = None,
+    kv_group_size: int = 64,
+    quantized_kv_start: int = 0,
+    draft_stats: Optional[DraftStats] = None,
+) -> Generator[Tuple[int, mx.array, bool], None, None]:
+    """Generate tokens, verifying draft tokens of an adaptive length.
+
+    Follows mlx-lm's ``speculative_generate_step``, with the draft length of
+    each step chosen by ``draft_length``. Steps without draft tokens are plain
+    decode steps.
+
+    Args:
+        prompt: Prompt tokens still to be processed
+        model: The model to generate with
+        drafter: Source of draft tokens with ``draft(num_tokens)`` and
+                 ``update(num_accepted, token)``, and optionally
+                 ``prefill(prompt, prefill_step_size)`` and
+                 ``finish(tokens, num_cached)``
+        draft_length: Chooses the number of draft tokens per step
+        max_tokens: Maximum number of tokens to generate
+        sampler: Sampler for a vector of log probabilities (default: greedy)
+        logits_processors: Logits processors applied before sampling
+        prompt_cache: The model's KV cache, updated in place. It must be trimmable.
+        prefill_step_size: Prompt tokens processed per forward pass
+        kv_bits: Bits for KV cache quantization, None for no quantization
+        kv_group_size: Group size for KV cache quantization
+        quantized_kv_start: Step to begin using a quantized KV cache
+        draft_stats: Receives the number of proposed and accepted draft tokens
+
+    Yields:
+        Tuples of (token, log probabilities, whether the token was drafted)
+    """
+    y = prompt.astype(mx.uint32)
+    prev_tokens = None
+    draft_stats = draft_stats if draft_stats is not None else DraftStats()
+    tokens_seen = prompt.tolist()
+
+    if prompt_cache is None:
+        prompt_cache = cache.make_prompt_cache(model)
+    cache_start = prompt_cache[0].offset
+
+    sampler = sampler or (lambda x: mx.argmax(x, axis=-1))
+
+    quantize_cache_fn = functools.partial(
+        maybe_quantize_kv_cache,
+        quantized_kv_start=quantized_kv_start,
+        kv_group_size=kv_group_size,
+        kv_bits=kv_bits,
+    )
+
+    def _process_and_sample(tokens, logits):
+        if logits_processors:
+            for processor in logits_processors:
+                logits = processor(tokens, logits)
+
+        logprobs = logits - mx.logsumexp(logits, axis=-1, keepdims=True)
+        return sampler(logprobs), logprobs
+
+    def _step(y, n_predict):
+        nonlocal prev_tokens
+        with mx.stream(generation_stream):
+            logits = model(y[None], cache=prompt_cache)
+            logits = logits[:, -n_predict:, :]
+
+            quantize_cache_fn(prompt_cache)
+            if not logits_processors:
+                return _process_and_sample(None, logits.squeeze(0))
+
+            # Every position sees the history up to its own input token
+            out_y, out_logprobs = [], []
+            if n_predict > 1:
+                y = y[: -(n_predict - 1)]
+            for i in range(n_predict):
+                prev_tokens = (
+                    mx.concat([prev_tokens, y]) if prev_tokens is not None else y
+                )
+                y, logprobs = _process_and_sample(prev_tokens, logits[:, i, :])
+                out_y.append(y)
+                out_logprobs.append(logprobs)
+            return mx.concatenate(out_y, axis=0), mx.concatenate(out_logprobs, axis=0)
+
+    with mx.stream(generation_stream):
+        if hasattr(drafter, "prefill"):
+            drafter.prefill(tokens_seen, prefill_step_size)
+        while y.size > prefill_step_size:
+            model(y[:prefill_step_size][None], cache=prompt_cache)
+            quantize_cache_fn(prompt_cache)
+            mx.eval([c.state for c in prompt_cache])
+            y = y[prefill_step_size:]
+            mx.clear_cache()
+
+    ntoks = 0
+    # Draft tokens of the current step and how many of them the cache keeps.
+    # Set these so the finally block doesn't raise.
+    num_draft = 0
+    kept = 0
+    try:
+        while True:
+            tic = time.perf_counter()
+            with mx.stream(generation_stream):
+                draft_tokens = drafter.draft(
+                    min(max_tokens - ntoks, draft_length.next())
+                )
+            num_draft = len(draft_tokens)
+            draft_time = time.perf_counter() - tic
+
+            tic = time.perf_counter()
+            y = mx.concatenate([y, mx.array(draft_tokens, mx.uint32)])
+            tokens, logprobs = _step(y, num_draft + 1)
+            mx.eval(tokens)
+            tokens = tokens.tolist()
+            verify_time = time.perf_counter() - tic
+
+            n = 0
+            while n < num_draft and tokens[n] == draft_tokens[n]:
+                n += 1
+            draft_stats.record(num_draft, n)
+            draft_length.update(num_draft, n, draft_time, verify_time)
+            drafter.update(n, tokens[n])
+
+            # The cache keeps the draft tokens up to the last yielded token
+            for i in range(n + 1):
+                if ntoks == max_tokens:
+                    break
+                ntoks += 1
+                kept = i
+                tokens_seen.append(tokens[i])
+                yield tokens[i], logprobs[i], i < n
+
+            if ntoks == max_tokens:
+                break
+
+            y = mx.array([tokens[n]], mx.uint32)
+            if prev_tokens is not None:
+                # Forget the tokens sampled after the first rejected draft token
+                prev_tokens = prev_tokens[: prev_tokens.size - (num_draft - n)]
+            cache.trim_prompt_cache(prompt_cache, num_draft - n)
+            num_draft = kept = 0
+    finally:
+        # Drop rejected and unused draft tokens from the cache
+        cache.trim_prompt_cache(prompt_cache, num_draft - kept)
+        if hasattr(drafter, "finish"):
+            drafter.finish(tokens_seen, prompt_cache[0].offset - cache_start)
+
+
+def _smooth(average: float, value: float) -> float:
+    """Exponential moving average, starting at the first value."""
+    return value if average == 0.0 else average + _SMOOTHING * (value - average)
+
+
+def draft_model_generate_step(
+    prompt: mx.array,
+    model: nn.Module,
+    draft_model: nn.Module,
+    *,
+    num_draft_tokens: int = DEFAULT_MAX_DRAFT_TOKENS,
+    prompt_cache: Optional[Any] = None,
+    draft_length: Optional[AdaptiveDraftLength] = None,
+    sampler: Optional[Callable[[mx.array], mx.array]] = None,
+    kv_bits: Optional[int] = None,
+    kv_group_size: int = 64,
+    quantized_kv_start: int = 0,
+    **kwargs,
+) -> Generator[Tuple[int, mx.array, bool], None, None]:
+    """Generate tokens, drafting with a draft model.
+
+    Drafts are sampled with the same sampler as the model, without logits
+    processors.
+
+    Args:
+        prompt: Prompt tokens still to be processed
+        model: The model to generate with
+        draft_model: The draft model
+        num_draft_tokens: Maximum draft tokens per step
+        prompt_cache: KV caches of the model followed by those of the draft model
+        draft_length: Chooses the number of draft tokens per step (default:
+                      adaptive up to ``num_draft_tokens``)
+        **kwargs: Further ``speculative_generate_step`` parameters
+
+    Yields:
+        Tuples of (token, log probabilities, whether the token was drafted)
+    """
+    if prompt_cache is None:
+        prompt_cache = cache.make_prompt_cache(model) + cache.make_prompt_cache(
+            draft_model
+        )
+    sampler = sampler or (lambda x: mx.argmax(x, axis=-1))
+    quantize_cache_fn = functools.partial(
+        maybe_quantize_kv_cache,
+        quantized_kv_start=quantized_kv_start,
+        kv_group_size=kv_group_size,
+        kv_bits=kv_bits,
+    )
+    drafter = DraftModelDrafter(
+        draft_model,
+        prompt_cache[len(model.layers) :],
+        sampler,
+        quantize_cache_fn,
+    )
+    yield from speculative_generate_step(
+        prompt,
+        model,
+        drafter,
+        draft_length=draft_length or AdaptiveDraftLength(num_draft_tokens),
+        prompt_cache=prompt_cache[: len(model.layers)],
+        sampler=sampler,
+        kv_bits=kv_bits,
+        kv_group_size=kv_group_size,
+        quantized_kv_start=quantized_kv_start,
+        **kwargs,
+    )
@@ -0,0 +1,111 @@
+"""Stop Sequence Matcher - incremental multi-pattern matching over streamed text.
+
+Stop sequences (OpenAI ``stop``, Anthropic ``stop_sequences``) have to be detected
+in detokenized text that arrives a few characters at a time, and a stop sequence
+can span several tokens. ``StopSequenceMatcher`` runs an Aho-Corasick automaton
+over the stream, so every character is examined once regardless of the number of
+stop sequences, and holds back text that could still turn out to be the start of
+a stop sequence so it never leaks into streamed deltas.
+"""
+
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+class StopSequenceMatcher:
+    """Incremental Aho-Corasick matcher for stop sequences.
+
+    Examples:
+        matcher = StopSequenceMatcher(["\\n\\nUser:", "</answer>"])
+        text, stop = matcher.feed("The answer is 4.</ans")
+        # text == "The answer is 4.", stop is None ("</ans" is held back)
+        text, stop = matcher.feed("wer> trailing")
+        # text == "", stop == "</answer>"
+    """
+
+    def __init__(self, stop_sequences: List[str]):
+        """Build the automaton.
+
+        Args:
+            stop_sequences: Strings that end generation when they appear in the output.
+                            Empty strings are ignored.
+        """
+        self.stop_sequences = [s for s in dict.fromkeys(stop_sequences) if s]
+
+        # Trie: per state its transitions, failure link, depth and the longest
+        # stop sequence ending in that state (directly or via failure links)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._depth: List[int] = [0]
+        self._match: List[Optional[str]] = [None]
+
+        for sequence in self.stop_sequences:
+            state = 0
+            for char in sequence:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._depth.append(self._depth[state] + 1)
+                    self._match.append(None)
+                state = next_state
+            self._match[state] = sequence
+
+        # Breadth-first construction of failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._match[next_state] is None:
+                    self._match[next_state] = self._match[self._fail[next_state]]
+
+        self._state = 0
+        self._pending = ""  # Text not yet released to the caller
+        self.matched: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.stop_sequences)
+
+    def feed(self, text: str) -> Tuple[str, Optional[str]]:
+        """Process newly generated text.
+
+        Args:
+            text: Next piece of detokenized output
+
+        Returns:
+            Tuple of (text that is safe to emit, matched stop sequence or None).
+            After a match, the text following the stop sequence is discarded.
+        """
+        if self.matched is not None:
+            return "", self.matched
+
+        for char in text:
+            while self._state and char not in self._goto[self._state]:
+                self._state = self._fail[self._state]
+            self._state = self._goto[self._state].get(char, 0)
+            self._pending += char
+
+            if self._match[self._state] is not None:
+                self.matched = self._match[self._state]
+                emit = self._pending[: len(self._pending) - len(self.matched)]
+                self._pending = ""
+                return emit, self.matched
+
+        # Hold back the longest suffix that may still grow into a stop sequence
+        held = self._depth[self._state]
+        emit = self._pending[: len(self._pending) - held]
+        self._pending = self._pending[len(self._pending) - held :]
+        return emit, None
+
+    def flush(self) -> str:
+        """Release held back text at the end of generation."""
+        text, self._pending = self._pending, ""
+        self._state = 0
+        return text if self.matched is None else ""
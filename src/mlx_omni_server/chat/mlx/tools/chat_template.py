@@ -4,6 +4,7 @@ from typing import Any, Dict, List, Optional, Union
 from mlx_lm.tokenizer_utils import TokenizerWrapper
 
 from ..core_types import ChatTemplateResult
+from ..generation_context import GenerationContext
 from .base_tools import BaseToolParser
 from .hugging_face import HuggingFaceToolParser
 from .llama3 import Llama3ToolParser
@@ -40,16 +41,18 @@ def load_thinking_decoder(model_type: str) -> ThinkingDecoder:
 
 
 class ChatTemplate(ABC):
-    """Base class for tools handlers."""
+    """Base class for tools handlers.
+
+    A chat template is shared by all requests for a model and is not modified
+    after construction. Per-request flags and parse state are kept in the
+    request's GenerationContext.
+    """
 
     start_tool_calls: str
     end_tool_calls: str
 
     def __init__(self, model_type: str, tokenizer: TokenizerWrapper):
         self.tokenizer = tokenizer
-        self.has_tools = False
-        self.reason_decoder = None
-        self.enable_thinking_parse: Optional[bool] = None
         self.model_type = model_type
         self.tools_parser: Optional[BaseToolParser] = load_tools_parser(model_type)
 
@@ -63,13 +66,19 @@ class ChatTemplate(ABC):
         messages: List[Dict[str, Any]],
         tools: Optional[List[Dict[str, Any]]] = None,
         tool_choice: Optional[Union[str, Dict[str, Any]]] = None,
+        context: Optional[GenerationContext] = None,
         **kwargs,
     ) -> str:
         """Encode tools and conversation into a prompt string.
 
         This is a common implementation that uses the tokenizer's chat template.
         Subclasses can override this if they need different behavior.
+
+        Thinking and tools flags, and the thinking decoder for parsing the
+        response, are recorded in ``context``.
         """
+        if context is None:
+            context = GenerationContext()
         schema_tools = tools  # tools are already in dict format
 
         # Check if the last message is from assistant (for prefill)
@@ -88,7 +97,7 @@ class ChatTemplate(ABC):
             conversation.append(msg_dict)
 
         if kwargs:
-            self.enable_thinking_parse = kwargs.pop("enable_thinking_parse", None)
+            context.enable_thinking_parse = kwargs.pop("enable_thinking_parse", None)
             skip_thinking_prefill = kwargs.pop("skip_thinking_prefill", False)
         else:
             skip_thinking_prefill = False
@@ -110,10 +119,10 @@ class ChatTemplate(ABC):
                 **kwargs,
             )
 
-        prompt = self._process_thinking_prompt(prompt, skip_thinking_prefill)
+        prompt = self._process_thinking_prompt(prompt, context, skip_thinking_prefill)
 
         if tools:
-            self.has_tools = True
+            context.has_tools = True
             # Handle different tool_choice formats:
             # 1. String type: "auto", "required", "none"
             # 2. Dict type: {"type": "function", "function": {"name": "func_name"}} for forced specific function calls
@@ -144,7 +153,9 @@ class ChatTemplate(ABC):
         """
         return prompt.rstrip().endswith(THINK_TAG)
 
-    def _process_thinking_prompt(self, prompt: str, skip_thinking_prefill=False) -> str:
+    def _process_thinking_prompt(
+        self, prompt: str, context: GenerationContext, skip_thinking_prefill=False
+    ) -> str:
         """Process thinking-related prompt modifications.
 
         Logic overview:
@@ -152,7 +163,7 @@ class ChatTemplate(ABC):
         - enable_thinking_parse=True: Extract thinking and content parts using current rules
         - enable_thinking_parse=False: No modification to prompt
         """
-        enable_thinking_parse = self.enable_thinking_parse
+        enable_thinking_parse = context.enable_thinking_parse
         stripped_prompt = prompt.rstrip()  # Single rstrip call for efficiency
 
         # Auto-detect thinking if not explicitly set
@@ -160,7 +171,7 @@ class ChatTemplate(ABC):
             if self.model_type == "gpt_oss" or self._detect_thinking_from_prompt(
                 prompt
             ):
-                self.enable_thinking_parse = True
+                context.enable_thinking_parse = True
                 enable_thinking_parse = True
             # If no <think> detected, remain None (no modification)
 
@@ -179,19 +190,21 @@ class ChatTemplate(ABC):
 
         elif enable_thinking_parse is False:
             # No modification to prompt
-            self.reason_decoder = None
+            context.reason_decoder = None
 
         # We basically always want a reason decoder as most reasoning models reason by default
-        self.reason_decoder = load_thinking_decoder(self.model_type)
+        context.reason_decoder = load_thinking_decoder(self.model_type)
 
         return prompt
 
-    def stream_parse_chat_result(self, text: str) -> ChatTemplateResult:
+    def stream_parse_chat_result(
+        self, text: str, context: GenerationContext
+    ) -> ChatTemplateResult:
         delta_content = text
         delta_thinking = None
 
-        if self.reason_decoder is not None:
-            result = self.reason_decoder.stream_decode(text)
+        if context.reason_decoder is not None:
+            result = context.reason_decoder.stream_decode(text)
             if result is not None:
                 delta_content = result.get("delta_content") or ""
                 delta_thinking = result.get("delta_thinking")
@@ -202,18 +215,20 @@ class ChatTemplate(ABC):
             thinking=delta_thinking,
         )
 
-    def parse_chat_response(self, text: str) -> ChatTemplateResult:
+    def parse_chat_response(
+        self, text: str, context: GenerationContext
+    ) -> ChatTemplateResult:
         content = text
         thinking = None
         tool_calls = None
 
-        if self.reason_decoder is not None:
-            result = self.reason_decoder.decode(text)
+        if context.reason_decoder is not None:
+            result = context.reason_decoder.decode(text)
             if result is not None:
                 content = result.get("content")
                 thinking = result.get("thinking")
 
-        if self.has_tools and self.tools_parser is not None:
+        if context.has_tools and self.tools_parser is not None:
             tool_calls = self.tools_parser.parse_tools(content)
 
             # If tool calls were found, clear content to avoid duplication
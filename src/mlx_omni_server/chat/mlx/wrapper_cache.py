@@ -3,16 +3,41 @@
 This module provides a unified caching system for ChatGenerator instances
 to avoid expensive model reloading when the same model configuration is used
 across different API endpoints.
+
+Besides a maximum number of models, residency can be bounded by the bytes of
+the models' weights: before a model is loaded, the least recently used models
+are evicted until the size of its weight files fits the budget, and once
+loaded its measured footprint is accounted.
+
+Preloaded models are exempt from the idle TTL, pinned models from eviction
+altogether. Models with requests in flight or queued are never evicted
+automatically, nor are models just handed to a request that has not been
+admitted yet. Finishing a request counts as a use of its model.
 """
 
+import gc
+import os
 import threading
 import time
 from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import mlx.core as mx
 
 from ...utils.logger import logger
 from .chat_generator import ChatGenerator
+from .model_types import weight_file_bytes
+
+
+class ModelBusyError(Exception):
+    """Raised when a model with requests in flight is evicted without force."""
+
+    def __init__(self, message: str, requests: int):
+        super().__init__(message)
+        self.requests = requests
 
 
 @dataclass(frozen=True)
@@ -36,11 +61,16 @@ class MLXWrapperCache:
     (OpenAI, Anthropic) can share the same cached wrapper instance.
 
     Uses LRU (Least Recently Used) eviction policy and TTL (Time To Live)
-    to manage memory usage automatically.
+    to manage memory usage automatically. With a memory budget, LRU models
+    are also evicted until the weights of all cached models fit into it.
     """
 
     def __init__(
-        self, max_size: int = 3, ttl_seconds: int = 300, cleanup_interval: int = 5
+        self,
+        max_size: int = 3,
+        ttl_seconds: int = 300,
+        cleanup_interval: int = 5,
+        max_bytes: int = 0,
     ):
         """Initialize cache with LRU eviction and TTL support.
 
@@ -49,11 +79,25 @@ class MLXWrapperCache:
             ttl_seconds: Time to live in seconds, after which unused models
                         are evicted from cache (default: 300 seconds = 5 minutes)
             cleanup_interval: Interval in seconds for background cleanup (default: 5 seconds)
+            max_bytes: Memory budget for the weights of all cached models
+                       (default: 0 = unlimited)
         """
         self._cache: OrderedDict[WrapperCacheKey, ChatGenerator] = OrderedDict()
         self._access_times: Dict[WrapperCacheKey, float] = {}
+        self._weight_bytes: Dict[WrapperCacheKey, int] = {}
+        # Loads in progress, with the estimated bytes of their weights
+        self._loading: Dict[WrapperCacheKey, Future] = {}
+        self._pending_bytes: Dict[WrapperCacheKey, int] = {}
+        self._load_stats: Dict[WrapperCacheKey, Dict[str, Any]] = {}
+        # Preloaded models, which outlive idle periods, and pinned models,
+        # which are never evicted
+        self._resident: Set[WrapperCacheKey] = set()
+        self._pinned: Set[WrapperCacheKey] = set()
+        # Wrappers dropped under the lock, released once it is released
+        self._evicted: List[ChatGenerator] = []
         self._lock = threading.Lock()
         self._max_size = max_size
+        self._max_bytes = max(max_bytes, 0)
         self._ttl_seconds = ttl_seconds
         self._cleanup_interval = cleanup_interval
         self._stop_event = threading.Event()
@@ -61,14 +105,15 @@ class MLXWrapperCache:
 
         # Start background cleanup thread if TTL is enabled
         if self._ttl_seconds > 0:
-            self._cleanup_thread = threading.Thread(
-                target=self._periodic_cleanup, daemon=True
-            )
-            self._cleanup_thread.start()
+            self._start_cleanup_thread()
 
     def _evict_expired_items(self) -> None:
         """Evict items that have exceeded their TTL.
 
+        Resident and pinned wrappers and wrappers holding pinned prompt
+        prefixes are kept, they are meant to outlive idle periods. Busy
+        wrappers are kept as well.
+
         This method should be called while holding the lock.
         """
         if self._ttl_seconds <= 0:
@@ -78,36 +123,165 @@ class MLXWrapperCache:
         expired_keys = []
 
         for key, access_time in self._access_times.items():
+            if key in self._resident or key in self._pinned or self._is_busy(key):
+                continue
             if current_time - access_time > self._ttl_seconds:
-                expired_keys.append(key)
+                has_pins = getattr(self._cache.get(key), "has_pinned_prefixes", None)
+                if has_pins is None or not has_pins():
+                    expired_keys.append(key)
 
         for key in expired_keys:
-            self._cache.pop(key, None)
-            self._access_times.pop(key, None)
+            self._evict(key)
             logger.info(
                 f"Evicted expired model from cache (TTL={self._ttl_seconds}s): {key}"
             )
 
-    def _evict_lru_if_needed(self) -> None:
+    def _evict_lru_if_needed(self) -> bool:
         """Evict least recently used item if cache is at capacity.
 
+        Pinned and busy models are never evicted, the cache exceeds its
+        capacity if all cached models are pinned or busy.
+
+        Returns:
+            Whether an item was evicted
+
         This method should be called while holding the lock.
         """
         if len(self._cache) >= self._max_size and self._max_size > 0:
+            candidates = [
+                k
+                for k in self._access_times
+                if k not in self._pinned and not self._is_busy(k)
+            ]
+            if not candidates:
+                logger.warning(
+                    "All cached models are pinned or busy, none can be evicted"
+                )
+                return False
             # Find the least recently used key
-            lru_key = min(
-                self._access_times.keys(), key=lambda k: self._access_times[k]
-            )
+            lru_key = min(candidates, key=lambda k: self._access_times[k])
 
             # Remove from cache and access times
-            self._cache.pop(lru_key, None)
-            self._access_times.pop(lru_key, None)
+            self._evict(lru_key)
 
             logger.info(f"Evicted LRU model from cache: {lru_key}")
+            return True
+        return False
+
+    def _evict_to_fit(
+        self, incoming_bytes: int = 0, keep: Optional[WrapperCacheKey] = None
+    ) -> None:
+        """Evict LRU items until the cached weights fit the memory budget.
 
-            # Optional: Clean up the evicted wrapper's resources
-            # This could include clearing VRAM, etc., but ChatGenerator
-            # doesn't currently expose cleanup methods
+        Args:
+            incoming_bytes: Bytes of a model about to be loaded
+            keep: Key that is never evicted, e.g. the model just loaded
+
+        This method should be called while holding the lock.
+        """
+        if self._max_bytes <= 0:
+            return
+
+        incoming_bytes += sum(self._pending_bytes.values())
+        while self._used_bytes() + incoming_bytes > self._max_bytes:
+            candidates = [
+                k
+                for k in self._access_times
+                if k != keep and k not in self._pinned and not self._is_busy(k)
+            ]
+            if not candidates:
+                break
+            lru_key = min(candidates, key=lambda k: self._access_times[k])
+            freed = self._weight_bytes.get(lru_key, 0)
+            self._evict(lru_key)
+            logger.info(
+                f"Evicted LRU model from cache to fit the memory budget "
+                f"({freed} bytes freed): {lru_key}"
+            )
+
+    def _is_busy(self, key: WrapperCacheKey) -> bool:
+        """Whether a cached model has requests in flight, queued or reserved.
+
+        This method should be called while holding the lock.
+        """
+        return self._busy_requests(key) > 0
+
+    def _busy_requests(self, key: WrapperCacheKey) -> int:
+        """Requests of a cached model in flight, queued or reserved.
+
+        This method should be called while holding the lock.
+        """
+        admission = getattr(self._cache.get(key), "admission", None)
+        if admission is None:
+            return 0
+        stats = admission.get_stats()
+        return (
+            stats["inflight_sequences"]
+            + stats["queued_requests"]
+            + stats["reserved_requests"]
+        )
+
+    @staticmethod
+    def _reserve(wrapper: ChatGenerator) -> None:
+        """Count a request handed the wrapper as busy until it is admitted."""
+        admission = getattr(wrapper, "admission", None)
+        if admission is not None:
+            admission.reserve()
+
+    def _used_bytes(self) -> int:
+        """Bytes of the weights of the cached models.
+
+        This method should be called while holding the lock.
+        """
+        return sum(self._weight_bytes.get(key, 0) for key in self._cache)
+
+    def _evict(self, key: WrapperCacheKey) -> None:
+        """Drop a wrapper, its resources are released with the lock.
+
+        This method should be called while holding the lock acquired by
+        ``_locked``.
+        """
+        wrapper = self._cache.pop(key, None)
+        if wrapper is not None:
+            self._evicted.append(wrapper)
+        self._access_times.pop(key, None)
+        self._weight_bytes.pop(key, None)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the lock, then release the wrappers evicted meanwhile.
+
+        Closing a wrapper and returning its memory is slow, so it happens
+        after the lock is released.
+        """
+        try:
+            with self._lock:
+                yield
+        finally:
+            self._release_evicted()
+
+    def _release_evicted(self) -> None:
+        """Release the evicted wrappers and return their memory to the system."""
+        with self._lock:
+            evicted, self._evicted = self._evicted, []
+        if not evicted:
+            return
+        while evicted:
+            self._release_wrapper(evicted.pop())
+        self._free_memory()
+
+    @staticmethod
+    def _release_wrapper(wrapper: Optional[ChatGenerator]) -> None:
+        """Release background resources of an evicted wrapper."""
+        close = getattr(wrapper, "close", None)
+        if close is not None:
+            close()
+
+    @staticmethod
+    def _free_memory() -> None:
+        """Return the buffers of dropped models to the system."""
+        gc.collect()  # Wrappers can be held by reference cycles
+        mx.clear_cache()
 
     def _update_access_time(self, key: WrapperCacheKey) -> None:
         """Update access time for LRU tracking.
@@ -116,6 +290,12 @@ class MLXWrapperCache:
         """
         self._access_times[key] = time.time()
 
+    def _touch(self, key: WrapperCacheKey, wrapper: ChatGenerator) -> None:
+        """Count a finished request as a use of its cached model."""
+        with self._lock:
+            if self._cache.get(key) is wrapper:
+                self._update_access_time(key)
+
     def _periodic_cleanup(self) -> None:
         """Background thread method for periodic cleanup of expired items.
 
@@ -123,11 +303,19 @@ class MLXWrapperCache:
         """
         while not self._stop_event.wait(self._cleanup_interval):
             try:
-                with self._lock:
+                with self._locked():
                     self._evict_expired_items()
             except Exception as e:
                 logger.error(f"Error in periodic cleanup: {e}")
 
+    def _start_cleanup_thread(self) -> None:
+        """Start the background cleanup thread."""
+        self._stop_event.clear()
+        self._cleanup_thread = threading.Thread(
+            target=self._periodic_cleanup, daemon=True
+        )
+        self._cleanup_thread.start()
+
     def _stop_cleanup_thread(self) -> None:
         """Stop the background cleanup thread gracefully."""
         if self._cleanup_thread is not None:
@@ -141,6 +329,7 @@ class MLXWrapperCache:
         model_id: str,
         adapter_path: Optional[str] = None,
         draft_model_id: Optional[str] = None,
+        reserve: bool = False,
     ) -> ChatGenerator:
         """Get or create ChatGenerator instance.
 
@@ -148,6 +337,10 @@ class MLXWrapperCache:
             model_id: Model name/path (HuggingFace model ID or local path)
             adapter_path: Optional path to LoRA adapter
             draft_model_id: Optional draft model name/path for speculative decoding
+            reserve: Reserve an admission for the caller, so the model is not
+                     evicted before the request is admitted. The caller passes
+                     ``reserved=True`` to ``admission.acquire`` or calls
+                     ``admission.cancel_reservation``.
 
         Returns:
             Cached or newly created ChatGenerator instance
@@ -155,6 +348,9 @@ class MLXWrapperCache:
         Note:
             This method is thread-safe and will only create one wrapper instance
             per unique parameter combination, even under concurrent access.
+            Models are loaded outside of the cache lock: concurrent requests
+            for a loading model wait for that load, requests for other models
+            do not.
         """
         key = WrapperCacheKey(
             model_id=model_id,
@@ -162,57 +358,249 @@ class MLXWrapperCache:
             draft_model_id=draft_model_id,
         )
 
-        # Double-checked locking pattern for performance
-        if key in self._cache:
-            with self._lock:
+        while True:
+            with self._locked():
                 # Evict expired items before checking cache
                 self._evict_expired_items()
 
-                # Check if key still exists after expiry cleanup
                 if key in self._cache:
                     # Update access time for LRU and TTL
                     self._update_access_time(key)
                     logger.debug(f"Cache hit for ChatGenerator: {key}")
-                    return self._cache[key]
+                    wrapper = self._cache[key]
+                    if reserve:
+                        self._reserve(wrapper)
+                    return wrapper
+
+                # Single flight: later requesters of the key wait for its load
+                future = self._loading.get(key)
+                loads = future is None
+                if loads:
+                    future = Future()
+                    self._loading[key] = future
+
+            if loads:
+                try:
+                    wrapper = self._load(key)
+                except BaseException as e:
+                    with self._lock:
+                        self._loading.pop(key, None)
+                        self._pending_bytes.pop(key, None)
+                    future.set_exception(e)
+                    raise
+                future.set_result(wrapper)
+            else:
+                logger.debug(f"Waiting for ChatGenerator being loaded: {key}")
+                wrapper = future.result()
+            if not reserve:
+                return wrapper
 
-        with self._lock:
-            # Evict expired items first
-            self._evict_expired_items()
+            with self._lock:
+                # Another load may have evicted the wrapper in the meantime,
+                # then look it up again
+                if self._cache.get(key) is wrapper or self._max_size <= 0:
+                    self._reserve(wrapper)
+                    return wrapper
 
-            # Check again inside lock in case another thread created it
-            if key in self._cache:
-                self._update_access_time(key)
-                logger.debug(f"Cache hit (after lock) for ChatGenerator: {key}")
-                return self._cache[key]
+    def _load(self, key: WrapperCacheKey) -> ChatGenerator:
+        """Create and cache the wrapper of a key, outside of the lock.
 
+        Only the thread that registered the key's load future calls this.
+        """
+        estimate = weight_file_bytes(key.model_id) + weight_file_bytes(
+            key.draft_model_id
+        )
+        with self._locked():
             # Cache miss - evict LRU if needed before creating new wrapper
             self._evict_lru_if_needed()
+            if self._max_size > 0:
+                self._evict_to_fit(estimate)
+            self._pending_bytes[key] = estimate
+
+        # Create new wrapper
+        logger.info(f"Creating new ChatGenerator for: {key}")
+        start_time = time.perf_counter()
+        try:
+            wrapper = ChatGenerator.create(
+                model_id=key.model_id,
+                adapter_path=key.adapter_path,
+                draft_model_id=key.draft_model_id,
+            )
+        except Exception as e:
+            with self._lock:
+                self._record_load(key, time.perf_counter() - start_time, failed=True)
+            logger.error(f"Failed to create ChatGenerator for {key}: {e}")
+            raise
+        load_seconds = time.perf_counter() - start_time
+
+        with self._locked():
+            self._loading.pop(key, None)
+            self._pending_bytes.pop(key, None)
+            self._record_load(key, load_seconds)
+
+            # Only cache if max_size > 0
+            if self._max_size > 0:
+                # Other keys may have been loaded meanwhile
+                self._evict_lru_if_needed()
+                self._cache[key] = wrapper
+                self._update_access_time(key)
+                admission = getattr(wrapper, "admission", None)
+                if admission is not None:
+                    admission.add_release_callback(lambda: self._touch(key, wrapper))
+                self._weight_bytes[key] = getattr(wrapper, "weight_bytes", 0)
+                self._evict_to_fit(keep=key)
+                logger.info(
+                    f"Successfully cached ChatGenerator: {key} in {load_seconds:.1f}s (cache size: {len(self._cache)}/{self._max_size}, "
+                    f"weights: {self._used_bytes()}/{self._max_bytes or 'unlimited'} bytes)"
+                )
+            else:
+                logger.info(f"Created ChatGenerator but not cached (max_size=0): {key}")
 
-            # Create new wrapper
-            logger.info(f"Creating new ChatGenerator for: {key}")
-            try:
-                wrapper = ChatGenerator.create(
-                    model_id=model_id,
-                    adapter_path=adapter_path,
-                    draft_model_id=draft_model_id,
+        return wrapper
+
+    def _record_load(
+        self, key: WrapperCacheKey, seconds: float, failed: bool = False
+    ) -> None:
+        """Account a model load in the load metrics.
+
+        This method should be called while holding the lock.
+        """
+        stats = self._load_stats.setdefault(
+            key,
+            {
+                "loads": 0,
+                "failures": 0,
+                "total_load_seconds": 0.0,
+                "last_load_seconds": 0.0,
+            },
+        )
+        stats["loads"] += 1
+        stats["failures"] += failed
+        stats["total_load_seconds"] += seconds
+        stats["last_load_seconds"] = seconds
+
+    def keep_resident(self, key: WrapperCacheKey) -> None:
+        """Exempt a model from TTL eviction, e.g. one preloaded at startup.
+
+        Resident models are still evicted as least recently used when the
+        cache needs room for another model.
+        """
+        with self._lock:
+            self._resident.add(key)
+
+    def pin(self, key: WrapperCacheKey) -> None:
+        """Never evict a model, neither when idle nor to make room for others.
+
+        Pinned models still count towards the cache size and memory budget.
+        """
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key: WrapperCacheKey) -> bool:
+        """Make a pinned or preloaded model evictable again.
+
+        Returns:
+            Whether the model was pinned or resident
+        """
+        with self._lock:
+            found = key in self._pinned or key in self._resident
+            self._pinned.discard(key)
+            self._resident.discard(key)
+            return found
+
+    def get_residency(self, key: WrapperCacheKey) -> Dict[str, bool]:
+        """Get whether a model is loaded, pinned and resident (preloaded)."""
+        with self._lock:
+            return {
+                "loaded": key in self._cache,
+                "pinned": key in self._pinned,
+                "resident": key in self._resident,
+            }
+
+    def evict(self, key: WrapperCacheKey, force: bool = True) -> bool:
+        """Unload a model now, even if it is pinned.
+
+        Pins are kept, so the model is never evicted again once reloaded.
+        Requests in flight, queued or reserved still finish, the model's
+        resources are released after them.
+
+        Args:
+            key: Model to unload
+            force: Also unload a model with requests in flight, queued or
+                   reserved
+
+        Returns:
+            Whether the model was cached
+
+        Raises:
+            ModelBusyError: If the model has requests and force is not set
+        """
+        with self._locked():
+            if key not in self._cache:
+                return False
+            requests = self._busy_requests(key)
+            if requests and not force:
+                raise ModelBusyError(
+                    f"{requests} requests of {key} are in flight or queued",
+                    requests,
                 )
+            self._evict(key)
+        logger.info(f"Evicted model from cache on demand: {key}")
+        return True
 
-                # Only cache if max_size > 0
-                if self._max_size > 0:
-                    self._cache[key] = wrapper
-                    self._update_access_time(key)
-                    logger.info(
-                        f"Successfully cached ChatGenerator: {key} (cache size: {len(self._cache)}/{self._max_size})"
-                    )
-                else:
-                    logger.info(
-                        f"Created ChatGenerator but not cached (max_size=0): {key}"
-                    )
+    def get_entries(self) -> List[Dict[str, Any]]:
+        """Get the cached and loading models without updating their access times.
 
-                return wrapper
-            except Exception as e:
-                logger.error(f"Failed to create ChatGenerator for {key}: {e}")
-                raise
+        Returns:
+            List of dictionaries with the key, the wrapper (None while loading),
+            last use, TTL expiry (None if exempt), weight bytes, pin and load
+            state and load metrics of every model, most recently used first
+        """
+        with self._lock:
+            keys = sorted(self._access_times, key=self._access_times.get, reverse=True)
+            keys += [key for key in self._loading if key not in self._access_times]
+            entries = []
+            for key in keys:
+                wrapper = self._cache.get(key)
+                last_used = self._access_times.get(key)
+                has_pins = getattr(wrapper, "has_pinned_prefixes", None)
+                exempt = (
+                    key in self._pinned
+                    or key in self._resident
+                    or (has_pins is not None and has_pins())
+                )
+                entries.append(
+                    {
+                        "key": key,
+                        "wrapper": wrapper,
+                        "last_used": last_used,
+                        "expires_at": (
+                            last_used + self._ttl_seconds
+                            if last_used is not None
+                            and self._ttl_seconds > 0
+                            and not exempt
+                            else None
+                        ),
+                        "weight_bytes": self._weight_bytes.get(
+                            key, self._pending_bytes.get(key, 0)
+                        ),
+                        "pinned": key in self._pinned,
+                        "resident": key in self._resident,
+                        "loading": key in self._loading,
+                        "load_stats": dict(self._load_stats.get(key, {})),
+                    }
+                )
+            return entries
+
+    def get_wrappers(self) -> List[Tuple[WrapperCacheKey, ChatGenerator]]:
+        """Get the cached wrappers without updating their access times.
+
+        Returns:
+            List of (cache key, wrapper) tuples, most recently used first
+        """
+        with self._lock:
+            keys = sorted(self._access_times, key=self._access_times.get, reverse=True)
+            return [(key, self._cache[key]) for key in keys if key in self._cache]
 
     def cleanup_expired_items(self) -> int:
         """Manually trigger cleanup of expired items.
@@ -223,7 +611,7 @@ class MLXWrapperCache:
         Returns:
             Number of items that were evicted
         """
-        with self._lock:
+        with self._locked():
             initial_size = len(self._cache)
             self._evict_expired_items()
             evicted_count = initial_size - len(self._cache)
@@ -241,19 +629,22 @@ class MLXWrapperCache:
         # Stop the cleanup thread first
         self._stop_cleanup_thread()
 
-        with self._lock:
+        with self._locked():
             cache_size = len(self._cache)
-            self._cache.clear()
-            self._access_times.clear()
+            for key in list(self._cache):
+                self._evict(key)
             logger.info(f"Cleared ChatGenerator cache ({cache_size} entries)")
 
     def get_cache_info(self) -> Dict[str, any]:
         """Get cache statistics.
 
         Returns:
-            Dictionary with cache statistics including LRU and TTL information
+            Dictionary with cache statistics including LRU and TTL information,
+            the memory budget, the weight bytes of every cached model, the
+            models being loaded and load durations per model
         """
-        with self._lock:
+        with self._locked():
+            wrappers = list(self._cache.items())
             # Clean up expired items first to get accurate stats
             self._evict_expired_items()
 
@@ -275,15 +666,34 @@ class MLXWrapperCache:
                         }
                     )
 
-            return {
+            info = {
                 "cache_size": len(self._cache),
                 "max_size": self._max_size,
                 "ttl_seconds": self._ttl_seconds,
                 "cached_keys": [str(key) for key in self._cache.keys()],
                 "lru_order": [str(key) for key, _ in sorted_keys],  # Most recent first
                 "ttl_info": ttl_info,
+                "max_bytes": self._max_bytes,
+                "used_bytes": self._used_bytes(),
+                "model_bytes": {
+                    str(key): self._weight_bytes.get(key, 0) for key in self._cache
+                },
+                "loading_keys": [str(key) for key in self._loading],
+                "resident_keys": [str(key) for key in self._resident],
+                "pinned_keys": [str(key) for key in self._pinned],
+                "load_stats": {
+                    str(key): dict(stats) for key, stats in self._load_stats.items()
+                },
             }
 
+        # Generators take their own locks, don't hold up loads for them
+        info["generation_stats"] = {
+            str(key): wrapper.get_stats()
+            for key, wrapper in wrappers
+            if hasattr(wrapper, "get_stats")
+        }
+        return info
+
     def set_max_size(self, max_size: int) -> None:
         """Update the maximum cache size.
 
@@ -294,22 +704,62 @@ class MLXWrapperCache:
             If the new size is smaller than current cache size,
             LRU items will be evicted immediately.
         """
-        with self._lock:
+        with self._locked():
             self._max_size = max_size
 
             # Evict items if current cache exceeds new limit
             while len(self._cache) > self._max_size:
-                self._evict_lru_if_needed()
+                if not self._evict_lru_if_needed():
+                    break
 
             logger.info(
                 f"Updated cache max_size to {max_size}, current size: {len(self._cache)}"
             )
 
+    def set_ttl_seconds(self, ttl_seconds: int) -> None:
+        """Update the time to live of unused models.
+
+        Args:
+            ttl_seconds: New time to live in seconds, 0 disables it
+
+        Note:
+            Models unused for longer are evicted immediately.
+        """
+        with self._locked():
+            self._ttl_seconds = ttl_seconds
+            self._evict_expired_items()
+            if ttl_seconds > 0 and self._cleanup_thread is None:
+                self._start_cleanup_thread()
+
+            logger.info(f"Updated cache ttl_seconds to {ttl_seconds}")
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Update the memory budget for the weights of the cached models.
+
+        Args:
+            max_bytes: New budget in bytes, 0 for unlimited
+
+        Note:
+            LRU items are evicted immediately until the cached weights fit.
+        """
+        with self._locked():
+            self._max_bytes = max(max_bytes, 0)
+            self._evict_to_fit()
+
+            logger.info(
+                f"Updated cache max_bytes to {max_bytes}, cached weights: {self._used_bytes()} bytes"
+            )
+
     def __del__(self) -> None:
         """Destructor to ensure cleanup thread is stopped."""
         self._stop_cleanup_thread()
 
 
 # Global cache instance - shared across all API endpoints
-# Default to 3 models with 5-minute TTL as suggested by user requirements
-wrapper_cache = MLXWrapperCache(max_size=3, ttl_seconds=300)
+# Default to 3 models with 5-minute TTL as suggested by user requirements,
+# the server command line can change the limits
+wrapper_cache = MLXWrapperCache(
+    max_size=int(os.environ.get("MLX_OMNI_MAX_MODELS", 3)),
+    ttl_seconds=300,
+    max_bytes=int(float(os.environ.get("MLX_OMNI_MODEL_CACHE_GB", 0)) * 1024**3),
+)
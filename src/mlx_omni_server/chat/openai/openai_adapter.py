@@ -1,9 +1,18 @@
 import time
 import uuid
-from typing import Generator
-
-from mlx_omni_server.chat.mlx.chat_generator import DEFAULT_MAX_TOKENS, ChatGenerator
+from typing import Any, Dict, Generator, List, Optional
+
+from mlx_omni_server.chat.mlx.cancellation import CancellationToken
+from mlx_omni_server.chat.mlx.chat_generator import (
+    DEFAULT_MAX_TOKENS,
+    KV_QUANTIZATION_PARAMS,
+    KV_WINDOW_PARAMS,
+    ChatGenerator,
+)
+from mlx_omni_server.chat.mlx.core_types import CompletionResult
 from mlx_omni_server.chat.openai.schema import (
+    CacheWarmRequest,
+    CacheWarmResponse,
     ChatCompletionChoice,
     ChatCompletionChunk,
     ChatCompletionChunkChoice,
@@ -31,8 +40,14 @@ class OpenAIAdapter:
         self._default_max_tokens = DEFAULT_MAX_TOKENS
         self._generate_wrapper = wrapper
 
-    def _prepare_generation_params(self, request: ChatCompletionRequest) -> dict:
-        """Prepare common parameters for both generate and stream_generate."""
+    def _prepare_generation_params(
+        self, request: ChatCompletionRequest, session_id: Optional[str] = None
+    ) -> dict:
+        """Prepare common parameters for both generate and stream_generate.
+
+        The session id (e.g. from a request header) takes precedence over the
+        request's ``user`` in selecting the prompt cache slot.
+        """
         max_tokens = (
             request.max_completion_tokens
             or request.max_tokens
@@ -68,26 +83,8 @@ class OpenAIAdapter:
             if key in extra_params:
                 template_kwargs[key] = extra_params[key]
 
-        # Convert messages to dict format
-        messages = [
-            {
-                "role": (
-                    msg.role.value if hasattr(msg.role, "value") else str(msg.role)
-                ),
-                "content": msg.content,
-                **({"name": msg.name} if msg.name else {}),
-                **({"tool_calls": msg.tool_calls} if msg.tool_calls else {}),
-            }
-            for msg in request.messages
-        ]
-
-        # Convert tools to dict format
-        tools = None
-        if request.tools:
-            tools = [
-                tool.model_dump() if hasattr(tool, "model_dump") else dict(tool)
-                for tool in request.tools
-            ]
+        messages = _convert_messages(request.messages)
+        tools = _convert_tools(request.tools)
 
         logger.info(f"messages: {messages}")
         logger.info(f"template_kwargs: {template_kwargs}")
@@ -96,7 +93,7 @@ class OpenAIAdapter:
         if request.response_format and request.response_format.json_schema:
             json_schema = request.response_format.json_schema.schema_def
 
-        return {
+        params = {
             "messages": messages,
             "tools": tools,
             "max_tokens": max_tokens,
@@ -106,40 +103,93 @@ class OpenAIAdapter:
             "enable_prompt_cache": True,
             "repetition_penalty": request.presence_penalty,
             "json_schema": json_schema,
+            "stop_sequences": (
+                [request.stop] if isinstance(request.stop, str) else request.stop
+            ),
+            # Like draft_model, accepted as a direct extra parameter too
+            "prompt_lookup_num_tokens": extra_params.get(
+                "prompt_lookup_num_tokens",
+                extra_body.get("prompt_lookup_num_tokens"),
+            ),
+            "session_id": session_id or request.user,
+        }
+
+        params.update(self._kv_params(request))
+        return params
+
+    def _kv_params(self, request: ChatCompletionRequest) -> Dict[str, Any]:
+        """KV cache quantization and window overrides of the model's defaults."""
+        extra_params = request.get_extra_params()
+        extra_body = extra_params.get("extra_body", {})
+        return {
+            key: extra_params.get(key, extra_body.get(key))
+            for key in KV_QUANTIZATION_PARAMS + KV_WINDOW_PARAMS
         }
 
+    def validate(self, request: ChatCompletionRequest) -> None:
+        """Reject a request that would fail generating, before it is admitted.
+
+        Raises:
+            ValueError: If the KV cache parameters don't suit the model
+        """
+        self._generate_wrapper.validate_kv_params(self._kv_params(request))
+
+    def _create_choice(
+        self, request: ChatCompletionRequest, result: CompletionResult
+    ) -> ChatCompletionChoice:
+        """Create an OpenAI choice from a completion result."""
+        logger.debug(f"Model Response:\n{result.content.text}")
+
+        # Use reasoning from the wrapper's result
+        final_content = result.content.text
+        reasoning_content = result.content.reasoning
+
+        # Use wrapper's chat tokenizer for tool processing
+        if request.tools:
+            message = ChatMessage(
+                role=Role.ASSISTANT,
+                content=final_content,
+                tool_calls=result.content.tool_calls,
+                reasoning=reasoning_content,
+            )
+        else:
+            message = ChatMessage(
+                role=Role.ASSISTANT,
+                content=final_content,
+                reasoning=reasoning_content,
+            )
+
+        return ChatCompletionChoice(
+            index=result.index,
+            message=message,
+            finish_reason=(
+                "tool_calls"
+                if message.tool_calls
+                else _map_finish_reason(result.finish_reason)
+            ),
+            logprobs=result.logprobs,
+        )
+
     def generate(
         self,
         request: ChatCompletionRequest,
+        cancellation_token: Optional[CancellationToken] = None,
+        session_id: Optional[str] = None,
     ) -> ChatCompletionResponse:
         """Generate complete response using the wrapper."""
         try:
             # Prepare parameters
-            params = self._prepare_generation_params(request)
+            params = self._prepare_generation_params(request, session_id)
+            params["cancellation_token"] = cancellation_token
 
-            # Directly use wrapper's generate method for complete response
-            result = self._generate_wrapper.generate(**params)
-
-            logger.debug(f"Model Response:\n{result.content.text}")
-
-            # Use reasoning from the wrapper's result
-            final_content = result.content.text
-            reasoning_content = result.content.reasoning
+            # Generate all requested choices from a single prompt prefill
+            results = self._generate_wrapper.generate_choices(
+                n=request.n or 1, **params
+            )
 
-            # Use wrapper's chat tokenizer for tool processing
-            if request.tools:
-                message = ChatMessage(
-                    role=Role.ASSISTANT,
-                    content=final_content,
-                    tool_calls=result.content.tool_calls,
-                    reasoning=reasoning_content,
-                )
-            else:
-                message = ChatMessage(
-                    role=Role.ASSISTANT,
-                    content=final_content,
-                    reasoning=reasoning_content,
-                )
+            # Prompt statistics are shared by all choices
+            result = results[0]
+            completion_tokens = sum(r.stats.completion_tokens for r in results)
 
             # Use cached tokens from wrapper stats
             cached_tokens = result.stats.cache_hit_tokens
@@ -155,23 +205,12 @@ class OpenAIAdapter:
                 id=f"chatcmpl-{uuid.uuid4().hex[:10]}",
                 created=int(time.time()),
                 model=request.model,
-                choices=[
-                    ChatCompletionChoice(
-                        index=0,
-                        message=message,
-                        finish_reason=(
-                            "tool_calls"
-                            if message.tool_calls
-                            else (result.finish_reason or "stop")
-                        ),
-                        logprobs=result.logprobs,
-                    )
-                ],
+                choices=[self._create_choice(request, r) for r in results],
                 usage=ChatCompletionUsage(
                     prompt_tokens=result.stats.prompt_tokens + cached_tokens,
-                    completion_tokens=result.stats.completion_tokens,
+                    completion_tokens=completion_tokens,
                     total_tokens=result.stats.prompt_tokens
-                    + result.stats.completion_tokens
+                    + completion_tokens
                     + cached_tokens,
                     prompt_tokens_details=prompt_tokens_details,
                 ),
@@ -180,19 +219,44 @@ class OpenAIAdapter:
             logger.error(f"Failed to generate completion: {str(e)}", exc_info=True)
             raise RuntimeError(f"Failed to generate completion: {str(e)}")
 
+    def warm_prompt_cache(self, request: CacheWarmRequest) -> CacheWarmResponse:
+        """Prefill and pin the KV cache of the request's prompt."""
+        pinned, cached_tokens = self._generate_wrapper.warm_prompt_cache(
+            messages=_convert_messages(request.messages),
+            tools=_convert_tools(request.tools),
+            template_kwargs=request.chat_template_kwargs,
+        )
+        logger.info(
+            f"Pinned {pinned.pinned_tokens} of {pinned.prompt_tokens} prompt tokens as {pinned.id}"
+        )
+        return CacheWarmResponse(
+            id=pinned.id,
+            model=request.model,
+            prompt_tokens=pinned.prompt_tokens,
+            pinned_tokens=pinned.pinned_tokens,
+            created=pinned.created,
+            cached_tokens=cached_tokens,
+        )
+
     def generate_stream(
         self,
         request: ChatCompletionRequest,
+        cancellation_token: Optional[CancellationToken] = None,
+        session_id: Optional[str] = None,
     ) -> Generator[ChatCompletionChunk, None, None]:
         """Stream generate OpenAI-compatible chunks."""
         try:
             chat_id = f"chatcmpl-{uuid.uuid4().hex[:10]}"
 
             # Prepare parameters
-            params = self._prepare_generation_params(request)
+            params = self._prepare_generation_params(request, session_id)
+            params["cancellation_token"] = cancellation_token
 
-            result = None
-            for chunk in self._generate_wrapper.generate_stream(**params):
+            # Last chunk of every choice, for usage reporting
+            final_chunks = {}
+            for chunk in self._generate_wrapper.generate_stream(
+                n=request.n or 1, **params
+            ):
                 created = int(time.time())
 
                 message = ChatMessage(
@@ -207,20 +271,29 @@ class OpenAIAdapter:
                     model=request.model,
                     choices=[
                         ChatCompletionChunkChoice(
-                            index=0,
+                            index=chunk.index,
                             delta=message,
-                            finish_reason=chunk.finish_reason,
+                            finish_reason=(
+                                _map_finish_reason(chunk.finish_reason)
+                                if chunk.finish_reason
+                                else None
+                            ),
                             logprobs=chunk.logprobs,
                         )
                     ],
                 )
-                result = chunk
+                final_chunks[chunk.index] = chunk
 
             if (
                 request.stream_options
                 and request.stream_options.include_usage
-                and result is not None
+                and final_chunks
             ):
+                # The prompt is shared, so it is reported once
+                result = final_chunks[0]
+                completion_tokens = sum(
+                    c.stats.completion_tokens for c in final_chunks.values()
+                )
                 created = int(time.time())
                 cached_tokens = result.stats.cache_hit_tokens
                 logger.debug(f"Stream response with {cached_tokens} cached tokens")
@@ -247,9 +320,9 @@ class OpenAIAdapter:
                     ],
                     usage=ChatCompletionUsage(
                         prompt_tokens=result.stats.prompt_tokens + cached_tokens,
-                        completion_tokens=result.stats.completion_tokens,
+                        completion_tokens=completion_tokens,
                         total_tokens=result.stats.prompt_tokens
-                        + result.stats.completion_tokens
+                        + completion_tokens
                         + cached_tokens,
                         prompt_tokens_details=prompt_tokens_details,
                     ),
@@ -258,3 +331,33 @@ class OpenAIAdapter:
         except Exception as e:
             logger.error(f"Error during stream generation: {str(e)}", exc_info=True)
             raise
+
+
+def _convert_messages(messages) -> List[Dict[str, Any]]:
+    """Convert request messages to dict format."""
+    return [
+        {
+            "role": (msg.role.value if hasattr(msg.role, "value") else str(msg.role)),
+            "content": msg.content,
+            **({"name": msg.name} if msg.name else {}),
+            **({"tool_calls": msg.tool_calls} if msg.tool_calls else {}),
+        }
+        for msg in messages
+    ]
+
+
+def _convert_tools(tools) -> Optional[List[Dict[str, Any]]]:
+    """Convert request tools to dict format."""
+    if not tools:
+        return None
+    return [
+        tool.model_dump() if hasattr(tool, "model_dump") else dict(tool)
+        for tool in tools
+    ]
+
+
+def _map_finish_reason(finish_reason: Optional[str]) -> str:
+    """Map internal finish reasons to OpenAI's (a matched stop sequence is "stop")."""
+    if finish_reason is None or finish_reason == "stop_sequence":
+        return "stop"
+    return finish_reason
@@ -1,14 +1,32 @@
+import asyncio
 import json
-from typing import Generator, Optional
+from typing import AsyncGenerator, Optional
 
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
-from mlx_omni_server.chat.mlx.chat_generator import ChatGenerator
+from mlx_omni_server.chat.mlx.admission import (
+    PRIORITY_HEADER,
+    OverloadedError,
+    Priority,
+    estimate_tokens,
+)
+from mlx_omni_server.chat.mlx.cancellation import (
+    CancellationToken,
+    cancel_on_disconnect,
+)
+from mlx_omni_server.chat.mlx.chat_generator import DEFAULT_MAX_TOKENS, ChatGenerator
+from mlx_omni_server.chat.mlx.model_registry import shared_model_registry
+from mlx_omni_server.chat.mlx.prompt_cache import SESSION_HEADER
+from mlx_omni_server.chat.mlx.wrapper_cache import wrapper_cache
 from mlx_omni_server.chat.openai.openai_adapter import OpenAIAdapter
 from mlx_omni_server.chat.openai.schema import (
+    CacheWarmRequest,
+    CacheWarmResponse,
     ChatCompletionRequest,
     ChatCompletionResponse,
+    PinnedPrefixInfo,
+    PinnedPrefixList,
 )
 
 router = APIRouter(tags=["chat—completions"])
@@ -16,24 +34,93 @@ router = APIRouter(tags=["chat—completions"])
 
 @router.post("/chat/completions", response_model=ChatCompletionResponse)
 @router.post("/v1/chat/completions", response_model=ChatCompletionResponse)
-async def create_chat_completion(request: ChatCompletionRequest):
+async def create_chat_completion(request: ChatCompletionRequest, raw_request: Request):
     """Create a chat completion"""
 
-    text_model = _create_text_model(
+    # Model loading can take a long time, keep it off the event loop
+    generator = await asyncio.to_thread(
+        _get_generator,
         request.model,
         request.get_extra_params().get("adapter_path"),
         request.get_extra_params().get("draft_model"),
+        reserve=True,
     )
+    text_model = OpenAIAdapter(wrapper=generator)
+    try:
+        text_model.validate(request)
+    except ValueError as e:
+        generator.admission.cancel_reservation()
+        return _error_response(400, str(e), "invalid_request_error")
+
+    # Stop generating (or waiting for admission) as soon as the client goes away
+    cancellation_token = CancellationToken()
+    watcher = asyncio.create_task(cancel_on_disconnect(raw_request, cancellation_token))
+
+    n = request.n or 1
+    try:
+        ticket = await generator.admission.acquire(
+            sequences=n,
+            tokens=estimate_tokens(
+                len(request.model_dump_json(include={"messages", "tools"})),
+                request.max_completion_tokens
+                or request.max_tokens
+                or DEFAULT_MAX_TOKENS,
+                n,
+            ),
+            priority=Priority.from_header(raw_request.headers.get(PRIORITY_HEADER)),
+            cancellation_token=cancellation_token,
+            reserved=True,
+        )
+    except OverloadedError as e:
+        watcher.cancel()
+        return JSONResponse(
+            status_code=429,
+            content={
+                "error": {
+                    "message": str(e),
+                    "type": "rate_limit_exceeded",
+                    "code": "rate_limit_exceeded",
+                }
+            },
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    if ticket is None:
+        # Client closed the connection while queued
+        watcher.cancel()
+        return Response(status_code=499)
 
     if not request.stream:
-        completion = text_model.generate(request)
+        try:
+            completion = await generator.executor.run(
+                text_model.generate,
+                request,
+                cancellation_token,
+                raw_request.headers.get(SESSION_HEADER),
+            )
+        finally:
+            watcher.cancel()
+            ticket.release()
         return JSONResponse(content=completion.model_dump(exclude_none=True))
 
-    async def event_generator() -> Generator[str, None, None]:
-        for chunk in text_model.generate_stream(request):
-            yield f"data: {json.dumps(chunk.model_dump(exclude_none=True))}\n\n"
-
-        yield "data: [DONE]\n\n"
+    # Also frees the slot if the response body is never iterated
+    cancellation_token.add_callback(ticket.release)
+
+    async def event_generator() -> AsyncGenerator[str, None]:
+        try:
+            async for chunk in generator.executor.stream(
+                text_model.generate_stream,
+                request,
+                cancellation_token,
+                raw_request.headers.get(SESSION_HEADER),
+            ):
+                yield f"data: {json.dumps(chunk.model_dump(exclude_none=True))}\n\n"
+
+            yield "data: [DONE]\n\n"
+        finally:
+            watcher.cancel()
+            ticket.release()
+            # No-op if generation completed, otherwise the client disconnected
+            cancellation_token.cancel()
 
     return StreamingResponse(
         event_generator(),
@@ -45,27 +132,85 @@ async def create_chat_completion(request: ChatCompletionRequest):
     )
 
 
-def _create_text_model(
+@router.post("/v1/cache/warm", response_model=CacheWarmResponse)
+async def warm_prompt_cache(request: CacheWarmRequest):
+    """Prefill and pin the KV cache of a prompt prefix.
+
+    Deploy scripts warm shared system prompts and tool catalogs before traffic
+    arrives. Chat requests rendering the same messages and tools first reuse the
+    pinned KV blocks, which are never evicted until unpinned.
+    """
+    generator = await asyncio.to_thread(
+        _get_generator, request.model, request.adapter_path, request.draft_model
+    )
+    text_model = OpenAIAdapter(wrapper=generator)
+    try:
+        response = await generator.executor.run(text_model.warm_prompt_cache, request)
+    except ValueError as e:
+        return _error_response(400, str(e), "invalid_request_error")
+    except RuntimeError as e:
+        return _error_response(503, str(e), "server_busy")
+    return JSONResponse(content=response.model_dump())
+
+
+@router.get("/v1/cache/pins", response_model=PinnedPrefixList)
+async def list_pinned_prefixes():
+    """List the pinned prompt prefixes of all loaded models."""
+    pins = [
+        PinnedPrefixInfo(
+            id=pinned.id,
+            model=key.model_id,
+            prompt_tokens=pinned.prompt_tokens,
+            pinned_tokens=pinned.pinned_tokens,
+            created=pinned.created,
+            expires_at=None if pinned.expires_at is None else int(pinned.expires_at),
+        )
+        for key, generator in wrapper_cache.get_wrappers()
+        for pinned in generator.list_pinned_prefixes()
+    ]
+    return PinnedPrefixList(data=pins)
+
+
+@router.delete("/v1/cache/pins/{pin_id}")
+async def unpin_prefix(pin_id: str):
+    """Unpin a prompt prefix, its KV blocks become evictable again."""
+    for _, generator in wrapper_cache.get_wrappers():
+        if generator.unpin_prefix(pin_id):
+            return {"id": pin_id, "object": "cache.pin", "deleted": True}
+    return _error_response(404, f"Pinned prefix {pin_id} not found", "not_found")
+
+
+def _error_response(status_code: int, message: str, error_type: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "code": error_type}},
+    )
+
+
+def _get_generator(
     model_id: str,
     adapter_path: Optional[str] = None,
     draft_model: Optional[str] = None,
-) -> OpenAIAdapter:
-    """Create a text model based on the model parameters.
+    reserve: bool = False,
+) -> ChatGenerator:
+    """Get the ChatGenerator for the model parameters.
 
     Uses the shared wrapper cache to get or create ChatGenerator instance.
     This avoids expensive model reloading when the same model configuration
-    is used across different requests or API endpoints.
+    is used across different requests or API endpoints. Model aliases are
+    resolved through the server's model registry. With ``reserve`` the model
+    stays loaded until the request acquires its admission.
     """
-    # Get cached or create new ChatGenerator
-    wrapper = ChatGenerator.get_or_create(
+    model_id, adapter_path, draft_model = shared_model_registry().resolve(
+        model_id, adapter_path, draft_model
+    )
+    return ChatGenerator.get_or_create(
         model_id=model_id,
         adapter_path=adapter_path,
         draft_model_id=draft_model,
+        reserve=reserve,
     )
 
-    # Create OpenAIAdapter with the cached wrapper directly
-    return OpenAIAdapter(wrapper=wrapper)
-
 
 # Legacy caching variables removed - now using shared wrapper_cache
 # This eliminates duplicate caching logic and enables sharing between endpoints
@@ -225,6 +225,7 @@ class ChatCompletionRequest(BaseModel):
     tools: Optional[List[Tool]] = None
     tool_choice: Optional[ToolChoiceType] = None
     response_format: Optional[ResponseFormat] = None
+    user: Optional[str] = None
 
     # Allow any additional fields
     class Config:
@@ -272,3 +273,36 @@ class ChatCompletionRequest(BaseModel):
             "draft-model",
         }
         return {k: v for k, v in self.model_dump().items() if k not in standard_fields}
+
+
+class CacheWarmRequest(BaseModel):
+    """Request to prefill and pin the KV cache of a prompt prefix."""
+
+    model: str = Field(..., description="ID of the model to warm")
+    messages: List[ChatMessage]
+    tools: Optional[List[Tool]] = None
+    adapter_path: Optional[str] = None
+    draft_model: Optional[str] = None
+    chat_template_kwargs: Optional[Dict[str, Any]] = Field(
+        None,
+        description="Template parameters (e.g. enable_thinking) of the requests to be served",
+    )
+
+
+class PinnedPrefixInfo(BaseModel):
+    id: str
+    object: str = "cache.pin"
+    model: str
+    prompt_tokens: int
+    pinned_tokens: int
+    created: int
+    expires_at: Optional[int] = None
+
+
+class CacheWarmResponse(PinnedPrefixInfo):
+    cached_tokens: int = 0
+
+
+class PinnedPrefixList(BaseModel):
+    object: str = "list"
+    data: List[PinnedPrefixInfo]
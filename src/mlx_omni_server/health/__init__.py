@@ -0,0 +1 @@
+"""Health checks of the server."""
@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from ..chat.mlx.preload import model_preloader
+from .schema import Readiness
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/health")
+async def get_liveness() -> dict:
+    """Report that the server is running, preloaded models may still be warming up."""
+    return {"status": "ok"}
+
+
+@router.get(
+    "/health/ready",
+    response_model=Readiness,
+    responses={503: {"model": Readiness, "description": "Models are warming up"}},
+)
+async def get_readiness() -> JSONResponse:
+    """Report ready (200) once every preloaded model is loaded and warm, 503 before."""
+    readiness = Readiness(**model_preloader.get_status())
+    return JSONResponse(
+        status_code=200 if readiness.status == "ready" else 503,
+        content=readiness.model_dump(),
+    )
@@ -0,0 +1,25 @@
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class ModelReadiness(BaseModel):
+    """Preload state of one model."""
+
+    model: str
+    adapter_path: Optional[str] = None
+    draft_model: Optional[str] = None
+    status: Literal["pending", "loading", "warming_up", "ready", "failed"]
+    load_seconds: Optional[float] = None
+    warm_up_seconds: Optional[float] = Field(
+        None, description="Duration of the dummy prefill and decode"
+    )
+    error: Optional[str] = None
+
+
+class Readiness(BaseModel):
+    """Whether the server is ready to serve, i.e. all preloaded models are warm."""
+
+    object: str = "health.readiness"
+    status: Literal["ready", "warming_up", "failed"]
+    models: List[ModelReadiness]
@@ -4,6 +4,15 @@ import os
 import uvicorn
 from fastapi import FastAPI
 
+from .chat.mlx.disk_cache import shared_disk_prompt_cache
+from .chat.mlx.model_registry import ModelRegistry, shared_model_registry
+from .chat.mlx.preload import (
+    PRELOAD_SEPARATOR,
+    configured_preload_keys,
+    model_preloader,
+    parse_preload_spec,
+)
+from .chat.mlx.wrapper_cache import WrapperCacheKey, wrapper_cache
 from .middleware.logging import RequestResponseLoggingMiddleware
 from .routers import api_router
 from .utils.logger import logger, set_logger_level
@@ -13,7 +22,7 @@ app = FastAPI(title="MLX Omni Server")
 # Add request/response logging middleware with custom levels
 app.add_middleware(
     RequestResponseLoggingMiddleware,
-    # exclude_paths=["/health"]
+    # exclude_paths=["/health", "/health/ready"]
 )
 
 from fastapi.middleware.cors import CORSMiddleware
@@ -21,6 +30,24 @@ from fastapi.middleware.cors import CORSMiddleware
 app.include_router(api_router)
 
 
+@app.on_event("startup")
+def preload_models():
+    """Pin registered models and load and warm up the ones to preload."""
+    for profile in shared_model_registry().profiles:
+        if profile.pinned:
+            wrapper_cache.pin(WrapperCacheKey(*profile.key))
+    model_preloader.start(configured_preload_keys())
+
+
+@app.on_event("shutdown")
+def release_models():
+    """Release cached models and wait for their prompt caches to be persisted."""
+    wrapper_cache.clear_cache()
+    disk_cache = shared_disk_prompt_cache()
+    if disk_cache is not None:
+        disk_cache.flush()
+
+
 def build_parser():
     """Create and configure the argument parser for the server."""
     parser = argparse.ArgumentParser(description="MLX Omni Server")
@@ -56,6 +83,148 @@ def build_parser():
         default="",
         help='Apply origins to CORSMiddleware. This is useful for accessing the local server directly from the browser (use --cors-allow-origins="*"). Defaults to disabled',
     )
+    parser.add_argument(
+        "--prefill-chunk-size",
+        type=int,
+        default=512,
+        help="Prompt tokens prefilled between decode steps of running requests, so long prompts do not stall streaming responses (0 disables chunking), defaults to 512",
+    )
+    parser.add_argument(
+        "--max-inflight-sequences",
+        type=int,
+        default=16,
+        help="Maximum sequences generated concurrently per model, further requests are queued, defaults to 16",
+    )
+    parser.add_argument(
+        "--max-queue-depth",
+        type=int,
+        default=64,
+        help="Maximum requests queued per model before new requests are rejected as overloaded, defaults to 64",
+    )
+    parser.add_argument(
+        "--max-inflight-tokens",
+        type=int,
+        default=0,
+        help="Maximum estimated prompt + completion tokens in flight per model (0 for no limit), defaults to 0",
+    )
+    parser.add_argument(
+        "--prompt-lookup-models",
+        type=str,
+        default="",
+        help="Comma-separated model IDs that use prompt lookup decoding (draft tokens copied from the prompt, no draft model) by default, '*' for all models",
+    )
+    parser.add_argument(
+        "--prompt-lookup-num-tokens",
+        type=int,
+        default=10,
+        help="Maximum draft tokens proposed per step by prompt lookup decoding, defaults to 10",
+    )
+    parser.add_argument(
+        "--max-models",
+        type=int,
+        default=3,
+        help="Maximum number of models kept loaded, defaults to 3",
+    )
+    parser.add_argument(
+        "--model-cache-gb",
+        type=float,
+        default=0,
+        help="Memory budget of the weights of all loaded models in GB, the least recently used models are unloaded to fit a new one, defaults to 0 (unlimited)",
+    )
+    parser.add_argument(
+        "--model-registry",
+        type=str,
+        default="",
+        help="YAML or TOML file mapping model aliases to models, adapters and draft models, with per-model defaults (KV cache, prompt cache slots, speculative decoding, concurrency) and residency (pinned, preload)",
+    )
+    parser.add_argument(
+        "--preload",
+        type=str,
+        action="append",
+        default=[],
+        metavar="MODEL[,ADAPTER][,DRAFT]",
+        help="Model or registry alias to load and warm up at startup and keep loaded, with an optional LoRA adapter and draft model, e.g. --preload mlx-community/Qwen3-8B-4bit,,mlx-community/Qwen3-0.6B-4bit. Can be repeated. /health/ready reports ready once all preloaded models are warm",
+    )
+    parser.add_argument(
+        "--prompt-cache-slots",
+        type=int,
+        default=4,
+        help="Number of prompt KV cache slots per model, so that several conversations keep their cached prefix, defaults to 4",
+    )
+    parser.add_argument(
+        "--session-ttl",
+        type=int,
+        default=600,
+        help="Seconds a client session (X-Session-Id header, OpenAI user or Anthropic metadata.user_id) keeps its dedicated prompt cache slot after its last request, 0 keeps it until evicted as least recently used, defaults to 600",
+    )
+    parser.add_argument(
+        "--prefix-cache-tokens",
+        type=int,
+        default=16384,
+        help="Tokens of KV blocks per model kept in the radix tree shared by all requests, so common prefixes like system prompts are prefilled once (0 to disable), defaults to 16384",
+    )
+    parser.add_argument(
+        "--prompt-cache-dir",
+        type=str,
+        default="",
+        help="Directory where evicted prompt caches are persisted and reloaded from after restarts (disabled if empty), e.g. ~/.cache/mlx-omni-server/prompt-cache",
+    )
+    parser.add_argument(
+        "--prompt-cache-disk-gb",
+        type=float,
+        default=10.0,
+        help="Disk budget of the persisted prompt caches in GB, least recently used files are deleted first, defaults to 10",
+    )
+    parser.add_argument(
+        "--prompt-cache-gb",
+        type=float,
+        default=0,
+        help="Memory budget of the prompt caches of all models in GB, the least valuable cached prefixes (short and long unused ones) are evicted first, defaults to 0 (unlimited)",
+    )
+    parser.add_argument(
+        "--kv-quantized-models",
+        type=str,
+        default="",
+        help="Comma-separated model IDs whose KV cache, including cached prompts, is quantized by default, '*' for all models. Requests override it with kv_bits (0 disables), kv_group_size and quantized_kv_start. Quantized requests are not batched",
+    )
+    parser.add_argument(
+        "--kv-bits",
+        type=int,
+        default=8,
+        choices=[2, 3, 4, 5, 6, 8],
+        help="Bits per value of quantized KV caches, defaults to 8",
+    )
+    parser.add_argument(
+        "--kv-group-size",
+        type=int,
+        default=64,
+        choices=[32, 64, 128],
+        help="Group size of quantized KV caches, defaults to 64",
+    )
+    parser.add_argument(
+        "--quantized-kv-start",
+        type=int,
+        default=5000,
+        help="Cached tokens from which a KV cache is quantized, shorter contexts stay in full precision, defaults to 5000",
+    )
+    parser.add_argument(
+        "--rotating-kv-models",
+        type=str,
+        default="",
+        help="Comma-separated model IDs whose KV cache is a rotating window of constant size by default, '*' for all models. Requests override it with max_kv_size (0 disables) and kv_sink_tokens. Models with their own cache layout or a draft model are not supported",
+    )
+    parser.add_argument(
+        "--max-kv-size",
+        type=int,
+        default=4096,
+        help="Tokens held by a rotating KV window, defaults to 4096",
+    )
+    parser.add_argument(
+        "--kv-sink-tokens",
+        type=int,
+        default=4,
+        help="Tokens at the start of a rotating KV window that are always kept (attention sinks), defaults to 4",
+    )
     return parser
 
 
@@ -97,6 +266,54 @@ def start():
     os.environ["MLX_OMNI_LOG_LEVEL"] = args.log_level
     # Set CORS through environment variable
     os.environ["MLX_OMNI_CORS"] = args.cors_allow_origins
+    # Set prefill chunk size through environment variable
+    os.environ["MLX_OMNI_PREFILL_CHUNK_SIZE"] = str(args.prefill_chunk_size)
+    # Set admission limits through environment variables
+    os.environ["MLX_OMNI_MAX_INFLIGHT_SEQUENCES"] = str(args.max_inflight_sequences)
+    os.environ["MLX_OMNI_MAX_QUEUE_DEPTH"] = str(args.max_queue_depth)
+    os.environ["MLX_OMNI_MAX_INFLIGHT_TOKENS"] = str(args.max_inflight_tokens)
+    # Set prompt lookup decoding defaults through environment variables
+    os.environ["MLX_OMNI_PROMPT_LOOKUP_MODELS"] = args.prompt_lookup_models
+    os.environ["MLX_OMNI_PROMPT_LOOKUP_NUM_TOKENS"] = str(args.prompt_lookup_num_tokens)
+    # Set model residency limits, through environment variables for workers
+    os.environ["MLX_OMNI_MAX_MODELS"] = str(args.max_models)
+    os.environ["MLX_OMNI_MODEL_CACHE_GB"] = str(args.model_cache_gb)
+    wrapper_cache.set_max_size(args.max_models)
+    wrapper_cache.set_max_bytes(int(args.model_cache_gb * 1024**3))
+    # Set model registry through environment variable, failing early if invalid
+    if args.model_registry:
+        try:
+            ModelRegistry.load(args.model_registry)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    os.environ["MLX_OMNI_MODEL_REGISTRY"] = (
+        os.path.abspath(args.model_registry) if args.model_registry else ""
+    )
+    # Set models to preload through environment variable
+    for spec in args.preload:
+        try:
+            parse_preload_spec(spec)
+        except ValueError as e:
+            parser.error(str(e))
+    os.environ["MLX_OMNI_PRELOAD"] = PRELOAD_SEPARATOR.join(args.preload)
+    # Set prompt cache slots through environment variable
+    os.environ["MLX_OMNI_PROMPT_CACHE_SLOTS"] = str(args.prompt_cache_slots)
+    os.environ["MLX_OMNI_PREFIX_CACHE_TOKENS"] = str(args.prefix_cache_tokens)
+    os.environ["MLX_OMNI_SESSION_TTL"] = str(args.session_ttl)
+    # Set prompt cache persistence through environment variables
+    os.environ["MLX_OMNI_PROMPT_CACHE_DIR"] = args.prompt_cache_dir
+    os.environ["MLX_OMNI_PROMPT_CACHE_DISK_GB"] = str(args.prompt_cache_disk_gb)
+    # Set prompt cache memory budget through environment variable
+    os.environ["MLX_OMNI_PROMPT_CACHE_GB"] = str(args.prompt_cache_gb)
+    # Set KV cache quantization defaults through environment variables
+    os.environ["MLX_OMNI_KV_QUANTIZED_MODELS"] = args.kv_quantized_models
+    os.environ["MLX_OMNI_KV_BITS"] = str(args.kv_bits)
+    os.environ["MLX_OMNI_KV_GROUP_SIZE"] = str(args.kv_group_size)
+    os.environ["MLX_OMNI_QUANTIZED_KV_START"] = str(args.quantized_kv_start)
+    # Set rotating KV window defaults through environment variables
+    os.environ["MLX_OMNI_ROTATING_KV_MODELS"] = args.rotating_kv_models
+    os.environ["MLX_OMNI_MAX_KV_SIZE"] = str(args.max_kv_size)
+    os.environ["MLX_OMNI_KV_SINK_TOKENS"] = str(args.kv_sink_tokens)
 
     set_logger_level(logger, args.log_level)
     configure_cors_middleware(args.cors_allow_origins)
@@ -1,9 +1,11 @@
 from fastapi import APIRouter
 
+from .admin import router as admin_router
 from .chat.anthropic import router as anthropic_router
 from .chat.openai import router as chat_router
 from .chat.openai.models import models
 from .embeddings import router as embeddings_router
+from .health import router as health_router
 
 from .images import images
 from .stt import stt as stt_router
@@ -17,3 +19,5 @@ api_router.include_router(images.router)
 api_router.include_router(chat_router.router)
 api_router.include_router(embeddings_router.router)
 api_router.include_router(anthropic_router.router, prefix="/anthropic")
+api_router.include_router(admin_router.router)
+api_router.include_router(health_router.router)
@@ -0,0 +1,186 @@
+"""Unit tests for AdmissionController.
+
+These tests verify concurrency and token limits, priority ordering of queued
+requests, fast rejection when the queue is full, and that cancelled waiters give
+up their place.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from mlx_omni_server.chat.mlx.admission import (
+    AdmissionController,
+    OverloadedError,
+    Priority,
+)
+from mlx_omni_server.chat.mlx.cancellation import CancellationToken
+
+
+class TestAdmissionController:
+    """Test AdmissionController functionality."""
+
+    def test_limits_inflight_sequences(self):
+        """Requests beyond the sequence limit wait until capacity is released."""
+
+        async def scenario():
+            controller = AdmissionController("test", max_inflight_sequences=2)
+            first = await controller.acquire(sequences=2)
+            waiting = asyncio.create_task(controller.acquire(sequences=1))
+            await asyncio.sleep(0.01)
+            assert not waiting.done()
+            assert controller.get_stats()["queued_requests"] == 1
+
+            first.release()
+            second = await asyncio.wait_for(waiting, timeout=1.0)
+            assert second.queue_wait > 0
+            second.release()
+            second.release()  # Releasing twice is harmless
+
+            stats = controller.get_stats()
+            assert stats["inflight_sequences"] == 0
+            assert stats["admitted_requests"] == 2
+            assert stats["max_queue_wait"] == second.queue_wait
+
+        asyncio.run(scenario())
+
+    def test_token_budget(self):
+        """The token budget queues requests, but never starves a large one."""
+
+        async def scenario():
+            controller = AdmissionController("test", max_inflight_tokens=100)
+            large = await controller.acquire(tokens=500)
+            small = asyncio.create_task(controller.acquire(tokens=10))
+            await asyncio.sleep(0.01)
+            assert not small.done()
+
+            large.release()
+            (await asyncio.wait_for(small, timeout=1.0)).release()
+
+        asyncio.run(scenario())
+
+    def test_priority_order(self):
+        """Queued requests are admitted by priority class, then arrival."""
+
+        async def scenario():
+            controller = AdmissionController("test", max_inflight_sequences=1)
+            running = await controller.acquire()
+            admitted = []
+
+            async def request(name, priority):
+                ticket = await controller.acquire(priority=priority)
+                admitted.append(name)
+                ticket.release()
+
+            tasks = [
+                asyncio.create_task(request("low", Priority.LOW)),
+                asyncio.create_task(request("normal", Priority.NORMAL)),
+                asyncio.create_task(request("high-1", Priority.HIGH)),
+                asyncio.create_task(request("high-2", Priority.HIGH)),
+            ]
+            await asyncio.sleep(0.01)
+            running.release()
+            await asyncio.wait_for(asyncio.gather(*tasks), timeout=1.0)
+            assert admitted == ["high-1", "high-2", "normal", "low"]
+
+        asyncio.run(scenario())
+
+    def test_full_queue_rejects(self):
+        """A full queue rejects new requests, or sheds a lower-priority waiter."""
+
+        async def scenario():
+            controller = AdmissionController(
+                "test", max_inflight_sequences=1, max_queue_depth=1
+            )
+            running = await controller.acquire()
+            low = asyncio.create_task(controller.acquire(priority=Priority.LOW))
+            await asyncio.sleep(0.01)
+
+            with pytest.raises(OverloadedError) as rejected:
+                await controller.acquire(priority=Priority.LOW)
+            assert rejected.value.retry_after >= 1
+
+            high = asyncio.create_task(controller.acquire(priority=Priority.HIGH))
+            with pytest.raises(OverloadedError):
+                await asyncio.wait_for(low, timeout=1.0)
+
+            running.release()
+            (await asyncio.wait_for(high, timeout=1.0)).release()
+            assert controller.get_stats()["rejected_requests"] == 2
+
+        asyncio.run(scenario())
+
+    def test_cancelled_while_queued(self):
+        """A cancelled waiter leaves the queue and gets no ticket."""
+
+        async def scenario():
+            controller = AdmissionController("test", max_inflight_sequences=1)
+            running = await controller.acquire()
+            token = CancellationToken()
+            waiting = asyncio.create_task(controller.acquire(cancellation_token=token))
+            await asyncio.sleep(0.01)
+
+            token.cancel()
+            assert await asyncio.wait_for(waiting, timeout=1.0) is None
+            assert controller.get_stats()["queued_requests"] == 0
+
+            running.release()
+            assert controller.get_stats()["inflight_sequences"] == 0
+
+        asyncio.run(scenario())
+
+    def test_idle_callback(self):
+        """Idle callbacks run once the last request is released."""
+
+        async def scenario():
+            controller = AdmissionController("test", max_inflight_sequences=1)
+            idle = threading.Event()
+            controller.add_idle_callback(idle.set)
+            assert idle.is_set()
+
+            idle.clear()
+            running = await controller.acquire()
+            waiting = asyncio.create_task(controller.acquire())
+            await asyncio.sleep(0.01)
+            controller.add_idle_callback(idle.set)
+
+            running.release()
+            ticket = await asyncio.wait_for(waiting, timeout=1.0)
+            assert not idle.is_set()
+            ticket.release()
+            assert idle.wait(timeout=1.0)
+
+        asyncio.run(scenario())
+
+    def test_reservation(self):
+        """Reserved requests keep the controller busy until they acquire."""
+
+        async def scenario():
+            controller = AdmissionController("test")
+            idle = threading.Event()
+            controller.reserve()
+            controller.add_idle_callback(idle.set)
+            assert controller.get_stats()["reserved_requests"] == 1
+            assert not idle.is_set()
+
+            ticket = await controller.acquire(reserved=True)
+            assert controller.get_stats()["reserved_requests"] == 0
+            assert not idle.is_set()
+            ticket.release()
+            assert idle.wait(timeout=1.0)
+
+            idle.clear()
+            controller.reserve()
+            controller.add_idle_callback(idle.set)
+            controller.cancel_reservation()
+            assert idle.wait(timeout=1.0)
+
+        asyncio.run(scenario())
+
+    def test_priority_from_header(self):
+        """Header values map to priority classes, unknown values to normal."""
+        assert Priority.from_header("high") == Priority.HIGH
+        assert Priority.from_header(" LOW ") == Priority.LOW
+        assert Priority.from_header(None) == Priority.NORMAL
+        assert Priority.from_header("urgent") == Priority.NORMAL
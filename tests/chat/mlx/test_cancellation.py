@@ -0,0 +1,55 @@
+"""Unit tests for CancellationToken and disconnect detection."""
+
+import asyncio
+
+from mlx_omni_server.chat.mlx.cancellation import (
+    CancellationToken,
+    cancel_on_disconnect,
+)
+
+
+class FakeRequest:
+    """Request stand-in that reports a disconnect after a number of checks."""
+
+    def __init__(self, disconnect_after: int):
+        self.checks = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        self.checks += 1
+        return self.checks > self.disconnect_after
+
+
+class TestCancellationToken:
+    """Test CancellationToken functionality."""
+
+    def test_callbacks_run_once(self):
+        """Callbacks run on the first cancel only, late callbacks run immediately."""
+        token = CancellationToken()
+        calls = []
+        token.add_callback(lambda: calls.append("early"))
+
+        def removed():
+            calls.append("removed")
+
+        token.add_callback(removed)
+        token.remove_callback(removed)
+
+        assert not token.cancelled
+        token.cancel()
+        token.cancel()
+        assert token.cancelled
+        assert calls == ["early"]
+
+        token.add_callback(lambda: calls.append("late"))
+        assert calls == ["early", "late"]
+
+    def test_cancel_on_disconnect(self):
+        """The watcher cancels the token once the client is gone."""
+        token = CancellationToken()
+        request = FakeRequest(disconnect_after=3)
+
+        asyncio.run(cancel_on_disconnect(request, token, poll_interval=0.001))
+
+        assert token.cancelled
+        assert request.checks == 4
@@ -25,7 +25,7 @@ class TestChatGenerator:
         """Test basic initialization."""
         assert mlx_wrapper.tokenizer is not None
         assert mlx_wrapper.chat_template is not None
-        assert mlx_wrapper._prompt_cache is None
+        assert mlx_wrapper._prompt_cache_pool is None
 
     def test_basic_generate(self, mlx_wrapper):
         """Test basic text generation."""
@@ -311,3 +311,33 @@ class TestChatGenerator:
         assert isinstance(result, GenerationResult)
         assert isinstance(result.content, CompletionContent)
         assert len(result.content.text) > 0
+
+    def test_kv_quantization_defaults_and_overrides(self, mlx_wrapper):
+        """Requests take the model's KV quantization unless they override it."""
+        mlx_wrapper.kv_quantization = {
+            "kv_bits": 8,
+            "kv_group_size": 64,
+            "quantized_kv_start": 5000,
+        }
+        mlx_wrapper._supports_kv_quantization = True
+
+        kwargs = {"kv_bits": None}
+        assert mlx_wrapper._resolve_kv_quantization(kwargs) == (8, 64)
+        assert kwargs["quantized_kv_start"] == 5000
+
+        kwargs = {"kv_bits": 4, "kv_group_size": 32}
+        assert mlx_wrapper._resolve_kv_quantization(kwargs) == (4, 32)
+
+        kwargs = {"kv_bits": 0}
+        assert mlx_wrapper._resolve_kv_quantization(kwargs) is None
+        assert kwargs == {}
+
+        with pytest.raises(ValueError):
+            mlx_wrapper._resolve_kv_quantization({"kv_bits": 7})
+
+        # Gemma 3's sliding window layers cannot be quantized
+        mlx_wrapper._supports_kv_quantization = None
+        assert not mlx_wrapper.supports_kv_quantization
+        assert mlx_wrapper._resolve_kv_quantization({}) is None
+        with pytest.raises(ValueError):
+            mlx_wrapper._resolve_kv_quantization({"kv_bits": 4})
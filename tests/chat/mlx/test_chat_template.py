@@ -1,5 +1,8 @@
+from types import SimpleNamespace
+
 from mlx_lm import load
 
+from mlx_omni_server.chat.mlx.generation_context import GenerationContext
 from mlx_omni_server.chat.mlx.tools.chat_template import ChatTemplate
 
 
@@ -14,14 +17,16 @@ class TestChatTemplate:
         chat_template = ChatTemplate(model_type="qwen3", tokenizer=tokenizer)
 
         messages = [{"role": "user", "content": "hello"}]
+        context = GenerationContext()
         prompt = chat_template.apply_chat_template(
             messages=messages,
             enable_thinking_parse=True,
+            context=context,
         )
         print(prompt)
         assert prompt.endswith("<think>")
-        assert chat_template.enable_thinking_parse is True
-        assert chat_template.reason_decoder is not None
+        assert context.enable_thinking_parse is True
+        assert context.reason_decoder is not None
 
     def test_thinking_disabled(self):
         # Test explicitly disabling thinking - should do no modification
@@ -29,16 +34,18 @@ class TestChatTemplate:
         chat_template = ChatTemplate(model_type="qwen3", tokenizer=tokenizer)
 
         messages = [{"role": "user", "content": "hello"}]
+        context = GenerationContext()
         prompt = chat_template.apply_chat_template(
             messages=messages,
             enable_thinking_parse=False,
+            context=context,
         )
         print(prompt)
         # Should not modify prompt, no thinking processing
         assert not prompt.endswith("<think>")
         assert "<think>\n\n</think>\n\n" not in prompt
-        assert chat_template.enable_thinking_parse is False
-        assert chat_template.reason_decoder is None
+        assert context.enable_thinking_parse is False
+        assert context.reason_decoder is None
 
     def test_thinking_auto_detect(self):
         # Test comprehensive None behavior: default value and auto-detection
@@ -46,27 +53,31 @@ class TestChatTemplate:
         chat_template = ChatTemplate(model_type="qwen3", tokenizer=tokenizer)
 
         # Test 1: Default value should be None
-        assert chat_template.enable_thinking_parse is None
-        assert chat_template.reason_decoder is None
+        context = GenerationContext()
+        assert context.enable_thinking_parse is None
+        assert context.reason_decoder is None
 
         # Test 2: No auto-detection when prompt doesn't end with <think>
         messages = [{"role": "user", "content": "hello"}]
-        prompt = chat_template.apply_chat_template(messages=messages)
+        prompt = chat_template.apply_chat_template(messages=messages, context=context)
         print("No auto-detection:", prompt)
         assert "<think>" not in prompt
-        assert chat_template.enable_thinking_parse is None
-        assert chat_template.reason_decoder is None
+        assert context.enable_thinking_parse is None
+        assert context.reason_decoder is None
 
         # Test 3: Auto-detection when prompt ends with <think>
         model2, tokenizer2 = load("deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B")
         chat_template2 = ChatTemplate(model_type="hf", tokenizer=tokenizer2)
 
-        prompt2 = chat_template2.apply_chat_template(messages=messages)
+        context2 = GenerationContext()
+        prompt2 = chat_template2.apply_chat_template(
+            messages=messages, context=context2
+        )
         print("Auto-detection:", prompt2)
         # This model's template should end with <think>, triggering auto-detection
         assert "<think>" in prompt2
-        assert chat_template2.enable_thinking_parse is True
-        assert chat_template2.reason_decoder is not None
+        assert context2.enable_thinking_parse is True
+        assert context2.reason_decoder is not None
 
     def test_multimodal_content(self):
         """Test handling of multimodal content (text + other types)"""
@@ -126,9 +137,12 @@ class TestChatTemplate:
             }
         ]
 
-        prompt = chat_template.apply_chat_template(messages=messages, tools=tools)
+        context = GenerationContext()
+        prompt = chat_template.apply_chat_template(
+            messages=messages, tools=tools, context=context
+        )
         print(prompt)
-        assert chat_template.has_tools is True
+        assert context.has_tools is True
         assert prompt.find("get_weather") != -1
         # Note: Tool inclusion in prompt depends on model/tokenizer support
         # The important thing is that has_tools flag is set correctly
@@ -147,26 +161,29 @@ class TestChatTemplate:
         ]
 
         # Test required choice
+        context = GenerationContext()
         prompt_required = chat_template.apply_chat_template(
-            messages=messages, tools=tools, tool_choice="required"
+            messages=messages, tools=tools, tool_choice="required", context=context
         )
-        assert chat_template.has_tools is True
+        assert context.has_tools is True
         assert prompt_required.strip().endswith(chat_template.start_tool_calls)
 
         # Test auto choice (should not add prefix)
         chat_template2 = ChatTemplate(model_type="llama", tokenizer=tokenizer)
+        context2 = GenerationContext()
         prompt_auto = chat_template2.apply_chat_template(
-            messages=messages, tools=tools, tool_choice="auto"
+            messages=messages, tools=tools, tool_choice="auto", context=context2
         )
-        assert chat_template2.has_tools is True
+        assert context2.has_tools is True
         # auto choice should not add tool_calls prefix
 
         # Test none choice (should not add prefix)
         chat_template3 = ChatTemplate(model_type="llama", tokenizer=tokenizer)
+        context3 = GenerationContext()
         prompt_none = chat_template3.apply_chat_template(
-            messages=messages, tools=tools, tool_choice="none"
+            messages=messages, tools=tools, tool_choice="none", context=context3
         )
-        assert chat_template3.has_tools is True
+        assert context3.has_tools is True
         # none choice should not add tool_calls prefix
 
     def test_thinking_with_tools(self):
@@ -177,12 +194,13 @@ class TestChatTemplate:
         messages = [{"role": "user", "content": "Use tools to help me"}]
         tools = [{"type": "function", "function": {"name": "helper"}}]
 
+        context = GenerationContext()
         prompt = chat_template.apply_chat_template(
-            messages=messages, tools=tools, enable_thinking_parse=True
+            messages=messages, tools=tools, enable_thinking_parse=True, context=context
         )
 
-        assert chat_template.has_tools is True
-        assert chat_template.enable_thinking_parse is True
+        assert context.has_tools is True
+        assert context.enable_thinking_parse is True
         assert prompt.endswith("<think>")
 
     def test_conversation_history(self):
@@ -217,3 +235,36 @@ class TestChatTemplate:
             messages=messages, custom_param="test_value"
         )
         assert isinstance(prompt, str)
+
+    def test_concurrent_requests_keep_separate_state(self):
+        """Flags and parse state of one request do not leak into another."""
+        tokenizer = SimpleNamespace(
+            apply_chat_template=lambda conversation, **kwargs: "<|user|>hi<|assistant|>"
+        )
+        chat_template = ChatTemplate(model_type="qwen3", tokenizer=tokenizer)
+        tools = [{"type": "function", "function": {"name": "helper"}}]
+
+        thinking = GenerationContext()
+        plain = GenerationContext()
+        chat_template.apply_chat_template(
+            messages=[{"role": "user", "content": "hi"}],
+            tools=tools,
+            enable_thinking_parse=True,
+            context=thinking,
+        )
+        chat_template.apply_chat_template(
+            messages=[{"role": "user", "content": "hi"}],
+            enable_thinking_parse=False,
+            context=plain,
+        )
+        assert thinking.enable_thinking_parse is True and thinking.has_tools
+        assert plain.enable_thinking_parse is False and not plain.has_tools
+
+        # Interleaved streams are parsed with their own decoder state: ending
+        # the thinking block of one request leaves the other one thinking
+        parse = chat_template.stream_parse_chat_result
+        assert parse("hmm", thinking).thinking == "hmm"
+        assert parse("</think>", thinking).thinking is None
+        assert parse("still", plain).thinking == "still"
+        assert parse("Answer", thinking).content == "Answer"
+        assert parse("more", plain).thinking == "more"
@@ -0,0 +1,110 @@
+"""Unit tests for GenerationExecutor.
+
+These tests verify that blocking work runs off the event loop thread, that streams
+are forwarded in order with backpressure, and that errors and early consumer exits
+are handled.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mlx_omni_server.chat.mlx.generation_executor import GenerationExecutor
+
+
+class TestGenerationExecutor:
+    """Test GenerationExecutor functionality."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.executor = GenerationExecutor("test-model", queue_size=2)
+
+    def teardown_method(self):
+        """Release worker threads."""
+        self.executor.shutdown(wait=True)
+
+    def test_run_off_event_loop(self):
+        """Blocking calls run in the worker thread while the loop stays responsive."""
+
+        async def scenario():
+            loop_thread = threading.get_ident()
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            def blocking_work(value):
+                time.sleep(0.2)
+                return value, threading.get_ident()
+
+            task = asyncio.create_task(ticker())
+            value, worker_thread = await self.executor.run(blocking_work, 42)
+            task.cancel()
+            return value, worker_thread != loop_thread, ticks
+
+        value, off_loop, ticks = asyncio.run(scenario())
+        assert value == 42
+        assert off_loop
+        # The event loop kept running while the work was blocking
+        assert ticks > 5
+
+    def test_stream_order_and_errors(self):
+        """Stream items arrive in order and producer errors are re-raised."""
+
+        def numbers(count):
+            for i in range(count):
+                yield i
+
+        def failing():
+            yield "first"
+            raise RuntimeError("Generation failed")
+
+        async def collect(fn, *args):
+            return [item async for item in self.executor.stream(fn, *args)]
+
+        assert asyncio.run(collect(numbers, 10)) == list(range(10))
+
+        received = []
+
+        async def collect_until_error():
+            async for item in self.executor.stream(failing):
+                received.append(item)
+
+        with pytest.raises(RuntimeError, match="Generation failed"):
+            asyncio.run(collect_until_error())
+        assert received == ["first"]
+
+    def test_backpressure_and_early_exit(self):
+        """A slow consumer bounds production, and leaving early closes the generator."""
+        produced = []
+        closed = threading.Event()
+
+        def endless():
+            try:
+                i = 0
+                while True:
+                    produced.append(i)
+                    yield i
+                    i += 1
+            finally:
+                closed.set()
+
+        async def scenario():
+            stream = self.executor.stream(endless)
+            first = await stream.__anext__()
+            # Give the producer time to fill the queue
+            await asyncio.sleep(0.2)
+            produced_while_idle = len(produced)
+            await stream.aclose()
+            return first, produced_while_idle
+
+        first, produced_while_idle = asyncio.run(scenario())
+        assert first == 0
+        # Queue size 2: one consumed, two buffered, one blocked in put
+        assert produced_while_idle <= 4
+        assert closed.wait(timeout=2.0)
@@ -0,0 +1,137 @@
+"""Tests for rejecting invalid KV cache parameters before admission.
+
+The chat endpoints run against a tiny random Llama model, so the requests
+never reach generation: they are rejected with a 400 before they are admitted.
+"""
+
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from mlx_omni_server.chat.anthropic import router as anthropic_router
+from mlx_omni_server.chat.mlx.chat_generator import ChatGenerator
+from mlx_omni_server.chat.openai import router as openai_router
+from tests.chat.mlx.tiny_model import make_tiny_model
+
+
+@pytest.fixture(scope="module")
+def generator():
+    generator = ChatGenerator(make_tiny_model(hidden_size=128))
+    yield generator
+    generator.close()
+
+
+@pytest.fixture
+def client(generator):
+    app = FastAPI()
+    app.include_router(openai_router.router)
+    app.include_router(anthropic_router.router)
+
+    def get_generator(*args, reserve=False):
+        if reserve:
+            generator.admission.reserve()
+        return generator
+
+    with (
+        patch.object(openai_router, "_get_generator", get_generator),
+        patch.object(anthropic_router, "_get_generator", get_generator),
+    ):
+        yield TestClient(app)
+
+
+def post_chat_completion(client, **params):
+    return client.post(
+        "/v1/chat/completions",
+        json={
+            "model": "tiny-llama",
+            "messages": [{"role": "user", "content": "Hi"}],
+            "max_tokens": 4,
+            **params,
+        },
+    )
+
+
+def post_message(client, **params):
+    return client.post(
+        "/v1/messages",
+        json={
+            "model": "tiny-llama",
+            "messages": [{"role": "user", "content": "Hi"}],
+            "max_tokens": 4,
+            **params,
+        },
+    )
+
+
+class TestKVQuantizationParams:
+    """Invalid KV cache quantization is a client error."""
+
+    @pytest.mark.parametrize(
+        "params, message",
+        [
+            ({"kv_bits": 7}, "kv_bits must be one of"),
+            ({"kv_bits": 4, "kv_group_size": 48}, "kv_group_size must be one of"),
+        ],
+    )
+    def test_openai_rejects_invalid_quantization(
+        self, client, generator, params, message
+    ):
+        response = post_chat_completion(client, **params)
+        assert response.status_code == 400
+        error = response.json()["error"]
+        assert error["type"] == "invalid_request_error"
+        assert message in error["message"]
+
+        stats = generator.admission.get_stats()
+        assert stats["reserved_requests"] == 0
+        assert stats["inflight_sequences"] == 0
+
+    def test_anthropic_rejects_invalid_quantization(self, client, generator):
+        response = post_message(client, kv_bits=7)
+        assert response.status_code == 400
+        error = response.json()["error"]
+        assert error["type"] == "invalid_request_error"
+        assert "kv_bits must be one of" in error["message"]
+        assert generator.admission.get_stats()["reserved_requests"] == 0
+
+    def test_unsupported_model_rejects_quantization(self, client, generator):
+        with patch.object(ChatGenerator, "supports_kv_quantization", False):
+            response = post_chat_completion(client, kv_bits=4)
+        assert response.status_code == 400
+        assert "cannot be quantized" in response.json()["error"]["message"]
+
+
+class TestKVWindowParams:
+    """Invalid rotating KV windows are a client error."""
+
+    @pytest.mark.parametrize(
+        "params, message",
+        [
+            ({"max_kv_size": 4, "kv_sink_tokens": 4}, "must be larger than"),
+            ({"max_kv_size": 64, "kv_sink_tokens": -1}, "must not be negative"),
+            ({"max_kv_size": "large"}, "max_kv_size must be an integer"),
+        ],
+    )
+    def test_openai_rejects_invalid_window(self, client, generator, params, message):
+        response = post_chat_completion(client, **params)
+        assert response.status_code == 400
+        error = response.json()["error"]
+        assert error["type"] == "invalid_request_error"
+        assert message in error["message"]
+        assert generator.admission.get_stats()["reserved_requests"] == 0
+
+    def test_anthropic_rejects_invalid_window(self, client, generator):
+        response = post_message(client, max_kv_size=4, kv_sink_tokens=4)
+        assert response.status_code == 400
+        error = response.json()["error"]
+        assert error["type"] == "invalid_request_error"
+        assert "must be larger than" in error["message"]
+        assert generator.admission.get_stats()["reserved_requests"] == 0
+
+    def test_unsupported_model_rejects_window(self, client, generator):
+        with patch.object(ChatGenerator, "supports_kv_window", False):
+            response = post_chat_completion(client, max_kv_size=64)
+        assert response.status_code == 400
+        assert "cannot be a rotating window" in response.json()["error"]["message"]
@@ -0,0 +1,135 @@
+"""Unit tests for ModelRegistry."""
+
+import pytest
+
+from mlx_omni_server.chat.mlx.model_registry import ModelProfile, ModelRegistry
+from mlx_omni_server.chat.mlx.preload import configured_preload_keys
+from mlx_omni_server.chat.mlx.wrapper_cache import WrapperCacheKey
+
+YAML_REGISTRY = """
+models:
+  qwen3-8b:
+    model: mlx-community/Qwen3-8B-4bit
+    draft_model: mlx-community/Qwen3-0.6B-4bit
+    aliases: [gpt-4o]
+    kv_bits: 8
+    num_draft_tokens: 4
+    pinned: true
+  gemma:
+    model: mlx-community/gemma-3-4b-it-4bit
+    max_kv_size: 2048
+    preload: true
+"""
+
+TOML_REGISTRY = """
+[models.qwen3-8b]
+model = "mlx-community/Qwen3-8B-4bit"
+adapter_path = "/adapters/support"
+aliases = ["support"]
+prompt_cache_slots = 8
+max_inflight_sequences = 4
+"""
+
+
+class TestModelRegistry:
+    """Test ModelRegistry functionality."""
+
+    def test_load_yaml(self, tmp_path):
+        """YAML entries give aliases and per-model defaults."""
+        path = tmp_path / "models.yaml"
+        path.write_text(YAML_REGISTRY)
+        registry = ModelRegistry.load(str(path))
+
+        assert [p.name for p in registry.profiles] == ["qwen3-8b", "gemma"]
+        profile = registry.profiles[0]
+        assert profile.kv_bits == 8
+        assert profile.num_draft_tokens == 4
+        assert profile.pinned and not profile.preload
+        assert profile.prompt_cache_slots is None
+
+    def test_load_toml(self, tmp_path):
+        """TOML tables are read like YAML mappings."""
+        path = tmp_path / "models.toml"
+        path.write_text(TOML_REGISTRY)
+        registry = ModelRegistry.load(str(path))
+
+        assert registry.resolve("support") == (
+            "mlx-community/Qwen3-8B-4bit",
+            "/adapters/support",
+            None,
+        )
+        assert registry.profiles[0].prompt_cache_slots == 8
+        assert registry.profiles[0].max_inflight_sequences == 4
+
+    def test_resolve(self, tmp_path):
+        """Aliases resolve to their model, request parameters take precedence."""
+        path = tmp_path / "models.yaml"
+        path.write_text(YAML_REGISTRY)
+        registry = ModelRegistry.load(str(path))
+
+        expected = (
+            "mlx-community/Qwen3-8B-4bit",
+            None,
+            "mlx-community/Qwen3-0.6B-4bit",
+        )
+        assert registry.resolve("qwen3-8b") == expected
+        assert registry.resolve("gpt-4o") == expected
+        assert registry.resolve("gpt-4o", draft_model="other") == (
+            "mlx-community/Qwen3-8B-4bit",
+            None,
+            "other",
+        )
+        # Model IDs pass through unchanged
+        assert registry.resolve("mlx-community/Qwen3-8B-4bit") == (
+            "mlx-community/Qwen3-8B-4bit",
+            None,
+            None,
+        )
+
+    def test_profile_for(self):
+        """The exact registration wins, otherwise the first one of the model."""
+        base = ModelProfile(name="base", model="m")
+        tuned = ModelProfile(name="tuned", model="m", adapter_path="/a")
+        registry = ModelRegistry([base, tuned])
+
+        assert registry.profile_for("m", "/a") is tuned
+        assert registry.profile_for("m") is base
+        assert registry.profile_for("m", None, "draft") is base
+        assert registry.profile_for("other") is None
+
+    def test_invalid_registry(self, tmp_path):
+        """Invalid files fail to load with the offending entry in the message."""
+        path = tmp_path / "models.yaml"
+        path.write_text("models:\n  broken:\n    model: m\n    kv_bit: 8\n")
+        with pytest.raises(ValueError, match="broken"):
+            ModelRegistry.load(str(path))
+
+        path.write_text("models:\n  a:\n    model: m\n    kv_bits: 7\n")
+        with pytest.raises(ValueError, match="kv_bits"):
+            ModelRegistry.load(str(path))
+
+        with pytest.raises(ValueError, match="Duplicate"):
+            ModelRegistry(
+                [
+                    ModelProfile(name="a", model="m"),
+                    ModelProfile(name="b", model="n", aliases=["a"]),
+                ]
+            )
+
+        with pytest.raises(ValueError, match=".toml"):
+            ModelRegistry.load(str(tmp_path / "models.json"))
+
+    def test_preload_keys(self, tmp_path, monkeypatch):
+        """Preload specs resolve aliases, registry entries can ask to be preloaded."""
+        path = tmp_path / "models.yaml"
+        path.write_text(YAML_REGISTRY)
+        registry = ModelRegistry.load(str(path))
+        monkeypatch.setenv("MLX_OMNI_PRELOAD", "gpt-4o;local-model,/adapter")
+
+        assert configured_preload_keys(registry) == [
+            WrapperCacheKey(
+                "mlx-community/Qwen3-8B-4bit", None, "mlx-community/Qwen3-0.6B-4bit"
+            ),
+            WrapperCacheKey("local-model", "/adapter", None),
+            WrapperCacheKey("mlx-community/gemma-3-4b-it-4bit", None, None),
+        ]
@@ -0,0 +1,597 @@
+"""Unit tests for the prompt cache pool, the radix prefix cache and the disk cache.
+
+These tests verify that requests continue the slot of their conversation, that
+other requests start from prefixes shared through the radix tree or persisted
+on disk, and that the least recently used slots, blocks and files are evicted.
+Rotating KV windows are trimmed only where the result matches a fresh prefill.
+A shared memory budget evicts the least valuable cached prefixes of all pools.
+Client sessions keep a dedicated slot until they expire.
+They use the tiny random Llama model of the shared test helpers.
+"""
+
+from array import array
+
+import mlx.core as mx
+from mlx_lm.models.cache import QuantizedKVCache, RotatingKVCache, make_prompt_cache
+
+from mlx_omni_server.chat.mlx.cache_budget import PromptCacheBudget, cache_nbytes
+from mlx_omni_server.chat.mlx.disk_cache import DiskPromptCache, disk_cache_namespace
+from mlx_omni_server.chat.mlx.prompt_cache import PromptCachePool, common_prefix_len
+from mlx_omni_server.chat.mlx.radix_cache import RadixPrefixCache
+from mlx_omni_server.chat.mlx.rotating_cache import make_window_cache, trim_window_cache
+from tests.chat.mlx.tiny_model import make_tiny_model
+
+
+class TestCommonPrefixLen:
+    """Test vectorized prefix matching."""
+
+    def test_matches_elementwise_comparison(self):
+        """Lists and token arrays give the length of the elementwise prefix."""
+        tokens = list(range(50000))
+        for mismatch in [0, 1, 16383, 16384, 16385, 49999]:
+            other = tokens.copy()
+            other[mismatch] = -1
+            assert common_prefix_len(tokens, other) == mismatch
+            assert common_prefix_len(array("i", tokens), other) == mismatch
+            assert common_prefix_len(array("i", tokens), array("i", other)) == mismatch
+
+        assert common_prefix_len(tokens, tokens[:20000]) == 20000
+        assert common_prefix_len(array("i", tokens), []) == 0
+        assert common_prefix_len([], array("i")) == 0
+
+
+class TestPromptCachePool:
+    """Test PromptCachePool functionality."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.model = make_tiny_model()
+
+    def _run(self, pool, prompt, session_id=None):
+        """Lease a slot, fill its KV cache with the remaining prompt, release it."""
+        lease = pool.acquire(self.model, prompt, session_id=session_id)
+        assert lease is not None
+        slot, remaining, cached_tokens = lease
+        self.model.model(mx.array(remaining)[None], cache=slot.cache)
+        mx.eval([c.state for c in slot.cache])
+        pool.release(slot)
+        assert slot.cache[0].offset == len(slot.tokens) == len(prompt)
+        return slot, cached_tokens
+
+    def test_alternating_conversations(self):
+        """Two conversations alternating on one model both keep their prefix."""
+        pool = PromptCachePool(num_slots=2, block_size=2)
+        first = [1, 2, 3, 4, 5, 6]
+        second = [1, 2, 3, 9, 9, 9]
+
+        slot_a, cached = self._run(pool, first)
+        assert cached == 0
+        slot_b, cached = self._run(pool, second)
+        assert cached == 2  # Shared block from the radix tree
+        assert slot_b is not slot_a
+        assert slot_a.tokens.tolist() == first
+
+        slot, cached = self._run(pool, first + [7, 8])
+        assert slot is slot_a and cached == len(first)
+        slot, cached = self._run(pool, second + [7, 8])
+        assert slot is slot_b and cached == len(second)
+
+        stats = pool.get_stats()
+        assert stats["used_slots"] == 2
+        assert stats["evictions"] == 0
+        assert stats["hits"] == 3
+        assert stats["hit_rate"] == 0.75
+        assert stats["cached_tokens"] == 2 + 6 + 6
+        assert stats["prefix_cache"]["hits"] == 1
+
+    def test_diverging_completion_trims_in_place(self):
+        """A follow-up turn diverging within generated tokens reuses the slot."""
+        pool = PromptCachePool(num_slots=2)
+        slot, _ = self._run(pool, [1, 2, 3, 4])
+        slot.extend_completion_cache([5, 6])  # Generated tokens
+        self.model.model(mx.array([[5, 6]]), cache=slot.cache)
+
+        same, cached = self._run(pool, [1, 2, 3, 4, 5, 9, 9])
+        assert same is slot and cached == 5
+        assert pool.get_stats()["used_slots"] == 1
+
+    def test_lru_eviction(self):
+        """The least recently used slot makes room for a new conversation."""
+        pool = PromptCachePool(num_slots=2)
+        slot_a, _ = self._run(pool, [1, 2, 3])
+        slot_b, _ = self._run(pool, [4, 5, 6])
+        self._run(pool, [1, 2, 3, 4])  # slot_a is now most recently used
+
+        slot_c, cached = self._run(pool, [7, 8, 9])
+        assert cached == 0
+        assert slot_c is slot_b
+        assert pool.get_stats()["evictions"] == 1
+        assert pool.get_stats()["cached_tokens_per_slot"] == [4, 3]
+
+    def test_all_slots_leased(self):
+        """Without a free slot the request runs uncached."""
+        pool = PromptCachePool(num_slots=1)
+        slot, _, _ = pool.acquire(self.model, [1, 2, 3])
+        assert pool.acquire(self.model, [1, 2, 3, 4]) is None
+        assert pool.get_stats()["uncached_requests"] == 1
+
+        pool.release(slot)
+        assert pool.acquire(self.model, [1, 2, 3, 4]) is not None
+
+    def test_session_keeps_its_slot(self):
+        """Other requests neither continue nor evict a live session's slot."""
+        pool = PromptCachePool(num_slots=2, prefix_cache_tokens=0)
+        session, _ = self._run(pool, [1, 2, 3, 4], session_id="a")
+
+        other, cached = self._run(pool, [1, 2, 3, 4, 5])
+        assert other is not session and cached == 0
+        evicting, _ = self._run(pool, [6, 7, 8])
+        assert evicting is other
+        assert session.tokens.tolist() == [1, 2, 3, 4]
+
+        # The session's edited transcript is trimmed where it diverges
+        slot, cached = self._run(pool, [1, 2, 9, 9], session_id="a")
+        assert slot is session and cached == 2
+
+        stats = pool.get_stats()
+        assert stats["sessions"] == 1
+        assert stats["session_requests"] == 2
+        assert stats["session_hits"] == 1
+
+    def test_session_slot_expires(self):
+        """An expired session's slot is shared again, else sessions go by LRU."""
+        pool = PromptCachePool(num_slots=2, prefix_cache_tokens=0, session_ttl=10)
+        slot_a, _ = self._run(pool, [1, 2, 3], session_id="a")
+        slot_b, _ = self._run(pool, [4, 5, 6], session_id="b")
+
+        # Both sessions are live, the least recently used one is evicted
+        slot, cached = self._run(pool, [7, 8, 9], session_id="c")
+        assert slot is slot_a and cached == 0
+        assert slot.session_id == "c"
+
+        slot_b.last_used -= 20
+        assert pool.get_stats()["sessions"] == 1
+        slot, cached = self._run(pool, [4, 5, 6, 7])
+        assert slot is slot_b and cached == 3
+        assert slot.session_id is None
+
+    def test_pinned_prefix_survives_eviction(self):
+        """Pinned blocks stay in the tree until unpinned."""
+        pool = PromptCachePool(num_slots=1, prefix_cache_tokens=4, block_size=2)
+        system = [1, 2, 3, 4]
+        self._run(pool, system + [5])
+        pinned = pool.pin(system)
+        assert pinned.pinned_tokens == 4
+        assert pool.pin(system).id == pinned.id
+
+        # Another conversation does not push the pinned blocks out
+        self._run(pool, [7, 8, 9, 10, 11])
+        _, cached = self._run(pool, system + [6])
+        assert cached == 4
+        assert [p.id for p in pool.list_pins()] == [pinned.id]
+
+        assert pool.unpin(pinned.id)
+        assert not pool.unpin(pinned.id)
+        self._run(pool, [7, 8, 9, 10, 11])
+        assert pool.prefix_cache.match(system) == []
+
+    def test_pinned_prefix_expires(self):
+        """A pin with a time to live is extended when pinned again, then dropped."""
+        pool = PromptCachePool(num_slots=1, prefix_cache_tokens=4, block_size=2)
+        system = [1, 2, 3, 4]
+        self._run(pool, system + [5])
+        pinned = pool.pin(system, ttl=10)
+        expires_at = pinned.expires_at
+        assert pool.pin(system, ttl=20).expires_at > expires_at
+
+        # Still pinned after another conversation filled the tree
+        self._run(pool, [7, 8, 9, 10, 11])
+        assert pool.get_stats()["pinned_tokens"] == 4
+
+        pinned.expires_at -= 30
+        assert pool.list_pins() == []
+        self._run(pool, [7, 8, 9, 10, 11])
+        assert pool.prefix_cache.match(system) == []
+
+    def test_retained_prefix_evicted_last(self):
+        """Retained blocks outlast other blocks but give way to the budget."""
+        budget = PromptCacheBudget()
+        pool = PromptCachePool(
+            num_slots=1, prefix_cache_tokens=4, block_size=2, budget=budget
+        )
+        system = [1, 2, 3, 4]
+        self._run(pool, system + [5])
+        assert pool.retain(system, ttl=60) == 4
+
+        # Another conversation pushes out its own blocks instead
+        self._run(pool, [7, 8, 9, 10, 11])
+        _, cached = self._run(pool, system + [6])
+        assert cached == 4
+        assert pool.get_stats()["pinned_tokens"] == 0
+
+        # Unlike pinned blocks, they are evicted when memory runs short
+        budget.max_bytes = 1
+        budget.enforce()
+        assert pool.prefix_cache.match(system) == []
+
+    def test_quantized_slot_needs_matching_request(self):
+        """Only requests with the same quantization continue a quantized slot."""
+        self.model = make_tiny_model(hidden_size=128)
+        pool = PromptCachePool(num_slots=2, prefix_cache_tokens=0)
+        slot, _ = self._run(pool, [1, 2, 3, 4])
+        for i, layer_cache in enumerate(slot.cache):
+            slot.cache[i] = layer_cache.to_quantized(group_size=32, bits=4)
+
+        other, _, cached = pool.acquire(self.model, [1, 2, 3, 4, 5])
+        assert other is not slot and cached == 0
+        pool.release(other)
+
+        same, _, cached = pool.acquire(self.model, [1, 2, 3, 4, 6], (4, 32))
+        assert same is slot and cached == 4
+        assert isinstance(same.cache[0], QuantizedKVCache)
+
+    def test_window_slot_reused_after_rotation(self):
+        """A window slot is trimmed where a follow-up turn diverges."""
+        pool = PromptCachePool(num_slots=2, block_size=2)
+        window = (16, 4)
+        prompt = list(range(1, 31))
+        slot, remaining, _ = pool.acquire(self.model, prompt, window=window)
+        self.model.model(mx.array(remaining)[None], cache=slot.cache)
+        pool.release(slot)
+        assert isinstance(slot.cache[0], RotatingKVCache)
+        assert pool.prefix_cache.get_stats()["blocks"] == 0  # Not shared
+
+        other, _, cached = pool.acquire(self.model, prompt + [9])
+        assert other is not slot and cached == 0  # Unbounded request
+        pool.release(other)
+
+        same, remaining, cached = pool.acquire(
+            self.model, prompt[:-3] + [9, 9], window=window
+        )
+        assert same is slot and cached == 27 and remaining == [9, 9]
+        assert slot.cache[0].offset == 27
+        pool.release(same)
+
+    def test_window_checkpoint_after_decoding(self):
+        """A decoded window resumes from its prefilled checkpoint."""
+        pool = PromptCachePool(num_slots=1)
+        prompt = list(range(1, 31))
+        slot, remaining, _ = pool.acquire(self.model, prompt, window=(16, 4))
+        self.model.model(mx.array(remaining[:-1])[None], cache=slot.cache)
+        slot.checkpoint_window(slot.cache)
+        for token in [remaining[-1], 40, 41, 42]:  # Decoding rotates the window
+            self.model.model(mx.array([[token]]), cache=slot.cache)
+        slot.extend_completion_cache([40, 41, 42])
+        pool.release(slot)
+
+        same, remaining, cached = pool.acquire(
+            self.model, prompt + [50, 51], window=(16, 4)
+        )
+        assert same is slot and cached == 29 and remaining == [30, 50, 51]
+        assert slot.cache[0].offset == 29 and slot.checkpoint == []
+        pool.release(same)
+
+    def test_window_seeded_from_radix_tree(self):
+        """A window request starts from a shared prefix fitting into its window."""
+        pool = PromptCachePool(num_slots=2, block_size=2)
+        system = list(range(1, 9))
+        self._run(pool, system + [9])
+
+        slot, remaining, cached = pool.acquire(
+            self.model, system + [10, 11], window=(16, 4)
+        )
+        assert cached == 8 and remaining == [10, 11]
+        assert isinstance(slot.cache[0], RotatingKVCache)
+        pool.release(slot)
+
+        long_system = list(range(1, 41))
+        self._run(pool, long_system + [9])
+        slot, _, cached = pool.acquire(self.model, long_system + [10], window=(16, 4))
+        assert cached == 14  # Blocks fitting into the window
+        pool.release(slot)
+
+
+class TestWindowCache:
+    """Test trimming of rotating KV windows."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.model = make_tiny_model().model
+        self.tokens = mx.array(list(range(1, 41)))[None]
+
+    def _logits(self, cache, tokens):
+        return self.model(tokens, cache=cache)[:, -1, :]
+
+    def test_trimmed_window_matches_fresh_prefill(self):
+        """Trimming a rotated window equals prefilling the shorter sequence."""
+        trimmed = make_window_cache(self.model, (16, 4))
+        self.model(self.tokens[:, :30], cache=trimmed)
+        assert not trimmed[0].is_trimmable()
+        assert trim_window_cache(trimmed, 3)
+        assert trimmed[0].offset == 27
+
+        fresh = make_window_cache(self.model, (16, 4))
+        self.model(self.tokens[:, :27], cache=fresh)
+        next_tokens = self.tokens[:, 30:33]
+        assert mx.allclose(
+            self._logits(trimmed, next_tokens), self._logits(fresh, next_tokens)
+        )
+
+    def test_decoded_window_trim_limit(self):
+        """A window filled token by token keeps only what the next step needs."""
+
+        def decode(num_tokens):
+            cache = make_window_cache(self.model, (16, 4))
+            self.model(self.tokens[:, :10], cache=cache)
+            for i in range(10, num_tokens):
+                self.model(self.tokens[:, i : i + 1], cache=cache)
+            return cache
+
+        cache = decode(24)
+        assert not trim_window_cache(cache, 2)  # Would lose attended tokens
+        assert cache[0].offset == 24
+        assert trim_window_cache(cache, 1)
+
+        next_tokens = self.tokens[:, 30:33]
+        assert mx.allclose(
+            self._logits(cache, next_tokens), self._logits(decode(23), next_tokens)
+        )
+
+
+class TestPromptCacheBudget:
+    """Test byte accounting and the memory budget of prompt caches."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.model = make_tiny_model()
+
+    def _run(self, pool, prompt):
+        slot, remaining, _ = pool.acquire(self.model, prompt)
+        self.model.model(mx.array(remaining)[None], cache=slot.cache)
+        pool.release(slot)
+        return slot
+
+    def test_bytes_accounted(self):
+        """Slots and radix tree blocks report the bytes they hold."""
+        budget = PromptCacheBudget()
+        pool = PromptCachePool(prefix_cache_tokens=4, block_size=2, budget=budget)
+        slot = self._run(pool, [1, 2, 3, 4, 5, 6, 7])
+
+        stats = pool.get_stats()
+        assert stats["bytes_per_slot"] == [cache_nbytes(slot.cache)] == [slot.nbytes]
+        block_bytes = stats["prefix_cache"]["bytes"] // 2
+        assert block_bytes > 0 and stats["prefix_cache"]["blocks"] == 2
+        assert stats["bytes"] == pool.nbytes == budget.used_bytes
+        assert budget.enforce() == 0  # Unlimited
+
+        self._run(pool, [9, 9, 9, 9, 9])  # Tree evicts down to its token budget
+        assert pool.get_stats()["prefix_cache"]["bytes"] == 2 * block_bytes
+
+        pool.close()
+        assert budget.get_stats()["models"] == 0
+
+    def test_evicts_least_valuable_across_pools(self):
+        """Short and long unused prefixes are evicted first, leased ones never."""
+        budget = PromptCacheBudget()
+        long_pool = PromptCachePool(prefix_cache_tokens=0, budget=budget)
+        short_pool = PromptCachePool(prefix_cache_tokens=0, budget=budget)
+        long_slot = self._run(long_pool, list(range(1, 41)))
+        short_slot = self._run(short_pool, [1, 2, 3, 4])
+
+        budget.max_bytes = budget.used_bytes - 1
+        assert budget.enforce() == short_slot.nbytes
+        assert short_pool.get_stats()["used_slots"] == 0
+        assert long_pool.get_stats()["used_slots"] == 1
+
+        # An hour old prefix is worth less than a recent short one
+        budget.max_bytes = 0
+        short_slot = self._run(short_pool, [1, 2, 3, 4])
+        long_slot.last_used -= 3600
+        budget.max_bytes = budget.used_bytes - 1
+        budget.enforce()
+        assert long_pool.get_stats()["used_slots"] == 0
+        assert short_pool.get_stats()["used_slots"] == 1
+
+        leased, _, _ = short_pool.acquire(self.model, [1, 2, 3, 4, 5])
+        budget.max_bytes = 1
+        assert budget.enforce() == 0
+        assert budget.get_stats()["evictions"] == 2
+        short_pool.release(leased)  # Enforces the budget
+        assert short_pool.get_stats()["used_slots"] == 0
+
+
+class TestRadixPrefixCache:
+    """Test RadixPrefixCache functionality."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.model = make_tiny_model().model
+
+    def _prefill(self, tokens):
+        cache = make_prompt_cache(self.model)
+        logits = self.model(mx.array(tokens)[None], cache=cache)
+        mx.eval(logits)
+        return cache, logits
+
+    def test_assembled_cache_matches_prefill(self):
+        """A cache assembled from blocks continues like the original prefill."""
+        prefix_cache = RadixPrefixCache(max_tokens=64, block_size=4)
+        tokens = [3, 7, 11, 5, 9, 2, 8, 6, 4, 1]
+        cache, _ = self._prefill(tokens)
+        assert prefix_cache.insert(tokens, cache) == 2  # Partial block skipped
+
+        prompt = tokens[:8] + [12, 13]
+        path = prefix_cache.match(prompt)
+        assert len(path) == 2
+        assembled = prefix_cache.make_cache(path)
+        logits = self.model(mx.array([prompt[8:]]), cache=assembled)
+
+        _, expected = self._prefill(prompt)
+        assert mx.allclose(logits[:, -1], expected[:, -1], atol=1e-4)
+        prefix_cache.release(path)
+
+    def test_quantized_blocks(self):
+        """Quantized caches are stored as quantized blocks of their own."""
+        self.model = make_tiny_model(hidden_size=128).model
+        prefix_cache = RadixPrefixCache(max_tokens=64, block_size=4)
+        tokens = [3, 7, 11, 5, 9, 2, 8, 6]
+        cache, _ = self._prefill(tokens)
+        quantized = [c.to_quantized(group_size=32, bits=8) for c in cache]
+        assert prefix_cache.insert(tokens, quantized) == 2
+
+        assert prefix_cache.match(tokens) == []  # Full precision requests
+        path = prefix_cache.match(tokens, (8, 32))
+        assert len(path) == 2
+        assembled = prefix_cache.make_cache(path)
+        assert isinstance(assembled[0], QuantizedKVCache)
+        assert assembled[0].offset == 8
+
+        logits = self.model(mx.array([[12, 13]]), cache=assembled)
+        expected = self.model(mx.array([[12, 13]]), cache=quantized)
+        assert mx.allclose(logits, expected, atol=1e-4)
+        prefix_cache.release(path)
+
+        # Quantized requests also reuse full precision blocks
+        prefix_cache.insert(
+            tokens + [1, 2, 3, 4], self._prefill(tokens + [1, 2, 3, 4])[0]
+        )
+        path = prefix_cache.match(tokens + [1, 2, 3, 4], (8, 32))
+        assert len(path) == 3 and path[0].kv_format is None
+        prefix_cache.release(path)
+
+    def test_shared_prefix_stored_once(self):
+        """Sequences sharing blocks only add their own blocks."""
+        prefix_cache = RadixPrefixCache(max_tokens=64, block_size=2)
+        first = [1, 2, 3, 4, 5, 6]
+        second = [1, 2, 3, 4, 7, 8]
+        prefix_cache.insert(first, self._prefill(first)[0])
+        assert prefix_cache.insert(second, self._prefill(second)[0]) == 1
+        assert prefix_cache.get_stats()["blocks"] == 4
+
+    def test_lru_leaf_eviction_skips_referenced(self):
+        """Unreferenced leaves are evicted least recently used first."""
+        prefix_cache = RadixPrefixCache(max_tokens=6, block_size=2)
+        first = [1, 2, 3, 4]
+        second = [5, 6]
+        prefix_cache.insert(first, self._prefill(first)[0])
+        prefix_cache.insert(second, self._prefill(second)[0])
+        path = prefix_cache.match(first)  # Referenced and most recently used
+
+        third = [7, 8]
+        prefix_cache.insert(third, self._prefill(third)[0])
+        assert prefix_cache.match(second) == []
+        assert prefix_cache.get_stats()["evicted_blocks"] == 1
+
+        # Referenced blocks stay although older than the evicted leaf
+        prefix_cache.insert([9, 10], self._prefill([9, 10])[0])
+        prefix_cache.release(path)
+        assert prefix_cache.match(third) == []
+        assert len(prefix_cache.match(first)) == 2
+
+
+class TestDiskPromptCache:
+    """Test DiskPromptCache functionality."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.model = make_tiny_model()
+
+    def _prefill(self, tokens):
+        cache = make_prompt_cache(self.model.model)
+        mx.eval(self.model.model(mx.array(tokens)[None], cache=cache))
+        return cache
+
+    def test_restart_restores_prefix(self, tmp_path):
+        """A pool closed before a restart is restored from disk."""
+        disk_cache = DiskPromptCache(str(tmp_path), block_size=4, min_tokens=8)
+        pool = PromptCachePool(
+            num_slots=1, prefix_cache_tokens=0, disk_cache=disk_cache
+        )
+        tokens = [3, 7, 11, 5, 9, 2, 8, 6, 4, 1]
+        slot, _, _ = pool.acquire(self.model, tokens)
+        self.model.model(mx.array(tokens)[None], cache=slot.cache)
+        pool.release(slot)
+        pool.close()
+        disk_cache.flush()
+
+        # A new process indexes the files left behind
+        disk_cache = DiskPromptCache(str(tmp_path), block_size=4, min_tokens=8)
+        pool = PromptCachePool(
+            num_slots=1, prefix_cache_tokens=0, disk_cache=disk_cache
+        )
+        prompt = tokens[:8] + [12, 13]
+        slot, remaining, cached_tokens = pool.acquire(self.model, prompt)
+        assert cached_tokens == 8 and remaining == [12, 13]
+        logits = self.model.model(mx.array([remaining]), cache=slot.cache)
+
+        expected = self.model.model(
+            mx.array(prompt)[None], cache=make_prompt_cache(self.model.model)
+        )
+        assert mx.allclose(logits[:, -1], expected[:, -1], atol=1e-4)
+        assert pool.get_stats()["disk_cache"]["hits"] == 1
+
+    def test_evicted_slot_is_persisted(self, tmp_path):
+        """Slots evicted for a new conversation are written to disk."""
+        disk_cache = DiskPromptCache(str(tmp_path), block_size=4, min_tokens=8)
+        pool = PromptCachePool(
+            num_slots=1, prefix_cache_tokens=0, disk_cache=disk_cache
+        )
+        first = list(range(1, 11))
+        slot, _, _ = pool.acquire(self.model, first)
+        self.model.model(mx.array(first)[None], cache=slot.cache)
+        pool.release(slot)
+
+        pool.release(pool.acquire(self.model, [20, 21, 22])[0])
+        disk_cache.flush()
+        assert disk_cache.get_stats()["saves"] == 1
+        assert disk_cache.match(disk_cache_namespace(self.model), first)[1] == 8
+
+    def test_quantized_cache_restored_for_quantized_requests(self, tmp_path):
+        """Quantized caches are persisted quantized, apart from full precision."""
+        self.model = make_tiny_model(hidden_size=128)
+        disk_cache = DiskPromptCache(str(tmp_path), block_size=4, min_tokens=8)
+        pool = PromptCachePool(
+            num_slots=1, prefix_cache_tokens=0, disk_cache=disk_cache
+        )
+        tokens = list(range(1, 11))
+        slot, _, _ = pool.acquire(self.model, tokens, (8, 32))
+        slot.cache = [
+            c.to_quantized(group_size=32, bits=8) for c in self._prefill(tokens)
+        ]
+        pool.release(slot)
+        pool.close()
+        disk_cache.flush()
+
+        pool = PromptCachePool(
+            num_slots=2, prefix_cache_tokens=0, disk_cache=disk_cache
+        )
+        _, _, cached_tokens = pool.acquire(self.model, tokens)
+        assert cached_tokens == 0
+        slot, _, cached_tokens = pool.acquire(self.model, tokens, (8, 32))
+        assert cached_tokens == 8
+        assert isinstance(slot.cache[0], QuantizedKVCache)
+
+    def test_longer_sequence_replaces_prefix_file(self, tmp_path):
+        """A file holding a prefix of a newly persisted sequence is deleted."""
+        disk_cache = DiskPromptCache(str(tmp_path), block_size=4, min_tokens=4)
+        tokens = list(range(1, 13))
+        disk_cache.save("model", tokens[:8], self._prefill(tokens[:8]))
+        disk_cache.save("model", tokens, self._prefill(tokens))
+        disk_cache.flush()
+
+        stats = disk_cache.get_stats()
+        assert stats["saves"] == 2 and stats["files"] == 1
+        assert len(list(tmp_path.rglob("*.safetensors"))) == 1
+
+    def test_size_budget(self, tmp_path):
+        """Least recently used files are deleted beyond the size budget."""
+        disk_cache = DiskPromptCache(str(tmp_path), block_size=4, min_tokens=4)
+        disk_cache.save("model", [1, 2, 3, 4], self._prefill([1, 2, 3, 4]))
+        disk_cache.flush()
+        disk_cache.max_bytes = disk_cache.get_stats()["bytes"] * 3 // 2
+
+        disk_cache.save("model", [5, 6, 7, 8], self._prefill([5, 6, 7, 8]))
+        disk_cache.flush()
+        assert disk_cache.match("model", [1, 2, 3, 4]) is None
+        assert disk_cache.match("model", [5, 6, 7, 8]) is not None
+        assert disk_cache.get_stats()["evictions"] == 1
@@ -0,0 +1,134 @@
+"""Unit tests for prompt lookup decoding.
+
+These tests verify n-gram draft lookup, that drafted generation produces the same
+tokens as plain generation, and that the scheduler reports draft statistics.
+They use the tiny random Llama model of the shared test helpers.
+"""
+
+import mlx.core as mx
+from mlx_lm.generate import generate_step
+from mlx_lm.models.cache import make_prompt_cache
+
+from mlx_omni_server.chat.mlx.prompt_lookup import (
+    NgramIndex,
+    prompt_lookup_generate_step,
+)
+from mlx_omni_server.chat.mlx.scheduler import GenerationScheduler
+from mlx_omni_server.chat.mlx.speculative import DraftStats
+from tests.chat.mlx.tiny_model import make_tiny_model
+
+
+def repeat_cycle(tokens, logits):
+    """Logits processor forcing the cycle 1, 2, 3, 4, 5, 1, ..."""
+    forced = tokens[-1].item() % 5 + 1
+    logits[:, forced] = 1e9
+    return logits
+
+
+class TestNgramIndex:
+    """Test NgramIndex draft lookup."""
+
+    def test_draft_follows_latest_occurrence(self):
+        """The longest trailing n-gram is looked up at its latest occurrence."""
+        index = NgramIndex([1, 2, 3, 4, 9, 2, 3, 5, 7, 2, 3])
+        assert index.draft(2) == [5, 7]
+
+        index.append(4)
+        assert index.draft(3) == [9, 2, 3]
+
+    def test_draft_continues_period(self):
+        """A match running into the end of the history repeats its period."""
+        index = NgramIndex([5, 1, 2, 1, 2])
+        assert index.draft(5) == [1, 2, 1, 2, 1]
+
+    def test_no_match(self):
+        """Without an earlier occurrence nothing is proposed."""
+        index = NgramIndex([1, 2, 3, 4])
+        assert index.draft(5) == []
+        assert index.draft(0) == []
+
+
+class TestPromptLookupGenerateStep:
+    """Test prompt_lookup_generate_step."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.model = make_tiny_model()
+
+    def test_matches_plain_generation(self):
+        """Drafted greedy decoding yields the same tokens as generate_step."""
+        prompt = mx.array([3, 7, 11, 3, 7, 11, 3, 7, 11, 3, 7])
+        expected = [
+            token for token, _ in generate_step(prompt, self.model.model, max_tokens=24)
+        ]
+
+        cache = make_prompt_cache(self.model.model)
+        tokens = [
+            token
+            for token, _, _ in prompt_lookup_generate_step(
+                prompt, self.model.model, max_tokens=24, prompt_cache=cache
+            )
+        ]
+
+        assert tokens == expected
+        # Rejected draft tokens are trimmed, the last token is not yet fed
+        assert cache[0].offset == prompt.size + len(tokens) - 1
+
+    def test_accepts_copied_spans(self):
+        """Continuations found in the prompt are accepted as draft tokens."""
+        prompt = mx.array([1, 2, 3, 4, 5, 1, 2])
+        expected = [
+            token
+            for token, _ in generate_step(
+                prompt,
+                self.model.model,
+                max_tokens=20,
+                logits_processors=[repeat_cycle],
+            )
+        ]
+
+        stats = DraftStats()
+        results = [
+            (token, from_draft)
+            for token, _, from_draft in prompt_lookup_generate_step(
+                prompt,
+                self.model.model,
+                num_draft_tokens=4,
+                max_tokens=20,
+                logits_processors=[repeat_cycle],
+                draft_stats=stats,
+            )
+        ]
+
+        assert [token for token, _ in results] == expected
+        assert stats.accepted == sum(from_draft for _, from_draft in results)
+        assert stats.accepted == stats.proposed > 10
+
+
+class TestSchedulerPromptLookup:
+    """Test prompt lookup decoding through the scheduler."""
+
+    def test_draft_statistics(self):
+        """Sequences report proposed and accepted draft tokens."""
+        model = make_tiny_model()
+        scheduler = GenerationScheduler(model)
+        try:
+            handle = scheduler.submit(
+                [1, 2, 3, 4, 5, 1, 2],
+                max_tokens=20,
+                logits_processors=[repeat_cycle],
+                prompt_lookup_num_tokens=4,
+            )
+            responses = list(handle)
+
+            assert [r.token for r in responses[:5]] == [3, 4, 5, 1, 2]
+            final = responses[-1]
+            assert final.finish_reason == "length"
+            assert final.accepted_draft_tokens == sum(r.from_draft for r in responses)
+            assert final.accepted_draft_tokens > 10
+
+            stats = scheduler.get_stats()
+            assert stats["accepted_draft_tokens"] == final.accepted_draft_tokens
+            assert stats["draft_acceptance_rate"] == 1.0
+        finally:
+            scheduler.shutdown()
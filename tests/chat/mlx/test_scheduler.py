@@ -0,0 +1,271 @@
+"""Unit tests for GenerationScheduler.
+
+These tests run a tiny randomly initialized Llama model, so they need no model
+downloads. They verify that batched decoding produces the same tokens as
+decoding each sequence on its own, and that finish reasons, KV cache write-back
+and cancellation work.
+"""
+
+import threading
+
+import mlx.core as mx
+import mlx.nn as nn
+from mlx_lm.generate import generate_step
+from mlx_lm.models.cache import QuantizedKVCache, make_prompt_cache
+
+from mlx_omni_server.chat.mlx.scheduler import GenerationScheduler
+from tests.chat.mlx.tiny_model import EOS_TOKEN, make_tiny_model, never_eos
+
+
+class CountingModel(nn.Module):
+    """Model wrapper that records the shape of every forward pass."""
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.inner = model
+        self.calls = []
+
+    @property
+    def layers(self):
+        return self.inner.layers
+
+    def __call__(self, inputs, cache=None):
+        self.calls.append(inputs.shape)
+        return self.inner(inputs, cache=cache)
+
+
+class TestGenerationScheduler:
+    """Test GenerationScheduler functionality."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.model = make_tiny_model()
+        self.scheduler = GenerationScheduler(self.model, max_batch_size=4)
+
+    def teardown_method(self):
+        """Stop the scheduler thread."""
+        self.scheduler.shutdown()
+
+    def test_batched_matches_individual_decoding(self):
+        """Concurrent sequences decode to the same tokens as sequential runs."""
+        prompts = [[i + 1] * (3 * i + 2) for i in range(6)]
+        max_tokens = 12
+
+        expected = []
+        for prompt in prompts:
+            tokens = []
+            for token, _ in generate_step(
+                mx.array(prompt),
+                self.model.model,
+                max_tokens=max_tokens,
+                logits_processors=[never_eos],
+            ):
+                tokens.append(token)
+            expected.append(tokens)
+
+        handles = [
+            self.scheduler.submit(
+                prompt, max_tokens=max_tokens, logits_processors=[never_eos]
+            )
+            for prompt in prompts
+        ]
+        results = [[response.token for response in handle] for handle in handles]
+
+        assert results == expected
+
+    def test_finish_reasons_and_cache_write_back(self):
+        """EOS finishes with "stop", the token limit with "length"."""
+
+        def eos_after_three(tokens, logits):
+            # The history holds the prompt's last token plus fed tokens
+            if tokens.size >= 4:
+                logits[:, EOS_TOKEN] = 1e9
+            else:
+                logits[:, EOS_TOKEN] = -1e9
+            return logits
+
+        prompt = [5, 6, 7, 8]
+        prompt_cache = make_prompt_cache(self.model.model)
+        stop_handle = self.scheduler.submit(
+            prompt,
+            prompt_cache=prompt_cache,
+            max_tokens=50,
+            logits_processors=[eos_after_three],
+        )
+        length_handle = self.scheduler.submit(
+            prompt, max_tokens=5, logits_processors=[never_eos]
+        )
+
+        stop_responses = list(stop_handle)
+        length_responses = list(length_handle)
+
+        assert [r.finish_reason for r in stop_responses[:-1]] == [None] * 3
+        assert stop_responses[-1].finish_reason == "stop"
+        assert stop_responses[-1].token == EOS_TOKEN
+        assert len(length_responses) == 5
+        assert length_responses[-1].finish_reason == "length"
+
+        # The caller's cache holds the prompt and every fed token, not the EOS
+        assert stop_handle.cache_length == len(prompt) + 3
+        assert prompt_cache[0].offset == len(prompt) + 3
+
+    def test_cancel_stops_generation(self):
+        """A cancelled sequence finishes early without blocking the others."""
+        long_handle = self.scheduler.submit(
+            [1, 2, 3], max_tokens=10_000, logits_processors=[never_eos]
+        )
+        short_handle = self.scheduler.submit(
+            [4, 5, 6], max_tokens=8, logits_processors=[never_eos]
+        )
+
+        received = threading.Event()
+
+        def consume():
+            for i, response in enumerate(long_handle):
+                if i == 2:
+                    long_handle.cancel()
+                    received.set()
+            consume.last = response
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+
+        assert len(list(short_handle)) == 8
+        consumer.join(timeout=10.0)
+        assert received.is_set()
+        assert consume.last.finish_reason == "cancelled"
+        assert consume.last.generation_tokens < 10_000
+        assert self.scheduler.num_active == 0
+
+        stats = self.scheduler.get_stats()
+        assert stats["completed_sequences"] == 2
+        assert stats["aborted_sequences"] == 1
+        assert stats["aborted_tokens_saved"] == (
+            10_000 - consume.last.generation_tokens
+        )
+
+    def test_stop_is_not_an_abort(self):
+        """A sequence ended by its consumer, e.g. on a stop sequence, is no abort."""
+        handle = self.scheduler.submit(
+            [1, 2, 3], max_tokens=10_000, logits_processors=[never_eos]
+        )
+        for i, response in enumerate(handle):
+            if i == 2:
+                handle.cancel(reason="stop")
+                # A later cancellation keeps the first reason
+                handle.cancel()
+
+        assert response.finish_reason == "stop"
+        assert response.generation_tokens < 10_000
+        stats = self.scheduler.get_stats()
+        assert stats["completed_sequences"] == 1
+        assert stats["aborted_sequences"] == 0
+        assert stats["aborted_tokens_saved"] == 0
+
+    def test_drain_shutdown_finishes_sequences(self):
+        """A draining shutdown lets unfinished sequences finish."""
+        handles = [
+            self.scheduler.submit(
+                [i + 1, i + 2], max_tokens=6, logits_processors=[never_eos]
+            )
+            for i in range(3)
+        ]
+        self.scheduler.shutdown(drain=True)
+
+        for handle in handles:
+            responses = list(handle)
+            assert len(responses) == 6
+            assert responses[-1].finish_reason == "length"
+        self.scheduler._thread.join(timeout=5.0)
+        assert not self.scheduler._thread.is_alive()
+
+    def test_parallel_sequences_share_prefill(self):
+        """n continuations prefill the prompt once and decode as one batch."""
+        counting_model = CountingModel(self.model.model)
+        self.model.model = counting_model
+        prompt = list(range(1, 11))
+
+        handles = self.scheduler.submit_parallel(
+            prompt,
+            n=3,
+            max_tokens=6,
+            logits_processors=[[never_eos] for _ in range(3)],
+        )
+        results = [[response.token for response in handle] for handle in handles]
+
+        expected = [
+            token
+            for token, _ in generate_step(
+                mx.array(prompt),
+                counting_model.inner,
+                max_tokens=6,
+                logits_processors=[never_eos],
+            )
+        ]
+        assert results == [expected] * 3
+
+        # One prefill pass, one pass for the last prompt token, then batched decode
+        prompt_tokens_fed = sum(shape[1] for shape in counting_model.calls)
+        assert prompt_tokens_fed == len(prompt) + 5
+        assert counting_model.calls[2:] == [(3, 1)] * 5
+
+    def test_kv_bits_quantize_cache_during_prefill(self):
+        """A request with kv_bits leaves a quantized KV cache behind."""
+        model = make_tiny_model(hidden_size=128)
+        scheduler = GenerationScheduler(model, max_batch_size=4)
+        prompt_cache = make_prompt_cache(model.model)
+        try:
+            handle = scheduler.submit(
+                list(range(1, 41)),
+                prompt_cache=prompt_cache,
+                max_tokens=4,
+                logits_processors=[never_eos],
+                kv_bits=8,
+                kv_group_size=32,
+                quantized_kv_start=16,
+            )
+            assert len(list(handle)) == 4
+        finally:
+            scheduler.shutdown()
+
+        assert all(isinstance(c, QuantizedKVCache) for c in prompt_cache)
+        assert prompt_cache[0].bits == 8 and prompt_cache[0].group_size == 32
+        # generate_step feeds the last sampled token too
+        assert handle.cache_length == prompt_cache[0].offset == 40 + 4
+
+    def test_long_prompt_prefill_is_chunked_between_decode_steps(self):
+        """A long prompt is prefilled in chunks while another sequence decodes."""
+        counting_model = CountingModel(self.model.model)
+        self.model.model = counting_model
+        self.scheduler.prefill_chunk_size = 16
+
+        running = self.scheduler.submit(
+            [1, 2, 3], max_tokens=40, logits_processors=[never_eos]
+        )
+        first = next(iter(running))
+        long_prompt = [(i % 100) + 1 for i in range(100)]
+        long_handle = self.scheduler.submit(
+            long_prompt, max_tokens=4, logits_processors=[never_eos]
+        )
+
+        long_responses = list(long_handle)
+        running_tokens = [first.token] + [r.token for r in running]
+
+        # No forward pass processes more than one chunk of the long prompt
+        assert max(shape[1] for shape in counting_model.calls) <= 16
+        chunks = long_responses[-1].prefill_chunks
+        assert sum(chunk.tokens for chunk in chunks) == len(long_prompt) - 1
+        assert all(chunk.tokens <= 16 and chunk.seconds > 0 for chunk in chunks)
+
+        # Chunking changes neither sequence's tokens
+        expected = [
+            token
+            for token, _ in generate_step(
+                mx.array(long_prompt),
+                counting_model.inner,
+                max_tokens=4,
+                logits_processors=[never_eos],
+            )
+        ]
+        assert [r.token for r in long_responses] == expected
+        assert len(running_tokens) == 40
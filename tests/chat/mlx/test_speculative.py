@@ -0,0 +1,166 @@
+"""Unit tests for adaptive speculative decoding.
+
+These tests verify that the draft length follows the acceptance rate, that
+speculation switches off when drafts are not accepted, and that draft model
+decoding produces the same tokens as plain decoding. They use the tiny random
+Llama model of the shared test helpers.
+"""
+
+import mlx.core as mx
+from mlx_lm.generate import generate_step
+from mlx_lm.models import llama
+from mlx_lm.models.cache import make_prompt_cache
+
+from mlx_omni_server.chat.mlx.scheduler import GenerationScheduler
+from mlx_omni_server.chat.mlx.speculative import (
+    AcceptanceTracker,
+    AdaptiveDraftLength,
+    DraftStats,
+    draft_model_generate_step,
+)
+from tests.chat.mlx.tiny_model import make_tiny_model, never_eos
+
+
+def make_draft_model(seed: int):
+    """Create a tiny random Llama model with the tokenizer of make_tiny_model."""
+    model = make_tiny_model().model
+    mx.random.seed(seed)
+    draft_model = llama.Model(model.args)
+    mx.eval(draft_model.parameters())
+    return draft_model
+
+
+class FixedDraftLength(AdaptiveDraftLength):
+    """Always drafts the maximum, so verification is exercised on every step."""
+
+    def next(self) -> int:
+        return self.max_draft_tokens
+
+
+class TestAdaptiveDraftLength:
+    """Test AdaptiveDraftLength functionality."""
+
+    def test_follows_acceptance(self):
+        """Accepted drafts lengthen the draft, rejected ones shorten it."""
+        draft_length = AdaptiveDraftLength(max_draft_tokens=8)
+        for _ in range(50):
+            num_draft = draft_length.next()
+            draft_length.update(num_draft, num_draft, 0.001 * num_draft, 0.02)
+        assert draft_length.next() == 8
+
+        for _ in range(20):
+            num_draft = draft_length.next()
+            draft_length.update(num_draft, 0, 0.001 * num_draft, 0.02)
+        assert 0 < draft_length.num_draft_tokens < 8
+
+    def test_switches_off_and_probes(self):
+        """Net-negative speculation stops drafting, except for probing steps."""
+        draft_length = AdaptiveDraftLength(max_draft_tokens=4, acceptance=0.1)
+        # Drafting a token costs half a verification pass
+        draft_length.update(1, 0, 0.01, 0.02)
+        assert not draft_length.enabled
+
+        lengths = [draft_length.next() for _ in range(32)]
+        assert lengths.count(1) == 2
+        assert lengths.count(0) == 30
+
+    def test_tracker_histograms(self):
+        """Sequence statistics are aggregated into per-model histograms."""
+        stats = DraftStats()
+        for proposed, accepted in [(4, 4), (4, 1), (4, 1), (0, 0)]:
+            stats.record(proposed, accepted)
+        assert stats.steps == 3
+        assert stats.rejections == 2
+        assert stats.accepted_histogram == [0, 2, 0, 0, 1]
+
+        tracker = AcceptanceTracker()
+        tracker.record(stats, enabled=True)
+        tracker.record(DraftStats(), enabled=False)
+        summary = tracker.get_stats()
+        assert summary["sequences"] == 2
+        assert summary["disabled_sequences"] == 1
+        assert summary["accepted_per_step"] == [0, 2, 0, 0, 1]
+        assert summary["sequence_acceptance"][5] == 1  # 6 of 12 accepted
+        assert summary["acceptance_rate"] == 0.5
+
+
+class TestDraftModelGenerateStep:
+    """Test draft_model_generate_step."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.model = make_tiny_model().model
+
+    def _check(self, draft_model):
+        prompt = mx.array([3, 7, 11, 5, 9])
+        expected = [
+            token
+            for token, _ in generate_step(
+                prompt, self.model, max_tokens=30, logits_processors=[never_eos]
+            )
+        ]
+
+        prompt_cache = make_prompt_cache(self.model) + make_prompt_cache(draft_model)
+        stats = DraftStats()
+        tokens = [
+            token
+            for token, _, _ in draft_model_generate_step(
+                prompt,
+                self.model,
+                draft_model,
+                prompt_cache=prompt_cache,
+                max_tokens=30,
+                logits_processors=[never_eos],
+                draft_length=FixedDraftLength(3),
+                draft_stats=stats,
+            )
+        ]
+
+        assert tokens == expected
+        # Both caches hold the prompt and all tokens but the last
+        num_layers = len(self.model.layers)
+        assert prompt_cache[0].offset == prompt.size + len(tokens) - 1
+        assert prompt_cache[num_layers].offset == prompt.size + len(tokens) - 1
+        return stats
+
+    def test_identical_draft_model(self):
+        """A draft model equal to the model has all drafts accepted."""
+        stats = self._check(make_tiny_model().model)
+        assert stats.steps == 8  # 7 full steps of 3 + 1, then 2 tokens
+        # Drafts ignore logits processors, so EOS drafts can be rejected
+        assert stats.acceptance_rate > 0.9
+
+    def test_unrelated_draft_model(self):
+        """Rejected drafts leave the output unchanged."""
+        stats = self._check(make_draft_model(seed=2))
+        assert stats.rejections > 0
+
+
+class TestSchedulerSpeculative:
+    """Test adaptive speculative decoding through the scheduler."""
+
+    def test_draft_model_statistics(self):
+        """The scheduler reports per-model acceptance histograms."""
+        model = make_tiny_model()
+        model.draft_model = make_tiny_model().model
+        scheduler = GenerationScheduler(model)
+        try:
+            handles = [
+                scheduler.submit(
+                    [3, 7, 11, 5, 9], max_tokens=20, logits_processors=[never_eos]
+                )
+                for _ in range(2)
+            ]
+            for handle in handles:
+                responses = list(handle)
+                assert responses[-1].finish_reason == "length"
+                assert responses[-1].accepted_draft_tokens == sum(
+                    r.from_draft for r in responses
+                )
+
+            stats = scheduler.get_stats()["speculative"]
+            assert stats["sequences"] == 2
+            assert sum(stats["accepted_per_step"]) > 0
+            assert sum(stats["sequence_acceptance"]) == 2
+        finally:
+            scheduler.shutdown()
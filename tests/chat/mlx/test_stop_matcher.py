@@ -0,0 +1,62 @@
+"""Unit tests for StopSequenceMatcher."""
+
+from mlx_omni_server.chat.mlx.stop_matcher import StopSequenceMatcher
+
+
+def feed_all(matcher, pieces):
+    """Feed pieces until a match and return (emitted text, matched sequence)."""
+    emitted = ""
+    for piece in pieces:
+        text, matched = matcher.feed(piece)
+        emitted += text
+        if matched is not None:
+            return emitted, matched
+    return emitted + matcher.flush(), None
+
+
+class TestStopSequenceMatcher:
+    """Test StopSequenceMatcher functionality."""
+
+    def test_match_within_single_piece(self):
+        """A stop sequence inside one piece cuts the text before it."""
+        matcher = StopSequenceMatcher(["STOP"])
+        assert matcher.feed("hello STOP world") == ("hello ", "STOP")
+
+    def test_match_split_across_pieces(self):
+        """Partial matches are held back until they resolve."""
+        matcher = StopSequenceMatcher(["</answer>"])
+        assert matcher.feed("4.</an") == ("4.", None)
+        assert matcher.feed("swer> tail") == ("", "</answer>")
+
+    def test_partial_match_released_when_it_fails(self):
+        """Held back text is emitted once it can no longer match."""
+        matcher = StopSequenceMatcher(["abc"])
+        assert matcher.feed("xab") == ("x", None)
+        assert matcher.feed("d") == ("abd", None)
+
+    def test_flush_releases_held_text(self):
+        """Text held back at the end of generation is not lost."""
+        emitted, matched = feed_all(StopSequenceMatcher(["\n\nUser:"]), ["Hi", "\n\n"])
+        assert emitted == "Hi\n\n"
+        assert matched is None
+
+    def test_earliest_of_several_sequences(self):
+        """With overlapping candidates the first completed sequence wins."""
+        matcher = StopSequenceMatcher(["bcd", "abcde", "c"])
+        assert feed_all(matcher, ["ab", "cde"]) == ("ab", "c")
+
+        matcher = StopSequenceMatcher(["she", "he", "hers"])
+        assert feed_all(matcher, ["us", "he", "rs"]) == ("u", "she")
+
+    def test_no_output_after_match(self):
+        """Once matched, later text and flush emit nothing."""
+        matcher = StopSequenceMatcher(["x"])
+        assert matcher.feed("axb") == ("a", "x")
+        assert matcher.feed("more") == ("", "x")
+        assert matcher.flush() == ""
+
+    def test_empty_sequences_are_ignored(self):
+        """An empty list disables matching."""
+        matcher = StopSequenceMatcher(["", ""])
+        assert not matcher
+        assert feed_all(matcher, ["any", "thing"]) == ("anything", None)
@@ -4,13 +4,20 @@ This module tests the MLXWrapperCache class to ensure proper caching behavior,
 LRU eviction, thread safety, and edge case handling.
 """
 
+import asyncio
 import threading
 import time
 from unittest.mock import Mock, patch
 
 import pytest
 
-from mlx_omni_server.chat.mlx.wrapper_cache import MLXWrapperCache, WrapperCacheKey
+from mlx_omni_server.chat.mlx.admission import AdmissionController
+from mlx_omni_server.chat.mlx.preload import ModelPreloader, parse_preload_spec
+from mlx_omni_server.chat.mlx.wrapper_cache import (
+    MLXWrapperCache,
+    ModelBusyError,
+    WrapperCacheKey,
+)
 
 
 class MockChatGenerator:
@@ -136,6 +143,36 @@ class TestMLXWrapperCache:
             self.cache.get_wrapper("broken_model")
         assert self.cache.get_cache_info()["cache_size"] == 0
 
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_evicted_wrappers_closed_outside_lock(self, mock_create):
+        """Evicted wrappers are closed once the cache lock is released."""
+        closed = []
+
+        def make_wrapper(model_id, **kwargs):
+            wrapper = MockChatGenerator(model_id)
+            wrapper.close = lambda: closed.append((model_id, self.cache._lock.locked()))
+            return wrapper
+
+        mock_create.side_effect = make_wrapper
+        self.cache.set_max_size(1)
+        self.cache.get_wrapper("model1")
+        self.cache.get_wrapper("model2")
+        assert self.cache.evict(WrapperCacheKey("model2"))
+
+        assert closed == [("model1", False), ("model2", False)]
+        assert self.cache.get_cache_info()["cache_size"] == 0
+
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_generation_stats_read_outside_lock(self, mock_create):
+        """Generator statistics are read once the cache lock is released."""
+        wrapper = MockChatGenerator("model1")
+        wrapper.get_stats = lambda: {"locked": self.cache._lock.locked()}
+        mock_create.return_value = wrapper
+        self.cache.get_wrapper("model1")
+
+        stats = self.cache.get_cache_info()["generation_stats"]
+        assert stats == {str(WrapperCacheKey("model1")): {"locked": False}}
+
 
 class TestMLXWrapperCacheThreadSafety:
     """Test thread safety of MLXWrapperCache."""
@@ -199,6 +236,88 @@ class TestMLXWrapperCacheThreadSafety:
             assert len(set(id(wrapper) for wrapper in different_key_wrappers)) == 3
             assert self.creation_count == first_creation_count + 3
 
+    def test_loading_does_not_block_other_keys(self):
+        """Hits for resident models return while another model loads."""
+        loading = threading.Event()
+        release = threading.Event()
+
+        def slow_create(model_id, **kwargs):
+            if model_id == "slow_model":
+                loading.set()
+                assert release.wait(5)
+            return MockChatGenerator(model_id)
+
+        with patch(
+            "mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create"
+        ) as mock_create:
+            mock_create.side_effect = slow_create
+            resident = self.cache.get_wrapper("resident_model")
+
+            waiters = [
+                threading.Thread(
+                    target=lambda: self.results.append(
+                        self.cache.get_wrapper("slow_model")
+                    )
+                )
+                for _ in range(3)
+            ]
+            for thread in waiters:
+                thread.start()
+            assert loading.wait(5)
+
+            start = time.perf_counter()
+            assert self.cache.get_wrapper("resident_model") is resident
+            assert time.perf_counter() - start < 1.0
+            info = self.cache.get_cache_info()
+            assert info["loading_keys"] == [str(WrapperCacheKey("slow_model"))]
+
+            release.set()
+            for thread in waiters:
+                thread.join()
+
+            # One load served every waiter
+            assert len(set(id(wrapper) for wrapper in self.results)) == 1
+            assert mock_create.call_count == 2
+            stats = self.cache.get_cache_info()["load_stats"]
+            slow_stats = stats[str(WrapperCacheKey("slow_model"))]
+            assert slow_stats["loads"] == 1
+            assert slow_stats["last_load_seconds"] > 0
+
+    def test_failed_load_reaches_waiters(self):
+        """Requesters waiting for a failing load get its error, then may retry."""
+        release = threading.Event()
+        errors = []
+
+        def failing_create(model_id, **kwargs):
+            assert release.wait(5)
+            raise RuntimeError("Model loading failed")
+
+        def worker():
+            try:
+                self.cache.get_wrapper("broken_model")
+            except RuntimeError as e:
+                errors.append(e)
+
+        with patch(
+            "mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create"
+        ) as mock_create:
+            mock_create.side_effect = failing_create
+            threads = [threading.Thread(target=worker) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.05)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+            assert len(errors) == 3
+            assert mock_create.call_count == 1
+            info = self.cache.get_cache_info()
+            assert info["loading_keys"] == []
+            stats = info["load_stats"][str(WrapperCacheKey("broken_model"))]
+            assert stats["loads"] == 1 and stats["failures"] == 1
+            assert stats["last_load_seconds"] >= 0.05
+
 
 class TestMLXWrapperCacheTTL:
     """Test TTL (Time To Live) functionality of MLXWrapperCache."""
@@ -208,6 +327,11 @@ class TestMLXWrapperCacheTTL:
         # Use short TTL for faster testing
         self.cache = MLXWrapperCache(max_size=5, ttl_seconds=1)
 
+    def make_wrapper(self, model_id):
+        wrapper = MockChatGenerator(model_id)
+        wrapper.admission = AdmissionController(model_id)
+        return wrapper
+
     @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
     def test_ttl_expiration_and_renewal(self, mock_create):
         """Test TTL expiration, renewal on access, and cache info."""
@@ -232,6 +356,128 @@ class TestMLXWrapperCacheTTL:
         info = self.cache.get_cache_info()
         assert info["cache_size"] == 0
 
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_pinned_prefixes_outlive_ttl(self, mock_create):
+        """Wrappers holding pinned prompt prefixes are not expired."""
+        wrapper = MockChatGenerator("model1")
+        wrapper.has_pinned_prefixes = Mock(return_value=True)
+        mock_create.return_value = wrapper
+
+        self.cache.get_wrapper("model1")
+        time.sleep(1.2)
+        assert self.cache.get_cache_info()["cache_size"] == 1
+        assert self.cache.get_wrappers()[0][1] is wrapper
+
+        wrapper.has_pinned_prefixes.return_value = False
+        assert self.cache.get_cache_info()["cache_size"] == 0
+
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_busy_models_are_not_evicted(self, mock_create):
+        """Models with requests in flight outlive the TTL and are no LRU victims."""
+        self.cache.set_max_size(2)
+        mock_create.side_effect = lambda model_id, **kwargs: self.make_wrapper(model_id)
+
+        busy = self.cache.get_wrapper("model1")
+        ticket = asyncio.run(busy.admission.acquire())
+        time.sleep(1.2)
+        assert self.cache.get_cache_info()["cache_size"] == 1
+
+        # model1 is least recently used, but busy
+        self.cache.get_wrapper("model2")
+        self.cache.get_wrapper("model3")
+        assert [key.model_id for key, _ in self.cache.get_wrappers()] == [
+            "model3",
+            "model1",
+        ]
+
+        # Finishing the request counts as a use
+        ticket.release()
+        entry = next(
+            e for e in self.cache.get_entries() if e["key"].model_id == "model1"
+        )
+        assert time.time() - entry["last_used"] < 0.5
+        self.cache.get_wrapper("model3")
+        self.cache.get_wrapper("model4")
+        assert {key.model_id for key, _ in self.cache.get_wrappers()} == {
+            "model3",
+            "model4",
+        }
+
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_reserved_models_are_not_evicted(self, mock_create):
+        """A model handed to a request stays loaded until it is admitted."""
+        self.cache.set_max_size(1)
+        mock_create.side_effect = lambda model_id, **kwargs: self.make_wrapper(model_id)
+
+        reserved = self.cache.get_wrapper("model1", reserve=True)
+        assert reserved.admission.get_stats()["reserved_requests"] == 1
+        with pytest.raises(ModelBusyError):
+            self.cache.evict(WrapperCacheKey("model1"), force=False)
+
+        # Another model is loaded between the lookup and the admission
+        self.cache.get_wrapper("model2")
+        assert WrapperCacheKey("model1") in {
+            key for key, _ in self.cache.get_wrappers()
+        }
+
+        async def admit():
+            ticket = await reserved.admission.acquire(reserved=True)
+            assert reserved.admission.get_stats()["reserved_requests"] == 0
+            ticket.release()
+
+        asyncio.run(admit())
+        self.cache.get_wrapper("model3")
+        assert [key.model_id for key, _ in self.cache.get_wrappers()] == ["model3"]
+
+        # Giving up the reservation makes the model evictable as well
+        reserved = self.cache.get_wrapper("model3", reserve=True)
+        reserved.admission.cancel_reservation()
+        self.cache.get_wrapper("model4")
+        assert [key.model_id for key, _ in self.cache.get_wrappers()] == ["model4"]
+
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_preloaded_models_outlive_ttl(self, mock_create):
+        """Preloaded models are warmed up, reported ready and not expired."""
+        wrappers = {
+            "model1": MockChatGenerator("model1"),
+            "broken": MockChatGenerator("broken"),
+        }
+        wrappers["model1"].warm_up = Mock()
+        wrappers["broken"].warm_up = Mock(side_effect=RuntimeError("no kernel"))
+        mock_create.side_effect = lambda model_id, **kwargs: wrappers[model_id]
+
+        preloader = ModelPreloader(self.cache)
+        assert preloader.get_status() == {"status": "ready", "models": []}
+
+        preloader.run([parse_preload_spec("model1")])
+        wrappers["model1"].warm_up.assert_called_once()
+        status = preloader.get_status()
+        assert status["status"] == "ready"
+        assert status["models"][0]["status"] == "ready"
+        assert status["models"][0]["warm_up_seconds"] is not None
+
+        time.sleep(1.2)
+        assert self.cache.get_cache_info()["cache_size"] == 1
+
+        preloader.run([parse_preload_spec("broken,,")])
+        assert not preloader.is_ready()
+        status = preloader.get_status()
+        assert status["status"] == "failed"
+        assert status["models"][1]["error"] == "no kernel"
+
+    def test_preload_spec(self):
+        """Preload specs give the model, adapter and draft model."""
+        assert parse_preload_spec("model, adapter ,draft") == WrapperCacheKey(
+            "model", "adapter", "draft"
+        )
+        assert parse_preload_spec("model,,draft") == WrapperCacheKey(
+            "model", None, "draft"
+        )
+        with pytest.raises(ValueError):
+            parse_preload_spec(",adapter")
+        with pytest.raises(ValueError):
+            parse_preload_spec("model,adapter,draft,extra")
+
     @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
     def test_ttl_management(self, mock_create):
         """Test TTL disabled, manual cleanup, and TTL+LRU interaction."""
@@ -282,6 +528,122 @@ class TestMLXWrapperCacheTTL:
             assert info["cache_size"] == 1
             assert any("model3" in key for key in info["cached_keys"])
 
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_pinned_models_are_never_evicted(self, mock_create):
+        """Pinned models survive the TTL and LRU eviction."""
+        mock_create.side_effect = lambda model_id, **kwargs: MockChatGenerator(model_id)
+        self.cache.pin(WrapperCacheKey("pinned"))
+        self.cache.set_max_size(2)
+
+        self.cache.get_wrapper("pinned")
+        time.sleep(0.01)
+        self.cache.get_wrapper("model1")
+        time.sleep(0.01)
+        self.cache.get_wrapper("model2")  # Evicts model1, not pinned
+        info = self.cache.get_cache_info()
+        assert info["cache_size"] == 2
+        assert str(WrapperCacheKey("pinned")) in info["cached_keys"]
+        assert str(WrapperCacheKey("model1")) not in info["cached_keys"]
+
+        time.sleep(1.2)
+        assert self.cache.get_cache_info()["cached_keys"] == [
+            str(WrapperCacheKey("pinned"))
+        ]
+
+        # Shrinking the cache stops at pinned models
+        self.cache.set_max_size(0)
+        assert self.cache.get_cache_info()["cache_size"] == 1
+
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_residency_management(self, mock_create):
+        """Models are evicted and unpinned on demand, the TTL changes at runtime."""
+        mock_create.side_effect = lambda model_id, **kwargs: MockChatGenerator(model_id)
+        key = WrapperCacheKey("model1")
+        self.cache.pin(key)
+        self.cache.get_wrapper("model1")
+
+        entry = self.cache.get_entries()[0]
+        assert entry["key"] == key
+        assert entry["pinned"] and entry["expires_at"] is None
+        assert self.cache.get_residency(key) == {
+            "loaded": True,
+            "pinned": True,
+            "resident": False,
+        }
+
+        # Evicting on demand keeps the pin
+        assert self.cache.evict(key)
+        assert not self.cache.evict(key)
+        assert self.cache.get_residency(key)["pinned"]
+
+        assert self.cache.unpin(key)
+        assert not self.cache.unpin(key)
+        self.cache.get_wrapper("model1")
+        assert self.cache.get_entries()[0]["expires_at"] is not None
+
+        self.cache.set_ttl_seconds(0)
+        time.sleep(1.2)
+        assert self.cache.get_cache_info()["cache_size"] == 1
+        self.cache.set_ttl_seconds(1)
+        assert self.cache.get_cache_info()["cache_size"] == 0
+
+
+class TestMLXWrapperCacheMemoryBudget:
+    """Test eviction by the weight bytes of the cached models."""
+
+    def make_wrapper(self, model_id, weight_bytes):
+        wrapper = MockChatGenerator(model_id)
+        wrapper.weight_bytes = weight_bytes
+        return wrapper
+
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.weight_file_bytes")
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_evicts_lru_to_fit_budget(self, mock_create, mock_file_bytes):
+        """Small models co-reside, a large one makes room before it is loaded."""
+        cache = MLXWrapperCache(max_size=10, ttl_seconds=0, max_bytes=100)
+        sizes = {"small1": 20, "small2": 20, "small3": 20, "large": 70}
+        mock_file_bytes.side_effect = lambda model_id: sizes.get(model_id, 0)
+        mock_create.side_effect = lambda model_id, **kwargs: self.make_wrapper(
+            model_id, sizes[model_id]
+        )
+
+        for model_id in ["small1", "small2", "small3"]:
+            cache.get_wrapper(model_id)
+            time.sleep(0.01)
+        info = cache.get_cache_info()
+        assert info["cache_size"] == 3
+        assert info["used_bytes"] == 60
+        assert info["max_bytes"] == 100
+
+        cache.get_wrapper("small1")  # small2 is now least recently used
+        cache.get_wrapper("large")
+        info = cache.get_cache_info()
+        assert sorted(info["model_bytes"].values()) == [20, 70]
+        assert any("small1" in key for key in info["cached_keys"])
+        assert info["used_bytes"] == 90
+
+        # Shrinking the budget evicts least recently used models first
+        cache.set_max_bytes(80)
+        info = cache.get_cache_info()
+        assert info["cached_keys"] == [str(WrapperCacheKey("large"))]
+
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.weight_file_bytes")
+    @patch("mlx_omni_server.chat.mlx.wrapper_cache.ChatGenerator.create")
+    def test_measured_size_enforced_after_load(self, mock_create, mock_file_bytes):
+        """Models without local weight files are measured once loaded."""
+        cache = MLXWrapperCache(max_size=10, ttl_seconds=0, max_bytes=100)
+        mock_file_bytes.return_value = 0
+        mock_create.side_effect = [
+            self.make_wrapper("model1", 60),
+            self.make_wrapper("model2", 60),
+        ]
+
+        cache.get_wrapper("model1")
+        time.sleep(0.01)
+        wrapper = cache.get_wrapper("model2")
+        assert cache.get_wrappers() == [(WrapperCacheKey("model2"), wrapper)]
+        assert cache.get_cache_info()["used_bytes"] == 60
+
 
 class TestMLXWrapperCacheEdgeCases:
     """Test edge cases and boundary conditions."""
@@ -0,0 +1,49 @@
+"""Tiny random Llama model shared by the MLX tests.
+
+The model needs no download and runs in milliseconds, so tests can compare
+generation paths token by token.
+"""
+
+from types import SimpleNamespace
+
+import mlx.core as mx
+from mlx_lm.models import llama
+
+from mlx_omni_server.chat.mlx.model_types import MLXModel
+
+EOS_TOKEN = 0
+
+
+def make_tiny_model(hidden_size: int = 64) -> MLXModel:
+    """Create a small random Llama model wrapped as MLXModel.
+
+    KV cache quantization needs a head dimension of at least 32, i.e. a
+    ``hidden_size`` of 128.
+    """
+    mx.random.seed(0)
+    args = llama.ModelArgs(
+        model_type="llama",
+        hidden_size=hidden_size,
+        num_hidden_layers=2,
+        intermediate_size=128,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        rms_norm_eps=1e-5,
+        vocab_size=128,
+    )
+    model = llama.Model(args)
+    mx.eval(model.parameters())
+    return MLXModel(
+        model_id="tiny-llama",
+        adapter_path=None,
+        draft_model_id=None,
+        model=model,
+        tokenizer=SimpleNamespace(eos_token_ids={EOS_TOKEN}),
+        chat_template=None,
+    )
+
+
+def never_eos(tokens, logits):
+    """Logits processor that keeps the random model from sampling EOS."""
+    logits[:, EOS_TOKEN] = -1e9
+    return logits